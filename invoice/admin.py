@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Company, InvoiceCategory, Invoice, InvoiceRecognition
+from .models import Company, InvoiceCategory, Invoice, InvoiceRecognition, OCRCacheCounter, OCRCacheEntry, Party
 
 # 公司信息管理
 @admin.register(Company)
@@ -14,6 +14,13 @@ class InvoiceCategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'monthly_limit', 'created_at')
     search_fields = ('name',)
 
+# 交易方管理
+@admin.register(Party)
+class PartyAdmin(admin.ModelAdmin):
+    list_display = ('name', 'tax_id', 'is_seller', 'is_buyer', 'created_at')
+    list_filter = ('is_seller', 'is_buyer', 'name_stale')
+    search_fields = ('name', 'tax_id')
+
 # 发票管理
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
@@ -22,7 +29,7 @@ class InvoiceAdmin(admin.ModelAdmin):
     list_filter = ('invoice_date', 'invoice_type', 'status', 'is_verified', 'category', 'company')
     search_fields = ('invoice_number', 'invoice_content', 'seller_name', 'buyer_name')
     date_hierarchy = 'invoice_date'
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('seller', 'buyer', 'created_at', 'updated_at')
     fieldsets = (
         ('基本信息', {
             'fields': ('invoice_number', 'invoice_content', 'invoice_date', 'invoice_type')
@@ -31,10 +38,10 @@ class InvoiceAdmin(admin.ModelAdmin):
             'fields': ('amount', 'tax_amount', 'total_amount')
         }),
         ('销售方信息', {
-            'fields': ('seller_name', 'seller_tax_id')
+            'fields': ('seller_name', 'seller_tax_id', 'seller')
         }),
         ('购买方信息', {
-            'fields': ('buyer_name', 'buyer_tax_id', 'company')
+            'fields': ('buyer_name', 'buyer_tax_id', 'buyer', 'company')
         }),
         ('分类信息', {
             'fields': ('category', 'description')
@@ -55,6 +62,18 @@ class InvoiceAdmin(admin.ModelAdmin):
 # 发票识别记录管理
 @admin.register(InvoiceRecognition)
 class InvoiceRecognitionAdmin(admin.ModelAdmin):
-    list_display = ('id', 'file', 'status', 'invoice', 'created_by', 'created_at')
-    list_filter = ('status', 'created_at')
-    readonly_fields = ('created_at', 'updated_at')
+    list_display = ('id', 'file', 'status', 'invoice_number', 'is_complete', 'attempts', 'invoice', 'created_by', 'created_at')
+    list_filter = ('status', 'is_complete', 'created_at')
+    search_fields = ('invoice_number',)
+    readonly_fields = ('attempts', 'locked_by', 'lease_expires_at', 'created_at', 'updated_at')
+
+# OCR结果缓存管理
+@admin.register(OCRCacheEntry)
+class OCRCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('cache_key', 'hit_count', 'created_at', 'last_used_at')
+    search_fields = ('cache_key',)
+    readonly_fields = ('created_at',)
+
+@admin.register(OCRCacheCounter)
+class OCRCacheCounterAdmin(admin.ModelAdmin):
+    list_display = ('name', 'value', 'updated_at')
@@ -4,6 +4,7 @@
 """
 
 import os
+from urllib.parse import urlsplit
 from django.conf import settings
 
 # 百度OCR API配置
@@ -18,6 +19,114 @@ class BaiduOCRConfig:
     # 请求配置
     TIMEOUT = 30  # 请求超时时间（秒）
     MAX_RETRIES = 3  # 最大重试次数
+    RETRY_BACKOFF_BASE = 0.5  # 重试退避基数（秒），第n次重试最多等待 BASE * 2^n 秒
+    RETRY_BACKOFF_MAX = 8.0  # 单次重试最长等待时间（秒）
+    # 可重试的百度错误码：1 未知错误，2 服务暂不可用，18 QPS超限，282000 服务内部错误
+    RETRYABLE_ERROR_CODES = {1, 2, 18, 282000}
+    
+    # 访问令牌配置
+    TOKEN_REFRESH_AHEAD = 3600  # 令牌过期前多少秒开始后台提前刷新
+    TOKEN_REFRESH_RETRY_SECONDS = 60  # 后台刷新失败后的重试间隔（秒）
+    # 令牌无效的百度错误码：110 Access token invalid，111 Access token expired
+    TOKEN_INVALID_ERROR_CODES = {110, 111}
+    
+    # 连接池配置（keep-alive复用与百度服务器的TCP+TLS连接）
+    POOL_CONNECTIONS = 4  # 缓存的连接池数量（按主机区分）
+    POOL_MAXSIZE = 10  # 每个连接池保留的最大连接数，应不小于并发识别线程数
+    
+    # 限流配置（同一台服务器上所有进程共享，避免触发百度QPS限制）
+    QPS_LIMIT = 2  # 每秒允许的请求数，0表示不限流
+    RATE_LIMIT_WAIT_TIMEOUT = 30  # 等待令牌的最长时间（秒），超时则本次请求失败
+    
+    # 熔断配置（所有进程共享熔断状态，熔断期间识别改用本地Tesseract）
+    CIRCUIT_FAILURE_THRESHOLD = 5  # 连续失败（含慢请求）多少次后熔断，0表示不启用熔断
+    CIRCUIT_SLOW_CALL_SECONDS = 10  # 单次请求耗时超过该值（秒）时计为失败
+    CIRCUIT_RESET_TIMEOUT = 60  # 熔断后多少秒放行一个探测请求
+    # 计入熔断的服务端错误码：1 未知错误，2 服务暂不可用，282000 服务内部错误（QPS超限不计入）
+    CIRCUIT_ERROR_CODES = {1, 2, 282000}
+    
+    # 批量识别配置
+    BATCH_MAX_WORKERS = 4  # 批量识别时同时进行的请求数
+    
+    # 多页PDF逐页识别配置
+    PDF_MAX_PAGES = 20  # 单个PDF最多识别的页数
+    PDF_TIME_BUDGET = 120  # 单个PDF所有页面识别的总时长上限（秒）
+    
+    @classmethod
+    def get_setting(cls, name, default):
+        """读取Django设置中的可调参数"""
+        try:
+            return getattr(settings, name, default)
+        except:
+            return default
+    
+    @classmethod
+    def get_pool_maxsize(cls):
+        """获取每个连接池的最大连接数"""
+        return cls.get_setting('BAIDU_OCR_POOL_MAXSIZE', cls.POOL_MAXSIZE)
+    
+    @classmethod
+    def get_batch_max_workers(cls):
+        """获取批量识别的最大并发请求数"""
+        return cls.get_setting('BAIDU_OCR_BATCH_MAX_WORKERS', cls.BATCH_MAX_WORKERS)
+    
+    @classmethod
+    def get_pdf_max_pages(cls):
+        """获取单个PDF最多识别的页数"""
+        return cls.get_setting('BAIDU_OCR_PDF_MAX_PAGES', cls.PDF_MAX_PAGES)
+    
+    @classmethod
+    def get_pdf_time_budget(cls):
+        """获取单个PDF所有页面识别的总时长上限（秒）"""
+        return cls.get_setting('BAIDU_OCR_PDF_TIME_BUDGET', cls.PDF_TIME_BUDGET)
+    
+    @classmethod
+    def get_qps_limit(cls):
+        """获取每秒允许的请求数"""
+        return cls.get_setting('BAIDU_OCR_QPS_LIMIT', cls.QPS_LIMIT)
+    
+    @classmethod
+    def get_rate_limit_wait_timeout(cls):
+        """获取等待令牌的最长时间（秒）"""
+        return cls.get_setting('BAIDU_OCR_RATE_LIMIT_WAIT_TIMEOUT', cls.RATE_LIMIT_WAIT_TIMEOUT)
+    
+    @classmethod
+    def get_circuit_failure_threshold(cls):
+        """获取熔断前允许的连续失败次数"""
+        return cls.get_setting('BAIDU_OCR_CIRCUIT_FAILURE_THRESHOLD', cls.CIRCUIT_FAILURE_THRESHOLD)
+    
+    @classmethod
+    def get_circuit_slow_call_seconds(cls):
+        """获取计为失败的慢请求耗时（秒）"""
+        return cls.get_setting('BAIDU_OCR_CIRCUIT_SLOW_CALL_SECONDS', cls.CIRCUIT_SLOW_CALL_SECONDS)
+    
+    @classmethod
+    def get_circuit_reset_timeout(cls):
+        """获取熔断后放行探测请求的间隔（秒）"""
+        return cls.get_setting('BAIDU_OCR_CIRCUIT_RESET_TIMEOUT', cls.CIRCUIT_RESET_TIMEOUT)
+    
+    @classmethod
+    def get_state_db_path(cls):
+        """获取跨进程共享状态（限流令牌桶、访问令牌）的SQLite文件路径"""
+        default_path = os.path.join(str(cls.get_setting('BASE_DIR', os.getcwd())), 'baidu_ocr_state.sqlite3')
+        return str(cls.get_setting('BAIDU_OCR_STATE_DB', default_path))
+    
+    @classmethod
+    def get_url(cls, url):
+        """获取实际请求的接口地址
+        
+        设置了 BAIDU_OCR_BASE_URL 时（如本地压测服务 http://127.0.0.1:8765），
+        保留接口路径，替换协议和主机部分。
+        """
+        base_url = cls.get_setting('BAIDU_OCR_BASE_URL', '')
+        if not base_url:
+            return url
+        return base_url.rstrip('/') + urlsplit(url).path
+    
+    @classmethod
+    def get_max_retries(cls):
+        """获取最大重试次数"""
+        return cls.get_setting('BAIDU_OCR_MAX_RETRIES', cls.MAX_RETRIES)
     
     @classmethod
     def get_app_id(cls):
@@ -4,43 +4,343 @@
 """
 
 import requests
-import base64
 import json
 import time
+import random
 import logging
 import re
+import threading
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from django.core.cache import cache
+from requests.adapters import HTTPAdapter
 from .baidu_ocr_config import BaiduOCRConfig
+from .rate_limiter import TokenBucketRateLimiter
+from .circuit_breaker import SharedCircuitBreaker
+from .token_store import SharedTokenStore
+from .image_optimizer import ImageOptimizer
+from .request_body import Base64FormBody
 
 logger = logging.getLogger(__name__)
 
+
+class RateLimitTimeout(requests.RequestException):
+    """在截止时间前未能获取到限流令牌"""
+
+
+class CircuitOpenError(requests.RequestException):
+    """百度OCR处于熔断状态，请求未发送"""
+
+
 class BaiduOCRService:
-    """百度OCR服务类"""
+    """百度OCR服务类
+    
+    每个实例持有一个带连接池的requests.Session，与百度服务器保持keep-alive连接。
+    进程内请通过 get_ocr_service() 获取共享实例，避免每次识别都重新建立TCP+TLS连接。
+    """
     
     def __init__(self):
         self.config = BaiduOCRConfig
         self._access_token = None
         self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+        self._token_timer_lock = threading.Lock()
+        self._token_timer = None
+        self.token_store = SharedTokenStore(self.config.get_state_db_path(), name='baidu_ocr')
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0, 'retries': 0, 'failures': 0,
+            'rate_limited': 0, 'rate_limit_timeouts': 0, 'rate_limit_wait_seconds': 0.0,
+            'token_refreshes': 0, 'upload_bytes': 0, 'request_seconds': 0.0,
+            'circuit_rejections': 0,
+        }
+        self.session = self._create_session()
+        self.rate_limiter = self._create_rate_limiter()
+        self.circuit_breaker = self._create_circuit_breaker()
     
-    def get_access_token(self):
-        """获取访问令牌"""
-        # 先从缓存中获取token
-        cached_token = cache.get('baidu_ocr_access_token')
-        if cached_token:
-            return cached_token
+    def _create_session(self):
+        """创建带连接池的会话"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.config.POOL_CONNECTIONS,
+            pool_maxsize=self.config.get_pool_maxsize(),
+            max_retries=0,  # 重试由 _post 统一处理
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def _create_rate_limiter(self):
+        """创建跨进程共享的令牌桶限流器，QPS_LIMIT为0时不限流"""
+        qps_limit = self.config.get_qps_limit()
+        if not qps_limit:
+            return None
+        return TokenBucketRateLimiter(self.config.get_state_db_path(), qps_limit, name='baidu_ocr')
+    
+    def _create_circuit_breaker(self):
+        """创建跨进程共享的熔断器，CIRCUIT_FAILURE_THRESHOLD为0时不启用"""
+        failure_threshold = self.config.get_circuit_failure_threshold()
+        if not failure_threshold:
+            return None
+        return SharedCircuitBreaker(
+            self.config.get_state_db_path(),
+            name='baidu_ocr',
+            failure_threshold=failure_threshold,
+            slow_call_seconds=self.config.get_circuit_slow_call_seconds(),
+            reset_timeout=self.config.get_circuit_reset_timeout(),
+            probe_timeout=self.config.TIMEOUT * 2,
+        )
+    
+    def _check_circuit(self):
+        """熔断期间直接拒绝请求
         
-        # 如果缓存中没有，则请求新的token
-        if not self.config.is_configured():
-            logger.error("百度OCR API密钥未配置")
+        Raises:
+            CircuitOpenError: 熔断器处于打开状态
+        """
+        if self.circuit_breaker is None:
+            return
+        try:
+            allowed = self.circuit_breaker.allow_request()
+        except Exception as e:
+            # 熔断状态文件不可用时不阻塞识别
+            logger.warning(f"百度OCR熔断器不可用，跳过熔断检查: {str(e)}")
+            return
+        if not allowed:
+            self._incr('circuit_rejections')
+            raise CircuitOpenError("百度OCR处于熔断状态，暂停请求")
+    
+    def _record_circuit_result(self, elapsed, failure_reason=None):
+        """向熔断器报告请求结果"""
+        if self.circuit_breaker is None:
+            return
+        try:
+            if failure_reason:
+                self.circuit_breaker.record_failure(failure_reason)
+            else:
+                self.circuit_breaker.record_success(elapsed)
+        except Exception as e:
+            logger.warning(f"百度OCR熔断器不可用，未记录请求结果: {str(e)}")
+    
+    def _circuit_failure_reason(self, response, retry_reason):
+        """服务端故障（5xx、服务端错误码）计入熔断，QPS超限等原因不计入"""
+        if retry_reason is None:
+            return None
+        if response.status_code >= 500:
+            return retry_reason
+        try:
+            error_code = response.json().get('error_code')
+        except (ValueError, AttributeError):
+            return None
+        return retry_reason if error_code in self.config.CIRCUIT_ERROR_CODES else None
+    
+    def is_circuit_open(self):
+        """百度OCR是否处于熔断状态"""
+        if self.circuit_breaker is None:
+            return False
+        try:
+            return self.circuit_breaker.is_open()
+        except Exception as e:
+            logger.warning(f"读取百度OCR熔断状态失败: {str(e)}")
+            return False
+    
+    def circuit_allows_request(self):
+        """熔断器当前是否可能放行请求（熔断中且未到探测时间时返回False）"""
+        if self.circuit_breaker is None:
+            return True
+        try:
+            return self.circuit_breaker.would_allow()
+        except Exception as e:
+            logger.warning(f"读取百度OCR熔断状态失败: {str(e)}")
+            return True
+    
+    def get_circuit_state(self):
+        """熔断器状态，未启用熔断时state为DISABLED"""
+        if self.circuit_breaker is None:
+            return {'state': 'DISABLED'}
+        return self.circuit_breaker.get_state()
+    
+    def _wait_for_rate_limit(self, deadline):
+        """请求前获取限流令牌，令牌不足时等待到deadline为止
+        
+        Raises:
+            RateLimitTimeout: 截止时间前未能获取到令牌
+        """
+        if self.rate_limiter is None:
+            return
+        
+        started_at = time.monotonic()
+        try:
+            acquired = self.rate_limiter.acquire(timeout=max(0.0, deadline - started_at))
+        except Exception as e:
+            # 限流状态文件不可用时不阻塞识别
+            logger.warning(f"百度OCR限流器不可用，跳过限流: {str(e)}")
+            return
+        
+        waited = time.monotonic() - started_at
+        if waited > 0.001:
+            self._incr('rate_limited')
+            self._incr('rate_limit_wait_seconds', waited)
+        if not acquired:
+            self._incr('rate_limit_timeouts')
+            raise RateLimitTimeout(f"等待百度OCR限流令牌超时（{waited:.1f}秒）")
+    
+    def _incr(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+    
+    def _backoff_delay(self, attempt):
+        """第attempt次重试前的等待时间（带随机抖动的指数退避）"""
+        cap = min(self.config.RETRY_BACKOFF_MAX, self.config.RETRY_BACKOFF_BASE * (2 ** (attempt - 1)))
+        return cap / 2 + random.uniform(0, cap / 2)
+    
+    @staticmethod
+    def _error_code(response):
+        """返回状态码200的响应中百度返回的错误码，没有时返回None"""
+        if response.status_code != 200:
+            return None
+        try:
+            result = response.json()
+        except ValueError:
+            return None
+        if not isinstance(result, dict):
             return None
+        return result.get('error_code')
+    
+    def _retry_reason(self, response):
+        """判断响应是否需要重试，需要时返回原因，否则返回None
+        
+        令牌失效的错误码不在此重试（重试地址中仍是旧令牌），由 _post_with_token 换新令牌后重试。
+        """
+        if response.status_code >= 500:
+            return f"状态码 {response.status_code}"
+        error_code = self._error_code(response)
+        if error_code in self.config.RETRYABLE_ERROR_CODES:
+            return f"错误码 {error_code}: {response.json().get('error_msg', '')}"
+        return None
+    
+    def _post(self, url, data=None, headers=None, wait_timeout=None):
+        """发送POST请求
+        
+        每次请求（含重试）前先从跨进程限流器获取令牌；
+        对超时、连接错误、5xx状态码和可重试的百度错误码（如QPS超限）
+        按带抖动的指数退避重试，最多重试 MAX_RETRIES 次。
+        
+        Args:
+            url: 请求地址
+            data: 请求体
+            headers: 请求头
+            wait_timeout: 等待限流令牌的最长时间（秒），默认使用 RATE_LIMIT_WAIT_TIMEOUT
+            
+        Returns:
+            requests.Response: 最后一次请求的响应
+            
+        Raises:
+            CircuitOpenError: 百度OCR处于熔断状态
+            RateLimitTimeout: 等待限流令牌超时
+            requests.RequestException: 重试次数用尽后仍发生网络错误
+        """
+        if wait_timeout is None:
+            wait_timeout = self.config.get_rate_limit_wait_timeout()
+        deadline = time.monotonic() + wait_timeout
+        max_retries = self.config.get_max_retries()
+        attempt = 0
+        while True:
+            self._check_circuit()
+            self._wait_for_rate_limit(deadline)
+            self._incr('requests')
+            if data is not None and not isinstance(data, dict):
+                self._incr('upload_bytes', len(data))
+            started = time.monotonic()
+            try:
+                response = self.session.post(url, data=data, headers=headers, timeout=self.config.TIMEOUT)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                elapsed = time.monotonic() - started
+                self._incr('request_seconds', elapsed)
+                reason = f"网络错误: {str(e)}"
+                self._record_circuit_result(elapsed, reason)
+                if attempt >= max_retries:
+                    self._incr('failures')
+                    raise
+            else:
+                elapsed = time.monotonic() - started
+                self._incr('request_seconds', elapsed)
+                reason = self._retry_reason(response)
+                self._record_circuit_result(elapsed, self._circuit_failure_reason(response, reason))
+                if reason is None or attempt >= max_retries:
+                    return response
+            
+            attempt += 1
+            delay = self._backoff_delay(attempt)
+            self._incr('retries')
+            logger.warning(f"百度OCR请求将在 {delay:.2f} 秒后进行第{attempt}次重试，原因: {reason}")
+            time.sleep(delay)
+    
+    def _post_with_token(self, url, access_token, data=None, headers=None, wait_timeout=None):
+        """携带访问令牌发送识别请求
+        
+        百度判定令牌无效或过期（TOKEN_INVALID_ERROR_CODES）时清除该令牌，
+        重新获取令牌后用新的 access_token 重试一次。
+        
+        Args:
+            url: 不含访问令牌的接口地址
+            access_token: 当前访问令牌
+            
+        其余参数和返回值、异常与 _post 相同。
+        """
+        response = self._post(f"{url}?access_token={access_token}", data=data, headers=headers,
+                              wait_timeout=wait_timeout)
+        if self._error_code(response) not in self.config.TOKEN_INVALID_ERROR_CODES:
+            return response
+        
+        self.invalidate_access_token(access_token)
+        new_token = self.get_access_token()
+        if not new_token or new_token == access_token:
+            return response
+        self._incr('retries')
+        logger.warning("百度OCR访问令牌已失效，使用新令牌重试")
+        return self._post(f"{url}?access_token={new_token}", data=data, headers=headers,
+                          wait_timeout=wait_timeout)
+    
+    def get_stats(self):
+        """请求统计：请求次数、重试次数、失败次数、上传字节数、请求耗时以及连接复用情况
+        
+        connections_opened 为实际建立的TCP+TLS连接数，
+        connections_reused 为复用已有连接发送的请求数（即节省的握手次数）。
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        
+        connections_opened = 0
+        pool_requests = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                connections_opened += pool.num_connections
+                pool_requests += pool.num_requests
+        
+        stats['connections_opened'] = connections_opened
+        stats['connections_reused'] = max(0, pool_requests - connections_opened)
+        return stats
+    
+    def _fetch_access_token(self):
+        """向TOKEN_URL请求新的访问令牌
         
+        令牌请求直接通过会话发送，不占用识别接口的QPS令牌，也不计入熔断器；
+        调用方已通过刷新租约保证同一时间只有一个请求。
+        
+        Returns:
+            tuple: (access_token, expires_at)，失败时返回(None, 0)
+        """
+        self._incr('token_refreshes')
         try:
-            response = requests.post(
-                 self.config.TOKEN_URL,
-                 data=self.config.get_token_params(),
-                 timeout=self.config.TIMEOUT
-             )
+            response = self.session.post(
+                self.config.get_url(self.config.TOKEN_URL),
+                data=self.config.get_token_params(),
+                timeout=self.config.TIMEOUT
+            )
             
             if response.status_code == 200:
                 result = response.json()
@@ -48,62 +348,160 @@ class BaiduOCRService:
                     access_token = result['access_token']
                     expires_in = result.get('expires_in', 2592000)  # 默认30天
                     
-                    # 将token存入缓存，提前5分钟过期以避免边界情况
-                    cache.set('baidu_ocr_access_token', access_token, expires_in - 300)
-                    
+                    # 提前5分钟过期以避免边界情况
                     logger.info("百度OCR访问令牌获取成功")
-                    return access_token
+                    return access_token, time.time() + expires_in - 300
                 else:
                     logger.error(f"获取访问令牌失败: {result}")
-                    return None
+                    return None, 0
             else:
                 logger.error(f"请求访问令牌失败，状态码: {response.status_code}")
-                return None
+                return None, 0
                 
         except requests.RequestException as e:
             logger.error(f"请求访问令牌时发生网络错误: {str(e)}")
-            return None
+            return None, 0
         except Exception as e:
             logger.error(f"获取访问令牌时发生未知错误: {str(e)}")
-            return None
+            return None, 0
     
-    def image_to_base64(self, image_path):
-        """将图片文件转换为base64编码"""
+    def _load_shared_token(self):
+        """从跨进程共享存储读取令牌，存储不可用时退回进程内的令牌"""
         try:
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
-                return base64.b64encode(image_data)
+            return self.token_store.get()
         except Exception as e:
-            logger.error(f"图片转换base64失败: {str(e)}")
-            return None
+            logger.warning(f"读取共享访问令牌失败: {str(e)}")
+            return self._access_token, self._token_expires_at
+    
+    def _remember_token(self, token, expires_at):
+        """在进程内记住令牌，并安排在临近过期前后台刷新"""
+        if token == self._access_token and expires_at == self._token_expires_at:
+            return
+        self._access_token = token
+        self._token_expires_at = expires_at
+        self._schedule_token_refresh(expires_at - self.config.TOKEN_REFRESH_AHEAD - time.time())
+    
+    def _schedule_token_refresh(self, delay):
+        """安排后台刷新令牌（每个进程只保留一个定时器）"""
+        with self._token_timer_lock:
+            if self._token_timer is not None:
+                self._token_timer.cancel()
+            self._token_timer = threading.Timer(max(0.0, delay), self._background_token_refresh)
+            self._token_timer.daemon = True
+            self._token_timer.start()
     
-    def pdf_to_base64(self, pdf_path, urlencoded=False):
-        """将PDF文件转换为base64编码
+    def _background_token_refresh(self):
+        """后台提前刷新令牌，失败时稍后重试"""
+        self._refresh_access_token(min_ttl=self.config.TOKEN_REFRESH_AHEAD)
+        if self._token_expires_at - time.time() <= self.config.TOKEN_REFRESH_AHEAD:
+            self._schedule_token_refresh(self.config.TOKEN_REFRESH_RETRY_SECONDS)
+    
+    def _refresh_access_token(self, min_ttl=0):
+        """刷新访问令牌（single-flight）
+        
+        进程内通过线程锁、进程间通过共享存储中的刷新租约保证同一时间只有一个调用方请求TOKEN_URL，
+        其他调用方等待新令牌写入共享存储后直接使用。
         
         Args:
-            pdf_path: PDF文件路径
-            urlencoded: 是否对结果进行URL编码
+            min_ttl: 令牌剩余有效期不足该秒数时才需要刷新（后台提前刷新时使用）
             
         Returns:
-            str: base64编码的字符串
+            str: 有效的访问令牌，失败时返回None
+        """
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        deadline = time.monotonic() + self.config.TIMEOUT
+        
+        with self._token_lock:
+            while True:
+                token, expires_at = self._load_shared_token()
+                if token and expires_at - time.time() > min_ttl:
+                    self._remember_token(token, expires_at)
+                    return token
+                
+                try:
+                    locked = self.token_store.try_lock(owner, self.config.TIMEOUT)
+                except Exception as e:
+                    logger.warning(f"抢占访问令牌刷新租约失败，直接刷新: {str(e)}")
+                    locked = True
+                
+                if locked:
+                    new_token, new_expires_at = self._fetch_access_token()
+                    try:
+                        if new_token:
+                            self.token_store.store(new_token, new_expires_at, owner)
+                        else:
+                            self.token_store.release(owner)
+                    except Exception as e:
+                        logger.warning(f"写入共享访问令牌失败: {str(e)}")
+                    
+                    if new_token:
+                        self._remember_token(new_token, new_expires_at)
+                        return new_token
+                    # 刷新失败时，尚未过期的旧令牌仍可继续使用
+                    return token if token and time.time() < expires_at else None
+                
+                # 其他进程正在刷新，等待其写入新令牌
+                if time.monotonic() >= deadline:
+                    logger.error("等待其他进程刷新访问令牌超时")
+                    return token if token and time.time() < expires_at else None
+                time.sleep(0.2)
+    
+    def get_access_token(self):
+        """获取访问令牌
+        
+        依次从进程内存和跨进程共享存储读取，都没有有效令牌时才刷新；
+        令牌会在过期前 TOKEN_REFRESH_AHEAD 秒由后台线程提前刷新，识别请求无需等待令牌请求。
+        """
+        if self._access_token and time.time() < self._token_expires_at:
+            return self._access_token
+        
+        if not self.config.is_configured():
+            logger.error("百度OCR API密钥未配置")
+            return None
+        
+        token, expires_at = self._load_shared_token()
+        if token and time.time() < expires_at:
+            self._remember_token(token, expires_at)
+            return token
+        
+        return self._refresh_access_token()
+    
+    def invalidate_access_token(self, token=None):
+        """百度判定令牌无效或过期时清除令牌，下次请求时重新获取
+        
+        Args:
+            token: 被判定失效的令牌，默认为进程内当前令牌；进程内已换成其他令牌时不清除
+        """
+        if token is None:
+            token = self._access_token
+        if token == self._access_token:
+            self._access_token = None
+            self._token_expires_at = 0
+        if token:
+            try:
+                self.token_store.invalidate(token)
+            except Exception as e:
+                logger.warning(f"清除共享访问令牌失败: {str(e)}")
+    
+    def image_body(self, image_path):
+        """构造图片识别的流式请求体（图片先经过 ImageOptimizer 旋转、缩放和压缩）
+        
+        Returns:
+            Base64FormBody: image字段的请求体，读取失败时返回None
         """
         try:
-            with open(pdf_path, "rb") as f:
-                content = base64.b64encode(f.read()).decode("utf8")
-                if urlencoded:
-                    import urllib.parse
-                    content = urllib.parse.quote_plus(content)
-                return content
+            return Base64FormBody('image', ImageOptimizer.optimize_file(image_path))
         except Exception as e:
-            logger.error(f"PDF转换base64失败: {str(e)}")
+            logger.error(f"读取图片失败: {str(e)}")
             return None
     
-    def recognize_text(self, image_path, use_accurate=False):
+    def recognize_text(self, image_path, use_accurate=False, wait_timeout=None):
         """识别图片中的文字
         
         Args:
             image_path: 图片文件路径
             use_accurate: 是否使用高精度OCR（收费更高但准确率更高）
+            wait_timeout: 等待限流令牌的最长时间（秒），默认使用 RATE_LIMIT_WAIT_TIMEOUT
             
         Returns:
             tuple: (success, result_text, raw_response)
@@ -112,25 +510,23 @@ class BaiduOCRService:
         if not access_token:
             return False, "无法获取访问令牌", None
         
-        # 将图片转换为base64
-        image_base64 = self.image_to_base64(image_path)
-        if not image_base64:
+        # 图片以base64+URL编码流式发送
+        body = self.image_body(image_path)
+        if body is None:
             return False, "图片转换失败", None
         
         # 选择OCR接口
-        ocr_url = self.config.ACCURATE_OCR_URL if use_accurate else self.config.GENERAL_OCR_URL
-        request_url = f"{ocr_url}?access_token={access_token}"
+        ocr_url = self.config.get_url(self.config.ACCURATE_OCR_URL if use_accurate else self.config.GENERAL_OCR_URL)
         
-        # 准备请求参数
-        params = {"image": image_base64}
         headers = {'content-type': 'application/x-www-form-urlencoded'}
         
         try:
-            response = requests.post(
-                request_url,
-                data=params,
+            response = self._post_with_token(
+                ocr_url,
+                access_token,
+                data=body,
                 headers=headers,
-                timeout=self.config.TIMEOUT
+                wait_timeout=wait_timeout
             )
             
             if response.status_code == 200:
@@ -166,11 +562,12 @@ class BaiduOCRService:
             logger.error(f"OCR识别时发生未知错误: {str(e)}")
             return False, f"未知错误: {str(e)}", None
     
-    def recognize_vat_invoice(self, image_path):
+    def recognize_vat_invoice(self, image_path, wait_timeout=None):
         """识别增值税发票
         
         Args:
             image_path: 图片文件路径
+            wait_timeout: 等待限流令牌的最长时间（秒），默认使用 RATE_LIMIT_WAIT_TIMEOUT
             
         Returns:
             tuple: (success, structured_data, raw_response)
@@ -179,24 +576,23 @@ class BaiduOCRService:
         if not access_token:
             return False, None, None
         
-        # 将图片转换为base64
-        image_base64 = self.image_to_base64(image_path)
-        if not image_base64:
+        # 图片以base64+URL编码流式发送
+        body = self.image_body(image_path)
+        if body is None:
             return False, None, None
         
         # 使用增值税发票识别接口
-        request_url = f"{self.config.VAT_INVOICE_URL}?access_token={access_token}"
+        request_url = self.config.get_url(self.config.VAT_INVOICE_URL)
         
-        # 准备请求参数
-        params = {"image": image_base64}
         headers = {'content-type': 'application/x-www-form-urlencoded'}
         
         try:
-            response = requests.post(
+            response = self._post_with_token(
                 request_url,
-                data=params,
+                access_token,
+                data=body,
                 headers=headers,
-                timeout=self.config.TIMEOUT
+                wait_timeout=wait_timeout
             )
             
             if response.status_code == 200:
@@ -229,12 +625,14 @@ class BaiduOCRService:
             logger.error(f"增值税发票识别时发生未知错误: {str(e)}")
             return False, None, None
     
-    def recognize_vat_invoice_pdf(self, pdf_path, seal_tag=False):
+    def recognize_vat_invoice_pdf(self, pdf_path, seal_tag=False, wait_timeout=None, page_number=None):
         """识别PDF格式的增值税发票
         
         Args:
             pdf_path: PDF文件路径
             seal_tag: 是否检测印章（默认False）
+            wait_timeout: 等待限流令牌的最长时间（秒），默认使用 RATE_LIMIT_WAIT_TIMEOUT
+            page_number: 识别的页码（从1开始），默认只识别第1页
             
         Returns:
             tuple: (success, structured_data, raw_response)
@@ -243,27 +641,26 @@ class BaiduOCRService:
         if not access_token:
             return False, None, None
         
-        # 将PDF转换为base64（URL编码）
-        pdf_base64 = self.pdf_to_base64(pdf_path, urlencoded=True)
-        if not pdf_base64:
-            return False, None, None
-        
         # 使用增值税发票识别接口
-        request_url = f"{self.config.VAT_INVOICE_URL}?access_token={access_token}"
+        request_url = self.config.get_url(self.config.VAT_INVOICE_URL)
         
-        # 准备请求参数（按照百度官方示例格式）
-        payload = f'pdf_file={pdf_base64}&seal_tag={str(seal_tag).lower()}'
+        # 准备请求参数（按照百度官方示例格式），PDF按块base64+URL编码后流式发送
+        extra_fields = {'seal_tag': str(seal_tag).lower()}
+        if page_number:
+            extra_fields['pdf_file_num'] = page_number
+        payload = Base64FormBody('pdf_file', pdf_path, extra_fields=extra_fields)
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded',
             'Accept': 'application/json'
         }
         
         try:
-            response = requests.post(
+            response = self._post_with_token(
                 request_url,
-                headers=headers,
+                access_token,
                 data=payload,
-                timeout=self.config.TIMEOUT
+                headers=headers,
+                wait_timeout=wait_timeout
             )
             
             if response.status_code == 200:
@@ -389,6 +786,73 @@ class BaiduOCRService:
         
         return invoice_data
     
+    # 增值税发票识别结果字段对应的中文名称（用于生成原始文本）
+    VAT_FIELD_LABELS = {
+        'InvoiceType': '发票类型',
+        'InvoiceTypeOrg': '发票名称',
+        'InvoiceCode': '发票代码',
+        'InvoiceNum': '发票号码',
+        'InvoiceDate': '开票日期',
+        'CheckCode': '校验码',
+        'MachineCode': '机器编号',
+        'PurchaserName': '购买方名称',
+        'PurchaserRegisterNum': '购买方纳税人识别号',
+        'PurchaserAddress': '购买方地址电话',
+        'PurchaserBank': '购买方开户行及账号',
+        'CommodityName': '货物或应税劳务、服务名称',
+        'CommodityType': '规格型号',
+        'CommodityUnit': '单位',
+        'CommodityNum': '数量',
+        'CommodityPrice': '单价',
+        'CommodityAmount': '金额',
+        'CommodityTaxRate': '税率',
+        'CommodityTax': '税额',
+        'TotalAmount': '合计金额',
+        'TotalTax': '合计税额',
+        'AmountInWords': '价税合计(大写)',
+        'AmountInFiguers': '价税合计(小写)',
+        'SellerName': '销售方名称',
+        'SellerRegisterNum': '销售方纳税人识别号',
+        'SellerAddress': '销售方地址电话',
+        'SellerBank': '销售方开户行及账号',
+        'Payee': '收款人',
+        'Checker': '复核',
+        'NoteDrawer': '开票人',
+        'Remarks': '备注',
+    }
+    
+    def words_result_to_text(self, words_result):
+        """将增值税发票识别的words_result转换为逐行的原始文本
+        
+        图片识别成功后用它生成原始文本记录，避免再调用一次通用文字识别接口。
+        
+        Args:
+            words_result: 百度OCR返回的words_result字段
+            
+        Returns:
+            str: 每行一个字段的文本，如"发票号码: 12345678"
+        """
+        if not isinstance(words_result, dict):
+            return ''
+        
+        def field_text(field_data):
+            if isinstance(field_data, str):
+                return field_data.strip()
+            if isinstance(field_data, dict):
+                return str(field_data.get('words', field_data.get('word', ''))).strip()
+            if isinstance(field_data, list):
+                return ' '.join(filter(None, (field_text(item) for item in field_data)))
+            if field_data is None:
+                return ''
+            return str(field_data).strip()
+        
+        lines = []
+        for key, field_data in words_result.items():
+            value = field_text(field_data)
+            if value:
+                lines.append(f"{self.VAT_FIELD_LABELS.get(key, key)}: {value}")
+        return '\n'.join(lines)
+    
     def _convert_date_format(self, date_str):
         """将中文日期格式转换为YYYY-MM-DD格式
         
@@ -443,27 +907,170 @@ class BaiduOCRService:
             logger.error(f"日期格式转换失败: {date_str}, 错误: {str(e)}")
             return date_str
     
-    def batch_recognize(self, image_paths, use_accurate=False):
-        """批量识别多个图片
+    def recognize_vat_invoice_pdf_pages(self, pdf_path, page_numbers, time_budget=None, max_workers=None):
+        """并发识别PDF中的多个页面（每页一次请求，通过 pdf_file_num 指定页码）
+        
+        所有页面共享一个时间预算：等待限流令牌的时间不超过剩余预算，
+        预算用完时仍未完成的页面记为失败，不再等待其结果。
         
         Args:
-            image_paths: 图片文件路径列表
-            use_accurate: 是否使用高精度OCR
+            pdf_path: PDF文件路径
+            page_numbers: 需要识别的页码列表（从1开始）
+            time_budget: 时间预算（秒），默认使用 PDF_TIME_BUDGET
+            max_workers: 最大并发请求数，默认使用 BATCH_MAX_WORKERS
             
         Returns:
-            list: 每个图片的识别结果列表
+            dict: {页码: (success, structured_data, raw_response)}
+        """
+        page_numbers = list(page_numbers)
+        results = {page_number: (False, None, None) for page_number in page_numbers}
+        if not page_numbers:
+            return results
+        
+        time_budget = time_budget or self.config.get_pdf_time_budget()
+        deadline = time.monotonic() + time_budget
+        max_workers = max(1, min(len(page_numbers), max_workers or self.config.get_batch_max_workers()))
+        
+        def recognize_page(page_number):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False, None, None
+            return self.recognize_vat_invoice_pdf(pdf_path, wait_timeout=remaining, page_number=page_number)
+        
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='baidu-ocr-pdf')
+        try:
+            futures = {executor.submit(recognize_page, page_number): page_number for page_number in page_numbers}
+            done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+            for future in done:
+                page_number = futures[future]
+                try:
+                    results[page_number] = future.result()
+                except Exception as e:
+                    logger.error(f"PDF第{page_number}页识别时发生错误: {str(e)}")
+            if not_done:
+                unfinished = '、'.join(str(page_number) for page_number in sorted(futures[future] for future in not_done))
+                logger.warning(f"PDF识别超出时间预算（{time_budget}秒），第{unfinished}页未完成: {pdf_path}")
+        finally:
+            # 不等待超出预算的请求，已排队未开始的页面直接取消
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+    
+    def recognize_vat_invoice_file(self, file_path, wait_timeout=None):
+        """识别增值税发票文件，根据扩展名选择PDF或图片接口
+        
+        Returns:
+            tuple: (success, structured_data, raw_response)
+        """
+        if file_path.lower().endswith('.pdf'):
+            return self.recognize_vat_invoice_pdf(file_path, wait_timeout=wait_timeout)
+        return self.recognize_vat_invoice(file_path, wait_timeout=wait_timeout)
+    
+    def _iter_batch(self, func, items, max_workers=None):
+        """并发执行批量识别，按完成顺序逐个返回结果
+        
+        同时在途的请求数不超过max_workers，未提交的任务不会提前占用内存。
+        
+        Args:
+            func: 对单个元素执行的识别函数
+            items: 待识别的元素列表
+            max_workers: 最大并发请求数，默认使用 BATCH_MAX_WORKERS
+            
+        Yields:
+            tuple: (index, item, result 或 None, exception 或 None)
+        """
+        items = list(items)
+        max_workers = max(1, max_workers or self.config.get_batch_max_workers())
+        
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='baidu-ocr') as executor:
+            pending = {}
+            next_index = 0
+            while next_index < len(items) or pending:
+                while next_index < len(items) and len(pending) < max_workers:
+                    future = executor.submit(func, items[next_index])
+                    pending[future] = next_index
+                    next_index += 1
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        yield index, items[index], future.result(), None
+                    except Exception as e:
+                        logger.error(f"批量识别第 {index + 1} 个文件时发生错误: {str(e)}")
+                        yield index, items[index], None, e
+    
+    def iter_batch_recognize(self, image_paths, use_accurate=False, max_workers=None):
+        """并发识别多个图片中的文字，按完成顺序逐个返回结果
+        
+        Yields:
+            dict: 单个图片的识别结果，index为其在输入列表中的位置
         """
-        results = []
-        for image_path in image_paths:
-            success, text, raw_response = self.recognize_text(image_path, use_accurate)
-            results.append({
+        for index, image_path, result, error in self._iter_batch(
+            lambda path: self.recognize_text(path, use_accurate), image_paths, max_workers
+        ):
+            success, text, raw_response = result if result else (False, f"未知错误: {str(error)}", None)
+            yield {
+                'index': index,
                 'image_path': image_path,
                 'success': success,
                 'text': text,
                 'raw_response': raw_response
-            })
+            }
+    
+    def batch_recognize(self, image_paths, use_accurate=False, max_workers=None):
+        """批量识别多个图片
+        
+        Args:
+            image_paths: 图片文件路径列表
+            use_accurate: 是否使用高精度OCR
+            max_workers: 最大并发请求数，默认使用 BATCH_MAX_WORKERS
             
-            # 添加小延迟避免请求过于频繁
-            time.sleep(0.1)
+        Returns:
+            list: 每个图片的识别结果列表（与输入顺序一致）
+        """
+        results = list(self.iter_batch_recognize(image_paths, use_accurate, max_workers))
+        return sorted(results, key=lambda item: item['index'])
+    
+    def iter_batch_recognize_vat_invoice(self, file_paths, max_workers=None):
+        """并发识别多个增值税发票文件（图片或PDF），按完成顺序逐个返回结果
+        
+        Yields:
+            dict: 单个文件的识别结果，index为其在输入列表中的位置
+        """
+        for index, file_path, result, error in self._iter_batch(
+            self.recognize_vat_invoice_file, file_paths, max_workers
+        ):
+            success, invoice_data, raw_response = result if result else (False, None, None)
+            yield {
+                'index': index,
+                'file_path': file_path,
+                'success': success,
+                'invoice_data': invoice_data,
+                'raw_response': raw_response
+            }
+    
+    def batch_recognize_vat_invoice(self, file_paths, max_workers=None):
+        """批量识别增值税发票文件（图片或PDF）
         
-        return results
\ No newline at end of file
+        Args:
+            file_paths: 文件路径列表
+            max_workers: 最大并发请求数，默认使用 BATCH_MAX_WORKERS
+            
+        Returns:
+            list: 每个文件的识别结果列表（与输入顺序一致）
+        """
+        results = list(self.iter_batch_recognize_vat_invoice(file_paths, max_workers))
+        return sorted(results, key=lambda item: item['index'])
+
+_service_instance = None
+_service_lock = threading.Lock()
+
+
+def get_ocr_service():
+    """获取进程内共享的BaiduOCRService实例（共享连接池与统计信息）"""
+    global _service_instance
+    if _service_instance is None:
+        with _service_lock:
+            if _service_instance is None:
+                _service_instance = BaiduOCRService()
+    return _service_instance
@@ -0,0 +1,169 @@
+# encoding:utf-8
+"""
+跨进程共享的熔断器
+
+百度OCR响应缓慢或不可用时，每个识别线程都要等满超时才失败。熔断器记录连续失败次数
+（超时、5xx、服务端错误码，以及耗时超过阈值的慢请求），达到阈值后进入OPEN状态，
+此后的请求直接失败，识别改走本地引擎；经过 reset_timeout 后进入HALF_OPEN状态，
+只放行一个探测请求，探测成功则恢复CLOSED，失败则重新OPEN。
+
+熔断状态保存在本机的SQLite状态文件中，所有gunicorn进程和后台识别进程共享同一个熔断器。
+"""
+
+import logging
+import time
+
+from .sqlite_state import SQLiteStateStore
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCircuitBreaker(SQLiteStateStore):
+    """基于SQLite文件的熔断器"""
+
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS circuit_breaker ('
+        'name TEXT PRIMARY KEY, state TEXT NOT NULL, failures INTEGER NOT NULL DEFAULT 0, '
+        'opened_until REAL NOT NULL DEFAULT 0, probe_until REAL NOT NULL DEFAULT 0, '
+        'last_error TEXT, updated_at REAL NOT NULL DEFAULT 0)',
+    )
+
+    def __init__(self, db_path, name='default', failure_threshold=5, slow_call_seconds=10.0,
+                 reset_timeout=60.0, probe_timeout=60.0):
+        """
+        Args:
+            db_path: SQLite状态文件路径（所有进程需使用同一路径）
+            name: 熔断器名称，同一文件中可保存多个熔断器
+            failure_threshold: 连续失败多少次后熔断
+            slow_call_seconds: 单次请求耗时超过该值时计为失败，0表示不统计慢请求
+            reset_timeout: 熔断后多少秒放行探测请求
+            probe_timeout: 探测请求的最长时间（秒），超时未回报结果时允许下一个探测请求
+        """
+        super().__init__(db_path)
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.slow_call_seconds = float(slow_call_seconds or 0)
+        self.reset_timeout = float(reset_timeout)
+        self.probe_timeout = float(probe_timeout)
+
+    def _init_schema(self, conn):
+        super()._init_schema(conn)
+        conn.execute(
+            'INSERT OR IGNORE INTO circuit_breaker (name, state) VALUES (?, ?)', (self.name, self.CLOSED)
+        )
+
+    def _read(self, conn):
+        return conn.execute(
+            'SELECT state, failures, opened_until, probe_until FROM circuit_breaker WHERE name = ?', (self.name,)
+        ).fetchone()
+
+    def allow_request(self):
+        """当前是否允许请求
+
+        CLOSED时放行；OPEN且未到恢复时间时拒绝；到达恢复时间后转为HALF_OPEN，
+        只有抢到探测机会的一个请求被放行。
+
+        Returns:
+            bool: 是否允许请求
+        """
+        conn = self._connect()
+        state, _, opened_until, probe_until = self._read(conn)
+        if state == self.CLOSED:
+            return True
+        now = time.time()
+        if state == self.OPEN and now < opened_until:
+            return False
+        if state == self.HALF_OPEN and now < probe_until:
+            return False
+        # 由OPEN转为HALF_OPEN（或上一个探测请求超时未回报）：带条件更新，只有一个进程能抢到探测机会
+        updated = conn.execute(
+            'UPDATE circuit_breaker SET state = ?, probe_until = ?, updated_at = ? '
+            'WHERE name = ? AND state = ? AND opened_until = ? AND probe_until = ?',
+            (self.HALF_OPEN, now + self.probe_timeout, now, self.name, state, opened_until, probe_until)
+        ).rowcount
+        if updated:
+            logger.info(f"熔断器 {self.name} 进入半开状态，放行探测请求")
+        return bool(updated)
+
+    def record_success(self, elapsed=0.0):
+        """记录一次成功的请求，耗时超过 slow_call_seconds 时按失败处理"""
+        if self.slow_call_seconds and elapsed >= self.slow_call_seconds:
+            self.record_failure(f"慢请求（{elapsed:.1f}秒）")
+            return
+        conn = self._connect()
+        state, failures, _, _ = self._read(conn)
+        if state == self.CLOSED and not failures:
+            return
+        conn.execute(
+            'UPDATE circuit_breaker SET state = ?, failures = 0, opened_until = 0, probe_until = 0, '
+            'updated_at = ? WHERE name = ?',
+            (self.CLOSED, time.time(), self.name)
+        )
+        if state != self.CLOSED:
+            logger.info(f"熔断器 {self.name} 探测请求成功，恢复正常")
+
+    def record_failure(self, reason=''):
+        """记录一次失败的请求，连续失败达到阈值或探测请求失败时熔断"""
+        with self.immediate_transaction() as conn:
+            now = time.time()
+            state, failures, _, _ = self._read(conn)
+            failures += 1
+            if state == self.HALF_OPEN or failures >= self.failure_threshold:
+                conn.execute(
+                    'UPDATE circuit_breaker SET state = ?, failures = ?, opened_until = ?, probe_until = 0, '
+                    'last_error = ?, updated_at = ? WHERE name = ?',
+                    (self.OPEN, failures, now + self.reset_timeout, reason, now, self.name)
+                )
+                if state != self.OPEN:
+                    logger.warning(
+                        f"熔断器 {self.name} 打开（连续失败 {failures} 次，最近原因: {reason}），"
+                        f"{self.reset_timeout:.0f}秒后探测恢复"
+                    )
+            else:
+                conn.execute(
+                    'UPDATE circuit_breaker SET failures = ?, last_error = ?, updated_at = ? WHERE name = ?',
+                    (failures, reason, now, self.name)
+                )
+
+    def would_allow(self):
+        """当前是否可能放行请求（只读取状态，不占用半开状态下的探测机会）"""
+        state, _, opened_until, probe_until = self._read(self._connect())
+        if state == self.CLOSED:
+            return True
+        now = time.time()
+        return now >= (opened_until if state == self.OPEN else probe_until)
+
+    def is_open(self):
+        """熔断器是否处于打开状态（含半开状态下等待探测结果）"""
+        return self._read(self._connect())[0] != self.CLOSED
+
+    def reset(self):
+        """手动恢复为CLOSED状态"""
+        self._connect().execute(
+            'UPDATE circuit_breaker SET state = ?, failures = 0, opened_until = 0, probe_until = 0, '
+            'last_error = NULL, updated_at = ? WHERE name = ?',
+            (self.CLOSED, time.time(), self.name)
+        )
+
+    def get_state(self):
+        """熔断器状态
+
+        Returns:
+            dict: state、连续失败次数、恢复探测时间（时间戳）、最近失败原因、状态更新时间
+        """
+        row = self._connect().execute(
+            'SELECT state, failures, opened_until, last_error, updated_at FROM circuit_breaker WHERE name = ?',
+            (self.name,)
+        ).fetchone()
+        state, failures, opened_until, last_error, updated_at = row
+        return {
+            'state': state,
+            'failures': failures,
+            'opened_until': opened_until if state == self.OPEN else None,
+            'last_error': last_error or '',
+            'updated_at': updated_at,
+        }
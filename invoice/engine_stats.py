@@ -0,0 +1,91 @@
+# encoding:utf-8
+"""
+跨进程共享的识别引擎统计
+
+记录每个识别引擎在每类文档上的成功率和平均耗时，供识别路由选择引擎。统计值为滑动平均：
+前 window 次取算术平均，之后每次结果按 1/window 的权重计入，较早的结果逐渐失去影响。
+
+统计保存在本机的SQLite状态文件中，所有gunicorn进程和后台识别进程共用一份，
+进程重启后不需要重新积累。
+"""
+
+import logging
+import time
+
+from .sqlite_state import SQLiteStateStore
+
+logger = logging.getLogger(__name__)
+
+
+class EngineStatsStore(SQLiteStateStore):
+    """基于SQLite文件的识别引擎滑动统计"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS ocr_engine_stats ('
+        'engine TEXT NOT NULL, doc_type TEXT NOT NULL, samples INTEGER NOT NULL DEFAULT 0, '
+        'success_rate REAL NOT NULL DEFAULT 0, latency REAL NOT NULL DEFAULT 0, '
+        'updated_at REAL NOT NULL DEFAULT 0, PRIMARY KEY (engine, doc_type))',
+    )
+
+    def __init__(self, db_path, window=50):
+        """
+        Args:
+            db_path: SQLite状态文件路径（所有进程需使用同一路径）
+            window: 滑动平均的窗口大小（次）
+        """
+        super().__init__(db_path)
+        self.window = max(1, int(window))
+
+    def record(self, engine, doc_type, success, latency):
+        """记录一次识别结果
+
+        Args:
+            engine: 引擎名称
+            doc_type: 文档类型
+            success: 是否得到完整结果
+            latency: 耗时（秒）
+        """
+        with self.immediate_transaction() as conn:
+            row = conn.execute(
+                'SELECT samples, success_rate, latency FROM ocr_engine_stats WHERE engine = ? AND doc_type = ?',
+                (engine, doc_type)
+            ).fetchone()
+            samples, success_rate, avg_latency = row or (0, 0.0, 0.0)
+            samples += 1
+            weight = 1.0 / min(samples, self.window)
+            success_rate += ((1.0 if success else 0.0) - success_rate) * weight
+            avg_latency += (latency - avg_latency) * weight
+            conn.execute(
+                'INSERT OR REPLACE INTO ocr_engine_stats '
+                '(engine, doc_type, samples, success_rate, latency, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (engine, doc_type, samples, success_rate, avg_latency, time.time())
+            )
+
+    def get(self, engine, doc_type):
+        """读取引擎在某类文档上的统计
+
+        Returns:
+            tuple: (样本数, 成功率, 平均耗时秒数)，没有记录时返回(0, 0.0, 0.0)
+        """
+        row = self._connect().execute(
+            'SELECT samples, success_rate, latency FROM ocr_engine_stats WHERE engine = ? AND doc_type = ?',
+            (engine, doc_type)
+        ).fetchone()
+        return tuple(row) if row else (0, 0.0, 0.0)
+
+    def get_all(self):
+        """全部统计
+
+        Returns:
+            list: 按文档类型、引擎排序的dict（engine、doc_type、samples、success_rate、latency、updated_at）
+        """
+        rows = self._connect().execute(
+            'SELECT engine, doc_type, samples, success_rate, latency, updated_at FROM ocr_engine_stats '
+            'ORDER BY doc_type, engine'
+        ).fetchall()
+        keys = ('engine', 'doc_type', 'samples', 'success_rate', 'latency', 'updated_at')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def reset(self):
+        """清空统计"""
+        self._connect().execute('DELETE FROM ocr_engine_stats')
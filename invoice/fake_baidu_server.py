@@ -0,0 +1,226 @@
+# encoding:utf-8
+"""
+本地百度OCR模拟服务
+
+用于在不消耗百度OCR额度的情况下压测识别链路，模拟以下接口：
+
+- /oauth/2.0/token                 获取访问令牌
+- /rest/2.0/ocr/v1/general_basic   通用文字识别
+- /rest/2.0/ocr/v1/accurate_basic  通用文字识别（高精度版）
+- /rest/2.0/ocr/v1/vat_invoice     增值税发票识别
+
+可配置响应延迟、随机错误率以及QPS限制（超出时返回错误码18）。
+将 BAIDU_OCR_BASE_URL 设置为模拟服务地址后，BaiduOCRService 的请求会发往本地。
+"""
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+SELLERS = [
+    ('北京星辰科技有限公司', '91110108MA01ABCD1X'),
+    ('上海云帆信息技术有限公司', '91310115MA1HXYZ23K'),
+    ('深圳前海数智服务有限公司', '91440300MA5F6789QW'),
+    ('杭州西湖餐饮管理有限公司', '91330106MA2CDEF45L'),
+]
+BUYERS = [
+    ('示例科技股份有限公司', '91110000100012345A'),
+    ('示例贸易有限公司', '91310000200023456B'),
+]
+COMMODITIES = ['*信息技术服务*技术服务费', '*餐饮服务*餐费', '*办公用品*打印纸', '*运输服务*客运服务费']
+
+
+def fake_vat_words_result(seed):
+    """根据种子生成与百度增值税发票识别格式一致的 words_result（同一文件内容结果固定）"""
+    rng = random.Random(seed)
+    seller_name, seller_tax_id = rng.choice(SELLERS)
+    buyer_name, buyer_tax_id = rng.choice(BUYERS)
+    amount = round(rng.uniform(50, 20000), 2)
+    tax_rate = rng.choice([0.01, 0.03, 0.06, 0.13])
+    tax = round(amount * tax_rate, 2)
+    total = round(amount + tax, 2)
+    special = rng.random() < 0.3
+    commodity = rng.choice(COMMODITIES)
+    return {
+        'InvoiceType': '电子专用发票' if special else '电子普通发票',
+        'InvoiceTypeOrg': '电子发票（增值税专用发票）' if special else '电子发票（普通发票）',
+        'InvoiceCode': '',
+        'InvoiceNum': str(rng.randint(10 ** 19, 10 ** 20 - 1)),
+        'InvoiceDate': f'{rng.randint(2023, 2025)}年{rng.randint(1, 12):02d}月{rng.randint(1, 28):02d}日',
+        'CheckCode': '',
+        'MachineCode': '',
+        'PurchaserName': buyer_name,
+        'PurchaserRegisterNum': buyer_tax_id,
+        'PurchaserAddress': '',
+        'PurchaserBank': '',
+        'SellerName': seller_name,
+        'SellerRegisterNum': seller_tax_id,
+        'SellerAddress': '',
+        'SellerBank': '',
+        'CommodityName': [{'row': '1', 'word': commodity}],
+        'CommodityAmount': [{'row': '1', 'word': f'{amount:.2f}'}],
+        'CommodityTaxRate': [{'row': '1', 'word': f'{int(tax_rate * 100)}%'}],
+        'CommodityTax': [{'row': '1', 'word': f'{tax:.2f}'}],
+        'TotalAmount': f'{amount:.2f}',
+        'TotalTax': f'{tax:.2f}',
+        'AmountInWords': '',
+        'AmountInFiguers': f'{total:.2f}',
+        'Payee': '',
+        'Checker': '',
+        'NoteDrawer': rng.choice(['张三', '李四', '王五']),
+        'Remarks': '',
+    }
+
+
+def fake_general_words_result(seed):
+    """生成通用文字识别格式的 words_result（按行列出发票内容）"""
+    words_result = fake_vat_words_result(seed)
+    lines = [
+        words_result['InvoiceTypeOrg'],
+        f"发票号码: {words_result['InvoiceNum']}",
+        f"开票日期: {words_result['InvoiceDate']}",
+        f"购买方名称: {words_result['PurchaserName']}",
+        f"统一社会信用代码/纳税人识别号: {words_result['PurchaserRegisterNum']}",
+        f"销售方名称: {words_result['SellerName']}",
+        f"统一社会信用代码/纳税人识别号: {words_result['SellerRegisterNum']}",
+        words_result['CommodityName'][0]['word'],
+        f"合计 ¥{words_result['TotalAmount']} ¥{words_result['TotalTax']}",
+        f"价税合计（小写）¥{words_result['AmountInFiguers']}",
+    ]
+    return [{'words': line} for line in lines]
+
+
+class FakeBaiduOCRServer:
+    """本地百度OCR模拟服务"""
+
+    ACCESS_TOKEN = 'fake-access-token'
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.2, jitter=0.05, error_rate=0.0, qps_limit=0):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机分配
+            latency: 识别接口的平均响应延迟（秒）
+            jitter: 响应延迟的标准差（秒）
+            error_rate: 随机错误率（0~1），一半返回HTTP 500，一半返回错误码282000
+            qps_limit: 每秒允许的识别请求数，超出时返回错误码18，0表示不限制
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.qps_limit = qps_limit
+        self._lock = threading.Lock()
+        self._recent = deque()
+        self.stats = {'token': 0, 'requests': 0, 'rate_limited': 0, 'errors': 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _incr(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _over_qps_limit(self):
+        """按最近1秒的请求数判断是否超出QPS限制"""
+        if not self.qps_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] >= 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.qps_limit:
+                return True
+            self._recent.append(now)
+            return False
+
+    def handle(self, path, query, body):
+        """处理请求
+
+        Returns:
+            tuple: (HTTP状态码, 响应数据dict)
+        """
+        if path == '/oauth/2.0/token':
+            self._incr('token')
+            return 200, {'access_token': self.ACCESS_TOKEN, 'expires_in': 2592000}
+
+        if path not in ('/rest/2.0/ocr/v1/general_basic', '/rest/2.0/ocr/v1/accurate_basic',
+                        '/rest/2.0/ocr/v1/vat_invoice'):
+            return 404, {'error_code': 3, 'error_msg': 'Unsupported openapi method'}
+
+        self._incr('requests')
+        if query.get('access_token', [''])[0] != self.ACCESS_TOKEN:
+            return 200, {'error_code': 110, 'error_msg': 'Access token invalid or no longer valid'}
+        if self._over_qps_limit():
+            self._incr('rate_limited')
+            return 200, {'error_code': 18, 'error_msg': 'Open api qps request limit reached'}
+
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            self._incr('errors')
+            if random.random() < 0.5:
+                return 500, {'error_msg': 'Internal Server Error'}
+            return 200, {'error_code': 282000, 'error_msg': 'internal error'}
+
+        form = parse_qs(body.decode('ascii', 'ignore'))
+        content = (form.get('image') or form.get('pdf_file') or [''])[0]
+        # 多页PDF的不同页面返回不同的发票（未指定页码时与第1页相同）
+        page_number = form.get('pdf_file_num', ['1'])[0]
+        if page_number != '1':
+            content += f':p{page_number}'
+        seed = hashlib.sha256(content.encode('ascii', 'ignore')).hexdigest()
+        log_id = random.randint(10 ** 17, 10 ** 18 - 1)
+        if path.endswith('/vat_invoice'):
+            words_result = fake_vat_words_result(seed)
+            return 200, {'log_id': log_id, 'words_result_num': len(words_result), 'words_result': words_result}
+        words_result = fake_general_words_result(seed)
+        return 200, {'log_id': log_id, 'words_result_num': len(words_result), 'words_result': words_result}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                parts = urlsplit(self.path)
+                status, data = server.handle(parts.path, parse_qs(parts.query), body)
+                payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json;charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -98,7 +98,8 @@ class InvoiceForm(forms.ModelForm):
             # 使用total_amount进行重复检查
             check_amount = cleaned_data.get('total_amount') or (cleaned_data.get('amount', 0) + cleaned_data.get('tax_amount', 0))
             
-            if InvoiceValidator.check_duplicate(invoice_number, seller_name, check_amount, invoice_date):
+            if InvoiceValidator.check_duplicate(invoice_number, seller_name, check_amount, invoice_date,
+                                                seller_tax_id=cleaned_data.get('seller_tax_id')):
                 raise ValidationError('该发票已存在（发票号码、销售方、金额、日期匹配）')
         
         # 验证金额计算
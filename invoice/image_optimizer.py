@@ -0,0 +1,188 @@
+# encoding:utf-8
+"""
+OCR上传前的图片优化
+
+手机拍摄的发票照片通常有6~12MB，直接base64上传既慢，也可能超过百度接口的大小限制
+（base64编码后不超过4MB，最长边不超过4096px）。上传前在内存中完成以下处理，不写临时文件：
+
+1. 按EXIF方向信息旋转图片
+2. 将最长边缩小到 MAX_LONG_EDGE
+3. 图片本身接近黑白时转为灰度（去掉色度通道，体积更小且不损失信息）
+4. 以JPEG重新编码，逐步降低质量直到不超过 MAX_BYTES
+
+原图已经足够小且无需旋转、缩放时直接使用原图。
+"""
+
+import io
+import logging
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image, ImageOps, ImageStat
+
+logger = logging.getLogger(__name__)
+
+
+class ImageOptimizer:
+    """上传OCR前的图片优化器"""
+
+    ENABLED = getattr(settings, 'OCR_IMAGE_OPTIMIZE', True)
+    # 缩放后的最长边（像素）
+    MAX_LONG_EDGE = getattr(settings, 'OCR_IMAGE_MAX_LONG_EDGE', 2400)
+    # 重新编码后的字节数上限（base64编码后约为4/3倍）
+    MAX_BYTES = getattr(settings, 'OCR_IMAGE_MAX_BYTES', 2 * 1024 * 1024)
+    # 平均饱和度低于该值（0~255）时视为黑白图片，转为灰度
+    GRAYSCALE_SATURATION = 24
+    # 依次尝试的JPEG质量
+    JPEG_QUALITIES = (85, 75, 65, 50)
+    # 降低质量仍超出字节上限时，每轮缩小的比例及最长边下限
+    SHRINK_FACTOR = 0.8
+    MIN_LONG_EDGE = 1000
+
+    _lock = threading.Lock()
+    _stats = {
+        'images': 0, 'optimized': 0, 'skipped': 0, 'errors': 0,
+        'bytes_in': 0, 'bytes_out': 0, 'optimize_seconds': 0.0,
+    }
+
+    @classmethod
+    def _record(cls, original_size, optimized_size, elapsed, optimized):
+        with cls._lock:
+            cls._stats['images'] += 1
+            cls._stats['optimized' if optimized else 'skipped'] += 1
+            cls._stats['bytes_in'] += original_size
+            cls._stats['bytes_out'] += optimized_size
+            cls._stats['optimize_seconds'] += elapsed
+
+    @classmethod
+    def _needs_rotation(cls, image):
+        """EXIF中是否记录了需要旋转/翻转的方向"""
+        try:
+            return image.getexif().get(0x0112, 1) not in (0, 1)
+        except Exception:
+            return False
+
+    @classmethod
+    def _is_grayscale_like(cls, image):
+        """图片是否接近黑白（按缩略图的平均饱和度判断）"""
+        if image.mode in ('L', '1'):
+            return True
+        thumbnail = image.copy()
+        thumbnail.thumbnail((256, 256))
+        saturation = ImageStat.Stat(thumbnail.convert('HSV')).mean[1]
+        return saturation < cls.GRAYSCALE_SATURATION
+
+    @staticmethod
+    def _to_rgb(image):
+        """转换为JPEG可编码的模式，透明背景铺白"""
+        if image.mode in ('RGB', 'L'):
+            return image
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            return background
+        return image.convert('RGB')
+
+    @staticmethod
+    def _resize(image, long_edge):
+        width, height = image.size
+        scale = long_edge / max(width, height)
+        if scale >= 1:
+            return image
+        return image.resize(
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            Image.Resampling.LANCZOS
+        )
+
+    @classmethod
+    def _encode(cls, image):
+        """以JPEG编码，逐步降低质量直至不超过MAX_BYTES，返回最后一次的编码结果"""
+        data = b''
+        for quality in cls.JPEG_QUALITIES:
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+            data = buffer.getvalue()
+            if len(data) <= cls.MAX_BYTES:
+                break
+        return data
+
+    @classmethod
+    def optimize_bytes(cls, data):
+        """优化图片内容
+
+        Args:
+            data: 原始图片字节
+
+        Returns:
+            tuple: (优化后的图片字节, 是否进行了优化)；无法解码或优化无收益时返回原始字节
+        """
+        image = Image.open(io.BytesIO(data))
+        image.load()
+
+        rotate = cls._needs_rotation(image)
+        oversized = max(image.size) > cls.MAX_LONG_EDGE
+        if not rotate and not oversized and len(data) <= cls.MAX_BYTES:
+            return data, False
+
+        if rotate:
+            image = ImageOps.exif_transpose(image)
+        image = cls._to_rgb(image)
+        if image.mode != 'L' and cls._is_grayscale_like(image):
+            image = image.convert('L')
+
+        long_edge = min(max(image.size), cls.MAX_LONG_EDGE)
+        image = cls._resize(image, long_edge)
+        optimized = cls._encode(image)
+        while len(optimized) > cls.MAX_BYTES and long_edge > cls.MIN_LONG_EDGE:
+            long_edge = max(cls.MIN_LONG_EDGE, int(long_edge * cls.SHRINK_FACTOR))
+            image = cls._resize(image, long_edge)
+            optimized = cls._encode(image)
+
+        # 原图无需旋转、缩放时，重新编码没有变小就保留原图
+        if not rotate and not oversized and len(optimized) >= len(data):
+            return data, False
+        return optimized, True
+
+    @classmethod
+    def optimize_file(cls, image_path):
+        """读取并优化图片文件
+
+        Args:
+            image_path: 图片文件路径
+
+        Returns:
+            bytes: 用于上传OCR的图片内容
+        """
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        if not cls.ENABLED:
+            return data
+
+        start = time.perf_counter()
+        try:
+            optimized, changed = cls.optimize_bytes(data)
+        except Exception as e:
+            logger.warning(f"图片优化失败，使用原图上传 {image_path}: {str(e)}")
+            with cls._lock:
+                cls._stats['errors'] += 1
+            return data
+        elapsed = time.perf_counter() - start
+
+        cls._record(len(data), len(optimized), elapsed, changed)
+        if changed:
+            logger.info(
+                f"图片优化: {image_path} {len(data) / 1024:.0f}KB -> {len(optimized) / 1024:.0f}KB，"
+                f"耗时 {elapsed * 1000:.0f}ms"
+            )
+        return optimized
+
+    @classmethod
+    def get_stats(cls):
+        """优化统计：处理的图片数、节省的字节数及优化耗时"""
+        with cls._lock:
+            stats = dict(cls._stats)
+        stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+        stats['saved_ratio'] = round(stats['bytes_saved'] / stats['bytes_in'], 4) if stats['bytes_in'] else 0.0
+        return stats
@@ -0,0 +1,212 @@
+# encoding:utf-8
+"""
+发票批量录入
+
+批量确认识别结果、手动填写发票信息和识别后自动确认原先逐张执行重复检查、invoice.save()
+和 recognition.save()，每张发票要4次以上查询，且各自在自动提交的事务中执行，SQLite下
+确认几百张发票需要上千次提交。
+
+InvoiceIngestion 先逐行校验（表单提交的字符串按模型字段转换），用一次查询检查整批发票
+是否重复，再在一个事务中 bulk_create 发票、bulk_update 识别记录，并批量完成 save() 和
+signals 原本逐张完成的工作：关联交易方、计算指纹、更新月度汇总和搜索索引。
+校验失败或重复的行不保存，逐行返回原因。
+"""
+
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, models, transaction
+from django.utils import timezone
+
+from .models import Invoice, InvoiceMonthlyRollup, InvoiceRecognition, Party
+from .search_index import InvoiceSearchIndex
+from .utils import InvoiceValidator
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionResult:
+    """批量录入的结果"""
+
+    def __init__(self):
+        # 创建的发票（已有主键）
+        self.created = []
+        # 未保存的行：[{'label': 行的名称（如文件名）, 'error': 原因}]
+        self.errors = []
+
+    def add_error(self, row, error):
+        self.errors.append({'label': row.get('label'), 'error': error})
+
+
+class InvoiceIngestion:
+    """发票批量录入服务"""
+
+    # 按模型字段校验和转换的发票字段
+    CLEAN_FIELDS = [
+        'invoice_number', 'invoice_content', 'invoice_date', 'invoice_type', 'amount', 'tax_amount',
+        'total_amount', 'seller_name', 'seller_tax_id', 'buyer_name', 'buyer_tax_id', 'status',
+    ]
+    REQUIRED_FIELDS = ['invoice_number', 'invoice_date', 'invoice_type', 'amount']
+    # 校验存在性的外键（每种一次查询）
+    REFERENCE_FIELDS = ['category', 'company']
+    BATCH_SIZE = 500
+
+    @classmethod
+    def ingest(cls, rows):
+        """校验、去重并在一个事务中保存一批发票
+
+        Args:
+            rows: dict 列表，每行包含：
+                invoice: 未保存的 Invoice（字段值可以是表单提交的字符串）
+                recognition: 识别记录（可选），保存后关联到新发票
+                recognition_status: 识别记录的新状态（可选）
+                label: 出错时显示的名称（如文件名）
+
+        Returns:
+            IngestionResult: 数据库写入失败时整批回滚，每行都记为错误
+        """
+        result = IngestionResult()
+        valid = []
+        for row in rows:
+            error = cls._clean(row['invoice'])
+            if error:
+                result.add_error(row, error)
+            else:
+                valid.append(row)
+        valid = cls._check_references(valid, result)
+
+        duplicates = InvoiceValidator.find_duplicates([
+            {name: getattr(row['invoice'], name) for name in Invoice.FINGERPRINT_FIELDS} for row in valid
+        ], match_numbers=True)
+        for position, error in duplicates.items():
+            result.add_error(valid[position], error)
+        valid = [row for position, row in enumerate(valid) if position not in duplicates]
+        if not valid:
+            return result
+
+        try:
+            with transaction.atomic():
+                cls._save(valid)
+        except DatabaseError as e:
+            logger.error(f"批量保存发票失败，已回滚 {len(valid)} 张: {str(e)}")
+            for row in valid:
+                row['invoice'].pk = None
+                result.add_error(row, f'保存失败: {str(e)}')
+            return result
+
+        result.created = [row['invoice'] for row in valid]
+        return result
+
+    @classmethod
+    def _clean(cls, invoice):
+        """按模型字段校验并转换发票字段，补全价税合计和指纹
+
+        Returns:
+            str: 错误信息，校验通过时为None
+        """
+        for name in cls.CLEAN_FIELDS:
+            field = invoice._meta.get_field(name)
+            value = getattr(invoice, field.attname)
+            if isinstance(value, str):
+                value = value.strip()
+            if value is None or value == '':
+                if name in cls.REQUIRED_FIELDS:
+                    return f'{field.verbose_name}不能为空'
+                if (value is None and not field.null) or (value == '' and not field.blank):
+                    value = field.get_default() if field.has_default() else ''
+                setattr(invoice, field.attname, value)
+                continue
+            try:
+                if isinstance(field, models.DecimalField):
+                    # 与 save() 写入时相同，按字段的小数位数四舍五入
+                    value = field.to_python(value).quantize(
+                        Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP
+                    )
+                setattr(invoice, field.attname, field.clean(value, invoice))
+            except ValidationError as e:
+                return f"{field.verbose_name}: {'；'.join(e.messages)}"
+        invoice.fill_computed_fields()
+        return None
+
+    @classmethod
+    def _check_references(cls, rows, result):
+        """类别、所属公司不存在的行记为错误
+
+        Returns:
+            list: 其余的行
+        """
+        for name in cls.REFERENCE_FIELDS:
+            field = Invoice._meta.get_field(name)
+            values = {}
+            for row in rows:
+                value = getattr(row['invoice'], field.attname)
+                if value in (None, ''):
+                    setattr(row['invoice'], field.attname, None)
+                    continue
+                try:
+                    values[id(row)] = field.target_field.to_python(value)
+                except ValidationError:
+                    values[id(row)] = None
+            if not values:
+                continue
+            existing = set(
+                field.related_model.objects.filter(pk__in={value for value in values.values() if value is not None})
+                .values_list('pk', flat=True)
+            )
+            remaining = []
+            for row in rows:
+                if id(row) not in values:
+                    remaining.append(row)
+                elif values[id(row)] in existing:
+                    setattr(row['invoice'], field.attname, values[id(row)])
+                    remaining.append(row)
+                else:
+                    result.add_error(row, f'{field.verbose_name}不存在')
+            rows = remaining
+        return rows
+
+    @classmethod
+    def _save(cls, rows):
+        """批量创建发票并更新识别记录（须在事务中调用）"""
+        invoices = [row['invoice'] for row in rows]
+        for role in ('seller', 'buyer'):
+            parties = Party.resolve_many(
+                [(getattr(invoice, f'{role}_tax_id'), getattr(invoice, f'{role}_name')) for invoice in invoices], role
+            )
+            for invoice, party in zip(invoices, parties):
+                setattr(invoice, role, party)
+
+        Invoice.objects.bulk_create(invoices, batch_size=cls.BATCH_SIZE)
+        # SQLite下 bulk_create 不回填主键，按（唯一的）发票号码取回
+        ids = dict(
+            Invoice.objects.filter(invoice_number__in=[invoice.invoice_number for invoice in invoices])
+            .values_list('invoice_number', 'pk')
+        )
+        for invoice in invoices:
+            invoice.pk = ids[invoice.invoice_number]
+            invoice._state.adding = False
+            invoice._state.db = Invoice.objects.db
+
+        now = timezone.now()
+        recognitions = []
+        for row in rows:
+            recognition = row.get('recognition')
+            if recognition is None:
+                continue
+            recognition.invoice = row['invoice']
+            recognition.status = row.get('recognition_status') or recognition.status
+            recognition.updated_at = now
+            recognitions.append(recognition)
+        InvoiceRecognition.objects.bulk_update(recognitions, ['invoice', 'status', 'updated_at'], batch_size=cls.BATCH_SIZE)
+
+        # 发票上的名称与规范名称不同时标记规范名称待重新统计（与 Invoice.save() 相同）
+        Party.mark_name_stale([
+            pair for invoice in invoices
+            for pair in ((invoice.seller, invoice.seller_name), (invoice.buyer, invoice.buyer_name))
+        ])
+
+        # bulk_create 不发送保存信号，在同一事务中更新月度汇总和搜索索引
+        InvoiceMonthlyRollup.add_invoices(invoices)
+        if InvoiceSearchIndex.is_supported():
+            InvoiceSearchIndex.index(invoices)
@@ -0,0 +1,446 @@
+# encoding:utf-8
+"""
+发票文本信息提取引擎
+
+InvoiceRecognizer.extract_invoice_info 的实现。所有正则在模块导入时编译一次；
+每条规则附带其匹配结果中必然出现的关键字，提取前先判断关键字是否出现在文本中，
+不可能匹配的规则直接跳过；整行匹配的规则只在包含关键字的行首尝试，不再对全文逐位置扫描。
+
+字段的匹配顺序、取值和清理逻辑与原实现逐条对应，输出的info字典保持一致
+（可用 python manage.py benchmark_extract_invoice_info 对比验证）。
+"""
+
+import re
+from bisect import bisect_right
+from datetime import datetime
+
+
+class Rule:
+    """预编译的提取规则
+
+    all_of 为匹配结果中必须全部出现的关键字，any_of 为至少出现一个的关键字，
+    文本中缺少这些关键字时规则不可能匹配，直接跳过。
+
+    以 ([^\n\r]* 开头的规则为整行规则：在一行中若能匹配，第一个匹配必然从行首开始且该行不会再有第二个匹配，
+    关键字也必然出现在该行中。这类规则先用关键字定位候选行，只在候选行的行首尝试一次匹配，
+    避免在每个位置都回溯整行（原实现的主要耗时）。
+
+    tail_any 用于以 (?=\s*关键字|...|$) 结尾的整行规则：只有行内出现这些关键字、
+    下一段非空白文本以它们开头或该行位于文本末尾时，才可能匹配。
+    """
+
+    __slots__ = ('regex', 'all_of', 'any_re', 'finder', 'line_anchored', 'tail_re')
+
+    def __init__(self, pattern, all_of=(), any_of=(), tail_any=()):
+        self.regex = re.compile(pattern)
+        self.all_of = tuple(all_of)
+        self.any_re = _keyword_regex(any_of)
+        self.line_anchored = pattern.startswith(r'([^\n\r]*')
+        # 整行规则用于定位候选行的关键字
+        self.finder = self.any_re or _keyword_regex(self.all_of[:1])
+        self.tail_re = _keyword_regex(tail_any)
+
+    def possible_in(self, text):
+        """文本中是否包含规则所需的关键字"""
+        for keyword in self.all_of:
+            if keyword not in text:
+                return False
+        return self.any_re is None or self.any_re.search(text) is not None
+
+
+def _keyword_regex(keywords):
+    """将关键字列表编译为一个正则，一次扫描即可判断是否出现任一关键字"""
+    if not keywords:
+        return None
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+
+LINE_RE = re.compile(r'[^\n\r]+')
+LEADING_WHITESPACE_RE = re.compile(r'\s*')
+
+
+SERVICE_KEYWORDS = ('餐饮', '服务', '运输', '客运', '货运', '咨询', '技术', '维修', '安装', '培训', '设计')
+GOODS_KEYWORDS = ('费', '服务', '产品', '商品')
+COMPANY_KEYWORDS = ('公司', '有限', '科技', '文化', '传播', '集团', '企业', '商贸', '贸易')
+SELLER_COMPANY_KEYWORDS = COMPANY_KEYWORDS + ('出行', '酒店')
+
+TAX_ID_LABEL = '统一社会信用代码/纳税人识别号'
+
+# 发票号码
+INVOICE_NUMBER_RULES = [
+    Rule(r'发票号码[：:：]\s*(\d{20,})', ['发票号码']),  # 20位长数字
+    Rule(r'发票号码[：:：]\s*(\d{8,})', ['发票号码']),   # 8位以上数字
+    Rule(r'(\d{20,})'),  # 独立的20位长数字序列
+    Rule(r'发票.*?号.*?[：:：]?\s*(\d{8,})', ['发票', '号']),
+    Rule(r'号码[：:：]\s*(\d{8,})', ['号码']),
+]
+
+# 发票类型（均为普通关键字，直接做子串判断）
+INVOICE_TYPE_KEYWORDS = [
+    ('ELECTRONIC', ('电子发票', '电子普通发票', '滴滴', '出行')),
+    ('VAT_GENERAL', ('增值税普通发票', '普通发票')),
+    ('VAT_SPECIAL', ('增值税专用发票', '专用发票')),
+    ('PAPER', ('纸质发票',)),
+]
+
+# 发票内容（原实现中的 \*([^\*]+)\* 与第一条规则在同一位置匹配、分组相同，已合并）
+CONTENT_RULES = [
+    Rule(r'\*([^\*]+)\*([^\n\r]*)', ['*']),  # *餐饮服务*餐饮服务格式
+    Rule(r'项目名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)', ['项目名称']),
+    Rule(r'货物或应税劳务[、，]?服务名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)', ['货物或应税劳务', '服务名称']),
+    Rule(r'商品名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)', ['商品名称']),
+    Rule(r'服务名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)', ['服务名称']),
+    Rule(r'\*([^\*\n\r]+)\*[^\n\r]*?([\d,.]+)\s+([\d,.]+)\s+6%', ['*', '6%']),  # 表格行中的服务项目
+    Rule(r'([^\n\r]*技术服务费[^\n\r]*)', ['技术服务费']),
+    Rule(r'([^\n\r]*服务费[^\n\r]*)', ['服务费']),
+    Rule(r'([^\n\r]*(?:餐饮|服务|运输|客运|货运|咨询|技术|维修|安装|培训|设计)[^\n\r]*?)(?=\s*\d|$)', any_of=SERVICE_KEYWORDS),
+    Rule(r'\*([^\*]+)\*\s*([\d,.]+)', ['*']),  # *服务类型* 后跟数字
+    Rule(r'([^\n\r]*(?:费|服务|产品|商品)[^\n\r]*?)(?=\s*[\d,.]+|$)', any_of=GOODS_KEYWORDS),
+]
+
+# 开票日期（原实现的外层循环在第一条规则后即退出，后两条规则从未生效，这里只保留第一条）
+DATE_RULE = Rule(r'开[革票目业]?[目日业]期[：:：]?\s*(\d{4}[年洗/-]\d{1,2}[月晶/-]\d{1,2}[日晶]?)', ['开', '期'])
+# 统一日期格式，处理OCR识别错误：年/洗/月/晶/斜杠 → '-'，日 → ''
+DATE_TRANSLATION = str.maketrans({'年': '-', '洗': '-', '月': '-', '晶': '-', '/': '-', '日': None})
+
+# 销售方名称
+SELLER_NAME_RULES = [
+    Rule(r'售方[\s\n]*名称[：:：]?\s*([^\n\r]+?)(?=\s*统一社会|纳税人|$)', ['售方', '名称']),
+    Rule(r'销售方名称[：:：]?\s*([^\n\r]+?)(?=\s*购买方|统一社会|纳税人|$)', ['销售方名称']),
+    Rule(r'销售方[：:：]?\s*([^\n\r]+?)(?=\s*购买方|统一社会|纳税人|$)', ['销售方']),
+    Rule(r'开票方[：:：]?\s*([^\n\r]+?)(?=\s*收票方|$)', ['开票方']),
+    Rule(r'售方[\s\n]*名称[：:：]\s*([^\n\r]+?)(?=\s*买方|购买方|统一社会|纳税人|$)', ['售方', '名称']),
+    Rule(r'销[\s\n]*名称[：:：]\s*([^\n\r]+?)(?=\s*买方|购买方|统一社会|纳税人|$)', ['销', '名称']),
+    Rule(r'([^\n\r]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易|出行|酒店)[^\n\r]*?)(?=\s*统一社会信用代码|纳税人识别号|$)',
+          any_of=SELLER_COMPANY_KEYWORDS, tail_any=('统一社会信用代码', '纳税人识别号')),
+]
+SELLER_PREFIX_RE = re.compile(r'^[购买销售称方名和郑：:：\s]+')
+SELLER_COMPANY_RE = re.compile(r'([^\s]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易|出行)[^\s]*(?:公司|有限)?[^\s]*?)')
+
+# 购买方名称
+BUYER_NAME_RULES = [
+    Rule(r'买方[\s\n]*名称[：:：]?\s*([^\n\r]+?)(?=\s*统一社会|纳税人|$)', ['买方', '名称']),
+    Rule(r'购买方名称[：:：]?\s*([^\n\r]+?)(?=\s*销售方|纳税人识别号|统一社会信用代码|$)', ['购买方名称']),
+    Rule(r'购买方[：:：]?\s*([^\n\r]+?)(?=\s*销售方|纳税人识别号|统一社会信用代码|$)', ['购买方']),
+    Rule(r'收票方[：:：]?\s*([^\n\r]+?)(?=\s*开票方|$)', ['收票方']),
+    Rule(r'购[\s\n]*名称[：:：]\s*([^\n\r]+?)(?=\s*销|售方|统一社会|纳税人|$)', ['购', '名称']),
+    Rule(r'买方[\s\n]*([^\n\r]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易)[^\n\r]*?)(?=\s*售方|销|统一社会|纳税人|$)',
+          ['买方'], COMPANY_KEYWORDS),
+    # 沿用原实现的字符集写法（匹配以其中任一字符开头的公司名）
+    Rule(r'([北京|上海|深圳|广州|天津|重庆|杭州|南京|成都|武汉][^\n\r]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易)[^\n\r]*?)(?=\s*统一社会信用代码|纳税人识别号|$)',
+          any_of=COMPANY_KEYWORDS),
+]
+BUYER_PREFIX_RE = re.compile(r'^[购买销售称方名自得和：:：\s]+')
+BUYER_SELLER_TAIL_RE = re.compile(r'\s*(销售|开票|和\s*名).*$')  # 去除后面的销售方信息
+BUYER_COMPANY_RE = re.compile(r'([^\s]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易)[^\s]*(?:公司|有限)?[^\s]*?)')
+
+NAME_SUFFIX_RE = re.compile(r'[：:：\s]*$')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# 税额：(规则, 税额所在分组)，-1表示最后一个分组
+TAX_RULES = [
+    (Rule(r'\*[^\*]+\*[^\n]*?([\d,.]+)\s+([\d,.]+)\s+6%\s+([\d,.]+)', ['*', '6%']), -1),  # 表格行格式：金额 金额 6% 税额
+    (Rule(r'合\s*计\s*￥?([\d,.]+)\s*￥?([\d,.]+)', ['合', '计']), 2),  # 合计行格式：￥390.38 ￥23.42
+    (Rule(r'税额[：:]\s*￥?([\d,.]+)', ['税额']), 1),
+    (Rule(r'([\d,.]+)\s+6%\s+([\d,.]+)', ['6%']), -1),  # 简化的金额 6% 税额格式
+]
+
+# 价税合计：(规则, 金额所在分组)
+TOTAL_RULES = [
+    (Rule(r'\(\s*小[写可]?\s*\)?\s*[¥￥]?([\d,.]+)', ['(', '小']), 1),  # (小写)￥413.80 格式
+    (Rule(r'价税[会合]计[（(]?[大小][写可][）)]?.*?[¥￥]?([\d,.]+)', ['价税', '计']), 1),
+    (Rule(r'(价税[会合]计|合计)[：:]\s*[¥￥]?([\d,.]+)', ['计']), 2),
+    (Rule(r'☒[^\n]*?([\d,.]+)圆[\d]*角\s*整', ['☒', '圆', '角', '整']), 1),  # ☒肆佰壹拾叁圆捌角整格式
+]
+SMALL_AMOUNT_RULE = Rule(r'\(小写\)[¥￥]?([\d,.]+)', ['(小写)'])
+
+# 不含税金额
+AMOUNT_RULES = [
+    Rule(r'\*[^\*]+\*[^\n]*?([\d,.]+)\s+([\d,.]+)\s+6%', ['*', '6%']),  # 表格行格式中的第一个金额
+    Rule(r'合\s*计\s*￥?([\d,.]+)\s*￥?[\d,.]+', ['合', '计']),  # 合计行的第一个金额
+]
+
+# 税号
+SELLER_TAX_ID_RULES = [
+    Rule(r'售方[\s\n]*.*?统一社会信用代码/纳税人识别号[：:：]?\s*([A-Z0-9]{15,18})', ['售方', TAX_ID_LABEL]),
+    Rule(r'销售方.*?统一社会信用代码[：:：]?\s*([A-Z0-9]{15,18})', ['销售方', '统一社会信用代码']),
+    Rule(r'统一社会信用代码/纳税人识别号[：:：]?\s*([A-Z0-9]{15,18})', [TAX_ID_LABEL]),  # 第一个出现的税号通常是销售方
+]
+TAX_ID_RULE = SELLER_TAX_ID_RULES[-1]
+
+# 全电发票PDF文本层的左右两栏布局：购买方在左、销售方在右，名称和税号各占一行
+TWO_COLUMN_NAMES_RE = re.compile(r'购\s*名\s*称[：:]\s*(\S+?)\s+销\s*名\s*称[：:]\s*(\S+)')
+TWO_COLUMN_TAX_IDS_RE = re.compile(
+    r'纳税人识别号[：:]\s*([0-9A-Z]{15,20})[^\n\r]*?纳税人识别号[：:]\s*([0-9A-Z]{15,20})'
+)
+
+
+class ScannedText:
+    """待提取的文本，行位置只扫描一次，供所有整行规则共用"""
+
+    def __init__(self, text):
+        self.text = text
+        self._lines = None
+        self._line_starts = None
+
+    @property
+    def lines(self):
+        """各非空行的 (起始位置, 结束位置)"""
+        if self._lines is None:
+            self._lines = [match.span() for match in LINE_RE.finditer(self.text)]
+            self._line_starts = [start for start, _ in self._lines]
+        return self._lines
+
+    def _candidate_lines(self, rule):
+        """包含规则关键字的行，按出现顺序返回 (起始位置, 结束位置, 行文本)"""
+        text = self.text
+        lines = self.lines
+        last_index = -1
+        for hit in rule.finder.finditer(text):
+            index = bisect_right(self._line_starts, hit.start()) - 1
+            if index == last_index:
+                continue
+            last_index = index
+            start, end = lines[index]
+            line = text[start:end]
+            if rule.possible_in(line):
+                yield start, end, line
+
+    def _tail_possible(self, rule, line, end):
+        """行尾的前瞻断言 (?=\s*关键字|...|$) 是否可能成立"""
+        text = self.text
+        if end == len(text) or (end == len(text) - 1 and text[end] == '\n'):
+            return True
+        if rule.tail_re.search(line):
+            return True
+        # \s* 可以跨过换行，检查下一段非空白文本
+        position = LEADING_WHITESPACE_RE.match(text, end).end()
+        return rule.tail_re.match(text, position) is not None
+
+    def iter_line_matches(self, rule):
+        """在候选行的行首尝试匹配整行规则
+
+        正则仍作用于全文（行尾之后的前瞻断言和 $ 的语义不变），每行最多产生一个匹配，
+        结果与对全文 findall/search 相同。
+        """
+        for start, end, line in self._candidate_lines(rule):
+            if rule.tail_re is not None and not self._tail_possible(rule, line, end):
+                continue
+            match = rule.regex.match(self.text, start)
+            if match:
+                yield match
+
+    def search(self, rule):
+        if not rule.possible_in(self.text):
+            return None
+        if rule.line_anchored:
+            return next(self.iter_line_matches(rule), None)
+        return rule.regex.search(self.text)
+
+    def findall(self, rule):
+        if not rule.possible_in(self.text):
+            return []
+        if rule.line_anchored:
+            return [match.group(1) for match in self.iter_line_matches(rule)]
+        return rule.regex.findall(self.text)
+
+
+class InvoiceInfoExtractor:
+    """基于预编译规则表的发票信息提取器"""
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value.replace(',', ''))
+        except ValueError:
+            return None
+
+    @classmethod
+    def _extract_invoice_number(cls, doc):
+        for rule in INVOICE_NUMBER_RULES:
+            match = doc.search(rule)
+            if match:
+                return match.group(1)
+        return None
+
+    @staticmethod
+    def _extract_invoice_type(doc):
+        text = doc.text
+        for invoice_type, keywords in INVOICE_TYPE_KEYWORDS:
+            if any(keyword in text for keyword in keywords):
+                return invoice_type
+        # 没有匹配到具体类型，根据其他特征判断
+        if '电子' in text or '滴滴' in text or '出行' in text:
+            return 'ELECTRONIC'
+        if '增值税' in text:
+            return 'VAT_GENERAL'
+        return 'OTHER'
+
+    @classmethod
+    def _extract_content(cls, doc):
+        for rule in CONTENT_RULES:
+            match = doc.search(rule)
+            if match:
+                # 清理内容：去除多余空格和特殊字符
+                content = WHITESPACE_RE.sub(' ', match.group(1).strip()).strip()
+                if content and len(content) > 1:  # 确保内容有意义
+                    return content
+        return None
+
+    @classmethod
+    def _extract_date(cls, doc):
+        current_year = datetime.now().year
+        for date_str in doc.findall(DATE_RULE):
+            date_str = date_str.translate(DATE_TRANSLATION)
+            parts = date_str.split('-')
+            if len(parts) != 3:
+                continue
+            try:
+                if date_str.isascii():
+                    # 正则已保证为 4位-1~2位-1~2位 数字，直接构造比strptime快，非法日期同样抛出ValueError
+                    date_obj = datetime(int(parts[0]), int(parts[1]), int(parts[2]))
+                else:
+                    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+            except ValueError:
+                continue
+            # 验证日期合理性（2000年后，不超过当前日期）
+            if 2000 <= date_obj.year <= current_year:
+                return date_obj.date()
+        return None
+
+    @classmethod
+    def _extract_seller_name(cls, doc):
+        for rule in SELLER_NAME_RULES:
+            for seller_name in doc.findall(rule):
+                seller_name = SELLER_PREFIX_RE.sub('', seller_name.strip())
+                seller_name = NAME_SUFFIX_RE.sub('', seller_name)
+
+                # 提取公司名称（优先选择最长的，通常更完整）
+                company_matches = SELLER_COMPANY_RE.findall(seller_name)
+                if company_matches:
+                    seller_name = max(company_matches, key=len)
+
+                seller_name = WHITESPACE_RE.sub('', seller_name).strip()
+                if seller_name and len(seller_name) > 2:  # 确保名称有意义
+                    return seller_name
+        return None
+
+    @classmethod
+    def _extract_buyer_name(cls, doc):
+        for rule in BUYER_NAME_RULES:
+            for buyer_name in doc.findall(rule):
+                buyer_name = BUYER_PREFIX_RE.sub('', buyer_name.strip())
+                buyer_name = NAME_SUFFIX_RE.sub('', buyer_name)
+                buyer_name = BUYER_SELLER_TAIL_RE.sub('', buyer_name)
+
+                company_matches = BUYER_COMPANY_RE.findall(buyer_name)
+                if company_matches:
+                    buyer_name = max(company_matches, key=len)
+
+                buyer_name = WHITESPACE_RE.sub('', buyer_name).strip()
+                if buyer_name and len(buyer_name) > 2:
+                    return buyer_name
+        return None
+
+    @classmethod
+    def _extract_amount_by_rules(cls, rules, doc):
+        """依次尝试 (规则, 分组) 列表，返回第一个能转换为数字的金额"""
+        for rule, group in rules:
+            match = doc.search(rule)
+            if match:
+                value = cls._to_float(match.group(match.lastindex if group == -1 else group))
+                if value is not None:
+                    return value
+        return None
+
+    @classmethod
+    def _extract_total_amount(cls, doc):
+        total_amount = cls._extract_amount_by_rules(TOTAL_RULES, doc)
+        if not total_amount:
+            # 尝试从(小写)行提取
+            match = doc.search(SMALL_AMOUNT_RULE)
+            if match:
+                value = cls._to_float(match.group(1))
+                if value is not None:
+                    return value
+        return total_amount
+
+    @classmethod
+    def _extract_amount(cls, doc):
+        for rule in AMOUNT_RULES:
+            match = doc.search(rule)
+            if match:
+                value = cls._to_float(match.group(1))
+                if value is not None:
+                    return value
+        return None
+
+    @classmethod
+    def _extract_tax_ids(cls, doc):
+        seller_tax_id = None
+        for rule in SELLER_TAX_ID_RULES:
+            match = doc.search(rule)
+            if match:
+                seller_tax_id = match.group(1)
+                break
+
+        # 查找所有税号，第二个通常是购买方的
+        buyer_tax_id = None
+        all_tax_ids = doc.findall(TAX_ID_RULE)
+        if len(all_tax_ids) >= 2:
+            buyer_tax_id = all_tax_ids[1]
+        elif len(all_tax_ids) == 1 and not seller_tax_id:
+            buyer_tax_id = all_tax_ids[0]
+        return seller_tax_id, buyer_tax_id
+
+    @staticmethod
+    def extract_two_column_parties(text):
+        """解析全电发票PDF文本层中左右两栏排列的购买方、销售方信息
+
+        extract 的规则按旧版发票布局编写（第一个税号视为销售方），
+        对两栏布局会漏掉销售方名称并颠倒税号，PDF文本层解析时用本方法的结果覆盖。
+
+        Returns:
+            dict: 识别到的 buyer_name/seller_name/buyer_tax_id/seller_tax_id，不是两栏布局时返回空字典
+        """
+        names = TWO_COLUMN_NAMES_RE.search(text)
+        if not names:
+            return {}
+        parties = {'buyer_name': names.group(1), 'seller_name': names.group(2)}
+        tax_ids = TWO_COLUMN_TAX_IDS_RE.search(text)
+        if tax_ids:
+            parties['buyer_tax_id'], parties['seller_tax_id'] = tax_ids.group(1), tax_ids.group(2)
+        return parties
+
+    @classmethod
+    def extract(cls, text):
+        """从文本中提取发票信息
+
+        Args:
+            text: OCR或PDF文本
+
+        Returns:
+            dict: 发票信息，未识别的字段为空字符串
+        """
+        doc = ScannedText(text)
+        seller_tax_id, buyer_tax_id = cls._extract_tax_ids(doc)
+        info = {
+            'invoice_number': cls._extract_invoice_number(doc),
+            'invoice_content': cls._extract_content(doc),  # 发票内容（原发票代码字段）
+            'invoice_date': cls._extract_date(doc),
+            'invoice_type': cls._extract_invoice_type(doc),
+            'amount': cls._extract_amount(doc),
+            'tax_amount': cls._extract_amount_by_rules(TAX_RULES, doc),
+            'total_amount': cls._extract_total_amount(doc),
+            'seller_name': cls._extract_seller_name(doc),
+            'seller_tax_id': seller_tax_id,
+            'buyer_name': cls._extract_buyer_name(doc),
+            'buyer_tax_id': buyer_tax_id,
+        }
+
+        # 清理None值，避免在JSON序列化时变成字符串'None'
+        for key, value in info.items():
+            if value is None:
+                info[key] = ''
+
+        return info
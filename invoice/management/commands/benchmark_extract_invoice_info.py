@@ -0,0 +1,423 @@
+import random
+import re
+import statistics
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.fake_baidu_server import fake_general_words_result, fake_vat_words_result
+from invoice.invoice_extractor import InvoiceInfoExtractor
+
+
+def legacy_extract_invoice_info(text):
+    """原 InvoiceRecognizer.extract_invoice_info 实现（逐条 re.search/re.findall），作为对照基准
+
+    仅修正了 match.group(-1) 会抛出IndexError的问题，改为取最后一个分组。
+    """
+    info = {
+        'invoice_number': None,
+        'invoice_content': None,  # 发票内容（原发票代码字段）
+        'invoice_date': None,
+        'invoice_type': None,
+        'amount': None,
+        'tax_amount': None,
+        'total_amount': None,
+        'seller_name': None,
+        'seller_tax_id': None,
+        'buyer_name': None,
+        'buyer_tax_id': None
+    }
+
+    # 发票号码匹配 - 根据实际OCR结果优化
+    invoice_number_patterns = [
+        r'发票号码[：:：]\s*(\d{20,})',  # 20位长数字
+        r'发票号码[：:：]\s*(\d{8,})',   # 8位以上数字
+        r'(\d{20,})',  # 独立的20位长数字序列
+        r'发票.*?号.*?[：:：]?\s*(\d{8,})',
+        r'号码[：:：]\s*(\d{8,})'
+    ]
+    for pattern in invoice_number_patterns:
+        match = re.search(pattern, text)
+        if match:
+            number = match.group(1)
+            if len(number) >= 8:  # 发票号码至少8位
+                info['invoice_number'] = number
+                break
+
+    # 发票类型识别 - 根据公司名称和内容判断
+    invoice_type_patterns = {
+        'ELECTRONIC': [r'电子发票', r'电子普通发票', r'滴滴', r'出行'],
+        'VAT_GENERAL': [r'增值税普通发票', r'普通发票'],
+        'VAT_SPECIAL': [r'增值税专用发票', r'专用发票'],
+        'PAPER': [r'纸质发票']
+    }
+
+    for invoice_type, patterns in invoice_type_patterns.items():
+        for pattern in patterns:
+            if re.search(pattern, text):
+                info['invoice_type'] = invoice_type
+                break
+        if info['invoice_type']:
+            break
+
+    # 如果没有匹配到具体类型，根据其他特征判断
+    if not info['invoice_type']:
+        if re.search(r'电子|滴滴|出行', text):
+            info['invoice_type'] = 'ELECTRONIC'
+        elif re.search(r'增值税', text):
+            info['invoice_type'] = 'VAT_GENERAL'
+        else:
+            info['invoice_type'] = 'OTHER'
+
+    # 发票内容匹配 - 根据实际OCR结果优化
+    content_patterns = [
+        r'\*([^\*]+)\*([^\n\r]*)',  # *餐饮服务*餐饮服务格式
+        r'\*([^\*]+)\*',  # 简单的*服务类型*格式
+        r'项目名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)',
+        r'货物或应税劳务[、，]?服务名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)',
+        r'商品名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)',
+        r'服务名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)',
+        r'\*([^\*\n\r]+)\*[^\n\r]*?([\d,.]+)\s+([\d,.]+)\s+6%',  # 表格行中的服务项目
+        r'([^\n\r]*技术服务费[^\n\r]*)',  # 直接匹配技术服务费
+        r'([^\n\r]*服务费[^\n\r]*)',  # 匹配各种服务费
+        r'([^\n\r]*(?:餐饮|服务|运输|客运|货运|咨询|技术|维修|安装|培训|设计)[^\n\r]*?)(?=\s*\d|$)',  # 包含服务关键词
+        r'\*([^\*]+)\*\s*([\d,.]+)',  # *服务类型* 后跟数字
+        r'([^\n\r]*(?:费|服务|产品|商品)[^\n\r]*?)(?=\s*[\d,.]+|$)',  # 以费、服务、产品、商品结尾的内容
+    ]
+
+    for pattern in content_patterns:
+        match = re.search(pattern, text)
+        if match:
+            if len(match.groups()) >= 2 and '*' in pattern:
+                # 对于*服务类型*描述格式，使用第一个匹配组
+                content = match.group(1).strip()
+            else:
+                content = match.group(1).strip()
+
+            # 清理内容：去除多余空格和特殊字符
+            content = re.sub(r'\s+', ' ', content)
+            content = content.strip()
+
+            if content and len(content) > 1:  # 确保内容有意义
+                info['invoice_content'] = content
+                break
+
+    # 开票日期匹配 - 处理OCR识别错误
+    date_patterns = [
+        r'开[革票目业]?[目日业]期[：:：]?\s*(\d{4}[年洗/-]\d{1,2}[月晶/-]\d{1,2}[日晶]?)',
+        r'(20\d{2}[年洗]\d{1,2}月\d{1,2}[日晶])',
+        r'(\d{4}[年洗/-]\d{1,2}[月晶/-]\d{1,2}[日晶]?)'
+    ]
+    for pattern in date_patterns:
+        matches = re.findall(pattern, text)
+        for date_str in matches:
+            # 统一日期格式，处理OCR识别错误
+            date_str = re.sub(r'[年洗]', '-', date_str)
+            date_str = re.sub(r'[月晶]', '-', date_str)
+            date_str = re.sub(r'[日晶]', '', date_str)
+            date_str = re.sub(r'[/]', '-', date_str)
+
+            try:
+                # 尝试解析日期
+                if len(date_str.split('-')) == 3:
+                    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+                    # 验证日期合理性（2000年后，不超过当前日期）
+                    if 2000 <= date_obj.year <= datetime.now().year:
+                        info['invoice_date'] = date_obj.date()
+                        break
+            except ValueError:
+                continue
+        if 'invoice_date' in info:
+            break
+
+    # 销售方名称匹配 - 根据实际OCR结果优化
+    seller_name_patterns = [
+        r'售方[\s\n]*名称[：:：]?\s*([^\n\r]+?)(?=\s*统一社会|纳税人|$)',  # "售方 名称:" 格式
+        r'销售方名称[：:：]?\s*([^\n\r]+?)(?=\s*购买方|统一社会|纳税人|$)',
+        r'销售方[：:：]?\s*([^\n\r]+?)(?=\s*购买方|统一社会|纳税人|$)',
+        r'开票方[：:：]?\s*([^\n\r]+?)(?=\s*收票方|$)',
+        r'售方[\s\n]*名称[：:：]\s*([^\n\r]+?)(?=\s*买方|购买方|统一社会|纳税人|$)',  # 新增：处理"售方名称："格式
+        r'销[\s\n]*名称[：:：]\s*([^\n\r]+?)(?=\s*买方|购买方|统一社会|纳税人|$)',  # 处理"销名称："格式
+        r'([^\n\r]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易|出行|酒店)[^\n\r]*?)(?=\s*统一社会信用代码|纳税人识别号|$)'
+    ]
+
+    for pattern in seller_name_patterns:
+        matches = re.findall(pattern, text)
+        for seller_name in matches:
+            seller_name = seller_name.strip()
+
+            # 清理前缀和后缀
+            seller_name = re.sub(r'^[购买销售称方名和郑：:：\s]+', '', seller_name)
+            seller_name = re.sub(r'[：:：\s]*$', '', seller_name)
+
+            # 提取公司名称（优先选择完整的公司名）
+            company_pattern = r'([^\s]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易|出行)[^\s]*(?:公司|有限)?[^\s]*?)'
+            company_matches = re.findall(company_pattern, seller_name)
+
+            if company_matches:
+                # 选择最长的公司名称（通常更完整）
+                seller_name = max(company_matches, key=len)
+
+            # 最终清理
+            seller_name = re.sub(r'\s+', '', seller_name)  # 去除所有空格
+            seller_name = seller_name.strip()
+
+            if seller_name and len(seller_name) > 2:  # 确保名称有意义
+                info['seller_name'] = seller_name
+                break
+        if info['seller_name']:
+            break
+
+    # 购买方名称匹配 - 根据实际OCR结果优化
+    buyer_name_patterns = [
+        r'买方[\s\n]*名称[：:：]?\s*([^\n\r]+?)(?=\s*统一社会|纳税人|$)',  # "买方 名称:" 格式
+        r'购买方名称[：:：]?\s*([^\n\r]+?)(?=\s*销售方|纳税人识别号|统一社会信用代码|$)',
+        r'购买方[：:：]?\s*([^\n\r]+?)(?=\s*销售方|纳税人识别号|统一社会信用代码|$)',
+        r'收票方[：:：]?\s*([^\n\r]+?)(?=\s*开票方|$)',
+        r'购[\s\n]*名称[：:：]\s*([^\n\r]+?)(?=\s*销|售方|统一社会|纳税人|$)',  # 新增：处理"购名称："格式
+        r'买方[\s\n]*([^\n\r]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易)[^\n\r]*?)(?=\s*售方|销|统一社会|纳税人|$)',  # 处理"买方"后直接跟公司名
+        r'([北京|上海|深圳|广州|天津|重庆|杭州|南京|成都|武汉][^\n\r]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易)[^\n\r]*?)(?=\s*统一社会信用代码|纳税人识别号|$)'
+    ]
+
+    for pattern in buyer_name_patterns:
+        matches = re.findall(pattern, text)
+        for buyer_name in matches:
+            buyer_name = buyer_name.strip()
+
+            # 清理前缀和后缀
+            buyer_name = re.sub(r'^[购买销售称方名自得和：:：\s]+', '', buyer_name)
+            buyer_name = re.sub(r'[：:：\s]*$', '', buyer_name)
+            buyer_name = re.sub(r'\s*(销售|开票|和\s*名).*$', '', buyer_name)  # 去除后面的销售方信息
+
+            # 提取公司名称
+            company_pattern = r'([^\s]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易)[^\s]*(?:公司|有限)?[^\s]*?)'
+            company_matches = re.findall(company_pattern, buyer_name)
+
+            if company_matches:
+                # 选择最长的公司名称
+                buyer_name = max(company_matches, key=len)
+
+            # 最终清理
+            buyer_name = re.sub(r'\s+', '', buyer_name)  # 去除所有空格
+            buyer_name = buyer_name.strip()
+
+            if buyer_name and len(buyer_name) > 2:  # 确保名称有意义
+                info['buyer_name'] = buyer_name
+                break
+        if info['buyer_name']:
+            break
+
+    # 税额匹配 - 根据实际OCR结果优化
+    tax_patterns = [
+        r'\*[^\*]+\*[^\n]*?([\d,.]+)\s+([\d,.]+)\s+6%\s+([\d,.]+)',  # 表格行格式：金额 金额 6% 税额
+        r'合\s*计\s*￥?([\d,.]+)\s*￥?([\d,.]+)',  # 合计行格式：￥390.38 ￥23.42
+        r'税额[：:]\s*￥?([\d,.]+)',
+        r'([\d,.]+)\s+6%\s+([\d,.]+)'  # 简化的金额 6% 税额格式
+    ]
+    for pattern in tax_patterns:
+        match = re.search(pattern, text)
+        if match:
+            if '6%' in pattern and len(match.groups()) >= 2:  # 包含税率的格式，取最后一个（税额）
+                tax_str = match.group(len(match.groups())).replace(',', '')
+            elif '合' in pattern and len(match.groups()) >= 2:  # 合计行格式，取第二个（税额）
+                tax_str = match.group(2).replace(',', '')
+            else:
+                tax_str = match.group(1).replace(',', '')
+            try:
+                info['tax_amount'] = float(tax_str)
+                break
+            except ValueError:
+                continue
+
+    # 价税合计匹配 - 根据实际OCR结果优化
+    total_patterns = [
+        r'\(\s*小[写可]?\s*\)?\s*[¥￥]?([\d,.]+)',  # (小写)￥413.80 格式
+        r'价税[会合]计[（(]?[大小][写可][）)]?.*?[¥￥]?([\d,.]+)',
+        r'(价税[会合]计|合计)[：:]\s*[¥￥]?([\d,.]+)',
+        r'☒[^\n]*?([\d,.]+)圆[\d]*角\s*整'  # ☒肆佰壹拾叁圆捌角整格式，提取数字
+    ]
+    for pattern in total_patterns:
+        match = re.search(pattern, text)
+        if match:
+            if len(match.groups()) >= 2:
+                total_str = match.group(2).replace(',', '')
+            else:
+                total_str = match.group(1).replace(',', '')
+            try:
+                info['total_amount'] = float(total_str)
+                break
+            except ValueError:
+                continue
+
+    # 如果没有匹配到价税合计，尝试从(小写)行提取
+    if not info['total_amount']:
+        small_amount_match = re.search(r'\(小写\)[¥￥]?([\d,.]+)', text)
+        if small_amount_match:
+            try:
+                info['total_amount'] = float(small_amount_match.group(1).replace(',', ''))
+            except ValueError:
+                pass
+
+    # 金额匹配 - 提取不含税金额
+    if not info['amount']:
+        amount_patterns = [
+            r'\*[^\*]+\*[^\n]*?([\d,.]+)\s+([\d,.]+)\s+6%',  # 表格行格式中的第一个金额
+            r'合\s*计\s*￥?([\d,.]+)\s*￥?[\d,.]+',  # 合计行的第一个金额
+        ]
+        for pattern in amount_patterns:
+            match = re.search(pattern, text)
+            if match:
+                try:
+                    info['amount'] = float(match.group(1).replace(',', ''))
+                    break
+                except ValueError:
+                    continue
+
+    # 销售方税号匹配
+    if not info['seller_tax_id']:
+        seller_tax_patterns = [
+            r'售方[\s\n]*.*?统一社会信用代码/纳税人识别号[：:：]?\s*([A-Z0-9]{15,18})',
+            r'销售方.*?统一社会信用代码[：:：]?\s*([A-Z0-9]{15,18})',
+            r'统一社会信用代码/纳税人识别号[：:：]?\s*([A-Z0-9]{15,18})'  # 第一个出现的税号通常是销售方
+        ]
+        for pattern in seller_tax_patterns:
+            match = re.search(pattern, text)
+            if match:
+                info['seller_tax_id'] = match.group(1)
+                break
+
+    # 购买方税号匹配
+    if not info['buyer_tax_id']:
+        # 查找所有税号，第二个通常是购买方的
+        all_tax_ids = re.findall(r'统一社会信用代码/纳税人识别号[：:：]?\s*([A-Z0-9]{15,18})', text)
+        if len(all_tax_ids) >= 2:
+            info['buyer_tax_id'] = all_tax_ids[1]  # 第二个税号是购买方
+        elif len(all_tax_ids) == 1 and not info['seller_tax_id']:
+            # 如果只有一个税号且销售方税号未设置，则这个是购买方的
+            info['buyer_tax_id'] = all_tax_ids[0]
+
+    # 清理None值，避免在JSON序列化时变成字符串'None'
+    for key, value in info.items():
+        if value is None:
+            info[key] = ''
+
+    return info
+
+
+
+def build_corpus(size, seed=0):
+    """生成有代表性的发票文本：通用文字识别结果、PDF文本层、增值税识别结果拼接的文本等格式"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        words = fake_vat_words_result(f'{seed}-{i}')
+        kind = i % 4
+        if kind == 0:
+            # 通用文字识别结果（每行一段）
+            lines = [item['words'] for item in fake_general_words_result(f'{seed}-{i}')]
+        elif kind == 1:
+            # 全电发票PDF文本层（pdfplumber提取）
+            lines = [
+                words['InvoiceTypeOrg'],
+                f"发票号码：{words['InvoiceNum']}",
+                f"开票日期：{words['InvoiceDate']}",
+                f"购 名称：{words['PurchaserName']} 销 名称：{words['SellerName']}",
+                "买 售",
+                f"方 统一社会信用代码/纳税人识别号：{words['PurchaserRegisterNum']} "
+                f"方 统一社会信用代码/纳税人识别号：{words['SellerRegisterNum']}",
+                "信 信",
+                "息 息",
+                "项目名称 规格型号 单 位 数 量 单 价 金 额 税率/征收率 税 额",
+                f"{words['CommodityName'][0]['word']} 1 {words['TotalAmount']} {words['TotalAmount']} "
+                f"{words['CommodityTaxRate'][0]['word']} {words['TotalTax']}",
+                f"合 计 ¥{words['TotalAmount']} ¥{words['TotalTax']}",
+                f"价税合计（大写） ☒{rng.choice(['肆佰壹拾叁', '贰仟零伍拾', '玖拾'])}圆{rng.randint(0, 9)}角整 "
+                f"（小写）¥{words['AmountInFiguers']}",
+                f"开票人：{words['NoteDrawer']}",
+            ]
+        elif kind == 2:
+            # 增值税发票识别结果拼接的文本（words_result_to_text）
+            lines = [
+                f"发票类型: {words['InvoiceType']}",
+                f"发票号码: {words['InvoiceNum']}",
+                f"开票日期: {words['InvoiceDate']}",
+                f"购买方名称: {words['PurchaserName']}",
+                f"购买方纳税人识别号: {words['PurchaserRegisterNum']}",
+                f"货物或应税劳务、服务名称: {words['CommodityName'][0]['word']}",
+                f"合计金额: {words['TotalAmount']}",
+                f"合计税额: {words['TotalTax']}",
+                f"价税合计(小写): {words['AmountInFiguers']}",
+                f"销售方名称: {words['SellerName']}",
+                f"销售方纳税人识别号: {words['SellerRegisterNum']}",
+            ]
+        else:
+            # 带OCR识别错误和噪声的拍照文本
+            lines = [
+                '滴滴出行 电子发票',
+                f"发 票 号 码:{words['InvoiceNum']}",
+                f"开革期:{words['InvoiceDate'].replace('年', '洗').replace('日', '晶')}",
+                f"买方 {words['PurchaserName']} 纳税人识别号 {words['PurchaserRegisterNum']}",
+                f"售方 名称：{words['SellerName']}统一社会信用代码/纳税人识别号:{words['SellerRegisterNum']}",
+                f"*客运服务*客运服务费 {words['TotalAmount']} {words['TotalAmount']} 6% {words['TotalTax']}",
+                f"(小写)￥{words['AmountInFiguers']}",
+            ]
+            lines += [''.join(rng.choice('发票金额税率 0123456789.,') for _ in range(40)) for _ in range(rng.randint(0, 8))]
+        corpus.append('\n'.join(lines))
+    return corpus
+
+
+class Command(BaseCommand):
+    help = '对比 extract_invoice_info 新旧实现的提取结果并测量耗时（结果不一致时命令失败）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=400, help='生成的样本文本数')
+        parser.add_argument('--repeat', type=int, default=5, help='重复测量的轮数，取中位数')
+        parser.add_argument('--from-db', action='store_true', help='同时使用识别记录中保存的原始文本作为样本')
+        parser.add_argument('--min-speedup', type=float, default=0.0, help='加速比低于该值时命令失败（用于防止性能回退）')
+
+    def handle(self, *args, **options):
+        corpus = build_corpus(options['size'])
+        if options['from_db']:
+            from invoice.models import RecognitionPayload
+            corpus += [
+                RecognitionPayload.decompress(data)
+                for data in RecognitionPayload.objects.values_list('raw_text', flat=True).iterator()
+            ]
+        if not corpus:
+            raise CommandError('没有可用的样本文本')
+
+        mismatches = 0
+        for text in corpus:
+            expected = legacy_extract_invoice_info(text)
+            actual = InvoiceInfoExtractor.extract(text)
+            if expected != actual:
+                mismatches += 1
+                if mismatches <= 5:
+                    diff = {key: (expected[key], actual[key]) for key in expected if expected[key] != actual.get(key)}
+                    self.stderr.write(f'结果不一致: {diff}\n{text[:200]}')
+        if mismatches:
+            raise CommandError(f'{mismatches}/{len(corpus)} 个样本的提取结果与原实现不一致')
+
+        legacy_time = self._measure(legacy_extract_invoice_info, corpus, options['repeat'])
+        engine_time = self._measure(InvoiceInfoExtractor.extract, corpus, options['repeat'])
+        speedup = legacy_time / engine_time if engine_time else float('inf')
+
+        self.stdout.write(self.style.SUCCESS(f'{len(corpus)} 个样本提取结果全部一致'))
+        self.stdout.write(
+            f'原实现: {legacy_time / len(corpus) * 1e6:.1f}µs/份，'
+            f'预编译引擎: {engine_time / len(corpus) * 1e6:.1f}µs/份，加速比 {speedup:.2f}x'
+        )
+        if speedup < options['min_speedup']:
+            raise CommandError(f'加速比 {speedup:.2f}x 低于要求的 {options["min_speedup"]:.2f}x')
+
+    @staticmethod
+    def _measure(func, corpus, repeat):
+        """多轮测量处理整个样本集的耗时，返回中位数（秒）"""
+        timings = []
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            for text in corpus:
+                func(text)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
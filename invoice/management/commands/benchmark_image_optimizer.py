@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.image_optimizer import ImageOptimizer
+
+
+class Command(BaseCommand):
+    help = '统计图片优化节省的上传字节数，以及优化耗时与按带宽估算的上传耗时差'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='图片文件路径')
+        parser.add_argument(
+            '--bandwidth-mbps', type=float, default=10.0,
+            help='估算上传耗时使用的上行带宽（Mbps）'
+        )
+
+    def handle(self, *args, **options):
+        bandwidth = options['bandwidth_mbps'] * 1000 * 1000 / 8  # 字节/秒
+        if bandwidth <= 0:
+            raise CommandError('--bandwidth-mbps 必须大于0')
+
+        total_in = total_out = 0
+        total_latency_saved = 0.0
+        for path in options['paths']:
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            start = time.perf_counter()
+            try:
+                optimized, changed = ImageOptimizer.optimize_bytes(data)
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'{path}: 优化失败 {e}'))
+                continue
+            elapsed = time.perf_counter() - start
+
+            # 上传内容为base64编码，体积约为原始字节的4/3
+            upload_before = len(data) * 4 / 3 / bandwidth
+            upload_after = len(optimized) * 4 / 3 / bandwidth
+            latency_saved = upload_before - upload_after - elapsed
+
+            total_in += len(data)
+            total_out += len(optimized)
+            total_latency_saved += latency_saved
+            self.stdout.write(
+                f'{path}: {len(data) / 1024:.0f}KB -> {len(optimized) / 1024:.0f}KB'
+                f'{"" if changed else "（保留原图）"}，优化耗时 {elapsed * 1000:.0f}ms，'
+                f'上传耗时 {upload_before * 1000:.0f}ms -> {upload_after * 1000:.0f}ms，'
+                f'净节省 {latency_saved * 1000:.0f}ms'
+            )
+
+        if total_in:
+            self.stdout.write(self.style.SUCCESS(
+                f'合计: {total_in / 1024:.0f}KB -> {total_out / 1024:.0f}KB，'
+                f'节省 {(total_in - total_out) / total_in:.0%}，'
+                f'净节省耗时 {total_latency_saved * 1000:.0f}ms'
+            ))
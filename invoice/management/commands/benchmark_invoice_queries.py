@@ -0,0 +1,256 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Count, Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from invoice.models import Invoice, InvoiceCategory, InvoiceRecognition, Party
+from invoice.pagination import KeysetPaginator
+from invoice.recognition_queue import RecognitionQueue
+
+BENCHMARK_ALIAS = 'query_benchmark'
+INDEXED_MODELS = [Invoice, InvoiceRecognition]
+
+
+class Command(BaseCommand):
+    help = '在临时SQLite数据库中生成大量发票和识别记录，对比添加索引前后各视图查询的执行计划和耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=1000000, help='生成的发票数')
+        parser.add_argument('--recognitions', type=int, default=200000, help='生成的识别记录数')
+        parser.add_argument('--repeat', type=int, default=5, help='每个查询的重复次数，取中位数')
+        parser.add_argument('--no-plans', action='store_true', help='不输出执行计划')
+
+    def handle(self, *args, **options):
+        if options['invoices'] <= 0 or options['repeat'] <= 0:
+            raise CommandError('--invoices 和 --repeat 必须大于0')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            connections.databases[BENCHMARK_ALIAS] = {
+                **connections.databases['default'],
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(tmp_dir, 'benchmark.sqlite3'),
+            }
+            try:
+                call_command('migrate', database=BENCHMARK_ALIAS, verbosity=0)
+                start = time.perf_counter()
+                params = self._seed(options['invoices'], options['recognitions'])
+                self.stdout.write(
+                    f"已生成 {options['invoices']} 张发票、{options['recognitions']} 条识别记录，"
+                    f"耗时 {time.perf_counter() - start:.1f}秒"
+                )
+                queries = self._build_queries(**params)
+
+                self._set_indexes(create=False)
+                before = self._run(queries, options['repeat'])
+                start = time.perf_counter()
+                self._set_indexes(create=True)
+                self.stdout.write(f'创建索引耗时 {time.perf_counter() - start:.1f}秒')
+                after = self._run(queries, options['repeat'])
+            finally:
+                connections[BENCHMARK_ALIAS].close()
+                del connections[BENCHMARK_ALIAS]
+                del connections.databases[BENCHMARK_ALIAS]
+
+        for name, _ in queries:
+            (before_ms, before_plans), (after_ms, after_plans) = before[name], after[name]
+            self.stdout.write(self.style.SUCCESS(f'{name}: {before_ms:.2f}ms -> {after_ms:.2f}ms'))
+            if not options['no_plans']:
+                self.stdout.write(f"  索引前: {' | '.join(before_plans)}")
+                self.stdout.write(f"  索引后: {' | '.join(after_plans)}")
+
+    def _seed(self, invoice_count, recognition_count):
+        """直接以SQL批量写入测试数据，返回查询使用的筛选条件"""
+        rng = random.Random(0)
+        users = self._create(User, [User(username=f'benchmark{i}', password='!') for i in range(20)])
+        categories = self._create(InvoiceCategory, [InvoiceCategory(name=f'类别{i}') for i in range(30)])
+        user_ids = [user.pk for user in users]
+        category_ids = [category.pk for category in categories] + [None]
+        buyers = self._create(Party, [
+            Party(tax_id=f'91110000{i:010d}', name=f'购买方{i}集团有限公司', is_buyer=True) for i in range(500)
+        ])
+        sellers = self._create(Party, [
+            Party(tax_id=f'91310000{i:010d}', name=f'销售方{i}科技有限公司', is_seller=True) for i in range(5000)
+        ])
+        contents = ['办公用品', '餐饮服务', '技术服务费', '住宿服务', '运输服务', '软件服务']
+        statuses = ['PENDING'] * 3 + ['VERIFIED'] * 5 + ['USED'] + ['REJECTED']
+        first_date = date(2020, 1, 1)
+
+        def invoice_row(pk):
+            invoice_date = first_date + timedelta(days=rng.randrange(365 * 5))
+            created_at = datetime.combine(invoice_date, datetime.min.time()) + timedelta(seconds=rng.randrange(86400 * 30))
+            amount = rng.randrange(100, 10000000) / 100
+            seller, buyer = rng.choice(sellers), rng.choice(buyers)
+            total_amount = f'{amount * 1.06:.2f}'
+            return {
+                'id': pk,
+                'invoice_number': f'{pk:020d}',
+                'invoice_content': rng.choice(contents),
+                'invoice_date': invoice_date.isoformat(),
+                'invoice_type': rng.choice(Invoice.INVOICE_TYPE_CHOICES)[0],
+                'amount': f'{amount:.2f}',
+                'tax_amount': f'{amount * 0.06:.2f}',
+                'total_amount': total_amount,
+                'seller_name': seller.name,
+                'seller_tax_id': seller.tax_id,
+                'buyer_name': buyer.name,
+                'buyer_tax_id': buyer.tax_id,
+                'seller_id': seller.pk,
+                'buyer_id': buyer.pk,
+                'category_id': rng.choice(category_ids),
+                'status': rng.choice(statuses),
+                'fingerprint': Invoice.make_fingerprint(
+                    f'{pk:020d}', seller.tax_id, seller.name, Decimal(total_amount), invoice_date
+                ),
+                'name_fingerprint': Invoice.make_fingerprint(
+                    f'{pk:020d}', None, seller.name, Decimal(total_amount), invoice_date
+                ),
+                'is_verified': False,
+                'created_by_id': rng.choice(user_ids),
+                'created_at': created_at.isoformat(' '),
+                'updated_at': created_at.isoformat(' '),
+            }
+
+        recognition_statuses = ['COMPLETED'] * 85 + ['MANUAL_COMPLETED'] * 6 + ['FAILED'] * 5 + ['PENDING'] * 3 + ['PROCESSING']
+        now = datetime.utcnow()
+
+        def recognition_row(pk):
+            status = rng.choice(recognition_statuses)
+            created_at = now - timedelta(seconds=rng.randrange(86400 * 365 * 2))
+            linked = status == 'COMPLETED' and rng.random() < 0.95
+            return {
+                'id': pk,
+                'file': f'invoice_files/{created_at:%Y%m%d}/{pk}.pdf',
+                'status': status,
+                'invoice_number': '',
+                'is_complete': status == 'COMPLETED',
+                'invoice_id': rng.randrange(1, invoice_count + 1) if linked else None,
+                'created_by_id': rng.choice(user_ids),
+                'attempts': 1,
+                'locked_by': '',
+                'created_at': created_at.isoformat(' '),
+                'updated_at': created_at.isoformat(' '),
+            }
+
+        self._bulk_insert(Invoice, invoice_row, invoice_count)
+        self._bulk_insert(InvoiceRecognition, recognition_row, recognition_count)
+
+        sample = Invoice.objects.using(BENCHMARK_ALIAS).order_by('pk').values('buyer_id', 'category_id').first()
+        return {
+            'user_id': user_ids[0],
+            'category_id': sample['category_id'] or category_ids[0],
+            'buyer_id': sample['buyer_id'],
+            'month': date(2022, 6, 1),
+        }
+
+    @staticmethod
+    def _create(model, objs):
+        """批量创建并重新读取（SQLite下 bulk_create 不回填主键）"""
+        queryset = model.objects.using(BENCHMARK_ALIAS)
+        first_pk = (queryset.order_by('-pk').values_list('pk', flat=True).first() or 0)
+        queryset.bulk_create(objs)
+        return list(queryset.filter(pk__gt=first_pk).order_by('pk'))
+
+    @staticmethod
+    def _bulk_insert(model, make_row, count, batch_size=10000):
+        columns = [field.column for field in model._meta.concrete_fields]
+        attnames = [field.attname for field in model._meta.concrete_fields]
+        sql = f"INSERT INTO {model._meta.db_table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        connection = connections[BENCHMARK_ALIAS]
+        with transaction.atomic(using=BENCHMARK_ALIAS), connection.cursor() as cursor:
+            for first in range(1, count + 1, batch_size):
+                rows = []
+                for pk in range(first, min(first + batch_size, count + 1)):
+                    row = make_row(pk)
+                    rows.append([row.get(attname, '' if attname in ('file', 'image', 'locked_by') else None)
+                                 for attname in attnames])
+                cursor.executemany(sql, rows)
+
+    @staticmethod
+    def _build_queries(user_id, category_id, buyer_id, month):
+        """与各视图相同的查询（发票列表、首页、报表、识别页面、识别队列）"""
+        invoices = Invoice.objects.using(BENCHMARK_ALIAS)
+        recognitions = InvoiceRecognition.objects.using(BENCHMARK_ALIAS)
+        invoice_list = invoices.select_related('category').order_by('-invoice_date')
+        month_end = (month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        now = timezone.now()
+        # 游标分页：从第499页最后一张发票之后取第500页
+        paginator = KeysetPaginator(invoice_list, 20)
+        cursor = paginator.encode_cursor(invoice_list.order_by('-invoice_date', '-id')[9979], paginator.NEXT)
+        return [
+            ('发票列表 第1页', lambda: list(invoice_list[:20])),
+            ('发票列表 第500页', lambda: list(invoice_list[9980:10000])),
+            ('发票列表 第500页（游标分页）', lambda: paginator.get_page(cursor).object_list),
+            ('发票列表 总数', lambda: invoice_list.count()),
+            ('发票列表 总数（计数上限）', lambda: paginator.approximate_count()),
+            ('发票列表 按类别筛选', lambda: list(invoice_list.filter(category_id=category_id)[:20])),
+            ('发票列表 按购买方筛选', lambda: list(invoice_list.filter(buyer_id=buyer_id)[:20])),
+            ('发票列表 按购买方筛选 总数', lambda: invoice_list.filter(buyer_id=buyer_id).count()),
+            ('发票列表 按状态筛选', lambda: list(invoice_list.filter(status='REJECTED')[:20])),
+            ('发票列表 按月份筛选', lambda: list(
+                invoice_list.filter(invoice_date__gte=month, invoice_date__lte=month_end)[:20]
+            )),
+            ('购买方下拉列表', lambda: list(
+                Party.objects.using(BENCHMARK_ALIAS).filter(is_buyer=True).only('id', 'name')
+            )),
+            ('首页 最近发票', lambda: list(invoices.order_by('-created_at')[:5])),
+            ('报表 月度合计', lambda: invoices.filter(
+                invoice_date__gte=month, invoice_date__lte=month_end
+            ).aggregate(total=Sum('total_amount'), count=Count('id'))),
+            ('识别页面 待确认', lambda: list(recognitions.filter(
+                status='COMPLETED', invoice__isnull=True, created_by_id=user_id
+            ).defer('result', 'result_data').order_by('-created_at'))),
+            ('识别页面 排队中', lambda: list(recognitions.filter(
+                status__in=['PENDING', 'PROCESSING'], created_by_id=user_id
+            ).defer('result', 'result_data').order_by('created_at'))),
+            ('识别页面 最近失败', lambda: list(recognitions.filter(
+                status='FAILED', created_by_id=user_id, created_at__gte=now - timedelta(days=1)
+            ).defer('result', 'result_data').order_by('-created_at'))),
+            ('识别队列 领取任务', lambda: list(
+                recognitions.filter(RecognitionQueue._claimable(now)).order_by('created_at')
+                .values_list('pk', flat=True)[:16]
+            )),
+        ]
+
+    @staticmethod
+    def _set_indexes(create):
+        """删除或创建模型 Meta.indexes 中的索引"""
+        with connections[BENCHMARK_ALIAS].schema_editor() as schema_editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    if create:
+                        schema_editor.add_index(model, index)
+                    else:
+                        schema_editor.remove_index(model, index)
+
+    @staticmethod
+    def _run(queries, repeat):
+        """执行每个查询，返回 {名称: (耗时中位数ms, 执行计划)}"""
+        connection = connections[BENCHMARK_ALIAS]
+        results = {}
+        for name, query in queries:
+            with CaptureQueriesContext(connection) as context:
+                query()
+            plans = []
+            with connection.cursor() as cursor:
+                for captured in context.captured_queries:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {captured['sql']}")
+                    plans.extend(row[-1] for row in cursor.fetchall())
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                query()
+                timings.append(time.perf_counter() - start)
+            results[name] = (statistics.median(timings) * 1000, plans)
+        return results
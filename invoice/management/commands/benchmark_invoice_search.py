@@ -0,0 +1,101 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+
+from invoice.management.commands.benchmark_invoice_queries import BENCHMARK_ALIAS, Command as QueryBenchmark
+from invoice.models import Invoice
+from invoice.search_index import InvoiceSearchIndex
+
+# 测试的搜索词：常见词、类别词、单字、公司名、完整发票号码、号码后8位、无结果
+DEFAULT_TERMS = ['有限公司', '技术服务费', '餐', '购买方123集团', '销售方4321科技', '00000000000000123456', '00123456', '不存在']
+
+
+class Command(BaseCommand):
+    help = '在临时SQLite数据库中生成大量发票，对比关键词搜索使用 icontains 查询和全文索引时发票列表第1页的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=1000000, help='生成的发票数')
+        parser.add_argument('--page-size', type=int, default=20, help='每页发票数')
+        parser.add_argument('--repeat', type=int, default=5, help='每个查询的重复次数，取中位数')
+        parser.add_argument('--term', action='append', dest='terms', help='搜索词，可重复指定')
+
+    def handle(self, *args, **options):
+        if options['invoices'] <= 0 or options['repeat'] <= 0:
+            raise CommandError('--invoices 和 --repeat 必须大于0')
+        terms = options['terms'] or DEFAULT_TERMS
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            connections.databases[BENCHMARK_ALIAS] = {
+                **connections.databases['default'],
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(tmp_dir, 'benchmark.sqlite3'),
+            }
+            try:
+                call_command('migrate', database=BENCHMARK_ALIAS, verbosity=0)
+                start = time.perf_counter()
+                QueryBenchmark()._seed(options['invoices'], 0)
+                self.stdout.write(f"已生成 {options['invoices']} 张发票，耗时 {time.perf_counter() - start:.1f}秒")
+
+                start = time.perf_counter()
+                InvoiceSearchIndex.rebuild(using=BENCHMARK_ALIAS)
+                with connections[BENCHMARK_ALIAS].cursor() as cursor:
+                    cursor.execute(
+                        "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE %s", [f'{InvoiceSearchIndex.TABLE}%']
+                    )
+                    index_bytes = cursor.fetchone()[0]
+                self.stdout.write(
+                    f'建立搜索索引耗时 {time.perf_counter() - start:.1f}秒，索引大小 {index_bytes / 1024 / 1024:.1f}MB'
+                )
+
+                for term in terms:
+                    before_ms, before_count = self._measure(self._icontains_page, term, options)
+                    after_ms, after_count = self._measure(self._ranked_page, term, options)
+                    self.stdout.write(self.style.SUCCESS(
+                        f'{term}: icontains {before_ms:.1f}ms（{before_count}条） -> '
+                        f'全文索引 {after_ms:.1f}ms（{after_count}条）'
+                    ))
+            finally:
+                connections[BENCHMARK_ALIAS].close()
+                del connections[BENCHMARK_ALIAS]
+                del connections.databases[BENCHMARK_ALIAS]
+
+    @staticmethod
+    def _measure(page_query, term, options):
+        """返回 (耗时中位数ms, 结果总数)"""
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            count = page_query(term, options['page_size'])
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000, count
+
+    @staticmethod
+    def _invoices():
+        return Invoice.objects.using(BENCHMARK_ALIAS).select_related('category').order_by('-invoice_date')
+
+    @classmethod
+    def _icontains_page(cls, term, page_size):
+        """调整前的发票列表搜索：四列 icontains，按开票日期排序分页"""
+        invoices = cls._invoices().filter(
+            Q(invoice_number__icontains=term) |
+            Q(invoice_content__icontains=term) |
+            Q(seller_name__icontains=term) |
+            Q(buyer_name__icontains=term)
+        )
+        page_obj = Paginator(invoices, page_size).get_page(1)
+        list(page_obj)
+        return page_obj.paginator.count
+
+    @classmethod
+    def _ranked_page(cls, term, page_size):
+        """与 invoice_list 视图相同：连接全文索引，按相关度排序分页"""
+        page_obj = Paginator(InvoiceSearchIndex.filter(cls._invoices(), term), page_size).get_page(1)
+        list(page_obj)
+        return page_obj.paginator.count
@@ -0,0 +1,140 @@
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from invoice import baidu_ocr_service
+from invoice.baidu_ocr_service import BaiduOCRService
+from invoice.fake_baidu_server import FakeBaiduOCRServer
+from invoice.ocr_cache import OCRResultCache
+from invoice.utils import InvoiceRecognizer
+
+
+def percentile(sorted_values, p):
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = '并发识别压测：输出吞吐量（文件/秒）和p50/p95/p99延迟，可配合本地百度OCR模拟服务使用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='样本发票文件（图片或PDF），按顺序循环使用')
+        parser.add_argument('--uploads', type=int, default=50, help='识别的文件总数')
+        parser.add_argument('--concurrency', type=int, default=8, help='同时进行的识别数')
+        parser.add_argument(
+            '--mode', choices=['service', 'recognizer'], default='recognizer',
+            help='service: 直接调用BaiduOCRService增值税发票识别；'
+                 'recognizer: 调用InvoiceRecognizer.recognize_invoice（与后台识别进程相同的链路）'
+        )
+        parser.add_argument('--use-cache', action='store_true', help='启用OCR结果缓存（默认关闭，以测量真实识别链路）')
+        parser.add_argument(
+            '--qps-limit', type=float, default=None,
+            help='客户端限流QPS，默认使用 BAIDU_OCR_QPS_LIMIT，0表示不限流'
+        )
+        parser.add_argument('--fake', action='store_true', help='在本进程内启动百度OCR模拟服务并将请求发往该服务')
+        parser.add_argument('--latency', type=float, default=0.2, help='模拟服务平均响应延迟（秒）')
+        parser.add_argument('--jitter', type=float, default=0.05, help='模拟服务响应延迟的标准差（秒）')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='模拟服务随机错误率（0~1）')
+        parser.add_argument('--server-qps-limit', type=int, default=0, help='模拟服务的QPS限制，0表示不限制')
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            if not os.path.exists(path):
+                raise CommandError(f'文件不存在: {path}')
+        uploads = max(1, options['uploads'])
+        concurrency = max(1, options['concurrency'])
+
+        overrides = {}
+        server = None
+        state_db = None
+        if options['fake']:
+            server = FakeBaiduOCRServer(
+                latency=options['latency'],
+                jitter=options['jitter'],
+                error_rate=options['error_rate'],
+                qps_limit=options['server_qps_limit'],
+            ).start()
+            # 使用单独的状态文件，避免模拟令牌和限流状态影响正式服务
+            state_db = os.path.join(tempfile.gettempdir(), f'baidu_ocr_benchmark_{os.getpid()}.sqlite3')
+            overrides.update(
+                BAIDU_OCR_BASE_URL=server.base_url,
+                BAIDU_OCR_API_KEY='fake',
+                BAIDU_OCR_SECRET_KEY='fake',
+                BAIDU_OCR_STATE_DB=state_db,
+            )
+            self.stdout.write(f'百度OCR模拟服务: {server.base_url}')
+        if options['qps_limit'] is not None:
+            overrides['BAIDU_OCR_QPS_LIMIT'] = options['qps_limit']
+
+        cache_enabled = OCRResultCache.ENABLED
+        previous_service = baidu_ocr_service._service_instance
+        try:
+            with override_settings(**overrides):
+                service = BaiduOCRService()
+                baidu_ocr_service._service_instance = service
+                OCRResultCache.ENABLED = options['use_cache']
+                service.get_access_token()
+
+                files = [options['paths'][i % len(options['paths'])] for i in range(uploads)]
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    results = list(executor.map(lambda path: self._recognize(options['mode'], service, path), files))
+                elapsed = time.perf_counter() - start
+        finally:
+            OCRResultCache.ENABLED = cache_enabled
+            baidu_ocr_service._service_instance = previous_service
+            if server is not None:
+                server.stop()
+            if state_db and os.path.exists(state_db):
+                os.remove(state_db)
+
+        latencies = sorted(latency for _, latency in results)
+        succeeded = sum(1 for success, _ in results if success)
+        self.stdout.write(self.style.SUCCESS(
+            f'识别 {uploads} 个文件（并发 {concurrency}，模式 {options["mode"]}）: '
+            f'成功 {succeeded}，失败 {uploads - succeeded}，总耗时 {elapsed:.2f}s，'
+            f'吞吐量 {uploads / elapsed:.2f} 文件/秒'
+        ))
+        self.stdout.write(
+            f'延迟: p50 {percentile(latencies, 50) * 1000:.0f}ms，'
+            f'p95 {percentile(latencies, 95) * 1000:.0f}ms，'
+            f'p99 {percentile(latencies, 99) * 1000:.0f}ms，'
+            f'最大 {latencies[-1] * 1000:.0f}ms'
+        )
+        stats = service.get_stats()
+        self.stdout.write(
+            f"OCR请求统计: 请求 {stats['requests']} 次，重试 {stats['retries']} 次，失败 {stats['failures']} 次，"
+            f"限流等待 {stats['rate_limited']} 次（共 {stats['rate_limit_wait_seconds']:.2f}s），"
+            f"新建连接 {stats['connections_opened']} 个"
+        )
+        if server is not None:
+            self.stdout.write(f'模拟服务统计: {server.stats}')
+
+    def _recognize(self, mode, service, path):
+        """识别单个文件
+
+        Returns:
+            tuple: (是否成功, 耗时秒数)
+        """
+        start = time.perf_counter()
+        try:
+            if mode == 'service':
+                success, _, _ = service.recognize_vat_invoice_file(path)
+            else:
+                invoice_info, _ = InvoiceRecognizer.recognize_invoice(path)
+                success = bool(invoice_info)
+        except Exception as e:
+            self.stderr.write(f'{path}: {e}')
+            success = False
+        finally:
+            connection.close()
+        return success, time.perf_counter() - start
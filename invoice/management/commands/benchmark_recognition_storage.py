@@ -0,0 +1,121 @@
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+import zlib
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.invoice_extractor import InvoiceInfoExtractor
+from invoice.management.commands.benchmark_extract_invoice_info import build_corpus
+
+# 两种存储方式的表结构：inline 为原始文本与识别结果同表存储；payload 为原始文本压缩后单独存储
+SCHEMAS = {
+    'inline': [
+        'CREATE TABLE recognition (id INTEGER PRIMARY KEY, file TEXT, status TEXT, result TEXT, raw_text TEXT, '
+        'invoice_id INTEGER, created_at REAL)',
+        'CREATE INDEX recognition_invoice_id ON recognition (invoice_id)',
+    ],
+    'payload': [
+        'CREATE TABLE recognition (id INTEGER PRIMARY KEY, file TEXT, status TEXT, result TEXT, '
+        'invoice_id INTEGER, created_at REAL)',
+        'CREATE INDEX recognition_invoice_id ON recognition (invoice_id)',
+        'CREATE TABLE payload (recognition_id INTEGER PRIMARY KEY, raw_text BLOB, raw_size INTEGER)',
+    ],
+}
+# 发票列表预取识别记录的查询：调整前读取全部列，调整后只读取文件链接所需的列
+LIST_QUERIES = {
+    'inline': 'SELECT id, file, status, result, raw_text, invoice_id, created_at FROM recognition WHERE invoice_id IN ({})',
+    'payload': 'SELECT id, invoice_id, file FROM recognition WHERE invoice_id IN ({})',
+}
+RAW_TEXT_QUERIES = {
+    'inline': 'SELECT raw_text FROM recognition WHERE id = ?',
+    'payload': 'SELECT raw_text FROM payload WHERE recognition_id = ?',
+}
+
+
+class Command(BaseCommand):
+    help = '在临时SQLite数据库中对比原始文本内联存储与压缩分表存储的行大小、发票列表查询耗时和数据库文件大小'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='生成的识别记录数')
+        parser.add_argument('--page-size', type=int, default=20, help='发票列表每页的发票数')
+        parser.add_argument('--queries', type=int, default=500, help='测量的列表查询次数，取中位数')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        if rows <= 0 or options['page_size'] <= 0:
+            raise CommandError('--rows 和 --page-size 必须大于0')
+
+        texts = build_corpus(min(rows, 2000))
+        results = [json.dumps(InvoiceInfoExtractor.extract(text), default=str) for text in texts]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report = {}
+            for layout in SCHEMAS:
+                path = os.path.join(tmp_dir, f'{layout}.sqlite3')
+                report[layout] = self._measure(path, layout, rows, texts, results, options)
+                stats = report[layout]
+                self.stdout.write(
+                    f"{layout}: 识别记录表平均每行 {stats['row_bytes']:.0f}B，数据库文件 {stats['file_bytes'] / 1024 / 1024:.1f}MB，"
+                    f"列表查询 p50 {stats['list_p50'] * 1000:.3f}ms，读取单条原始文本 p50 {stats['raw_p50'] * 1000:.3f}ms"
+                )
+
+        before, after = report['inline'], report['payload']
+        self.stdout.write(self.style.SUCCESS(
+            f"识别记录表行大小 {before['row_bytes']:.0f}B -> {after['row_bytes']:.0f}B，"
+            f"数据库文件 {before['file_bytes'] / 1024 / 1024:.1f}MB -> {after['file_bytes'] / 1024 / 1024:.1f}MB，"
+            f"列表查询 {before['list_p50'] * 1000:.3f}ms -> {after['list_p50'] * 1000:.3f}ms"
+        ))
+
+    def _measure(self, path, layout, rows, texts, results, options):
+        conn = sqlite3.connect(path)
+        for statement in SCHEMAS[layout]:
+            conn.execute(statement)
+
+        batch, payloads = [], []
+        for pk in range(1, rows + 1):
+            index = pk % len(texts)
+            row = [pk, f'invoice_recognition/2024/05/20/{pk:08d}.pdf', 'COMPLETED', results[index], pk, time.time()]
+            if layout == 'inline':
+                row.insert(4, texts[index])
+            else:
+                data = texts[index].encode('utf-8')
+                payloads.append((pk, zlib.compress(data, 6), len(data)))
+            batch.append(row)
+            if len(batch) >= 5000 or pk == rows:
+                conn.executemany(f"INSERT INTO recognition VALUES ({', '.join('?' * len(row))})", batch)
+                if payloads:
+                    conn.executemany('INSERT INTO payload VALUES (?, ?, ?)', payloads)
+                batch, payloads = [], []
+        conn.commit()
+        conn.execute('VACUUM')
+
+        table_bytes = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = 'recognition'").fetchone()[0]
+
+        rng = random.Random(0)
+        page_size = options['page_size']
+        list_query = LIST_QUERIES[layout].format(', '.join('?' * page_size))
+        list_timings, raw_timings = [], []
+        for _ in range(options['queries']):
+            first = rng.randint(1, max(1, rows - page_size))
+            start = time.perf_counter()
+            conn.execute(list_query, list(range(first, first + page_size))).fetchall()
+            list_timings.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            raw_text = conn.execute(RAW_TEXT_QUERIES[layout], (first,)).fetchone()[0]
+            if layout == 'payload':
+                zlib.decompress(raw_text).decode('utf-8')
+            raw_timings.append(time.perf_counter() - start)
+        conn.close()
+
+        return {
+            'row_bytes': table_bytes / rows,
+            'file_bytes': os.path.getsize(path),
+            'list_p50': statistics.median(list_timings),
+            'raw_p50': statistics.median(raw_timings),
+        }
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from invoice.fake_baidu_server import FakeBaiduOCRServer
+
+
+class Command(BaseCommand):
+    help = '启动本地百度OCR模拟服务（设置 BAIDU_OCR_BASE_URL 指向该地址后即可在不消耗额度的情况下压测）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+        parser.add_argument('--port', type=int, default=8765, help='监听端口')
+        parser.add_argument('--latency', type=float, default=0.2, help='识别接口平均响应延迟（秒）')
+        parser.add_argument('--jitter', type=float, default=0.05, help='响应延迟的标准差（秒）')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='随机错误率（0~1）')
+        parser.add_argument('--qps-limit', type=int, default=0, help='每秒允许的识别请求数，0表示不限制')
+
+    def handle(self, *args, **options):
+        server = FakeBaiduOCRServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            qps_limit=options['qps_limit'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'百度OCR模拟服务已启动: {server.base_url}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            self.stdout.write(f'模拟服务统计: {server.stats}')
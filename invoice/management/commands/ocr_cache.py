@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from invoice.ocr_cache import OCRResultCache
+
+
+class Command(BaseCommand):
+    help = '查看或维护OCR识别结果缓存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help='按保留天数和最大条数淘汰缓存')
+        parser.add_argument('--clear', action='store_true', help='清空全部缓存')
+        parser.add_argument('--reset-stats', action='store_true', help='清零累计的命中、未命中次数')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = OCRResultCache.clear()
+            self.stdout.write(self.style.SUCCESS(f'已清空OCR缓存，共删除 {deleted} 条'))
+        elif options['prune']:
+            deleted = OCRResultCache.evict()
+            self.stdout.write(self.style.SUCCESS(f'已淘汰 {deleted} 条OCR缓存'))
+        if options['reset_stats']:
+            OCRResultCache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('已清零OCR缓存计数'))
+
+        stats = OCRResultCache.get_stats()
+        self.stdout.write(f"缓存条数: {stats['entries']}")
+        self.stdout.write(
+            f"累计命中率: {stats['total_hit_rate']:.1%}（命中 {stats['total_hits']} 次，"
+            f"未命中 {stats['total_misses']} 次）"
+        )
+        self.stdout.write(f"累计写入 {stats['total_stores']} 条，淘汰 {stats['total_evictions']} 条")
+        self.stdout.write(
+            f"保留策略: 最多 {OCRResultCache.MAX_ENTRIES} 条，最长 {OCRResultCache.MAX_AGE_DAYS} 天"
+        )
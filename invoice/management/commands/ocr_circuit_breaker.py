@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from invoice.baidu_ocr_service import get_ocr_service
+from invoice.tesseract_engine import TesseractOCREngine
+
+
+class Command(BaseCommand):
+    help = '查看或重置百度OCR熔断器状态（所有进程共享）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='立即恢复为CLOSED状态，下一个请求直接发往百度OCR')
+
+    def handle(self, *args, **options):
+        service = get_ocr_service()
+        if service.circuit_breaker is None:
+            self.stdout.write('未启用熔断（BAIDU_OCR_CIRCUIT_FAILURE_THRESHOLD 为0）')
+            return
+
+        if options['reset']:
+            service.circuit_breaker.reset()
+            self.stdout.write(self.style.SUCCESS('已重置百度OCR熔断器'))
+
+        state = service.get_circuit_state()
+        self.stdout.write(f"熔断状态: {state['state']}")
+        self.stdout.write(f"连续失败次数: {state['failures']}")
+        if state['opened_until']:
+            self.stdout.write(f"探测恢复时间: {datetime.fromtimestamp(state['opened_until']):%Y-%m-%d %H:%M:%S}")
+        if state['last_error']:
+            self.stdout.write(f"最近失败原因: {state['last_error']}")
+        self.stdout.write(f"本地Tesseract可用: {'是' if TesseractOCREngine.is_available() else '否'}")
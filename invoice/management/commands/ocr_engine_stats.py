@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from invoice.ocr_engines import ALL_DOC_TYPES, get_ocr_router
+
+
+class Command(BaseCommand):
+    help = '查看识别引擎在各类文档上的滑动成功率、平均耗时、期望成本，以及当前的引擎尝试顺序'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='清空统计，所有引擎重新积累样本')
+
+    def handle(self, *args, **options):
+        router = get_ocr_router()
+        if options['reset']:
+            router.stats_store.reset()
+            self.stdout.write(self.style.SUCCESS('已清空识别引擎统计'))
+
+        engines = {engine.name: engine for engine in router.get_engines()}
+        for doc_type in ALL_DOC_TYPES:
+            self.stdout.write(f'[{doc_type}]')
+            for engine in engines.values():
+                if doc_type not in engine.doc_types:
+                    continue
+                stats = router.get_stats(engine.name, doc_type)
+                samples, success_rate, latency = stats
+                available = '' if engine.is_available() else '（不可用）'
+                self.stdout.write(
+                    f'  {engine.name}{available}: 成本 {engine.cost:g}，期望成本 {router.expected_cost(engine, stats):g}，'
+                    f'样本 {samples}，成功率 {success_rate:.1%}，平均耗时 {latency * 1000:.0f}ms'
+                )
+            planned = router.plan(doc_type, explore=False)
+            self.stdout.write(self.style.SUCCESS(f"  尝试顺序: {' -> '.join(engine.name for engine in planned) or '无'}"))
+
+        updated = [row['updated_at'] for row in router.stats_store.get_all()]
+        if updated:
+            self.stdout.write(f'统计更新时间: {datetime.fromtimestamp(max(updated)):%Y-%m-%d %H:%M:%S}')
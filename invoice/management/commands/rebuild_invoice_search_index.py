@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.search_index import InvoiceSearchIndex
+
+
+class Command(BaseCommand):
+    help = '重建发票关键词搜索索引（SQLite FTS5）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='数据库别名')
+
+    def handle(self, *args, **options):
+        if not InvoiceSearchIndex.is_supported(options['database']):
+            raise CommandError('当前数据库不使用搜索索引（仅支持SQLite，且 INVOICE_SEARCH_INDEX 为 True）')
+        start = time.perf_counter()
+        count = InvoiceSearchIndex.rebuild(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(
+            f'已重建 {count} 张发票的搜索索引，耗时 {time.perf_counter() - start:.1f}秒'
+        ))
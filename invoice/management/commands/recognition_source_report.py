@@ -0,0 +1,51 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from invoice.models import InvoiceRecognition
+
+# 识别结果来源说明，pdf_text、qr 和 tesseract 为本地识别（不调用百度OCR）
+SOURCE_LABELS = {
+    'pdf_text': 'PDF文本层',
+    'qr': '发票二维码',
+    'tesseract': '本地Tesseract',
+    'qr+baidu': '二维码+百度OCR',
+    'baidu': '百度OCR',
+    'baidu_general': '百度通用文字识别',
+    'baidu_accurate': '百度高精度文字识别',
+    'qr+baidu_general': '二维码+百度通用文字识别',
+    'qr+baidu_accurate': '二维码+百度高精度文字识别',
+}
+LOCAL_SOURCES = {'pdf_text', 'qr', 'tesseract'}
+
+
+class Command(BaseCommand):
+    help = '统计已完成识别记录的结果来源，输出未调用百度OCR的占比'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='统计最近多少天的识别记录，0表示全部')
+
+    def handle(self, *args, **options):
+        queryset = InvoiceRecognition.objects.filter(status='COMPLETED')
+        if options['days'] > 0:
+            queryset = queryset.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+
+        counts = Counter()
+        for row in queryset.order_by().values('result_data__source').annotate(count=Count('id')):
+            counts[row['result_data__source'] or 'unknown'] += row['count']
+
+        total = sum(counts.values())
+        if not total:
+            self.stdout.write('没有已完成的识别记录')
+            return
+
+        for source, count in counts.most_common():
+            label = SOURCE_LABELS.get(source, '未记录来源')
+            self.stdout.write(f'{label}（{source}）: {count} 条，占 {count / total:.1%}')
+        local = sum(counts[source] for source in LOCAL_SOURCES)
+        self.stdout.write(self.style.SUCCESS(
+            f'共 {total} 条识别记录，其中 {local} 条未调用百度OCR，占 {local / total:.1%}'
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from invoice.models import Party
+
+
+class Command(BaseCommand):
+    help = '重新统计被标记的交易方的规范名称（关联发票中出现次数最多的名称）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='数据库别名')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = Party.refresh_stale_names(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(
+            f'已重新统计 {count} 个交易方的名称，耗时 {time.perf_counter() - start:.1f}秒'
+        ))
@@ -0,0 +1,151 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from invoice.baidu_ocr_service import get_ocr_service
+from invoice.image_optimizer import ImageOptimizer
+from invoice.ocr_cache import OCRResultCache
+from invoice.qr_decoder import InvoiceQRDecoder
+from invoice.recognition_queue import RecognitionQueue
+from invoice.tesseract_engine import TesseractOCREngine
+
+
+class Command(BaseCommand):
+    help = '启动后台发票识别进程，从识别队列中领取任务并发调用OCR识别'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'RECOGNITION_WORKER_CONCURRENCY', 4),
+            help='同时进行的识别任务数'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='队列为空时的轮询间隔（秒）'
+        )
+        parser.add_argument(
+            '--lease-seconds', type=int, default=None,
+            help='任务租约时长（秒），默认使用 RECOGNITION_LEASE_SECONDS'
+        )
+        parser.add_argument(
+            '--stats-interval', type=float, default=300,
+            help='输出OCR请求统计的间隔（秒），0表示只在退出时输出'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='处理完当前队列中的任务后退出'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        lease_seconds = options['lease_seconds']
+        worker_id = RecognitionQueue.default_worker_id()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'识别进程已启动: {worker_id}，并发数: {concurrency}'
+        ))
+
+        stats_interval = options['stats_interval']
+        last_stats_at = time.monotonic()
+        processed = 0
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='recognition') as executor:
+            try:
+                while True:
+                    RecognitionQueue.fail_exhausted()
+
+                    free_slots = concurrency - len(in_flight)
+                    if free_slots > 0:
+                        for recognition in RecognitionQueue.claim(worker_id, free_slots, lease_seconds):
+                            in_flight.add(executor.submit(self._run_job, recognition, worker_id))
+                        # 查看原始文本时请求的通用文字识别
+                        free_slots = concurrency - len(in_flight)
+                        for recognition in RecognitionQueue.claim_raw_text(free_slots, lease_seconds):
+                            in_flight.add(executor.submit(self._run_raw_text_job, recognition))
+                    close_old_connections()
+
+                    if not in_flight:
+                        if options['once']:
+                            break
+                        time.sleep(poll_interval)
+                        continue
+
+                    done, in_flight = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        status = future.result()
+                        if status:
+                            processed += 1
+                    
+                    if stats_interval and time.monotonic() - last_stats_at >= stats_interval:
+                        self._write_stats()
+                        last_stats_at = time.monotonic()
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING('收到中断信号，等待正在进行的识别任务完成...'))
+                wait(in_flight)
+
+        # 进程内累加的OCR缓存计数写入数据库
+        OCRResultCache.flush_stats()
+        self._write_stats()
+        self.stdout.write(self.style.SUCCESS(f'识别进程退出，共处理 {processed} 个任务'))
+
+    def _write_stats(self):
+        """输出本进程的百度OCR请求统计、熔断状态、图片优化统计、二维码解码统计和OCR缓存统计"""
+        http_stats = get_ocr_service().get_stats()
+        avg_request_ms = http_stats['request_seconds'] * 1000 / http_stats['requests'] if http_stats['requests'] else 0
+        self.stdout.write(
+            f"OCR请求统计: 请求 {http_stats['requests']} 次，重试 {http_stats['retries']} 次，"
+            f"失败 {http_stats['failures']} 次，新建连接 {http_stats['connections_opened']} 个，"
+            f"复用连接 {http_stats['connections_reused']} 次，上传 {http_stats['upload_bytes'] / 1024:.0f}KB，"
+            f"平均耗时 {avg_request_ms:.0f}ms"
+        )
+        circuit_state = get_ocr_service().get_circuit_state()
+        tesseract_stats = TesseractOCREngine.get_stats()
+        self.stdout.write(
+            f"百度OCR熔断状态: {circuit_state['state']}，"
+            f"熔断拒绝 {http_stats['circuit_rejections']} 次，"
+            f"本地Tesseract识别 {tesseract_stats['succeeded']} 个（失败 {tesseract_stats['failed']} 个）"
+        )
+        image_stats = ImageOptimizer.get_stats()
+        self.stdout.write(
+            f"图片优化统计: 优化 {image_stats['optimized']} 张，跳过 {image_stats['skipped']} 张，"
+            f"节省 {image_stats['bytes_saved'] / 1024:.0f}KB（{image_stats['saved_ratio']:.0%}），"
+            f"优化耗时 {image_stats['optimize_seconds'] * 1000:.0f}ms"
+        )
+        qr_stats = InvoiceQRDecoder.get_stats()
+        self.stdout.write(
+            f"二维码解码统计: 尝试 {qr_stats['files']} 个文件，解码成功 {qr_stats['decoded']} 个"
+            f"（{qr_stats['decoded_ratio']:.0%}），耗时 {qr_stats['decode_seconds'] * 1000:.0f}ms"
+        )
+        cache_stats = OCRResultCache.get_stats()
+        self.stdout.write(
+            f"OCR缓存统计: 命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次，"
+            f"缓存条数 {cache_stats['entries']}"
+        )
+
+    def _run_job(self, recognition, worker_id):
+        """在线程中处理单个任务，结束后关闭该线程的数据库连接"""
+        try:
+            status = RecognitionQueue.process(recognition, worker_id)
+            self.stdout.write(f'识别记录 {recognition.pk}: {status or "租约失效"}')
+            return status
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'识别记录 {recognition.pk} 处理异常: {e}'))
+            return None
+        finally:
+            connection.close()
+
+    def _run_raw_text_job(self, recognition):
+        """在线程中处理原始文本识别请求，结束后关闭该线程的数据库连接"""
+        try:
+            found = RecognitionQueue.process_raw_text(recognition)
+            self.stdout.write(f'识别记录 {recognition.pk} 原始文本: {"已更新" if found else "未识别到文本"}')
+            return 'RAW_TEXT'
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'识别记录 {recognition.pk} 原始文本识别异常: {e}'))
+            return None
+        finally:
+            connection.close()
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0006_alter_invoicerecognition_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='尝试次数'),
+        ),
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='租约到期时间'),
+        ),
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='locked_by',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='处理进程'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0007_invoicerecognition_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=100, unique=True, verbose_name='缓存键')),
+                ('invoice_data', models.TextField(verbose_name='结构化识别结果')),
+                ('words_result', models.TextField(blank=True, null=True, verbose_name='原始识别结果')),
+                ('hit_count', models.PositiveIntegerField(default=0, verbose_name='命中次数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='创建时间')),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='最近使用时间')),
+            ],
+            options={
+                'verbose_name': 'OCR结果缓存',
+                'verbose_name_plural': 'OCR结果缓存',
+                'ordering': ['-last_used_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0008_ocrcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='raw_text',
+            field=models.TextField(blank=True, null=True, verbose_name='原始文本'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0009_invoicerecognition_raw_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='page_number',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='页码'),
+        ),
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='invoice.invoicerecognition', verbose_name='所属识别记录'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:48
+
+import zlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 500
+
+
+def move_raw_text_to_payload(apps, schema_editor):
+    """将已有识别记录的原始文本压缩后写入 RecognitionPayload"""
+    db_alias = schema_editor.connection.alias
+    InvoiceRecognition = apps.get_model('invoice', 'InvoiceRecognition')
+    RecognitionPayload = apps.get_model('invoice', 'RecognitionPayload')
+    batch = []
+    queryset = InvoiceRecognition.objects.using(db_alias).exclude(raw_text__isnull=True).exclude(raw_text='')
+    for pk, raw_text in queryset.values_list('pk', 'raw_text').iterator(chunk_size=BATCH_SIZE):
+        data = raw_text.encode('utf-8')
+        batch.append(RecognitionPayload(recognition_id=pk, raw_text=zlib.compress(data, 6), raw_size=len(data)))
+        if len(batch) >= BATCH_SIZE:
+            RecognitionPayload.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    if batch:
+        RecognitionPayload.objects.using(db_alias).bulk_create(batch)
+
+
+def restore_raw_text(apps, schema_editor):
+    """回滚：将压缩的原始文本写回识别记录"""
+    db_alias = schema_editor.connection.alias
+    InvoiceRecognition = apps.get_model('invoice', 'InvoiceRecognition')
+    RecognitionPayload = apps.get_model('invoice', 'RecognitionPayload')
+    for pk, data in RecognitionPayload.objects.using(db_alias).values_list('recognition_id', 'raw_text').iterator(chunk_size=BATCH_SIZE):
+        InvoiceRecognition.objects.using(db_alias).filter(pk=pk).update(raw_text=zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0010_invoicerecognition_pages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecognitionPayload',
+            fields=[
+                ('recognition', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload', serialize=False, to='invoice.invoicerecognition', verbose_name='识别记录')),
+                ('raw_text', models.BinaryField(verbose_name='原始文本（压缩）')),
+                ('raw_size', models.PositiveIntegerField(default=0, verbose_name='原始文本字节数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '识别原始文本',
+                'verbose_name_plural': '识别原始文本',
+            },
+        ),
+        migrations.RunPython(move_raw_text_to_payload, restore_raw_text),
+        migrations.RemoveField(
+            model_name='invoicerecognition',
+            name='raw_text',
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:50
+
+import django.core.serializers.json
+import json
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+REQUIRED_RESULT_FIELDS = ['invoice_number', 'amount', 'invoice_date']
+
+
+def parse_results(apps, schema_editor):
+    """将 result 中的JSON识别结果解析到 result_data，并填充 invoice_number、is_complete"""
+    db_alias = schema_editor.connection.alias
+    InvoiceRecognition = apps.get_model('invoice', 'InvoiceRecognition')
+    batch = []
+    queryset = InvoiceRecognition.objects.using(db_alias).filter(result__startswith='{').only('pk', 'result')
+    for recognition in queryset.iterator(chunk_size=BATCH_SIZE):
+        try:
+            invoice_info = json.loads(recognition.result)
+        except ValueError:
+            continue
+        if not isinstance(invoice_info, dict):
+            continue
+        recognition.result = None
+        recognition.result_data = invoice_info
+        recognition.invoice_number = str(invoice_info.get('invoice_number') or '')[:50]
+        recognition.is_complete = all(invoice_info.get(field) for field in REQUIRED_RESULT_FIELDS)
+        batch.append(recognition)
+        if len(batch) >= BATCH_SIZE:
+            InvoiceRecognition.objects.using(db_alias).bulk_update(batch, ['result', 'result_data', 'invoice_number', 'is_complete'])
+            batch = []
+    if batch:
+        InvoiceRecognition.objects.using(db_alias).bulk_update(batch, ['result', 'result_data', 'invoice_number', 'is_complete'])
+
+
+def dump_results(apps, schema_editor):
+    """回滚：将 result_data 写回 result"""
+    db_alias = schema_editor.connection.alias
+    InvoiceRecognition = apps.get_model('invoice', 'InvoiceRecognition')
+    queryset = InvoiceRecognition.objects.using(db_alias).filter(result_data__isnull=False).only('pk', 'result_data')
+    for recognition in queryset.iterator(chunk_size=BATCH_SIZE):
+        InvoiceRecognition.objects.using(db_alias).filter(pk=recognition.pk).update(
+            result=json.dumps(recognition.result_data, default=str)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0011_recognitionpayload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='invoice_number',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=50, verbose_name='识别的发票号码'),
+        ),
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='is_complete',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='识别结果完整'),
+        ),
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='result_data',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='识别结果'),
+        ),
+        migrations.AlterField(
+            model_name='invoicerecognition',
+            name='result',
+            field=models.TextField(blank=True, null=True, verbose_name='失败原因'),
+        ),
+        migrations.RunPython(parse_results, dump_results),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-17 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0012_recognition_result_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['invoice_date'], name='invoice_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['category', 'invoice_date'], name='invoice_category_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['buyer_name', 'invoice_date'], name='invoice_buyer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'invoice_date'], name='invoice_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_at'], name='invoice_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoicerecognition',
+            index=models.Index(fields=['created_by', 'status', 'invoice', 'created_at'], name='recognition_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoicerecognition',
+            index=models.Index(fields=['status', 'created_at'], name='recognition_status_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from invoice.search_index import InvoiceSearchIndex
+
+
+def build_search_index(apps, schema_editor):
+    """建立发票搜索索引表并写入已有发票（仅SQLite）"""
+    db_alias = schema_editor.connection.alias
+    if not InvoiceSearchIndex.is_supported(db_alias):
+        return
+    Invoice = apps.get_model('invoice', 'Invoice')
+    InvoiceSearchIndex.rebuild(queryset=Invoice.objects.using(db_alias), using=db_alias)
+
+
+def drop_search_index(apps, schema_editor):
+    """回滚：删除发票搜索索引表"""
+    db_alias = schema_editor.connection.alias
+    if schema_editor.connection.vendor == 'sqlite':
+        InvoiceSearchIndex.drop(db_alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0013_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:29
+
+import re
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+BATCH_SIZE = 500
+
+
+def normalize_tax_id(tax_id):
+    return re.sub(r'[^0-9A-Za-z]', '', tax_id or '').upper() or None
+
+
+def normalize_name(name):
+    return re.sub(r'\s+(?=[^\x00-\x7f])|(?<=[^\x00-\x7f])\s+', '', ' '.join((name or '').split()))[:100]
+
+
+def party_key(tax_id, name):
+    """与 Party.resolve 相同：有税号时按税号归并，否则按名称归并"""
+    tax_id = normalize_tax_id(tax_id)
+    if tax_id:
+        return ('tax_id', tax_id)
+    name = normalize_name(name)
+    return ('name', name) if name else None
+
+
+def backfill_parties(apps, schema_editor):
+    """由已有发票的销售方、购买方生成交易方（以出现次数最多的名称为规范名称），并关联发票"""
+    db_alias = schema_editor.connection.alias
+    Invoice = apps.get_model('invoice', 'Invoice')
+    Party = apps.get_model('invoice', 'Party')
+
+    names = defaultdict(Counter)
+    roles = defaultdict(set)
+    for role in ('seller', 'buyer'):
+        rows = Invoice.objects.using(db_alias).values(f'{role}_tax_id', f'{role}_name')\
+            .annotate(count=Count('id')).order_by()
+        for row in rows:
+            key = party_key(row[f'{role}_tax_id'], row[f'{role}_name'])
+            if key is None:
+                continue
+            name = normalize_name(row[f'{role}_name'])
+            if name:
+                names[key][name] += row['count']
+            roles[key].add(role)
+
+    Party.objects.using(db_alias).bulk_create([
+        Party(
+            tax_id=value if kind == 'tax_id' else None,
+            name=names[(kind, value)].most_common(1)[0][0] if names[(kind, value)] else '',
+            is_seller='seller' in roles[(kind, value)],
+            is_buyer='buyer' in roles[(kind, value)],
+        )
+        for kind, value in roles
+    ], batch_size=BATCH_SIZE)
+    party_ids = {
+        ('tax_id', tax_id) if tax_id else ('name', name): pk
+        for pk, tax_id, name in Party.objects.using(db_alias).values_list('id', 'tax_id', 'name')
+    }
+
+    batch = []
+    queryset = Invoice.objects.using(db_alias).only('id', 'seller_tax_id', 'seller_name', 'buyer_tax_id', 'buyer_name')
+    for invoice in queryset.iterator(chunk_size=BATCH_SIZE):
+        invoice.seller_id = party_ids.get(party_key(invoice.seller_tax_id, invoice.seller_name))
+        invoice.buyer_id = party_ids.get(party_key(invoice.buyer_tax_id, invoice.buyer_name))
+        batch.append(invoice)
+        if len(batch) >= BATCH_SIZE:
+            Invoice.objects.using(db_alias).bulk_update(batch, ['seller', 'buyer'])
+            batch = []
+    if batch:
+        Invoice.objects.using(db_alias).bulk_update(batch, ['seller', 'buyer'])
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0014_invoice_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Party',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tax_id', models.CharField(blank=True, max_length=50, null=True, unique=True, verbose_name='税号')),
+                ('name', models.CharField(max_length=100, verbose_name='名称')),
+                ('is_seller', models.BooleanField(default=False, verbose_name='销售方')),
+                ('is_buyer', models.BooleanField(default=False, verbose_name='购买方')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '交易方',
+                'verbose_name_plural': '交易方',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='party',
+            index=models.Index(fields=['is_buyer', 'name'], name='party_buyer_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='party',
+            index=models.Index(fields=['name'], name='party_name_idx'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='buyer',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bought_invoices', to='invoice.party', verbose_name='购买方'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='seller',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sold_invoices', to='invoice.party', verbose_name='销售方'),
+        ),
+        migrations.RunPython(backfill_parties, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='invoice_buyer_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['buyer', 'invoice_date'], name='invoice_buyer_date_idx'),
+        ),
+    ]
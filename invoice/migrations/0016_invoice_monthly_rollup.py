@@ -0,0 +1,71 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:36
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+BATCH_SIZE = 500
+
+
+def build_rollups(apps, schema_editor):
+    """由已有发票生成月度汇总"""
+    db_alias = schema_editor.connection.alias
+    Invoice = apps.get_model('invoice', 'Invoice')
+    InvoiceMonthlyRollup = apps.get_model('invoice', 'InvoiceMonthlyRollup')
+    rows = Invoice.objects.using(db_alias).annotate(rollup_month=TruncMonth('invoice_date'))\
+        .values('rollup_month', 'category_id', 'buyer_id', 'seller_id', 'status')\
+        .annotate(
+            rollup_count=Count('id'),
+            rollup_amount=Sum('amount'),
+            rollup_tax_amount=Sum('tax_amount'),
+            rollup_total_amount=Sum('total_amount'),
+        ).order_by()
+    batch = []
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        batch.append(InvoiceMonthlyRollup(
+            month=row['rollup_month'], category_id=row['category_id'], buyer_id=row['buyer_id'],
+            seller_id=row['seller_id'], status=row['status'], invoice_count=row['rollup_count'],
+            amount=row['rollup_amount'] or 0, tax_amount=row['rollup_tax_amount'] or 0,
+            total_amount=row['rollup_total_amount'] or 0,
+        ))
+        if len(batch) >= BATCH_SIZE:
+            InvoiceMonthlyRollup.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    InvoiceMonthlyRollup.objects.using(db_alias).bulk_create(batch)
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0015_party'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='月份')),
+                ('status', models.CharField(choices=[('PENDING', '待处理'), ('VERIFIED', '已验证'), ('REJECTED', '已拒绝'), ('USED', '已使用')], max_length=20, verbose_name='状态')),
+                ('invoice_count', models.IntegerField(default=0, verbose_name='发票数')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='金额')),
+                ('tax_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='税额')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='价税合计')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('buyer', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='invoice.party', verbose_name='购买方')),
+                ('category', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='invoice.invoicecategory', verbose_name='发票类别')),
+                ('seller', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='invoice.party', verbose_name='销售方')),
+            ],
+            options={
+                'verbose_name': '发票月度汇总',
+                'verbose_name_plural': '发票月度汇总',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='invoicemonthlyrollup',
+            constraint=models.UniqueConstraint(fields=('month', 'category', 'buyer', 'seller', 'status'), name='invoice_rollup_key'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-17 09:12
+
+from django.db import migrations
+from django.db.models import Count
+
+KEY_FIELDS = ['month', 'category_id', 'buyer_id', 'seller_id', 'status']
+AMOUNT_FIELDS = ['amount', 'tax_amount', 'total_amount']
+
+
+def merge_duplicate_rollups(apps, schema_editor):
+    """合并汇总键中含空值的重复汇总行（唯一约束不约束空值，并发创建时可能重复）"""
+    db_alias = schema_editor.connection.alias
+    InvoiceMonthlyRollup = apps.get_model('invoice', 'InvoiceMonthlyRollup')
+    rollups = InvoiceMonthlyRollup.objects.using(db_alias)
+    duplicates = rollups.values(*KEY_FIELDS).annotate(rows=Count('id')).filter(rows__gt=1).order_by()
+    for key in list(duplicates):
+        key.pop('rows')
+        first, *others = rollups.filter(**key).order_by('pk')
+        for other in others:
+            for field in ['invoice_count'] + AMOUNT_FIELDS:
+                setattr(first, field, getattr(first, field) + getattr(other, field))
+        first.save(update_fields=['invoice_count'] + AMOUNT_FIELDS)
+        rollups.filter(pk__in=[other.pk for other in others]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0017_invoice_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        # 空值按0比较的唯一索引（Django 3.2 的 UniqueConstraint 不支持表达式）
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX invoice_rollup_key_nulls ON invoice_invoicemonthlyrollup '
+            '(month, COALESCE(category_id, 0), COALESCE(buyer_id, 0), COALESCE(seller_id, 0), status)',
+            'DROP INDEX invoice_rollup_key_nulls',
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:12
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+BATCH_SIZE = 500
+
+
+def rebuild_rollups(apps, db_alias):
+    """与 InvoiceMonthlyRollup.rebuild 相同：由发票表重新生成月度汇总"""
+    Invoice = apps.get_model('invoice', 'Invoice')
+    InvoiceMonthlyRollup = apps.get_model('invoice', 'InvoiceMonthlyRollup')
+    InvoiceMonthlyRollup.objects.using(db_alias).all().delete()
+    rows = Invoice.objects.using(db_alias).annotate(rollup_month=TruncMonth('invoice_date'))\
+        .values('rollup_month', 'category_id', 'buyer_id', 'seller_id', 'status')\
+        .annotate(
+            rollup_count=Count('id'),
+            rollup_amount=Sum('amount'),
+            rollup_tax_amount=Sum('tax_amount'),
+            rollup_total_amount=Sum('total_amount'),
+        ).order_by()
+    batch = []
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        batch.append(InvoiceMonthlyRollup(
+            month=row['rollup_month'], category_id=row['category_id'], buyer_id=row['buyer_id'],
+            seller_id=row['seller_id'], status=row['status'], invoice_count=row['rollup_count'],
+            amount=row['rollup_amount'] or 0, tax_amount=row['rollup_tax_amount'] or 0,
+            total_amount=row['rollup_total_amount'] or 0,
+        ))
+        if len(batch) >= BATCH_SIZE:
+            InvoiceMonthlyRollup.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    InvoiceMonthlyRollup.objects.using(db_alias).bulk_create(batch)
+
+
+def merge_duplicate_parties(apps, schema_editor):
+    """合并名称相同、没有税号的重复交易方（并发保存发票时可能重复创建），发票改为关联保留的交易方"""
+    db_alias = schema_editor.connection.alias
+    Invoice = apps.get_model('invoice', 'Invoice')
+    Party = apps.get_model('invoice', 'Party')
+
+    parties = Party.objects.using(db_alias).filter(tax_id__isnull=True)
+    duplicates = parties.values('name').annotate(rows=Count('id')).filter(rows__gt=1).order_by()
+    merged = False
+    for row in list(duplicates):
+        first, *others = parties.filter(name=row['name']).order_by('pk')
+        other_ids = [other.pk for other in others]
+        Invoice.objects.using(db_alias).filter(seller_id__in=other_ids).update(seller_id=first.pk)
+        Invoice.objects.using(db_alias).filter(buyer_id__in=other_ids).update(buyer_id=first.pk)
+        first.is_seller = first.is_seller or any(other.is_seller for other in others)
+        first.is_buyer = first.is_buyer or any(other.is_buyer for other in others)
+        first.save(update_fields=['is_seller', 'is_buyer'])
+        Party.objects.using(db_alias).filter(pk__in=other_ids).delete()
+        merged = True
+    # 月度汇总按交易方ID汇总，合并后重新生成
+    if merged:
+        rebuild_rollups(apps, db_alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0018_invoice_rollup_null_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='party',
+            name='name_stale',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='名称待重新统计'),
+        ),
+        migrations.RunPython(merge_duplicate_parties, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='party',
+            constraint=models.UniqueConstraint(condition=models.Q(('tax_id__isnull', True)), fields=('name',), name='party_unique_name_without_tax_id'),
+        ),
+    ]
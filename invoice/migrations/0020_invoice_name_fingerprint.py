@@ -0,0 +1,65 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:40
+
+import hashlib
+import re
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+FINGERPRINT_FIELDS = ['invoice_number', 'seller_name', 'total_amount', 'invoice_date']
+
+
+def normalize_tax_id(tax_id):
+    return re.sub(r'[^0-9A-Za-z]', '', tax_id or '').upper() or None
+
+
+def normalize_name(name):
+    return re.sub(r'\s+(?=[^\x00-\x7f])|(?<=[^\x00-\x7f])\s+', '', ' '.join((name or '').split()))[:100]
+
+
+def make_fingerprint(invoice_number, seller_tax_id, seller_name, total_amount, invoice_date):
+    """与 Invoice.make_fingerprint 相同（已保存的发票金额为Decimal、日期为date）"""
+    number = re.sub(r'[^0-9A-Za-z]', '', invoice_number or '').upper()
+    if not number or total_amount is None or not isinstance(invoice_date, date):
+        return ''
+    cents = (Decimal(str(total_amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+    tax_id = normalize_tax_id(seller_tax_id)
+    seller = f'T:{tax_id}' if tax_id else f'N:{normalize_name(seller_name)}'
+    return hashlib.sha1(f'{number}|{seller}|{cents}|{invoice_date.isoformat()}'.encode('utf-8')).hexdigest()
+
+
+def backfill_name_fingerprints(apps, schema_editor):
+    """按销售方名称计算已有发票的重复检查指纹"""
+    db_alias = schema_editor.connection.alias
+    Invoice = apps.get_model('invoice', 'Invoice')
+
+    batch = []
+    queryset = Invoice.objects.using(db_alias).only('id', *FINGERPRINT_FIELDS)
+    for invoice in queryset.iterator(chunk_size=BATCH_SIZE):
+        invoice.name_fingerprint = make_fingerprint(
+            invoice.invoice_number, None, invoice.seller_name, invoice.total_amount, invoice.invoice_date
+        )
+        batch.append(invoice)
+        if len(batch) >= BATCH_SIZE:
+            Invoice.objects.using(db_alias).bulk_update(batch, ['name_fingerprint'])
+            batch = []
+    if batch:
+        Invoice.objects.using(db_alias).bulk_update(batch, ['name_fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0019_party_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='name_fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=40, verbose_name='重复检查指纹（按销售方名称）'),
+        ),
+        migrations.RunPython(backfill_name_fingerprints, migrations.RunPython.noop),
+    ]
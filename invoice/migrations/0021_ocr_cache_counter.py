@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0020_invoice_name_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRCacheCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True, verbose_name='计数项')),
+                ('value', models.BigIntegerField(default=0, verbose_name='累计次数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': 'OCR缓存计数',
+                'verbose_name_plural': 'OCR缓存计数',
+            },
+        ),
+    ]
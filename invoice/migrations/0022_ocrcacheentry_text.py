@@ -0,0 +1,60 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:40
+
+import json
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+ROUTER_KEY_SUFFIX = ':router'
+
+
+def move_router_text(apps, schema_editor):
+    """识别路由的缓存原先把原始文本存放在 words_result 中，移到 text 字段"""
+    db_alias = schema_editor.connection.alias
+    OCRCacheEntry = apps.get_model('invoice', 'OCRCacheEntry')
+    queryset = OCRCacheEntry.objects.using(db_alias).filter(
+        cache_key__endswith=ROUTER_KEY_SUFFIX, words_result__isnull=False
+    ).only('pk', 'words_result')
+    batch = []
+    for entry in queryset.iterator(chunk_size=BATCH_SIZE):
+        try:
+            text = json.loads(entry.words_result)
+        except ValueError:
+            text = None
+        entry.text = text if isinstance(text, str) else None
+        entry.words_result = None
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            OCRCacheEntry.objects.using(db_alias).bulk_update(batch, ['text', 'words_result'])
+            batch = []
+    if batch:
+        OCRCacheEntry.objects.using(db_alias).bulk_update(batch, ['text', 'words_result'])
+
+
+def restore_router_text(apps, schema_editor):
+    """回滚：将识别路由缓存的原始文本写回 words_result"""
+    db_alias = schema_editor.connection.alias
+    OCRCacheEntry = apps.get_model('invoice', 'OCRCacheEntry')
+    queryset = OCRCacheEntry.objects.using(db_alias).filter(
+        cache_key__endswith=ROUTER_KEY_SUFFIX, text__isnull=False
+    ).only('pk', 'text')
+    for entry in queryset.iterator(chunk_size=BATCH_SIZE):
+        OCRCacheEntry.objects.using(db_alias).filter(pk=entry.pk).update(
+            words_result=json.dumps(entry.text, ensure_ascii=False)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0021_ocr_cache_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrcacheentry',
+            name='text',
+            field=models.TextField(blank=True, null=True, verbose_name='原始文本'),
+        ),
+        migrations.RunPython(move_router_text, restore_router_text),
+    ]
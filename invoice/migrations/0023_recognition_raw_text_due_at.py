@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0022_ocrcacheentry_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicerecognition',
+            name='raw_text_due_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='原始文本识别请求时间'),
+        ),
+    ]
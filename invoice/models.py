@@ -1,7 +1,16 @@
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from collections import Counter
+from decimal import Decimal, ROUND_HALF_UP
+import hashlib
 import os
+import re
+import zlib
 
 # 公司信息模型
 class Company(models.Model):
@@ -38,6 +47,162 @@ class InvoiceCategory(models.Model):
     def __str__(self):
         return self.name
 
+# 交易方（销售方/购买方）模型
+class Party(models.Model):
+    """按税号归并的交易方
+
+    同一税号的名称可能因OCR识别误差而不同，以关联发票中出现次数最多的名称作为规范名称；
+    没有税号的交易方（如个人）按名称归并。发票保存时自动关联。
+    发票上的名称与规范名称不同时只标记 name_stale，规范名称由
+    python manage.py refresh_party_names 统一重新统计（统计需要扫描交易方的全部发票）。
+    """
+    tax_id = models.CharField('税号', max_length=50, unique=True, null=True, blank=True)
+    name = models.CharField('名称', max_length=100)
+    is_seller = models.BooleanField('销售方', default=False)
+    is_buyer = models.BooleanField('购买方', default=False)
+    name_stale = models.BooleanField('名称待重新统计', default=False, db_index=True)
+    created_at = models.DateTimeField('创建时间', auto_now_add=True)
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+
+    class Meta:
+        verbose_name = '交易方'
+        verbose_name_plural = '交易方'
+        ordering = ['name']
+        indexes = [
+            # 购买方下拉列表；无税号的交易方按名称查找
+            models.Index(fields=['is_buyer', 'name'], name='party_buyer_name_idx'),
+            models.Index(fields=['name'], name='party_name_idx'),
+        ]
+        constraints = [
+            # 没有税号的交易方按（规范化的）名称归并，名称唯一
+            models.UniqueConstraint(fields=['name'], condition=Q(tax_id__isnull=True), name='party_unique_name_without_tax_id'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def normalize_tax_id(tax_id):
+        """去掉空格和符号并转为大写，为空时返回None"""
+        return re.sub(r'[^0-9A-Za-z]', '', tax_id or '').upper() or None
+
+    @staticmethod
+    def normalize_name(name):
+        """合并连续空白，并去掉中文前后的空格（OCR常在汉字间插入空格）"""
+        return re.sub(r'\s+(?=[^\x00-\x7f])|(?<=[^\x00-\x7f])\s+', '', ' '.join((name or '').split()))[:100]
+
+    @classmethod
+    def resolve(cls, tax_id, name, role):
+        """按税号（没有税号时按名称）查找或创建交易方
+
+        Args:
+            tax_id: 发票上的税号
+            name: 发票上的名称
+            role: 'seller' 或 'buyer'
+
+        Returns:
+            Party: 税号和名称都为空时返回None
+        """
+        tax_id = cls.normalize_tax_id(tax_id)
+        name = cls.normalize_name(name)
+        if not tax_id and not name:
+            return None
+        flag = 'is_seller' if role == 'seller' else 'is_buyer'
+        if tax_id:
+            party, created = cls.objects.get_or_create(tax_id=tax_id, defaults={'name': name, flag: True})
+        else:
+            party, created = cls.objects.get_or_create(tax_id=None, name=name, defaults={flag: True})
+        if not created and (not getattr(party, flag) or (name and not party.name)):
+            setattr(party, flag, True)
+            party.name = party.name or name
+            party.save(update_fields=[flag, 'name', 'updated_at'])
+        return party
+
+    @classmethod
+    def resolve_many(cls, pairs, role):
+        """批量查找或创建交易方，归并规则与 resolve 相同，查询次数与数量无关
+
+        Args:
+            pairs: [(税号, 名称)]
+            role: 'seller' 或 'buyer'
+
+        Returns:
+            list: 与 pairs 一一对应的 Party，税号和名称都为空时为None
+        """
+        flag = 'is_seller' if role == 'seller' else 'is_buyer'
+        keys, names = [], {}
+        for tax_id, name in pairs:
+            tax_id, name = cls.normalize_tax_id(tax_id), cls.normalize_name(name)
+            key = ('tax_id', tax_id) if tax_id else (('name', name) if name else None)
+            keys.append(key)
+            if key and (key not in names or not names[key]):
+                names[key] = name
+
+        def load():
+            found = {}
+            tax_ids = [value for kind, value in names if kind == 'tax_id']
+            plain_names = [value for kind, value in names if kind == 'name']
+            parties = cls.objects.filter(Q(tax_id__in=tax_ids) | Q(tax_id__isnull=True, name__in=plain_names)).order_by('pk')
+            for party in parties:
+                found.setdefault(('tax_id', party.tax_id) if party.tax_id else ('name', party.name), party)
+            return found
+
+        found = load() if names else {}
+        missing = [key for key in names if key not in found]
+        if missing:
+            cls.objects.bulk_create([
+                cls(tax_id=value if kind == 'tax_id' else None, name=names[(kind, value)], **{flag: True})
+                for kind, value in missing
+            ], ignore_conflicts=True)
+            found = load()
+        for key, party in found.items():
+            if not getattr(party, flag) or (names[key] and not party.name):
+                setattr(party, flag, True)
+                party.name = party.name or names[key]
+                party.save(update_fields=[flag, 'name', 'updated_at'])
+        return [found.get(key) if key else None for key in keys]
+
+    @classmethod
+    def mark_name_stale(cls, parties, using=None):
+        """发票上出现了与规范名称不同的名称，标记交易方的规范名称待重新统计
+
+        Args:
+            parties: [(Party, 发票上的名称)]，Party 可以为None
+        """
+        stale_ids = {
+            party.pk for party, name in parties
+            if party and not party.name_stale and party.name != cls.normalize_name(name)
+        }
+        if stale_ids:
+            cls.objects.using(using).filter(pk__in=stale_ids).update(name_stale=True)
+
+    @classmethod
+    def refresh_stale_names(cls, using='default'):
+        """重新统计所有被标记的交易方的规范名称
+
+        Returns:
+            int: 重新统计的交易方数
+        """
+        count = 0
+        for party in cls.objects.using(using).filter(name_stale=True).iterator():
+            party.refresh_name()
+            count += 1
+        return count
+
+    def refresh_name(self):
+        """以关联发票中出现次数最多的名称作为规范名称，并清除待重新统计标记"""
+        counts = Counter()
+        for related, field in ((self.sold_invoices, 'seller_name'), (self.bought_invoices, 'buyer_name')):
+            for row in related.values(field).annotate(count=Count('id')).order_by():
+                name = self.normalize_name(row[field])
+                if name:
+                    counts[name] += row['count']
+        name = counts.most_common(1)[0][0] if counts else self.name
+        if name != self.name or self.name_stale:
+            self.name = name
+            self.name_stale = False
+            self.save(update_fields=['name', 'name_stale', 'updated_at'])
+
 # 发票模型
 class Invoice(models.Model):
     INVOICE_TYPE_CHOICES = (
@@ -66,6 +231,9 @@ class Invoice(models.Model):
     seller_tax_id = models.CharField('销售方税号', max_length=50)
     buyer_name = models.CharField('购买方名称', max_length=100)
     buyer_tax_id = models.CharField('购买方税号', max_length=50)
+    seller = models.ForeignKey(Party, on_delete=models.SET_NULL, null=True, blank=True, related_name='sold_invoices', verbose_name='销售方')
+    # 购买方筛选使用 invoice_buyer_date_idx 索引，不再单独建索引
+    buyer = models.ForeignKey(Party, on_delete=models.SET_NULL, null=True, blank=True, related_name='bought_invoices', verbose_name='购买方', db_index=False)
     category = models.ForeignKey(InvoiceCategory, on_delete=models.SET_NULL, null=True, verbose_name='发票类别')
     company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, verbose_name='所属公司')
     description = models.TextField('描述', blank=True, null=True)
@@ -73,6 +241,10 @@ class Invoice(models.Model):
     is_verified = models.BooleanField('是否已验证', default=False)
     verification_date = models.DateTimeField('验证时间', null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_invoices', verbose_name='创建人')
+    # 重复检查指纹（见 make_fingerprint），保存时计算；name_fingerprint 总是按销售方名称计算，
+    # 用于匹配没有识别出销售方税号的发票
+    fingerprint = models.CharField('重复检查指纹', max_length=40, blank=True, default='', db_index=True, editable=False)
+    name_fingerprint = models.CharField('重复检查指纹（按销售方名称）', max_length=40, blank=True, default='', db_index=True, editable=False)
     created_at = models.DateTimeField('创建时间', auto_now_add=True)
     updated_at = models.DateTimeField('更新时间', auto_now=True)
     
@@ -89,14 +261,241 @@ class Invoice(models.Model):
         verbose_name = '发票'
         verbose_name_plural = '发票'
         ordering = ['-invoice_date', '-created_at']
+        indexes = [
+            # 发票列表按开票日期倒序分页，发票列表和报表按开票日期范围筛选
+            models.Index(fields=['invoice_date'], name='invoice_date_idx'),
+            # 发票列表按类别、购买方、状态筛选后按开票日期排序
+            models.Index(fields=['category', 'invoice_date'], name='invoice_category_date_idx'),
+            models.Index(fields=['buyer', 'invoice_date'], name='invoice_buyer_date_idx'),
+            models.Index(fields=['status', 'invoice_date'], name='invoice_status_date_idx'),
+            # 首页最近添加的发票
+            models.Index(fields=['created_at'], name='invoice_created_at_idx'),
+        ]
     
     def __str__(self):
         return f"{self.invoice_number} - {self.total_amount}"
     
-    def save(self, *args, **kwargs):
+    PARTY_FIELDS = ['seller_name', 'seller_tax_id', 'buyer_name', 'buyer_tax_id']
+    FINGERPRINT_FIELDS = ['invoice_number', 'seller_tax_id', 'seller_name', 'total_amount', 'invoice_date']
+
+    @staticmethod
+    def make_fingerprint(invoice_number, seller_tax_id, seller_name, total_amount, invoice_date):
+        """重复检查指纹
+
+        规范化的发票号码、销售方（有税号时用税号，否则用名称）、价税合计（分）和开票日期拼接后的SHA1。
+
+        Returns:
+            str: 发票号码、价税合计或开票日期为空（或无法解析）时返回空字符串
+        """
+        number = re.sub(r'[^0-9A-Za-z]', '', invoice_number or '').upper()
+        if not number:
+            return ''
+        try:
+            cents = (Decimal(str(total_amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+            invoice_date = Invoice._meta.get_field('invoice_date').to_python(invoice_date)
+        except (ArithmeticError, ValidationError, TypeError, ValueError):
+            return ''
+        if invoice_date is None:
+            return ''
+        tax_id = Party.normalize_tax_id(seller_tax_id)
+        seller = f'T:{tax_id}' if tax_id else f'N:{Party.normalize_name(seller_name)}'
+        return hashlib.sha1(f'{number}|{seller}|{cents}|{invoice_date.isoformat()}'.encode('utf-8')).hexdigest()
+
+    def fill_computed_fields(self):
+        """补全价税合计并计算重复检查指纹（批量创建时不调用 save()，需先调用本方法）"""
         if not self.total_amount:
             self.total_amount = self.amount + self.tax_amount
+        self.fingerprint = self.make_fingerprint(*(getattr(self, name) for name in self.FINGERPRINT_FIELDS))
+        self.name_fingerprint = self.make_fingerprint(
+            self.invoice_number, None, self.seller_name, self.total_amount, self.invoice_date
+        )
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(self.FINGERPRINT_FIELDS):
+            self.fill_computed_fields()
+            if update_fields is not None:
+                kwargs['update_fields'] = list(update_fields) + ['fingerprint', 'name_fingerprint']
+        elif not self.total_amount:
+            self.total_amount = self.amount + self.tax_amount
+        # 发票、交易方和月度汇总（由 signals 更新）在同一事务中写入
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Invoice, instance=self)):
+            self._save_with_parties(*args, **kwargs)
+
+    def _save_with_parties(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not set(update_fields) & set(self.PARTY_FIELDS):
+            super().save(*args, **kwargs)
+            return
+        # 关联销售方、购买方
+        self.seller = Party.resolve(self.seller_tax_id, self.seller_name, 'seller')
+        self.buyer = Party.resolve(self.buyer_tax_id, self.buyer_name, 'buyer')
+        if update_fields is not None:
+            kwargs['update_fields'] = list(update_fields) + ['seller', 'buyer']
         super().save(*args, **kwargs)
+        # 发票上的名称与规范名称不同时标记规范名称待重新统计
+        Party.mark_name_stale(((self.seller, self.seller_name), (self.buyer, self.buyer_name)), kwargs.get('using'))
+
+# 发票月度汇总
+class InvoiceMonthlyRollup(models.Model):
+    """按（月份、类别、购买方、销售方、状态）汇总的发票数量和金额
+
+    发票保存、删除时由 signals 在同一事务内增量更新，首页和统计报表只读取该表；
+    可用 python manage.py rebuild_invoice_rollups 重建。
+    """
+    KEY_FIELDS = ['month', 'category_id', 'buyer_id', 'seller_id', 'status']
+    AMOUNT_FIELDS = ['amount', 'tax_amount', 'total_amount']
+    # 发票中影响汇总的字段
+    SOURCE_FIELDS = ['invoice_date', 'category_id', 'buyer_id', 'seller_id', 'status'] + AMOUNT_FIELDS
+
+    month = models.DateField('月份')  # 当月第一天
+    # 类别、交易方删除后由 signals 重建汇总，不使用数据库外键约束
+    category = models.ForeignKey(InvoiceCategory, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+', verbose_name='发票类别')
+    buyer = models.ForeignKey(Party, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+', verbose_name='购买方')
+    seller = models.ForeignKey(Party, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+', verbose_name='销售方')
+    status = models.CharField('状态', max_length=20, choices=Invoice.STATUS_CHOICES)
+    invoice_count = models.IntegerField('发票数', default=0)
+    amount = models.DecimalField('金额', max_digits=16, decimal_places=2, default=0)
+    tax_amount = models.DecimalField('税额', max_digits=16, decimal_places=2, default=0)
+    total_amount = models.DecimalField('价税合计', max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+
+    class Meta:
+        verbose_name = '发票月度汇总'
+        verbose_name_plural = '发票月度汇总'
+        ordering = ['-month']
+        # 唯一约束不约束空值，类别、交易方为空的汇总键另由迁移0018中的唯一索引
+        # invoice_rollup_key_nulls（空值按0比较）保证唯一；该约束同时用作按汇总键查找的索引
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'category', 'buyer', 'seller', 'status'], name='invoice_rollup_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.status} {self.invoice_count}"
+
+    @classmethod
+    def bucket(cls, invoice):
+        """发票所属的汇总键和金额
+
+        Args:
+            invoice: Invoice 对象，或包含 SOURCE_FIELDS 的dict
+
+        Returns:
+            tuple: (汇总键dict, 金额dict)
+        """
+        get = invoice.get if isinstance(invoice, dict) else lambda name: getattr(invoice, name)
+        # 视图中可能以字符串赋值（如表单提交的日期、类别ID），按字段类型转换
+        fields = {field.attname: field for field in Invoice._meta.concrete_fields}
+        key = {field: fields[field].to_python(get(field)) for field in cls.KEY_FIELDS if field != 'month'}
+        key['month'] = fields['invoice_date'].to_python(get('invoice_date')).replace(day=1)
+        amounts = {field: Decimal(str(get(field) or 0)) for field in cls.AMOUNT_FIELDS}
+        return key, amounts
+
+    @classmethod
+    def apply(cls, key, amounts, sign, using='default'):
+        """将一张发票计入（sign=1）或移出（sign=-1）汇总
+
+        移出时汇总行不存在（如汇总回填前保存的发票）不做处理，不写入负数的汇总行。
+        """
+        if sign > 0:
+            cls._add_group(key, {'invoice_count': 1, **amounts}, using)
+            return
+        queryset = cls.objects.using(using).filter(**key)
+        if queryset.update(
+            invoice_count=F('invoice_count') - 1,
+            updated_at=timezone.now(),
+            **{field: F(field) - amounts[field] for field in cls.AMOUNT_FIELDS}
+        ):
+            queryset.filter(invoice_count__lte=0).delete()
+
+    @classmethod
+    def add_invoices(cls, invoices, using='default'):
+        """将批量创建（不发送保存信号）的发票计入汇总，需在创建发票的事务中调用
+
+        按汇总键合并后一次查询已有的汇总行，再批量更新和创建。
+        """
+        groups = {}
+        for invoice in invoices:
+            key, amounts = cls.bucket(invoice)
+            group = groups.setdefault(tuple(key[field] for field in cls.KEY_FIELDS), {
+                'invoice_count': 0, **{field: Decimal(0) for field in cls.AMOUNT_FIELDS}
+            })
+            group['invoice_count'] += 1
+            for field in cls.AMOUNT_FIELDS:
+                group[field] += amounts[field]
+        if not groups:
+            return
+        condition = Q()
+        for values in groups:
+            condition |= Q(**dict(zip(cls.KEY_FIELDS, values)))
+        now = timezone.now()
+        existing = []
+        for rollup in cls.objects.using(using).select_for_update().filter(condition):
+            group = groups.pop(tuple(getattr(rollup, field) for field in cls.KEY_FIELDS))
+            for field, value in group.items():
+                setattr(rollup, field, getattr(rollup, field) + value)
+            rollup.updated_at = now
+            existing.append(rollup)
+        cls.objects.using(using).bulk_update(existing, ['invoice_count', 'updated_at'] + cls.AMOUNT_FIELDS)
+        try:
+            with transaction.atomic(using=using):
+                cls.objects.using(using).bulk_create([
+                    cls(**dict(zip(cls.KEY_FIELDS, values)), **group) for values, group in groups.items()
+                ])
+        except IntegrityError:
+            # 部分汇总行已被并发的事务创建，逐行计入
+            for values, group in groups.items():
+                cls._add_group(dict(zip(cls.KEY_FIELDS, values)), group, using)
+
+    @classmethod
+    def _add_group(cls, key, group, using):
+        """将一组发票的数量和金额计入一个汇总行
+
+        汇总行不存在时创建；与并发的事务同时创建（违反唯一约束）时改为更新该行。
+        """
+        queryset = cls.objects.using(using).filter(**key)
+        changes = dict(updated_at=timezone.now(), **{field: F(field) + value for field, value in group.items()})
+        if queryset.update(**changes):
+            return
+        try:
+            with transaction.atomic(using=using):
+                cls.objects.using(using).create(**key, **group)
+        except IntegrityError:
+            queryset.update(**changes)
+
+    @classmethod
+    def rebuild(cls, using='default', batch_size=1000):
+        """由发票表重新生成全部汇总
+
+        Returns:
+            int: 汇总行数
+        """
+        rows = Invoice.objects.using(using).annotate(rollup_month=TruncMonth('invoice_date'))\
+            .values('rollup_month', 'category_id', 'buyer_id', 'seller_id', 'status')\
+            .annotate(
+                rollup_count=Count('id'),
+                rollup_amount=Sum('amount'),
+                rollup_tax_amount=Sum('tax_amount'),
+                rollup_total_amount=Sum('total_amount'),
+            ).order_by()
+        count = 0
+        with transaction.atomic(using=using):
+            cls.objects.using(using).all().delete()
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(cls(
+                    month=row['rollup_month'], category_id=row['category_id'], buyer_id=row['buyer_id'],
+                    seller_id=row['seller_id'], status=row['status'], invoice_count=row['rollup_count'],
+                    amount=row['rollup_amount'] or 0, tax_amount=row['rollup_tax_amount'] or 0,
+                    total_amount=row['rollup_total_amount'] or 0,
+                ))
+                if len(batch) >= batch_size:
+                    cls.objects.using(using).bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            cls.objects.using(using).bulk_create(batch)
+            count += len(batch)
+        return count
 
 
 
@@ -114,11 +513,27 @@ class InvoiceRecognition(models.Model):
         ('MANUAL_COMPLETED', '手动完成'),
     )
     
+    # 识别结果中均有值时计为结果完整（可自动确认）
+    REQUIRED_RESULT_FIELDS = ['invoice_number', 'amount', 'invoice_date']
+    
     file = models.FileField('文件', upload_to=invoice_recognition_file_path)
     status = models.CharField('状态', max_length=20, choices=STATUS_CHOICES, default='PENDING')
-    result = models.TextField('识别结果', blank=True, null=True)
+    result = models.TextField('失败原因', blank=True, null=True)
+    # 识别出的发票信息；发票号码和结果是否完整另存为带索引的列，待确认队列可直接在SQL中筛选和计数
+    result_data = models.JSONField('识别结果', blank=True, null=True, encoder=DjangoJSONEncoder)
+    invoice_number = models.CharField('识别的发票号码', max_length=50, blank=True, default='', db_index=True)
+    is_complete = models.BooleanField('识别结果完整', default=False, db_index=True)
     invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, null=True, blank=True, related_name='recognitions', verbose_name='关联发票')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='recognitions', verbose_name='创建人')
+    # 后台识别队列的租约信息（PENDING→PROCESSING时写入，租约过期后可被其他进程重新领取）
+    attempts = models.PositiveIntegerField('尝试次数', default=0)
+    locked_by = models.CharField('处理进程', max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField('租约到期时间', null=True, blank=True)
+    # 多页PDF逐页识别：第1页的结果写在原记录上，其余每页生成一条子记录（共用同一文件）
+    page_number = models.PositiveIntegerField('页码', null=True, blank=True)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='pages', verbose_name='所属识别记录')
+    # 按需调用通用文字识别重新生成原始文本：请求时写入当前时间，后台识别进程领取时改为租约到期时间，完成后清空
+    raw_text_due_at = models.DateTimeField('原始文本识别请求时间', null=True, blank=True, db_index=True)
     created_at = models.DateTimeField('创建时间', auto_now_add=True)
     updated_at = models.DateTimeField('更新时间', auto_now=True)
     
@@ -126,6 +541,100 @@ class InvoiceRecognition(models.Model):
         verbose_name = '发票识别记录'
         verbose_name_plural = '发票识别记录'
         ordering = ['-created_at']
+        indexes = [
+            # 识别页面：当前用户的待确认（未关联发票）、排队中和失败记录，按创建时间排序
+            models.Index(fields=['created_by', 'status', 'invoice', 'created_at'], name='recognition_user_status_idx'),
+            # 后台识别进程按创建时间领取待处理任务、查找租约过期的任务
+            models.Index(fields=['status', 'created_at'], name='recognition_status_idx'),
+        ]
     
     def __str__(self):
         return f"识别记录 {self.id}"
+    
+    @classmethod
+    def result_fields(cls, invoice_info):
+        """识别结果对应的字段值（result_data 及由其提取的 invoice_number、is_complete），用于 update()/create()"""
+        if not invoice_info:
+            return {'result_data': None, 'invoice_number': '', 'is_complete': False}
+        return {
+            'result_data': invoice_info,
+            'invoice_number': str(invoice_info.get('invoice_number') or '')[:50],
+            'is_complete': all(invoice_info.get(field) for field in cls.REQUIRED_RESULT_FIELDS),
+        }
+    
+    def get_raw_text(self):
+        """原始文本（从 RecognitionPayload 解压），没有时返回空字符串"""
+        try:
+            return self.payload.get_raw_text()
+        except RecognitionPayload.DoesNotExist:
+            return ''
+    
+    def set_raw_text(self, raw_text):
+        """压缩保存原始文本，为空时删除已保存的原始文本"""
+        if not raw_text:
+            RecognitionPayload.objects.filter(recognition=self).delete()
+            return
+        data = RecognitionPayload.compress(raw_text)
+        payload, _ = RecognitionPayload.objects.update_or_create(
+            recognition=self,
+            defaults={'raw_text': data, 'raw_size': len(raw_text.encode('utf-8'))},
+        )
+        self.payload = payload
+
+
+# 识别记录的原始文本（zlib压缩后单独存储，列表和队列查询不读取，只在查看原始文本时按需加载）
+class RecognitionPayload(models.Model):
+    recognition = models.OneToOneField(InvoiceRecognition, on_delete=models.CASCADE, primary_key=True, related_name='payload', verbose_name='识别记录')
+    raw_text = models.BinaryField('原始文本（压缩）')
+    raw_size = models.PositiveIntegerField('原始文本字节数', default=0)
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+    
+    class Meta:
+        verbose_name = '识别原始文本'
+        verbose_name_plural = '识别原始文本'
+    
+    def __str__(self):
+        return f"识别记录 {self.recognition_id} 的原始文本"
+    
+    @staticmethod
+    def compress(raw_text):
+        return zlib.compress(raw_text.encode('utf-8'), 6)
+    
+    @staticmethod
+    def decompress(data):
+        return zlib.decompress(bytes(data)).decode('utf-8')
+    
+    def get_raw_text(self):
+        return self.decompress(self.raw_text) if self.raw_text else ''
+
+
+# OCR识别结果缓存（按文件内容SHA-256去重，重复上传同一文件时不再调用百度OCR）
+class OCRCacheEntry(models.Model):
+    cache_key = models.CharField('缓存键', max_length=100, unique=True)
+    invoice_data = models.TextField('结构化识别结果')
+    words_result = models.TextField('原始识别结果', blank=True, null=True)
+    text = models.TextField('原始文本', blank=True, null=True)
+    hit_count = models.PositiveIntegerField('命中次数', default=0)
+    created_at = models.DateTimeField('创建时间', auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField('最近使用时间', default=timezone.now, db_index=True)
+    
+    class Meta:
+        verbose_name = 'OCR结果缓存'
+        verbose_name_plural = 'OCR结果缓存'
+        ordering = ['-last_used_at']
+    
+    def __str__(self):
+        return self.cache_key
+
+# OCR结果缓存的累计计数（命中、未命中等），所有进程共用，可由 ocr_cache 命令查看命中率
+class OCRCacheCounter(models.Model):
+    name = models.CharField('计数项', max_length=20, unique=True)
+    value = models.BigIntegerField('累计次数', default=0)
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'OCR缓存计数'
+        verbose_name_plural = 'OCR缓存计数'
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
@@ -0,0 +1,253 @@
+# encoding:utf-8
+"""
+OCR识别结果缓存
+
+以文件内容的SHA-256作为键，持久化保存百度增值税发票识别的结构化结果
+（_parse_vat_invoice_result 的输出）和原始 words_result。
+同一文件重复上传时直接返回缓存结果，不再发起网络请求。
+识别路由（ocr_engines.OCRRouter）的最终结果以 kind='router' 的键另行缓存，
+内容为路由返回的发票信息和原始文本（保存在 text 字段，words_result 只保存百度的原始返回）。
+
+命中、未命中等次数先在进程内累加，每隔 STATS_FLUSH_SECONDS 秒（及识别进程退出时）
+用一条UPDATE累计到 OCRCacheCounter 表中（所有进程共用），避免每次查缓存都占用数据库写锁；
+python manage.py ocr_cache 可查看累计命中率。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class OCRResultCache:
+    """基于数据库的OCR识别结果缓存"""
+
+    ENABLED = getattr(settings, 'OCR_CACHE_ENABLED', True)
+    # 最多保留的缓存条数，超出时按最近使用时间淘汰
+    MAX_ENTRIES = getattr(settings, 'OCR_CACHE_MAX_ENTRIES', 10000)
+    # 缓存最长保留天数，超过后视为过期
+    MAX_AGE_DAYS = getattr(settings, 'OCR_CACHE_MAX_AGE_DAYS', 90)
+    # 每写入多少条缓存执行一次淘汰
+    EVICT_EVERY = 100
+    # 进程内累加的计数每隔多少秒写入数据库
+    STATS_FLUSH_SECONDS = getattr(settings, 'OCR_CACHE_STATS_FLUSH_SECONDS', 60)
+
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    _lock = threading.Lock()
+    _stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+    # 尚未写入数据库的计数
+    _pending = dict.fromkeys(_stats, 0)
+    _last_flush = time.monotonic()
+
+    @classmethod
+    def file_sha256(cls, file_path):
+        """分块计算文件内容的SHA-256"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(cls.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(content_hash, page=None, kind=None):
+        """生成缓存键，多页PDF按页区分，kind 区分同一文件的不同结果（如识别路由的最终结果）"""
+        key = f"{content_hash}:p{page}" if page else content_hash
+        if kind:
+            return f"{key}:{kind}"
+        return key
+
+    @classmethod
+    def _incr(cls, name, amount=1):
+        """计入当前进程的统计，距上次写入数据库超过 STATS_FLUSH_SECONDS 秒时写入累计计数"""
+        with cls._lock:
+            cls._stats[name] += amount
+            cls._pending[name] += amount
+            due = time.monotonic() - cls._last_flush >= cls.STATS_FLUSH_SECONDS
+        if due:
+            cls.flush_stats()
+
+    @classmethod
+    def flush_stats(cls):
+        """将进程内尚未写入的计数用一条UPDATE累计到数据库（计数行不存在时创建）"""
+        from .models import OCRCacheCounter
+
+        with cls._lock:
+            pending = {name: value for name, value in cls._pending.items() if value}
+            cls._pending = dict.fromkeys(cls._stats, 0)
+            cls._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        now = timezone.now()
+        counters = OCRCacheCounter.objects.filter(name__in=pending)
+        try:
+            updated = counters.update(
+                value=Case(
+                    *[When(name=name, then=F('value') + value) for name, value in pending.items()],
+                    output_field=models.BigIntegerField(),
+                ),
+                updated_at=now,
+            )
+            if updated < len(pending):
+                for name in pending.keys() - set(counters.values_list('name', flat=True)):
+                    try:
+                        with transaction.atomic():
+                            OCRCacheCounter.objects.create(name=name, value=pending[name])
+                    except IntegrityError:
+                        # 其他进程同时创建了该计数
+                        OCRCacheCounter.objects.filter(name=name).update(
+                            value=F('value') + pending[name], updated_at=now
+                        )
+        except Exception as e:
+            # 计数写入失败不影响识别，留到下次写入
+            logger.warning(f"OCR缓存计数写入失败: {str(e)}")
+            with cls._lock:
+                for name, value in pending.items():
+                    cls._pending[name] += value
+
+    @classmethod
+    def get(cls, cache_key):
+        """读取缓存
+
+        Args:
+            cache_key: 缓存键（见 make_key）
+
+        Returns:
+            tuple: (invoice_data, words_result, text)，未命中时返回None
+        """
+        from .models import OCRCacheEntry
+
+        if not cls.ENABLED:
+            return None
+
+        min_created_at = timezone.now() - timedelta(days=cls.MAX_AGE_DAYS)
+        entry = OCRCacheEntry.objects.filter(
+            cache_key=cache_key, created_at__gte=min_created_at
+        ).first()
+        if entry is None:
+            cls._incr('misses')
+            return None
+
+        try:
+            invoice_data = json.loads(entry.invoice_data)
+            words_result = json.loads(entry.words_result) if entry.words_result else None
+        except (json.JSONDecodeError, TypeError):
+            logger.warning(f"OCR缓存内容损坏，已删除: {cache_key}")
+            entry.delete()
+            cls._incr('misses')
+            return None
+
+        OCRCacheEntry.objects.filter(pk=entry.pk).update(
+            hit_count=F('hit_count') + 1, last_used_at=timezone.now()
+        )
+        cls._incr('hits')
+        logger.info(f"OCR缓存命中: {cache_key}")
+        return invoice_data, words_result, entry.text
+
+    @classmethod
+    def set(cls, cache_key, invoice_data, words_result=None, text=None):
+        """写入缓存（同一键重复写入时覆盖）
+
+        Args:
+            cache_key: 缓存键（见 make_key）
+            invoice_data: 结构化识别结果
+            words_result: 百度OCR原始返回的words_result
+            text: 识别的原始文本
+        """
+        from .models import OCRCacheEntry
+
+        if not cls.ENABLED:
+            return
+
+        values = {
+            'invoice_data': json.dumps(invoice_data, ensure_ascii=False, default=str),
+            'words_result': json.dumps(words_result, ensure_ascii=False) if words_result is not None else None,
+            'text': text,
+            'last_used_at': timezone.now(),
+        }
+        try:
+            OCRCacheEntry.objects.update_or_create(cache_key=cache_key, defaults=values)
+        except IntegrityError:
+            # 其他进程同时写入了同一文件的结果，保留已有缓存即可
+            return
+
+        cls._incr('stores')
+        if cls._stats['stores'] % cls.EVICT_EVERY == 0:
+            cls.evict()
+
+    @classmethod
+    def evict(cls):
+        """按保留天数和最大条数淘汰缓存
+
+        Returns:
+            int: 删除的缓存条数
+        """
+        from .models import OCRCacheEntry
+
+        min_created_at = timezone.now() - timedelta(days=cls.MAX_AGE_DAYS)
+        deleted, _ = OCRCacheEntry.objects.filter(created_at__lt=min_created_at).delete()
+
+        overflow = OCRCacheEntry.objects.count() - cls.MAX_ENTRIES
+        if overflow > 0:
+            stale_ids = list(
+                OCRCacheEntry.objects.order_by('last_used_at').values_list('pk', flat=True)[:overflow]
+            )
+            extra, _ = OCRCacheEntry.objects.filter(pk__in=stale_ids).delete()
+            deleted += extra
+
+        if deleted:
+            cls._incr('evictions', deleted)
+            logger.info(f"OCR缓存淘汰 {deleted} 条")
+        return deleted
+
+    @classmethod
+    def clear(cls):
+        """清空缓存"""
+        from .models import OCRCacheEntry
+
+        deleted, _ = OCRCacheEntry.objects.all().delete()
+        return deleted
+
+    @classmethod
+    def reset_stats(cls):
+        """清零当前进程和数据库中的累计计数"""
+        from .models import OCRCacheCounter
+
+        with cls._lock:
+            cls._stats = dict.fromkeys(cls._stats, 0)
+            cls._pending = dict.fromkeys(cls._stats, 0)
+        OCRCacheCounter.objects.all().delete()
+
+    @classmethod
+    def get_stats(cls):
+        """缓存统计
+
+        Returns:
+            dict: 当前进程的计数（hits、misses、stores、evictions、hit_rate），所有进程的累计计数
+                （total_hits、total_misses、total_stores、total_evictions、total_hit_rate）和缓存条数（entries）
+        """
+        from .models import OCRCacheCounter, OCRCacheEntry
+
+        with cls._lock:
+            stats = dict(cls._stats)
+            pending = dict(cls._pending)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+
+        totals = dict(OCRCacheCounter.objects.values_list('name', 'value'))
+        for name in ('hits', 'misses', 'stores', 'evictions'):
+            stats[f'total_{name}'] = totals.get(name, 0) + pending[name]
+        lookups = stats['total_hits'] + stats['total_misses']
+        stats['total_hit_rate'] = round(stats['total_hits'] / lookups, 4) if lookups else 0.0
+        stats['entries'] = OCRCacheEntry.objects.count()
+        return stats
@@ -0,0 +1,463 @@
+# encoding:utf-8
+"""
+识别引擎注册表与按成本路由
+
+每种识别方式封装为一个引擎（OCREngine），声明支持的文档类型和单次识别的相对成本：
+
+    pdf_text        PDF文本层解析（本地）
+    qr              发票二维码解码（本地）
+    baidu_general   百度通用文字识别 + 本地规则提取
+    baidu_accurate  百度高精度文字识别 + 本地规则提取
+    baidu           百度增值税发票识别（结构化结果）
+    tesseract       本地Tesseract识别，仅在百度OCR熔断期间可用
+
+路由器（OCRRouter）按期望成本（成本 / 成功率）从低到高依次尝试支持该类文档的引擎，结果完整即返回，
+不完整时才升级到下一个引擎。每个引擎在每类文档上的成功率和耗时记录在共享的滑动统计中，
+样本不足 MIN_SAMPLES 时按成功率100%估计（按 EXPLORE_RATE 的比例仍如此估计，以便排在后面的引擎的统计随实际情况更新），
+期望成本相同的引擎先尝试平均耗时短的。每个文件最多调用 MAX_REMOTE_CALLS 个远程（付费）引擎。
+
+调用第一个远程引擎前先按文件内容（多页PDF按页）查 OCRResultCache，命中时直接返回；远程引擎得到的完整结果写入缓存。
+多页PDF由 InvoiceRecognizer.recognize_pdf_pages 逐页调用路由器，上下文中的 page_number 为页码。
+
+引擎名称同时作为识别结果的 source，与 recognition_source_report 的统计口径一致。
+自定义引擎可在 OCR_ENGINES 中填写类的导入路径，或调用 get_ocr_router().register() 注册。
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .baidu_ocr_config import BaiduOCRConfig
+from .baidu_ocr_service import get_ocr_service
+from .engine_stats import EngineStatsStore
+from .invoice_extractor import InvoiceInfoExtractor
+from .ocr_cache import OCRResultCache
+from .qr_decoder import InvoiceQRDecoder
+from .tesseract_engine import TesseractOCREngine
+from .utils import InvoiceRecognizer
+
+logger = logging.getLogger(__name__)
+
+# 引擎识别结果：complete 为False表示结果不完整，路由器会继续尝试更贵的引擎
+EngineResult = namedtuple('EngineResult', ['invoice_info', 'text', 'complete'])
+
+# 文档类型
+DOC_IMAGE = 'image'  # 图片
+DOC_PDF_TEXT = 'pdf_text'  # 带文本层的PDF（电子发票）
+DOC_PDF_SCAN = 'pdf_scan'  # 没有文本层的PDF（扫描件）
+ALL_DOC_TYPES = (DOC_IMAGE, DOC_PDF_TEXT, DOC_PDF_SCAN)
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.tiff', '.tif']
+
+# 未配置 OCR_ENGINES 时启用的引擎（百度付费接口只启用增值税发票识别）
+DEFAULT_ENGINES = ['pdf_text', 'qr', 'baidu', 'tesseract']
+
+
+class OCREngine:
+    """识别引擎接口
+
+    子类设置 name、doc_types 和 cost，实现 recognize()。
+    """
+
+    name = ''
+    # 支持的文档类型
+    doc_types = ALL_DOC_TYPES
+    # 单次识别的相对成本，路由器按期望成本（成本 / 成功率）从低到高尝试
+    cost = 0.0
+    # 是否调用远程（付费）接口：调用前先查OCR结果缓存，且每个文件的调用次数受 MAX_REMOTE_CALLS 限制
+    remote = False
+    # 不完整的结果是否合并进最终结果（其中已有的字段优先），如二维码中的发票号码和金额
+    merge_partial = False
+
+    def __init__(self, cost=None):
+        if cost is not None:
+            self.cost = float(cost)
+
+    def is_available(self):
+        """当前是否可用（依赖未安装、未配置或服务熔断时返回False）"""
+        return True
+
+    def recognize(self, file_path, context):
+        """识别发票文件
+
+        Args:
+            file_path: 文件路径
+            context: 本次识别的上下文，doc_type 为文档类型，text 为PDF文本层（图片为空字符串），
+                page_number 为PDF的页码（识别整个文件时为None），deadline 为识别截止时间（time.monotonic()，可以为None）
+
+        Returns:
+            EngineResult: 识别结果，识别失败时返回None
+        """
+        raise NotImplementedError
+
+
+class PdfTextEngine(OCREngine):
+    """解析PDF内嵌文本层，要求字段完整且金额自洽"""
+
+    name = 'pdf_text'
+    doc_types = (DOC_PDF_TEXT,)
+
+    def recognize(self, file_path, context):
+        invoice_info = InvoiceRecognizer.parse_local_invoice_text(context['text'])
+        if not invoice_info:
+            return None
+        return EngineResult(invoice_info, context['text'], True)
+
+
+class QRCodeEngine(OCREngine):
+    """本地解码发票二维码，并用PDF文本层补充二维码中没有的字段"""
+
+    name = 'qr'
+    merge_partial = True
+
+    def is_available(self):
+        return InvoiceQRDecoder.is_available()
+
+    def recognize(self, file_path, context):
+        invoice_info, payload = InvoiceRecognizer.recognize_qr_code(
+            file_path, context['text'], context.get('page_number') or 1
+        )
+        if not invoice_info:
+            return None
+        # 二维码中没有销售方等信息；PDF文本层也未补全且 OCR_QR_FILL_FROM_OCR 开启时视为不完整，由后续引擎补全
+        return EngineResult(invoice_info, payload, not InvoiceRecognizer.qr_needs_ocr(invoice_info))
+
+
+class BaiduEngine(OCREngine):
+    """百度OCR引擎的公共部分：未配置密钥或熔断中（未到探测时间）时不可用"""
+
+    remote = True
+
+    def is_available(self):
+        return BaiduOCRConfig.is_configured() and get_ocr_service().circuit_allows_request()
+
+
+class BaiduTextEngine(BaiduEngine):
+    """百度文字识别 + 本地规则提取，提取结果完整且金额自洽时才算完整"""
+
+    doc_types = (DOC_IMAGE,)
+    use_accurate = False
+
+    def recognize(self, file_path, context):
+        success, text, _ = get_ocr_service().recognize_text(file_path, use_accurate=self.use_accurate)
+        if not success or not text.strip():
+            return None
+        invoice_info = InvoiceRecognizer.parse_local_invoice_text(text)
+        if invoice_info:
+            return EngineResult(invoice_info, text, True)
+
+        invoice_info = InvoiceRecognizer.extract_invoice_info(text)
+        invoice_info.update(InvoiceInfoExtractor.extract_two_column_parties(text))
+        if not invoice_info.get('invoice_number'):
+            return None
+        return EngineResult(InvoiceRecognizer._format_extracted_info(invoice_info, text), text, False)
+
+
+class BaiduGeneralEngine(BaiduTextEngine):
+    name = 'baidu_general'
+    cost = 1.0
+
+
+class BaiduAccurateEngine(BaiduTextEngine):
+    name = 'baidu_accurate'
+    cost = 3.0
+    use_accurate = True
+
+
+class BaiduVATEngine(BaiduEngine):
+    """百度增值税发票识别（支持图片和PDF，结果按内容缓存）"""
+
+    name = 'baidu'
+    cost = 10.0
+    # 结果完整所需的字段
+    REQUIRED_FIELDS = ['invoice_number', 'invoice_date']
+
+    def recognize(self, file_path, context):
+        # 缓存由路由器统一读写
+        deadline = context.get('deadline')
+        success, invoice_info, words_result = InvoiceRecognizer.extract_structured_invoice_data(
+            file_path, return_raw=True, use_cache=False, page_number=context.get('page_number'),
+            wait_timeout=max(0, deadline - time.monotonic()) if deadline else None,
+        )
+        if not success:
+            return None
+        # 原始文本默认由增值税发票识别结果生成，不再额外调用通用文字识别接口
+        if context['doc_type'] == DOC_IMAGE and InvoiceRecognizer.RAW_TEXT_SOURCE == 'general':
+            text = InvoiceRecognizer.extract_text_from_image(file_path)
+        else:
+            text = get_ocr_service().words_result_to_text(words_result)
+        complete = (all(invoice_info.get(field) for field in self.REQUIRED_FIELDS)
+                    and bool(invoice_info.get('total_amount') or invoice_info.get('amount')))
+        return EngineResult(invoice_info, text, complete)
+
+
+class TesseractEngine(OCREngine):
+    """本地Tesseract识别，仅在百度OCR熔断期间使用"""
+
+    name = 'tesseract'
+    cost = 20.0
+
+    def is_available(self):
+        return TesseractOCREngine.is_available() and get_ocr_service().is_circuit_open()
+
+    def recognize(self, file_path, context):
+        invoice_info, text = InvoiceRecognizer.recognize_with_fallback_engine(file_path, context.get('page_number') or 1)
+        if not invoice_info:
+            return None
+        return EngineResult(invoice_info, text, True)
+
+
+# 内置引擎：名称 -> 类
+ENGINE_CLASSES = {
+    engine_class.name: engine_class
+    for engine_class in (
+        PdfTextEngine, QRCodeEngine, BaiduGeneralEngine, BaiduAccurateEngine, BaiduVATEngine, TesseractEngine
+    )
+}
+
+
+class OCRRouter:
+    """按期望成本和滑动统计选择识别引擎"""
+
+    # 样本数达到该值后才按统计的成功率排序
+    MIN_SAMPLES = getattr(settings, 'OCR_ROUTER_MIN_SAMPLES', 20)
+    # 引擎仍按成功率100%估计的概率
+    EXPLORE_RATE = getattr(settings, 'OCR_ROUTER_EXPLORE_RATE', 0.05)
+    # 每个文件最多调用的远程引擎数，0表示不限
+    MAX_REMOTE_CALLS = getattr(settings, 'OCR_ROUTER_MAX_REMOTE_CALLS', 2)
+    # 计算期望成本时成功率的下限，避免成功率为0时除零
+    MIN_SUCCESS_RATE = 0.01
+    # 缓存键中区分路由最终结果的后缀
+    CACHE_KIND = 'router'
+    # 滑动统计的窗口大小（次）
+    STATS_WINDOW = getattr(settings, 'OCR_ROUTER_STATS_WINDOW', 50)
+
+    def __init__(self, engines=(), stats_store=None):
+        """
+        Args:
+            engines: 识别引擎列表
+            stats_store: EngineStatsStore，为None时不记录统计，只按成本排序
+        """
+        self._engines = {}
+        self._lock = threading.Lock()
+        self.stats_store = stats_store
+        for engine in engines:
+            self.register(engine)
+
+    def register(self, engine):
+        """注册识别引擎，同名引擎会被替换"""
+        with self._lock:
+            self._engines[engine.name] = engine
+
+    def get_engines(self):
+        with self._lock:
+            return list(self._engines.values())
+
+    def get_stats(self, engine_name, doc_type):
+        """引擎在某类文档上的滑动统计 (样本数, 成功率, 平均耗时秒数)"""
+        if self.stats_store is None:
+            return 0, 0.0, 0.0
+        try:
+            return self.stats_store.get(engine_name, doc_type)
+        except Exception as e:
+            logger.warning(f"读取识别引擎统计失败: {str(e)}")
+            return 0, 0.0, 0.0
+
+    def _record(self, engine_name, doc_type, success, elapsed):
+        if self.stats_store is None:
+            return
+        try:
+            self.stats_store.record(engine_name, doc_type, success, elapsed)
+        except Exception as e:
+            logger.warning(f"记录识别引擎统计失败: {str(e)}")
+
+    @staticmethod
+    def get_document_type(file_path, text=''):
+        """文档类型，不支持的文件类型返回None"""
+        file_ext = os.path.splitext(file_path)[1].lower()
+        if file_ext == '.pdf':
+            return DOC_PDF_TEXT if text.strip() else DOC_PDF_SCAN
+        if file_ext in IMAGE_EXTENSIONS:
+            return DOC_IMAGE
+        return None
+
+    def expected_cost(self, engine, stats, explore=False):
+        """引擎得到完整结果的期望成本（成本 / 成功率）
+
+        Args:
+            engine: 识别引擎
+            stats: 引擎在本类文档上的统计 (样本数, 成功率, 平均耗时秒数)
+            explore: 是否按 EXPLORE_RATE 随机按成功率100%估计
+        """
+        samples, success_rate, _ = stats
+        if samples < self.MIN_SAMPLES or (explore and random.random() < self.EXPLORE_RATE):
+            success_rate = 1.0
+        return engine.cost / max(success_rate, self.MIN_SUCCESS_RATE)
+
+    def plan(self, doc_type, explore=True):
+        """本类文档的引擎尝试顺序
+
+        Args:
+            doc_type: 文档类型
+            explore: 是否按 EXPLORE_RATE 随机按成功率100%估计引擎的期望成本
+
+        Returns:
+            list: 按期望成本（相同时按平均耗时）从低到高排序的可用引擎，远程引擎最多 MAX_REMOTE_CALLS 个
+        """
+        candidates = [
+            engine for engine in self.get_engines()
+            if doc_type in engine.doc_types and engine.is_available()
+        ]
+        stats = {engine.name: self.get_stats(engine.name, doc_type) for engine in candidates}
+        scores = {engine.name: self.expected_cost(engine, stats[engine.name], explore) for engine in candidates}
+        candidates.sort(key=lambda engine: (scores[engine.name], stats[engine.name][2]))
+
+        planned = []
+        remote_calls = 0
+        for engine in candidates:
+            if engine.remote:
+                if self.MAX_REMOTE_CALLS and remote_calls >= self.MAX_REMOTE_CALLS:
+                    continue
+                remote_calls += 1
+            planned.append(engine)
+        return planned
+
+    def _load_cached(self, file_path, page_number=None):
+        """按文件内容（多页PDF按页）读取路由的缓存结果
+
+        Returns:
+            tuple: (缓存键, (invoice_info, text))，未命中时结果为None，读取失败时缓存键也为None
+        """
+        try:
+            cache_key = OCRResultCache.make_key(
+                OCRResultCache.file_sha256(file_path), page_number, kind=self.CACHE_KIND
+            )
+            cached = OCRResultCache.get(cache_key)
+            if cached:
+                invoice_info, _, text = cached
+                return cache_key, (invoice_info, text or '')
+            return cache_key, None
+        except Exception as e:
+            logger.warning(f"读取OCR缓存失败: {str(e)}")
+            return None, None
+
+    @staticmethod
+    def _store_cached(cache_key, invoice_info, text):
+        try:
+            OCRResultCache.set(cache_key, invoice_info, text=text)
+        except Exception as e:
+            logger.warning(f"写入OCR缓存失败: {str(e)}")
+
+    def recognize(self, file_path, page_number=None, text=None, deadline=None):
+        """识别发票文件（单张发票，PDF只识别首页）或多页PDF的一页
+
+        Args:
+            file_path: 文件路径
+            page_number: 只识别PDF的指定页（从1开始），为None时识别整个文件
+            text: 该页的PDF文本层，为None时从文件读取
+            deadline: 识别截止时间（time.monotonic()），到期后不再尝试后续引擎
+
+        Returns:
+            tuple: (invoice_info, text)，识别失败时invoice_info为None、text为失败原因
+        """
+        if text is None:
+            text = InvoiceRecognizer.extract_pdf_text_layer(file_path) if file_path.lower().endswith('.pdf') else ''
+        doc_type = self.get_document_type(file_path, text)
+        if doc_type is None:
+            logger.error(f"不支持的文件类型: {os.path.splitext(file_path)[1].lower()}")
+            return None, "不支持的文件类型"
+
+        context = {'doc_type': doc_type, 'text': text, 'page_number': page_number, 'deadline': deadline}
+        planned = self.plan(doc_type)
+        logger.debug(f"识别路由 {doc_type}: {' -> '.join(engine.name for engine in planned)} {file_path}")
+
+        merged = None  # 需要合并进最终结果的不完整结果（如二维码）
+        partial = None  # 其余不完整结果中最后得到的一个
+        cache_checked = False
+        cache_key = None
+        for engine in planned:
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning(f"识别超出时间预算，不再尝试 {engine.name} 等引擎: {file_path}")
+                break
+            # 本地引擎没有完整结果时，调用远程引擎前先查缓存
+            if engine.remote and not cache_checked:
+                cache_checked = True
+                cache_key, cached = self._load_cached(file_path, page_number)
+                if cached:
+                    return cached
+            start = time.perf_counter()
+            try:
+                result = engine.recognize(file_path, context)
+            except Exception as e:
+                logger.error(f"识别引擎 {engine.name} 异常 {file_path}: {str(e)}")
+                result = None
+            success = result is not None and (result.complete or engine.merge_partial)
+            self._record(engine.name, doc_type, success, time.perf_counter() - start)
+            if result is None:
+                continue
+            if result.complete:
+                invoice_info, result_text = self._finish(engine.name, result, merged, text)
+                if cache_key and engine.remote:
+                    self._store_cached(cache_key, invoice_info, result_text)
+                return invoice_info, result_text
+            if engine.merge_partial and merged is None:
+                merged = result
+            else:
+                partial = (engine.name, result)
+
+        # 没有完整结果：优先采用二维码结果，留待人工确认
+        if merged is not None:
+            return self._finish(QRCodeEngine.name, merged, None, text)
+        if partial is not None:
+            return self._finish(partial[0], partial[1], None, text)
+        return None, "无法识别发票内容"
+
+    @staticmethod
+    def _finish(engine_name, result, merged, text):
+        """设置结果来源；原始文本优先使用PDF文本层"""
+        invoice_info = result.invoice_info
+        if merged is not None:
+            invoice_info = InvoiceRecognizer._merge_qr_info(invoice_info, merged.invoice_info, engine_name)
+        else:
+            invoice_info['source'] = engine_name
+        return invoice_info, text or result.text
+
+
+def create_engines():
+    """按 OCR_ENGINES 和 OCR_ENGINE_COSTS 创建识别引擎
+
+    OCR_ENGINES 中可填写内置引擎名称，或自定义引擎类的导入路径（如 'myapp.engines.MyEngine'）。
+    """
+    costs = getattr(settings, 'OCR_ENGINE_COSTS', {})
+    engines = []
+    for name in getattr(settings, 'OCR_ENGINES', DEFAULT_ENGINES):
+        if name == PdfTextEngine.name and not InvoiceRecognizer.PDF_LOCAL_FIRST:
+            continue
+        try:
+            engine_class = ENGINE_CLASSES.get(name) or import_string(name)
+        except ImportError as e:
+            logger.error(f"未知的识别引擎 {name}: {str(e)}")
+            continue
+        engines.append(engine_class(costs.get(engine_class.name)))
+    return engines
+
+
+_router_instance = None
+_router_lock = threading.Lock()
+
+
+def get_ocr_router():
+    """获取进程内共享的OCRRouter实例"""
+    global _router_instance
+    if _router_instance is None:
+        with _router_lock:
+            if _router_instance is None:
+                stats_store = EngineStatsStore(BaiduOCRConfig.get_state_db_path(), OCRRouter.STATS_WINDOW)
+                _router_instance = OCRRouter(create_engines(), stats_store)
+    return _router_instance
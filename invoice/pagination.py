@@ -0,0 +1,129 @@
+# encoding:utf-8
+"""
+发票列表的游标分页
+
+Paginator 按 OFFSET 分页，并且每次都要对筛选结果执行 COUNT(*)，页码越大、发票越多越慢。
+游标分页按 (开票日期, ID) 倒序排列，下一页从上一页最后一张发票之后开始取，
+可以沿 invoice_date 索引（及类别、购买方、状态与开票日期的复合索引）直接定位，
+耗时与所在页数无关。游标是签名后的字符串，只能由本模块生成和解析。
+
+总数只是可选的提示：最多计数到 COUNT_LIMIT 条，超过时只显示"超过 N 条"。
+"""
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """游标分页的一页，可直接在模板中迭代"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # 总数（可选）；count_capped 为 True 时表示实际数量超过 count
+        self.count = None
+        self.count_capped = False
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """按若干字段倒序的游标分页（默认 (invoice_date, id)，与发票列表的排序一致）"""
+
+    NEXT = 'n'
+    PREVIOUS = 'p'
+    SALT = 'invoice.pagination.keyset'
+    # 计数的上限，超过时只显示"超过 N 条"；为0时不计数
+    COUNT_LIMIT = getattr(settings, 'INVOICE_LIST_COUNT_LIMIT', 10000)
+
+    def __init__(self, queryset, per_page, fields=('invoice_date', 'id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.fields = list(fields)
+        self.model_fields = [queryset.model._meta.get_field(name) for name in self.fields]
+
+    def encode_cursor(self, obj, direction):
+        """由一张发票生成游标：direction 为 NEXT 时取其后的发票，PREVIOUS 时取其前的发票"""
+        values = [field.value_to_string(obj) for field in self.model_fields]
+        return signing.dumps([direction] + values, salt=self.SALT)
+
+    def decode_cursor(self, cursor):
+        """解析游标
+
+        Returns:
+            tuple: (方向, 字段值列表)，游标无效时为 (None, None)
+        """
+        try:
+            direction, *values = signing.loads(cursor, salt=self.SALT)
+            if direction not in (self.NEXT, self.PREVIOUS) or len(values) != len(self.model_fields):
+                return None, None
+            return direction, [field.to_python(value) for field, value in zip(self.model_fields, values)]
+        except (signing.BadSignature, ValidationError, TypeError, ValueError):
+            return None, None
+
+    def _beyond(self, values, direction):
+        """排在游标之后（NEXT）或之前（PREVIOUS）的条件
+
+        (a, b) < (x, y) 展开为 a <= x AND (a < x OR (a = x AND b < y))，
+        第一个条件可以直接作为索引的范围。
+        """
+        lookup = 'lt' if direction == self.NEXT else 'gt'
+        condition = Q()
+        for position, name in enumerate(self.fields):
+            equal = {field: value for field, value in zip(self.fields[:position], values)}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[position]})
+        return Q(**{f'{self.fields[0]}__{lookup}e': values[0]}) & condition
+
+    def get_page(self, cursor=None):
+        """取游标所指的一页，游标为空或无效时取第一页"""
+        direction, values = self.decode_cursor(cursor) if cursor else (None, None)
+        queryset = self.queryset.order_by(*[f'-{name}' for name in self.fields])
+        if values is not None:
+            queryset = queryset.filter(self._beyond(values, direction))
+            if direction == self.PREVIOUS:
+                queryset = queryset.reverse()
+
+        # 多取一条判断是否还有下一页（向前翻页时为上一页）
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if direction == self.PREVIOUS:
+            object_list.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = values is not None, has_more
+
+        page = KeysetPage(object_list)
+        if object_list and has_next:
+            page.next_cursor = self.encode_cursor(object_list[-1], self.NEXT)
+        if object_list and has_previous:
+            page.previous_cursor = self.encode_cursor(object_list[0], self.PREVIOUS)
+        return page
+
+    def approximate_count(self, limit=None):
+        """最多计数到 limit 条（默认 COUNT_LIMIT）
+
+        Returns:
+            tuple: (数量, 是否超过 limit)，limit 为0时为 (None, False)
+        """
+        limit = self.COUNT_LIMIT if limit is None else limit
+        if not limit:
+            return None, False
+        count = self.queryset.order_by().values('pk')[:limit + 1].count()
+        return min(count, limit), count > limit
@@ -0,0 +1,90 @@
+# encoding:utf-8
+"""
+跨进程令牌桶限流器
+
+令牌桶状态保存在本机的SQLite文件中，同一台服务器上的所有gunicorn进程、
+后台识别进程共享同一个桶，借助SQLite的写锁（BEGIN IMMEDIATE）保证扣减令牌的原子性。
+"""
+
+import logging
+import time
+
+from .sqlite_state import SQLiteStateStore
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucketRateLimiter(SQLiteStateStore):
+    """基于SQLite文件的令牌桶限流器"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS token_bucket ('
+        'name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)',
+    )
+
+    def __init__(self, db_path, rate, capacity=None, name='default'):
+        """
+        Args:
+            db_path: SQLite状态文件路径（所有进程需使用同一路径）
+            rate: 每秒补充的令牌数（即允许的QPS）
+            capacity: 桶容量（允许的突发请求数），默认等于rate
+            name: 桶名称，同一文件中可保存多个桶
+        """
+        super().__init__(db_path)
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.name = name
+
+    def try_acquire(self, tokens=1):
+        """尝试立即获取令牌
+
+        Returns:
+            float: 0表示获取成功，否则为令牌补足前需要等待的秒数
+        """
+        with self.immediate_transaction() as conn:
+            now = time.time()
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM token_bucket WHERE name = ?', (self.name,)
+            ).fetchone()
+            if row is None:
+                available = self.capacity
+            else:
+                available = min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+
+            if available >= tokens:
+                available -= tokens
+                wait_seconds = 0.0
+            else:
+                wait_seconds = (tokens - available) / self.rate
+
+            conn.execute(
+                'INSERT OR REPLACE INTO token_bucket (name, tokens, updated_at) VALUES (?, ?, ?)',
+                (self.name, available, now)
+            )
+        return wait_seconds
+
+    def acquire(self, timeout=None, tokens=1):
+        """获取令牌，令牌不足时等待
+
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+            tokens: 需要的令牌数
+
+        Returns:
+            bool: 是否在超时前获取到令牌
+
+        Raises:
+            ValueError: 需要的令牌数超过桶容量（永远无法获取）
+        """
+        if tokens > self.capacity:
+            raise ValueError(f"需要的令牌数 {tokens} 超过桶容量 {self.capacity:g}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait_seconds = self.try_acquire(tokens)
+            if wait_seconds <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining < wait_seconds:
+                    return False
+            time.sleep(wait_seconds)
@@ -0,0 +1,435 @@
+# encoding:utf-8
+"""
+发票识别任务队列
+
+上传视图只负责保存文件并将识别记录置为PENDING，真正的OCR识别由
+`python manage.py run_recognition_worker` 启动的后台进程完成。
+后台进程通过租约（PENDING→PROCESSING + lease_expires_at）领取任务，
+进程崩溃后租约过期，任务会被其他进程重新领取。
+
+查看原始文本时按需调用通用文字识别同样由后台进程完成：请求时写入 raw_text_due_at，
+后台进程领取时将其推迟到租约到期时间，完成后清空。
+"""
+
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .ingestion import InvoiceIngestion
+from .models import Invoice, InvoiceRecognition
+from .utils import InvoiceRecognizer
+
+logger = logging.getLogger(__name__)
+
+
+def _build_invoice(recognition, user):
+    """由识别结果生成未保存的发票，识别结果不完整时返回None"""
+    invoice_info = recognition.result_data
+    if not invoice_info:
+        logger.error(f"识别结果为空，无法自动确认: {recognition.pk}")
+        return None
+
+    # 检查必要字段
+    for field in InvoiceRecognition.REQUIRED_RESULT_FIELDS:
+        if not invoice_info.get(field):
+            logger.warning(f"缺少必要字段 {field}，无法自动确认: {recognition.pk}")
+            return None
+
+    # 解析日期
+    invoice_date_str = invoice_info.get('invoice_date')
+    invoice_date = None
+    if invoice_date_str:
+        if isinstance(invoice_date_str, str):
+            date_formats = ['%Y-%m-%d', '%Y/%m/%d', '%Y年%m月%d日']
+            for fmt in date_formats:
+                try:
+                    invoice_date = datetime.strptime(invoice_date_str, fmt).date()
+                    break
+                except ValueError:
+                    continue
+        else:
+            invoice_date = invoice_date_str
+    if not invoice_date and invoice_date_str:
+        logger.warning(f"无法解析日期格式，无法自动确认: {invoice_date_str}")
+        return None
+
+    try:
+        invoice = Invoice(
+            invoice_number=invoice_info.get('invoice_number'),
+            invoice_content=invoice_info.get('invoice_content', ''),
+            invoice_date=invoice_date,
+            invoice_type=invoice_info.get('invoice_type', 'ELECTRONIC'),
+            amount=float(invoice_info.get('amount', 0)),
+            tax_amount=float(invoice_info.get('tax_amount', 0)),
+            total_amount=float(invoice_info.get('total_amount', 0)),
+            seller_name=invoice_info.get('seller_name', ''),
+            seller_tax_id=invoice_info.get('seller_tax_id', ''),
+            buyer_name=invoice_info.get('buyer_name', ''),
+            buyer_tax_id=invoice_info.get('buyer_tax_id', ''),
+            description=invoice_info.get('description', ''),
+            created_by=user
+        )
+    except (TypeError, ValueError) as e:
+        logger.warning(f"识别结果金额无效，无法自动确认: {recognition.pk}: {str(e)}")
+        return None
+
+    # 使用识别记录中的文件
+    invoice.file = recognition.file
+    return invoice
+
+
+def auto_confirm_recognitions(recognitions, user=None):
+    """
+    批量自动确认识别结果，在一个事务中创建发票记录
+
+    Args:
+        recognitions: 识别记录列表
+        user: 发票的创建人，为None时使用各识别记录的创建人
+
+    Returns:
+        list: 创建的发票（重复或无效的识别结果不创建）
+    """
+    rows = []
+    for recognition in recognitions:
+        invoice = _build_invoice(recognition, user or recognition.created_by)
+        if invoice is not None:
+            rows.append({'invoice': invoice, 'recognition': recognition, 'label': recognition.file.name})
+    if not rows:
+        return []
+
+    result = InvoiceIngestion.ingest(rows)
+    for error in result.errors:
+        logger.warning(f"拒绝自动确认 {error['label']}: {error['error']}")
+    for invoice in result.created:
+        logger.info(f"自动确认发票成功: {invoice.invoice_number}")
+    return result.created
+
+
+def auto_confirm_recognition(recognition, user):
+    """
+    自动确认识别结果，创建发票记录
+    """
+    created = auto_confirm_recognitions([recognition], user)
+    return created[0] if created else None
+
+
+class RecognitionQueue:
+    """基于InvoiceRecognition表的识别任务队列"""
+
+    # 租约时长（秒），需大于单个文件识别的最长耗时（含百度OCR超时与重试）
+    LEASE_SECONDS = getattr(settings, 'RECOGNITION_LEASE_SECONDS', 300)
+    # 单个任务的最大尝试次数，超过后直接标记为失败
+    MAX_ATTEMPTS = getattr(settings, 'RECOGNITION_MAX_ATTEMPTS', 3)
+    # 识别结果完整时自动确认所需的字段
+    REQUIRED_FIELDS = InvoiceRecognition.REQUIRED_RESULT_FIELDS
+    # 由二维码、本地Tesseract或文字识别+规则提取得到的结果还需具备以下字段才自动确认
+    # （二维码中没有销售方、税额等信息，Tesseract识别和规则提取的准确率低于百度增值税发票识别）
+    STRICT_SOURCES = ('qr', 'tesseract', 'baidu_general', 'baidu_accurate')
+    STRICT_REQUIRED_FIELDS = REQUIRED_FIELDS + ['tax_amount', 'total_amount', 'seller_name']
+    # 每个用户同时排队的原始文本识别请求数上限
+    RAW_TEXT_MAX_PENDING = getattr(settings, 'RECOGNITION_RAW_TEXT_MAX_PENDING', 5)
+
+    @staticmethod
+    def default_worker_id():
+        """当前进程的标识（主机名:进程号）"""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def enqueue(uploaded_file, user):
+        """保存上传文件并创建待识别任务
+
+        Args:
+            uploaded_file: 上传的文件对象
+            user: 上传用户
+
+        Returns:
+            InvoiceRecognition: 状态为PENDING的识别记录
+        """
+        recognition = InvoiceRecognition(
+            file=uploaded_file,
+            status='PENDING',
+            created_by=user
+        )
+        recognition.save()
+        return recognition
+
+    @classmethod
+    def _claimable(cls, now):
+        """可领取的任务：待处理，或处理中但租约已过期（含旧版本遗留的无租约记录）"""
+        return Q(status='PENDING') | Q(
+            Q(lease_expires_at__lt=now) | Q(lease_expires_at__isnull=True),
+            status='PROCESSING',
+            attempts__lt=cls.MAX_ATTEMPTS,
+        )
+
+    @classmethod
+    def fail_exhausted(cls):
+        """将租约过期且已达到最大尝试次数的任务标记为失败
+
+        Returns:
+            int: 被标记为失败的任务数
+        """
+        now = timezone.now()
+        return InvoiceRecognition.objects.filter(
+            status='PROCESSING',
+            lease_expires_at__lt=now,
+            attempts__gte=cls.MAX_ATTEMPTS,
+        ).update(
+            status='FAILED',
+            result='识别超时，已达到最大重试次数',
+            lease_expires_at=None,
+            updated_at=now,
+        )
+
+    @classmethod
+    def claim(cls, worker_id, limit=1, lease_seconds=None):
+        """领取待识别任务
+
+        先查询候选任务，再逐条用带条件的UPDATE抢占租约，
+        UPDATE影响行数为1才算领取成功，多个进程同时领取时不会重复处理。
+
+        Args:
+            worker_id: 领取任务的进程标识
+            limit: 最多领取的任务数
+            lease_seconds: 租约时长（秒），默认使用LEASE_SECONDS
+
+        Returns:
+            list: 领取到的InvoiceRecognition列表
+        """
+        if limit <= 0:
+            return []
+
+        now = timezone.now()
+        lease_expires_at = now + timedelta(seconds=lease_seconds or cls.LEASE_SECONDS)
+        claimable = cls._claimable(now)
+
+        candidate_ids = list(
+            InvoiceRecognition.objects.filter(claimable)
+            .order_by('created_at')
+            .values_list('pk', flat=True)[:limit * 4]
+        )
+
+        claimed_ids = []
+        for pk in candidate_ids:
+            updated = InvoiceRecognition.objects.filter(claimable, pk=pk).update(
+                status='PROCESSING',
+                locked_by=worker_id,
+                lease_expires_at=lease_expires_at,
+                attempts=F('attempts') + 1,
+                updated_at=now,
+            )
+            if updated:
+                claimed_ids.append(pk)
+                if len(claimed_ids) >= limit:
+                    break
+
+        return list(InvoiceRecognition.objects.filter(pk__in=claimed_ids).order_by('created_at'))
+
+    @staticmethod
+    def _finish(recognition, worker_id, status, result, raw_text=None, page_number=None, invoice_info=None):
+        """在仍持有租约的前提下写入识别结果及原始文本（原始文本压缩后写入 RecognitionPayload）
+
+        Args:
+            result: 识别失败的原因，识别成功时为None
+            invoice_info: 识别出的发票信息，写入 result_data
+
+        Returns:
+            bool: 是否写入成功（租约已被其他进程接管时返回False）
+        """
+        fields = dict(
+            status=status,
+            result=result,
+            page_number=page_number,
+            lease_expires_at=None,
+            **InvoiceRecognition.result_fields(invoice_info),
+        )
+        updated = InvoiceRecognition.objects.filter(
+            pk=recognition.pk,
+            status='PROCESSING',
+            locked_by=worker_id,
+        ).update(updated_at=timezone.now(), **fields)
+        if updated:
+            for name, value in fields.items():
+                setattr(recognition, name, value)
+            recognition.set_raw_text(raw_text)
+        return bool(updated)
+
+    @classmethod
+    def _auto_confirm_complete(cls, records):
+        """识别结果完整的页面一次批量自动确认
+
+        Args:
+            records: [(识别记录, invoice_info)]
+        """
+        complete = []
+        for recognition, invoice_info in records:
+            if not invoice_info:
+                continue
+            if invoice_info.get('source') in cls.STRICT_SOURCES:
+                required_fields = cls.STRICT_REQUIRED_FIELDS
+            else:
+                required_fields = cls.REQUIRED_FIELDS
+            if all(invoice_info.get(field) for field in required_fields):
+                complete.append(recognition)
+        if not complete:
+            return
+        try:
+            auto_confirm_recognitions(complete)
+        except Exception as e:
+            logger.error(f"自动确认发票失败 {complete[0].file.name}: {str(e)}")
+
+    @staticmethod
+    def _recognize(file_path):
+        """识别文件，多页PDF逐页识别
+
+        Returns:
+            list: [(页码, invoice_info, text)]，单页文件的页码为None
+        """
+        if os.path.splitext(file_path)[1].lower() == '.pdf' and InvoiceRecognizer.get_pdf_page_count(file_path) > 1:
+            return InvoiceRecognizer.recognize_pdf_pages(file_path) or [(None, None, '无法读取PDF页面')]
+        invoice_info, text = InvoiceRecognizer.recognize_invoice(file_path)
+        return [(None, invoice_info, text)]
+
+    @classmethod
+    def process(cls, recognition, worker_id):
+        """识别单个任务，完成后写回结果并尝试自动确认
+
+        多页PDF的第1页结果写入原记录，其余每页创建一条子记录（与原记录在同一事务中写入）。
+
+        Args:
+            recognition: 已领取的识别记录
+            worker_id: 领取任务的进程标识
+
+        Returns:
+            str: 任务（第1页）最终状态（COMPLETED/FAILED），租约丢失时返回None
+        """
+        try:
+            file_path = recognition.file.path
+            page_results = cls._recognize(file_path)
+        except Exception as e:
+            logger.error(f"发票识别失败 {recognition.file.name}: {str(e)}")
+            page_results = [(None, None, str(e))]
+
+        records = []
+        with transaction.atomic():
+            for page_number, invoice_info, text in page_results:
+                if invoice_info:
+                    status, result = 'COMPLETED', None
+                else:
+                    status, result, text = 'FAILED', text or '识别失败', None
+                if not records:
+                    if not cls._finish(recognition, worker_id, status, result, raw_text=text,
+                                       page_number=page_number, invoice_info=invoice_info):
+                        logger.warning(f"识别任务租约已失效，放弃写入结果: {recognition.pk}")
+                        return None
+                    page_recognition = recognition
+                else:
+                    page_recognition = InvoiceRecognition.objects.create(
+                        file=recognition.file.name,
+                        status=status,
+                        result=result,
+                        page_number=page_number,
+                        parent=recognition,
+                        created_by=recognition.created_by,
+                        **InvoiceRecognition.result_fields(invoice_info),
+                    )
+                    page_recognition.set_raw_text(text)
+                records.append((page_recognition, invoice_info))
+
+        # 检查识别结果是否完整，如果完整则自动确认（多页PDF的各页一次确认）
+        cls._auto_confirm_complete(records)
+
+        return recognition.status
+
+    @classmethod
+    def request_raw_text(cls, recognition, user):
+        """请求后台进程调用通用文字识别重新生成原始文本
+
+        Args:
+            recognition: 识别记录
+            user: 发起请求的用户（识别记录的创建人）
+
+        Returns:
+            bool: 是否已在排队（已排队的请求不重复提交）；该用户排队中的请求达到 RAW_TEXT_MAX_PENDING 时返回False
+        """
+        if recognition.raw_text_due_at:
+            return True
+        pending_count = InvoiceRecognition.objects.filter(created_by=user, raw_text_due_at__isnull=False).count()
+        if pending_count >= cls.RAW_TEXT_MAX_PENDING:
+            return False
+        now = timezone.now()
+        InvoiceRecognition.objects.filter(pk=recognition.pk, raw_text_due_at__isnull=True).update(raw_text_due_at=now)
+        recognition.raw_text_due_at = now
+        return True
+
+    @classmethod
+    def claim_raw_text(cls, limit=1, lease_seconds=None):
+        """领取原始文本识别请求，与 claim 相同地逐条用带条件的UPDATE抢占
+
+        Args:
+            limit: 最多领取的请求数
+            lease_seconds: 租约时长（秒），默认使用LEASE_SECONDS，进程崩溃后到期可被重新领取
+
+        Returns:
+            list: 领取到的InvoiceRecognition列表（raw_text_due_at 为租约到期时间）
+        """
+        if limit <= 0:
+            return []
+
+        now = timezone.now()
+        lease_expires_at = now + timedelta(seconds=lease_seconds or cls.LEASE_SECONDS)
+        candidates = list(
+            InvoiceRecognition.objects.filter(raw_text_due_at__lte=now)
+            .order_by('raw_text_due_at')
+            .values_list('pk', 'raw_text_due_at')[:limit * 4]
+        )
+
+        claimed_ids = []
+        for pk, due_at in candidates:
+            if InvoiceRecognition.objects.filter(pk=pk, raw_text_due_at=due_at).update(raw_text_due_at=lease_expires_at):
+                claimed_ids.append(pk)
+                if len(claimed_ids) >= limit:
+                    break
+
+        return list(
+            InvoiceRecognition.objects.filter(pk__in=claimed_ids)
+            .only('id', 'file', 'page_number', 'raw_text_due_at')
+            .order_by('raw_text_due_at')
+        )
+
+    @staticmethod
+    def _general_text(file_path, page_number=None):
+        """通用文字识别的原始文本：图片调用百度通用文字识别，PDF读取文本层（多页PDF的页面只读取该页）"""
+        if os.path.splitext(file_path)[1].lower() != '.pdf':
+            return InvoiceRecognizer.extract_text_from_image(file_path)
+        if page_number is None:
+            return InvoiceRecognizer.extract_pdf_text_layer(file_path)
+        pages_text = InvoiceRecognizer.extract_pdf_pages_text(file_path)
+        return pages_text[page_number - 1] if page_number <= len(pages_text) else ''
+
+    @classmethod
+    def process_raw_text(cls, recognition):
+        """处理已领取的原始文本识别请求，识别出文本时保存，完成后清除请求
+
+        Returns:
+            bool: 是否识别出原始文本
+        """
+        try:
+            text = cls._general_text(recognition.file.path, recognition.page_number)
+        except Exception as e:
+            logger.error(f"原始文本识别失败 {recognition.file.name}: {str(e)}")
+            text = ''
+        if text:
+            recognition.set_raw_text(text)
+        else:
+            logger.warning(f"未识别到原始文本，保留原有文本: {recognition.pk}")
+        InvoiceRecognition.objects.filter(
+            pk=recognition.pk, raw_text_due_at=recognition.raw_text_due_at
+        ).update(raw_text_due_at=None)
+        return bool(text)
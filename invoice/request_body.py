@@ -0,0 +1,80 @@
+# encoding:utf-8
+"""
+流式表单请求体
+
+百度OCR接口要求以 application/x-www-form-urlencoded 提交base64编码后的文件内容。
+一次性 read → b64encode → decode → quote_plus 会在内存中产生多份与文件等大的副本，
+大扫描件PDF会造成明显的内存峰值。
+
+Base64FormBody 按块读取文件，逐块完成base64编码和URL编码后直接交给requests发送，
+单次识别的内存占用只与块大小有关，与文件大小无关。
+"""
+
+import base64
+from urllib.parse import urlencode
+
+
+class Base64FormBody:
+    """以base64+URL编码流式发送文件的表单请求体
+
+    可重复迭代（请求重试时重新读取文件），并提供 __len__ 以便requests设置Content-Length。
+    """
+
+    # 每块读取的原始字节数，需为3的倍数，保证各块base64编码后可直接拼接
+    CHUNK_SIZE = 3 * 64 * 1024
+
+    def __init__(self, field, source, extra_fields=None, chunk_size=None):
+        """
+        Args:
+            field: 文件内容对应的表单字段名（如 image、pdf_file）
+            source: 文件路径，或已在内存中的文件内容（bytes）
+            extra_fields: 其他表单字段，dict或(key, value)列表
+            chunk_size: 每块读取的原始字节数
+        """
+        self.field = field
+        self.source = source
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        if self.chunk_size % 3:
+            raise ValueError('chunk_size必须为3的倍数')
+        self.suffix = ('&' + urlencode(extra_fields)).encode('ascii') if extra_fields else b''
+        self._length = None
+
+    def _iter_raw_chunks(self):
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            view = memoryview(self.source)
+            for start in range(0, len(view), self.chunk_size):
+                yield view[start:start + self.chunk_size]
+            return
+        with open(self.source, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    @staticmethod
+    def _quote(encoded):
+        """对base64结果做URL编码（base64字母表中只有 + / = 需要转义）"""
+        return encoded.replace(b'+', b'%2B').replace(b'/', b'%2F').replace(b'=', b'%3D')
+
+    def __iter__(self):
+        yield self.field.encode('ascii') + b'='
+        for chunk in self._iter_raw_chunks():
+            yield self._quote(base64.b64encode(chunk))
+        if self.suffix:
+            yield self.suffix
+
+    def __len__(self):
+        """请求体总字节数
+
+        URL编码后的长度取决于 + / 出现的次数，需要逐块编码统计一遍（不保留编码结果），结果会被缓存。
+        """
+        if self._length is None:
+            length = len(self.field) + 1 + len(self.suffix)
+            for chunk in self._iter_raw_chunks():
+                encoded = base64.b64encode(chunk)
+                length += len(encoded) + 2 * (
+                    encoded.count(b'+') + encoded.count(b'/') + encoded.count(b'=')
+                )
+            self._length = length
+        return self._length
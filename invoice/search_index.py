@@ -0,0 +1,170 @@
+# encoding:utf-8
+"""
+发票关键词搜索索引
+
+发票列表的关键词搜索原先对发票号码、发票内容、销售方、购买方四列做 icontains 查询，
+无法使用索引，发票越多越慢。这里用SQLite FTS5 建立全文索引：中文没有空格分词，
+因此把每个词拆成相邻两个字的二元组（"餐饮服务" -> "餐饮 饮服 服务 务"）再交给
+unicode61 分词器，查询词同样拆成二元组后按短语匹配，效果等同于子串匹配；
+一个字的查询按前缀匹配。发票号码等长数字的二元组区分度很低，另外把完整号码及其倒序
+写入 number_head、number_tail 两列，8位以上的数字按号码前缀或后缀匹配。
+
+搜索时索引表与发票表在同一条SQL中连接，类别、状态、日期等其余筛选条件与全文匹配一起执行，
+结果按 bm25 相关度排序（发票号码的权重最高），不截断匹配结果。
+
+索引表 invoice_search 的 rowid 即发票ID，由 signals 中的 Invoice 保存/删除信号同步，
+可用 python manage.py rebuild_invoice_search_index 重建。非SQLite数据库不建立索引，
+搜索退回 icontains 查询。
+"""
+
+import logging
+import re
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceSearchIndex:
+    """基于SQLite FTS5的发票全文索引"""
+
+    TABLE = 'invoice_search'
+    # 参与搜索的发票字段
+    FIELDS = ['invoice_number', 'invoice_content', 'seller_name', 'buyer_name']
+    # 索引表的列：FIELDS 的二元组，以及完整发票号码（number_head）和倒序的发票号码（number_tail）
+    COLUMNS = FIELDS + ['number_head', 'number_tail']
+    # 各列的 bm25 权重
+    WEIGHTS = [10.0, 1.0, 3.0, 3.0, 10.0, 10.0]
+    # 按号码前缀/后缀匹配的最短数字长度
+    NUMBER_MIN_LENGTH = 8
+
+    ENABLED = getattr(settings, 'INVOICE_SEARCH_INDEX', True)
+    BATCH_SIZE = 1000
+
+    # 与 unicode61 分词器一致：字母和数字组成词，其余字符（含下划线、全角标点）均为分隔符
+    WORD_PATTERN = re.compile(r'[^\W_]+')
+
+    @classmethod
+    def is_supported(cls, using='default'):
+        """当前数据库是否使用全文索引"""
+        return cls.ENABLED and connections[using].vendor == 'sqlite'
+
+    @classmethod
+    def ngrams(cls, value):
+        """将文本拆成二元组，词的最后一个字单独保留，使单字查询也能前缀匹配"""
+        tokens = []
+        for word in cls.WORD_PATTERN.findall(str(value or '').lower()):
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+            tokens.append(word[-1])
+        return ' '.join(tokens)
+
+    @classmethod
+    def build_match(cls, search):
+        """将搜索词转换为 FTS5 查询表达式，多个词之间为"且"
+
+        Returns:
+            str: 查询表达式，搜索词中没有字母和数字时返回空字符串
+        """
+        terms = []
+        for word in cls.WORD_PATTERN.findall(search.lower()):
+            if word.isdigit() and len(word) >= cls.NUMBER_MIN_LENGTH:
+                terms.append(f'(number_head : "{word}" * OR number_tail : "{word[::-1]}" *)')
+            elif len(word) == 1:
+                terms.append(f'"{word}" *')
+            else:
+                terms.append('"' + ' '.join(word[i:i + 2] for i in range(len(word) - 1)) + '"')
+        return ' AND '.join(terms)
+
+    @classmethod
+    def create(cls, using='default'):
+        """建立索引表（已存在时不处理）"""
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {cls.TABLE} USING fts5("
+                f"{', '.join(cls.COLUMNS)}, tokenize='unicode61 remove_diacritics 0', prefix='1')"
+            )
+            cursor.execute(
+                f"INSERT INTO {cls.TABLE} ({cls.TABLE}, rank) VALUES ('rank', %s)",
+                [f"bm25({', '.join(str(weight) for weight in cls.WEIGHTS)})"]
+            )
+
+    @classmethod
+    def drop(cls, using='default'):
+        """删除索引表"""
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {cls.TABLE}')
+
+    @classmethod
+    def index(cls, invoices, using='default'):
+        """写入或更新发票的索引
+
+        Args:
+            invoices: Invoice 对象或包含 id 及索引字段的dict
+        """
+        rows = []
+        for invoice in invoices:
+            get = invoice.get if isinstance(invoice, dict) else lambda name: getattr(invoice, name)
+            number = ''.join(cls.WORD_PATTERN.findall(str(get('invoice_number') or '').lower()))
+            rows.append([get('id')] + [cls.ngrams(get(field)) for field in cls.FIELDS] + [number, number[::-1]])
+        if not rows:
+            return
+        with connections[using].cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {cls.TABLE} (rowid, {', '.join(cls.COLUMNS)}) "
+                f"VALUES (%s, {', '.join(['%s'] * len(cls.COLUMNS))})",
+                rows
+            )
+
+    @classmethod
+    def remove(cls, invoice_ids, using='default'):
+        """删除发票的索引"""
+        with connections[using].cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {cls.TABLE} WHERE rowid = %s', [[pk] for pk in invoice_ids])
+
+    @classmethod
+    def rebuild(cls, queryset=None, using='default'):
+        """按批重建全部发票的索引
+
+        Returns:
+            int: 写入索引的发票数
+        """
+        from .models import Invoice
+
+        queryset = queryset if queryset is not None else Invoice.objects.using(using)
+        with transaction.atomic(using=using):
+            cls.drop(using)
+            cls.create(using)
+            count, batch = 0, []
+            for row in queryset.values('id', *cls.FIELDS).iterator(chunk_size=cls.BATCH_SIZE):
+                batch.append(row)
+                if len(batch) >= cls.BATCH_SIZE:
+                    cls.index(batch, using)
+                    count += len(batch)
+                    batch = []
+            cls.index(batch, using)
+            count += len(batch)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {cls.TABLE} ({cls.TABLE}) VALUES ('optimize')")
+        logger.info(f"发票搜索索引重建完成，共 {count} 张发票")
+        return count
+
+    @classmethod
+    def filter(cls, queryset, search):
+        """按搜索词筛选发票，结果按相关度排序
+
+        索引表连接到发票查询中，与 queryset 已有（及之后追加）的筛选条件在同一条SQL中执行，
+        可以直接计数和分页。相关度写入 search_rank（越小越相关）。
+
+        Returns:
+            QuerySet: 搜索词中没有字母和数字时为空结果
+        """
+        match = cls.build_match(search)
+        if not match:
+            return queryset.none()
+        return queryset.extra(
+            select={'search_rank': f'{cls.TABLE}.rank'},
+            tables=[cls.TABLE],
+            where=[f'{cls.TABLE}.rowid = {queryset.model._meta.db_table}.id', f'{cls.TABLE} MATCH %s'],
+            params=[match],
+        ).order_by('search_rank', '-pk')
@@ -0,0 +1,69 @@
+# encoding:utf-8
+"""
+发票模型信号：保存或删除发票时同步关键词搜索索引和月度汇总
+
+Invoice.save() 在事务中执行，汇总的增减与发票写入同时提交或回滚；
+删除发票时 Django 同样在事务中逐张发送 pre_delete/post_delete 信号。
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Invoice, InvoiceCategory, InvoiceMonthlyRollup, Party
+from .search_index import InvoiceSearchIndex
+
+
+@receiver(post_save, sender=Invoice)
+def index_invoice(sender, instance, using, **kwargs):
+    if InvoiceSearchIndex.is_supported(using):
+        InvoiceSearchIndex.index([instance], using)
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_invoice_from_index(sender, instance, using, **kwargs):
+    if InvoiceSearchIndex.is_supported(using):
+        InvoiceSearchIndex.remove([instance.pk], using)
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_rollup_bucket(sender, instance, using, update_fields=None, **kwargs):
+    """记录发票修改前所属的汇总，post_save 时从中移出"""
+    instance._rollup_previous = None
+    if instance._state.adding or not instance.pk:
+        return
+    if update_fields is not None and not {
+        sender._meta.get_field(name).attname for name in update_fields
+    } & set(InvoiceMonthlyRollup.SOURCE_FIELDS):
+        instance._rollup_skip = True
+        return
+    previous = sender.objects.using(using).select_for_update()\
+        .filter(pk=instance.pk).values(*InvoiceMonthlyRollup.SOURCE_FIELDS).first()
+    if previous:
+        instance._rollup_previous = InvoiceMonthlyRollup.bucket(previous)
+
+
+@receiver(post_save, sender=Invoice)
+def update_rollup(sender, instance, using, **kwargs):
+    if getattr(instance, '_rollup_skip', False):
+        instance._rollup_skip = False
+        return
+    key, amounts = InvoiceMonthlyRollup.bucket(instance)
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous == (key, amounts):
+        return
+    if previous:
+        InvoiceMonthlyRollup.apply(*previous, -1, using)
+    InvoiceMonthlyRollup.apply(key, amounts, 1, using)
+
+
+@receiver(pre_delete, sender=Invoice)
+def remove_from_rollup(sender, instance, using, **kwargs):
+    # 在删除前计算（发票可能只加载了部分字段，删除后无法再读取）
+    InvoiceMonthlyRollup.apply(*InvoiceMonthlyRollup.bucket(instance), -1, using)
+
+
+@receiver(post_delete, sender=InvoiceCategory)
+@receiver(post_delete, sender=Party)
+def rebuild_rollups(sender, instance, using, **kwargs):
+    """类别或交易方删除后发票的外键被置空（不发送发票信号），重建汇总"""
+    InvoiceMonthlyRollup.rebuild(using)
@@ -0,0 +1,57 @@
+# encoding:utf-8
+"""
+跨进程共享状态的SQLite存储基类
+
+限流器、访问令牌、熔断器和识别引擎统计各用一张表，保存在本机的同一个SQLite状态文件中，
+所有gunicorn进程和后台识别进程共享。sqlite3连接不能跨线程共享，每个线程使用各自的连接
+（自动提交模式），需要原子地读取并修改时在 immediate_transaction() 中执行。
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteStateStore:
+    """基于SQLite文件的共享状态，子类在 SCHEMA 中列出建表语句"""
+
+    # 建立连接后执行的建表语句
+    SCHEMA = ()
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: SQLite状态文件路径（所有进程需使用同一路径）
+        """
+        self.db_path = str(db_path)
+        self._local = threading.local()
+
+    def _connect(self):
+        """获取当前线程的数据库连接（首次连接时建表）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self._init_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self, conn):
+        """建表，需要写入初始数据的子类可覆盖"""
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+
+    @contextmanager
+    def immediate_transaction(self):
+        """在写锁（BEGIN IMMEDIATE）下执行，保证读取和写入之间没有其他进程修改，异常时回滚
+
+        Yields:
+            sqlite3.Connection: 当前线程的连接
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
@@ -0,0 +1,139 @@
+# encoding:utf-8
+"""
+本地Tesseract识别引擎
+
+百度OCR熔断期间的备用识别引擎。Tesseract识别是CPU密集型任务，在独立的进程池中运行，
+不阻塞识别线程；进程池以spawn方式启动子进程，避免在多线程进程中fork。
+
+需要安装tesseract及中文语言包，例如：apt install tesseract-ocr tesseract-ocr-chi-sim
+"""
+
+import logging
+import multiprocessing
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import pdfplumber
+import pytesseract
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+def _ocr_file(file_path, lang, page_number, resolution):
+    """在子进程中执行：读取图片或渲染PDF页面，识别其中的文字"""
+    if file_path.lower().endswith('.pdf'):
+        with pdfplumber.open(file_path) as pdf:
+            image = pdf.pages[page_number - 1].to_image(resolution=resolution).original
+    else:
+        with Image.open(file_path) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    return pytesseract.image_to_string(image.convert('L'), lang=lang)
+
+
+class TesseractOCREngine:
+    """在进程池中运行的Tesseract识别引擎"""
+
+    ENABLED = getattr(settings, 'OCR_TESSERACT_FALLBACK', True)
+    # 识别语言，中文发票需要chi_sim语言包
+    LANG = getattr(settings, 'OCR_TESSERACT_LANG', 'chi_sim+eng')
+    # 进程池大小
+    MAX_WORKERS = getattr(settings, 'OCR_TESSERACT_MAX_WORKERS', 2)
+    # 单个文件（页面）的识别超时（秒）
+    TIMEOUT = getattr(settings, 'OCR_TESSERACT_TIMEOUT', 60)
+    # PDF页面渲染分辨率（DPI）
+    PDF_RESOLUTION = 300
+
+    _executor = None
+    _executor_lock = threading.Lock()
+    _available = None
+    _lock = threading.Lock()
+    _stats = {'files': 0, 'succeeded': 0, 'failed': 0, 'ocr_seconds': 0.0}
+
+    @classmethod
+    def is_available(cls):
+        """是否启用且已安装tesseract可执行文件"""
+        if not cls.ENABLED:
+            return False
+        if cls._available is None:
+            cls._available = shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+            if not cls._available:
+                logger.warning("未找到tesseract可执行文件，百度OCR熔断期间无法使用本地识别")
+        return cls._available
+
+    @classmethod
+    def _get_executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=max(1, cls.MAX_WORKERS),
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return cls._executor
+
+    @classmethod
+    def _reset_executor(cls, executor, terminate=False):
+        """丢弃进程池，下次识别时重新创建
+
+        子进程异常退出后进程池不可再用；识别超时时子进程仍在运行，terminate 为True时
+        结束其全部子进程（同一进程池中其他进行中的识别随之失败），避免卡住的子进程一直占用进程池。
+        """
+        with cls._executor_lock:
+            if cls._executor is executor:
+                cls._executor = None
+        processes = list((getattr(executor, '_processes', None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        if terminate:
+            for process in processes:
+                process.terminate()
+
+    @classmethod
+    def recognize_text(cls, file_path, page_number=1):
+        """识别图片或PDF指定页面中的文字
+
+        Args:
+            file_path: 文件路径
+            page_number: PDF的页码（从1开始），图片忽略该参数
+
+        Returns:
+            tuple: (success, text)，失败时text为失败原因
+        """
+        if not cls.is_available():
+            return False, 'Tesseract不可用'
+
+        executor = cls._get_executor()
+        start = time.perf_counter()
+        try:
+            future = executor.submit(_ocr_file, file_path, cls.LANG, page_number, cls.PDF_RESOLUTION)
+            text = future.result(timeout=cls.TIMEOUT).strip()
+            success, message = bool(text), text or 'Tesseract未识别到文字'
+        except FutureTimeoutError:
+            cls._reset_executor(executor, terminate=True)
+            success, message = False, f"Tesseract识别超时（{cls.TIMEOUT}秒），已结束识别进程"
+        except BrokenProcessPool as e:
+            cls._reset_executor(executor)
+            success, message = False, f"Tesseract进程异常退出: {str(e)}"
+        except Exception as e:
+            success, message = False, f"Tesseract识别失败: {str(e)}"
+        elapsed = time.perf_counter() - start
+
+        with cls._lock:
+            cls._stats['files'] += 1
+            cls._stats['succeeded' if success else 'failed'] += 1
+            cls._stats['ocr_seconds'] += elapsed
+        if success:
+            logger.info(f"Tesseract识别完成 {file_path}，耗时 {elapsed * 1000:.0f}ms")
+        else:
+            logger.error(f"{message} {file_path}")
+        return success, message
+
+    @classmethod
+    def get_stats(cls):
+        """识别统计：识别的文件数、成功和失败数及耗时"""
+        with cls._lock:
+            return dict(cls._stats)
@@ -1,3 +1,1365 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qsl
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.query import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .baidu_ocr_service import BaiduOCRService
+from .circuit_breaker import SharedCircuitBreaker
+from .engine_stats import EngineStatsStore
+from .fake_baidu_server import fake_vat_words_result
+from .ingestion import InvoiceIngestion
+from .models import (
+    Invoice, InvoiceCategory, InvoiceMonthlyRollup, InvoiceRecognition, OCRCacheCounter, OCRCacheEntry, Party,
+)
+from .ocr_cache import OCRResultCache
+from .ocr_engines import DOC_IMAGE, EngineResult, OCREngine, OCRRouter
+from .pagination import KeysetPage, KeysetPaginator
+from .qr_decoder import InvoiceQRDecoder
+from .rate_limiter import TokenBucketRateLimiter
+from .recognition_queue import RecognitionQueue
+from .search_index import InvoiceSearchIndex
+from .tesseract_engine import TesseractOCREngine
+from .token_store import SharedTokenStore
+from .utils import InvoiceRecognizer, InvoiceValidator
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+
+def make_invoice(invoice_number, **fields):
+    """未保存的发票，未指定的字段使用默认值"""
+    values = {
+        'invoice_date': date(2024, 3, 15),
+        'invoice_type': 'ELECTRONIC',
+        'invoice_content': '*餐饮服务*餐费',
+        'amount': Decimal('100.00'),
+        'tax_amount': Decimal('6.00'),
+        'total_amount': Decimal('106.00'),
+        'seller_name': '北京测试餐饮有限公司',
+        'seller_tax_id': '91110000000000001A',
+        'buyer_name': '上海测试科技有限公司',
+        'buyer_tax_id': '91310000000000002B',
+    }
+    values.update(fields)
+    return Invoice(invoice_number=invoice_number, **values)
+
+
+def bulk_create_invoices(invoices):
+    """批量写入发票（不经过 save() 和信号），并重建搜索索引"""
+    for invoice in invoices:
+        invoice.fill_computed_fields()
+    Invoice.objects.bulk_create(invoices)
+    InvoiceSearchIndex.rebuild()
+
+
+def make_temp_dir(test_case):
+    """创建测试结束后删除的临时目录（状态文件、测试图片）"""
+    temp_dir = tempfile.TemporaryDirectory()
+    test_case.addCleanup(temp_dir.cleanup)
+    return temp_dir.name
+
+
+class MigrationTestCase(TransactionTestCase):
+    """迁移测试：先回滚到 migrate_from，由 setUpBeforeMigration 写入旧结构的数据，再迁移到 migrate_to"""
+
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.addCleanup(self.migrate_to_latest)
+        self.old_apps = self.migrate([('invoice', self.migrate_from)])
+        self.setUpBeforeMigration(self.old_apps)
+        self.apps = self.migrate([('invoice', self.migrate_to)])
+
+    def setUpBeforeMigration(self, apps):
+        pass
+
+    def migrate(self, targets):
+        """迁移到 targets，返回迁移后的历史模型（apps）"""
+        self.executor.loader.build_graph()
+        self.executor.migrate(targets)
+        return self.executor.loader.project_state(targets).apps
+
+    def migrate_to_latest(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+
+
+class RecognitionQueueTests(TestCase):
+    """识别任务的租约领取"""
+
+    def setUp(self):
+        self.recognition = InvoiceRecognition.objects.create(file='invoice_files/test.jpg', status='PENDING')
+
+    def test_two_workers_claim_same_job(self):
+        # worker-b 查到候选任务后、抢占租约前，worker-a 先领取了同一任务
+        original_update = QuerySet.update
+        claimed_by_a = []
+
+        def racing_update(queryset, **kwargs):
+            if not claimed_by_a:
+                claimed_by_a.append(None)
+                claimed_by_a[0] = RecognitionQueue.claim('worker-a')
+            return original_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            claimed_by_b = RecognitionQueue.claim('worker-b')
+
+        self.assertEqual([recognition.pk for recognition in claimed_by_a[0]], [self.recognition.pk])
+        self.assertEqual(claimed_by_b, [])
+        self.recognition.refresh_from_db()
+        self.assertEqual(self.recognition.locked_by, 'worker-a')
+        self.assertEqual(self.recognition.attempts, 1)
+
+    def test_active_lease_is_not_reclaimed(self):
+        self.assertEqual(len(RecognitionQueue.claim('worker-a')), 1)
+        self.assertEqual(RecognitionQueue.claim('worker-b'), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        recognition, = RecognitionQueue.claim('worker-a')
+        InvoiceRecognition.objects.filter(pk=recognition.pk).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        reclaimed, = RecognitionQueue.claim('worker-b')
+        self.assertEqual(reclaimed.pk, recognition.pk)
+        self.assertEqual(reclaimed.locked_by, 'worker-b')
+        self.assertEqual(reclaimed.attempts, 2)
+
+        # 原进程的租约已被接管，不能再写入结果
+        self.assertFalse(RecognitionQueue._finish(recognition, 'worker-a', 'FAILED', '识别失败'))
+        self.assertTrue(RecognitionQueue._finish(reclaimed, 'worker-b', 'FAILED', '识别失败'))
+
+    def test_exhausted_job_is_failed_instead_of_reclaimed(self):
+        InvoiceRecognition.objects.filter(pk=self.recognition.pk).update(
+            status='PROCESSING',
+            attempts=RecognitionQueue.MAX_ATTEMPTS,
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+
+        self.assertEqual(RecognitionQueue.claim('worker-a'), [])
+        self.assertEqual(RecognitionQueue.fail_exhausted(), 1)
+        self.recognition.refresh_from_db()
+        self.assertEqual(self.recognition.status, 'FAILED')
+
+
+class RecognitionRawTextTests(TestCase):
+    """查看原始文本只读取已保存的文本，重新识别经POST交给后台进程"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass')
+        self.client.force_login(self.user)
+        self.recognition = InvoiceRecognition.objects.create(
+            file='invoice_files/test.jpg', status='COMPLETED', created_by=self.user
+        )
+        self.recognition.set_raw_text('增值税发票识别文本')
+        self.url = reverse('invoice:recognition_raw_text', args=[self.recognition.pk])
+
+    def test_get_serves_stored_text_without_ocr(self):
+        empty = InvoiceRecognition.objects.create(file='invoice_files/empty.jpg', status='COMPLETED', created_by=self.user)
+        with mock.patch.object(InvoiceRecognizer, 'extract_text_from_image') as extract:
+            response = self.client.get(self.url, {'refresh': 'general'})
+            self.assertContains(response, '增值税发票识别文本')
+            response = self.client.get(reverse('invoice:recognition_raw_text', args=[empty.pk]))
+            self.assertContains(response, '暂无原始文本')
+        extract.assert_not_called()
+        self.assertFalse(InvoiceRecognition.objects.filter(raw_text_due_at__isnull=False).exists())
+
+    def test_post_queues_general_ocr_for_worker(self):
+        self.client.post(self.url)
+        self.assertEqual(self.client.get(self.url, {'format': 'json'}).json(),
+                         {'pending': True, 'raw_text': '增值税发票识别文本'})
+
+        recognition, = RecognitionQueue.claim_raw_text()
+        # 已领取的请求在租约到期前不会被其他进程重复领取
+        self.assertEqual(RecognitionQueue.claim_raw_text(), [])
+        with mock.patch.object(InvoiceRecognizer, 'extract_text_from_image', return_value='通用文字识别文本') as extract:
+            self.assertTrue(RecognitionQueue.process_raw_text(recognition))
+        extract.assert_called_once_with(recognition.file.path)
+        self.assertEqual(self.client.get(self.url, {'format': 'json'}).json(),
+                         {'pending': False, 'raw_text': '通用文字识别文本'})
+
+    def test_post_requires_owner(self):
+        other = User.objects.create_user('other', password='pass')
+        self.client.force_login(other)
+        self.client.post(self.url)
+        self.recognition.refresh_from_db()
+        self.assertIsNone(self.recognition.raw_text_due_at)
+
+    def test_pending_requests_capped_per_user(self):
+        with mock.patch.object(RecognitionQueue, 'RAW_TEXT_MAX_PENDING', 1):
+            other = InvoiceRecognition.objects.create(file='invoice_files/other.jpg', status='COMPLETED', created_by=self.user)
+            self.assertTrue(RecognitionQueue.request_raw_text(other, self.user))
+            self.assertFalse(RecognitionQueue.request_raw_text(self.recognition, self.user))
+            # 已在排队的请求不重复计数
+            self.assertTrue(RecognitionQueue.request_raw_text(other, self.user))
+
+    def test_page_record_reads_only_its_page(self):
+        page = InvoiceRecognition.objects.create(
+            file='invoice_files/merged.pdf', status='COMPLETED', created_by=self.user, page_number=2,
+        )
+        RecognitionQueue.request_raw_text(page, self.user)
+        recognition, = RecognitionQueue.claim_raw_text()
+        with mock.patch.object(InvoiceRecognizer, 'extract_pdf_pages_text', return_value=['第一页', '第二页']), \
+                mock.patch.object(InvoiceRecognizer, 'extract_text_from_pdf') as extract_whole_file:
+            RecognitionQueue.process_raw_text(recognition)
+        extract_whole_file.assert_not_called()
+        self.assertEqual(page.get_raw_text(), '第二页')
+
+
+class BaiduAccessTokenTests(TestCase):
+    """百度OCR访问令牌失效后的重试"""
+
+    def setUp(self):
+        temp_dir = make_temp_dir(self)
+        settings_override = override_settings(
+            BAIDU_OCR_API_KEY='key', BAIDU_OCR_SECRET_KEY='secret',
+            BAIDU_OCR_STATE_DB=os.path.join(temp_dir, 'state.sqlite3'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.image_path = os.path.join(temp_dir, 'invoice.jpg')
+        Image.new('RGB', (40, 40), 'white').save(self.image_path)
+
+        self.service = BaiduOCRService()
+        self.addCleanup(lambda: self.service._token_timer and self.service._token_timer.cancel())
+        self.urls = []
+        self.tokens = iter(['token-1', 'token-2'])
+        self.service.session.post = self.fake_post
+
+    def fake_post(self, url, data=None, headers=None, timeout=None):
+        self.urls.append(url)
+        if 'access_token=' not in url:
+            return FakeResponse({'access_token': next(self.tokens), 'expires_in': 86400})
+        if url.endswith('access_token=token-1'):
+            return FakeResponse({'error_code': 110, 'error_msg': 'Access token invalid or no longer valid'})
+        return FakeResponse({'words_result': [{'words': '电子发票'}]})
+
+    def test_invalid_token_is_refreshed_and_request_retried_once(self):
+        success, text, _ = self.service.recognize_text(self.image_path)
+
+        self.assertTrue(success)
+        self.assertEqual(text, '电子发票')
+        ocr_urls = [url for url in self.urls if 'access_token=' in url]
+        self.assertEqual([url.rsplit('=', 1)[1] for url in ocr_urls], ['token-1', 'token-2'])
+        self.assertEqual(self.service.get_stats()['token_refreshes'], 2)
+
+    def test_token_requests_bypass_rate_limiter_and_circuit_breaker(self):
+        with mock.patch.object(self.service, '_wait_for_rate_limit') as wait, \
+                mock.patch.object(self.service, '_record_circuit_result') as record:
+            self.service.recognize_text(self.image_path)
+
+        # 只有两次识别请求经过限流器和熔断器，两次令牌请求不经过
+        self.assertEqual(wait.call_count, 2)
+        self.assertEqual(record.call_count, 2)
+        self.assertEqual(self.service.get_stats()['requests'], 2)
+
+
+class BaiduPdfPagesTests(TestCase):
+    """多页PDF逐页调用百度增值税发票识别（页码经 pdf_file_num 传递）"""
+
+    def setUp(self):
+        temp_dir = make_temp_dir(self)
+        settings_override = override_settings(
+            BAIDU_OCR_API_KEY='key', BAIDU_OCR_SECRET_KEY='secret', BAIDU_OCR_MAX_RETRIES=0, BAIDU_OCR_QPS_LIMIT=0,
+            BAIDU_OCR_STATE_DB=os.path.join(temp_dir, 'state.sqlite3'), MEDIA_ROOT=temp_dir,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # 3页扫描件（没有文本层）
+        self.pdf_path = os.path.join(temp_dir, 'merged.pdf')
+        pages = [Image.new('RGB', (200, 280), 'white') for _ in range(3)]
+        pages[0].save(self.pdf_path, save_all=True, append_images=pages[1:])
+
+        self.service = BaiduOCRService()
+        self.addCleanup(lambda: self.service._token_timer and self.service._token_timer.cancel())
+        self.service.session.post = self.fake_post
+        self.failed_pages = set()
+        self.slow_pages = set()
+        self.release_slow_pages = threading.Event()
+        self.addCleanup(self.release_slow_pages.set)
+
+    def fake_post(self, url, data=None, headers=None, timeout=None):
+        if 'access_token=' not in url:
+            return FakeResponse({'access_token': 'token', 'expires_in': 86400})
+        page_number = int(dict(parse_qsl(data.suffix.decode('ascii').lstrip('&')))['pdf_file_num'])
+        if page_number in self.slow_pages:
+            self.release_slow_pages.wait(5)
+        if page_number in self.failed_pages:
+            return FakeResponse({'error_code': 216201, 'error_msg': 'image format error'})
+        return FakeResponse({'words_result': fake_vat_words_result(f'page-{page_number}')})
+
+    def test_failed_page_alongside_successful_pages(self):
+        self.failed_pages = {2}
+        results = self.service.recognize_vat_invoice_pdf_pages(self.pdf_path, [1, 2, 3])
+
+        self.assertEqual({page: result[0] for page, result in results.items()}, {1: True, 2: False, 3: True})
+        self.assertNotEqual(results[1][1]['invoice_number'], results[3][1]['invoice_number'])
+        self.assertEqual(results[2][2]['error_code'], 216201)
+
+    def test_pages_unfinished_within_time_budget_fail(self):
+        self.slow_pages = {3}
+        start = time.monotonic()
+        results = self.service.recognize_vat_invoice_pdf_pages(self.pdf_path, [1, 2, 3], time_budget=0.5)
+
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual({page: result[0] for page, result in results.items()}, {1: True, 2: True, 3: False})
+
+    def test_process_creates_page_records(self):
+        self.failed_pages = {2}
+        user = User.objects.create_user('uploader')
+        recognition = InvoiceRecognition.objects.create(file='merged.pdf', status='PENDING', created_by=user)
+        claimed, = RecognitionQueue.claim('worker-a')
+
+        with mock.patch('invoice.baidu_ocr_service._service_instance', self.service), \
+                mock.patch('invoice.ocr_engines._router_instance', None), \
+                mock.patch.object(TesseractOCREngine, 'is_available', return_value=False):
+            self.assertEqual(RecognitionQueue.process(claimed, 'worker-a'), 'COMPLETED')
+
+        # 第1页的结果写在原记录上，其余每页一条子记录
+        recognition.refresh_from_db()
+        self.assertEqual((recognition.page_number, recognition.status), (1, 'COMPLETED'))
+        pages = {page.page_number: page for page in recognition.pages.all()}
+        self.assertEqual({number: page.status for number, page in pages.items()}, {2: 'FAILED', 3: 'COMPLETED'})
+        self.assertEqual(pages[2].result, '第2页无法识别发票内容')
+        self.assertTrue(all(page.file.name == recognition.file.name for page in pages.values()))
+        self.assertEqual(pages[3].created_by, user)
+        self.assertIn('发票号码', pages[3].get_raw_text())
+
+        # 识别结果完整的页面自动确认为发票
+        self.assertEqual(
+            set(Invoice.objects.values_list('invoice_number', flat=True)),
+            {recognition.invoice_number, pages[3].invoice_number},
+        )
+
+
+class RateLimiterTests(TestCase):
+    """跨进程令牌桶"""
+
+    def setUp(self):
+        self.db_path = os.path.join(make_temp_dir(self), 'state.sqlite3')
+        self.now = 1000.0
+        clock = mock.patch('invoice.rate_limiter.time.time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def make_limiter(self):
+        # 同一状态文件上的两个实例相当于两个进程
+        return TokenBucketRateLimiter(self.db_path, rate=2, capacity=3, name='test')
+
+    def test_tokens_debited_across_instances(self):
+        limiter_a, limiter_b = self.make_limiter(), self.make_limiter()
+        self.assertEqual(limiter_a.try_acquire(), 0)
+        self.assertEqual(limiter_b.try_acquire(2), 0)
+        # 桶已空，补足1个令牌需要 1 / rate 秒
+        self.assertAlmostEqual(limiter_a.try_acquire(), 0.5)
+        self.now += 0.5
+        self.assertEqual(limiter_b.try_acquire(), 0)
+
+    def test_concurrent_acquire_never_overdraws(self):
+        limiter = self.make_limiter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            waits = list(executor.map(lambda _: limiter.try_acquire(), range(8)))
+        self.assertEqual(sum(1 for wait_seconds in waits if wait_seconds == 0), 3)
+
+    def test_acquire_times_out(self):
+        limiter = self.make_limiter()
+        limiter.try_acquire(3)
+        self.assertFalse(limiter.acquire(timeout=0.1))
+
+    def test_acquire_rejects_more_tokens_than_capacity(self):
+        with self.assertRaises(ValueError):
+            self.make_limiter().acquire(tokens=4)
+
+
+class SharedTokenStoreTests(TestCase):
+    """跨进程共享的访问令牌和刷新租约"""
+
+    def setUp(self):
+        self.db_path = os.path.join(make_temp_dir(self), 'state.sqlite3')
+        self.now = 1000.0
+        clock = mock.patch('invoice.token_store.time.time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.store_a = SharedTokenStore(self.db_path, name='test')
+        self.store_b = SharedTokenStore(self.db_path, name='test')
+
+    def test_single_refresh_lease(self):
+        self.assertTrue(self.store_a.try_lock('a', 30))
+        self.assertFalse(self.store_b.try_lock('b', 30))
+
+        # 未持有租约的进程写入的令牌被忽略
+        self.store_b.store('token-b', 5000, 'b')
+        self.assertEqual(self.store_b.get(), (None, 0))
+
+        self.store_a.store('token-a', 5000, 'a')
+        self.assertEqual(self.store_b.get(), ('token-a', 5000))
+        # 写入令牌后租约释放
+        self.assertTrue(self.store_b.try_lock('b', 30))
+
+    def test_expired_lease_taken_over(self):
+        self.assertTrue(self.store_a.try_lock('a', 30))
+        self.now += 31
+        self.assertTrue(self.store_b.try_lock('b', 30))
+
+        # 原持有者在租约过期后才拿到令牌，不能覆盖新持有者的租约
+        self.store_a.store('token-a', 5000, 'a')
+        self.assertEqual(self.store_a.get(), (None, 0))
+        self.assertFalse(self.store_a.try_lock('a', 30))
+
+        self.store_b.store('token-b', 5000, 'b')
+        self.assertEqual(self.store_a.get(), ('token-b', 5000))
+
+    def test_release_and_invalidate(self):
+        self.store_a.try_lock('a', 30)
+        self.store_a.release('a')
+        self.assertTrue(self.store_b.try_lock('b', 30))
+        self.store_b.store('token-b', 5000, 'b')
+
+        self.store_a.invalidate('stale-token')
+        self.assertEqual(self.store_a.get(), ('token-b', 5000))
+        self.store_a.invalidate('token-b')
+        self.assertEqual(self.store_b.get(), (None, 0))
+
+
+class CircuitBreakerTests(TestCase):
+    """跨进程共享的熔断器"""
+
+    def setUp(self):
+        self.db_path = os.path.join(make_temp_dir(self), 'state.sqlite3')
+        self.now = 1000.0
+        clock = mock.patch('invoice.circuit_breaker.time.time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def make_breaker(self):
+        # 同一状态文件上的两个实例相当于两个进程
+        return SharedCircuitBreaker(self.db_path, name='test', failure_threshold=3, reset_timeout=60, probe_timeout=30)
+
+    def open_breaker(self, breaker):
+        for _ in range(3):
+            breaker.record_failure('状态码 500')
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = self.make_breaker()
+        breaker.record_failure('状态码 500')
+        breaker.record_failure('状态码 500')
+        self.assertTrue(breaker.allow_request())
+
+        breaker.record_failure('状态码 500')
+        self.assertEqual(breaker.get_state()['state'], SharedCircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+        self.assertFalse(self.make_breaker().allow_request())
+
+    def test_success_resets_failure_count(self):
+        breaker = self.make_breaker()
+        breaker.record_failure('状态码 500')
+        breaker.record_failure('状态码 500')
+        breaker.record_success(0.1)
+        breaker.record_failure('状态码 500')
+        self.assertEqual(breaker.get_state()['state'], SharedCircuitBreaker.CLOSED)
+
+    def test_slow_call_counts_as_failure(self):
+        breaker = SharedCircuitBreaker(self.db_path, name='slow', failure_threshold=1, slow_call_seconds=5)
+        breaker.record_success(6)
+        self.assertFalse(breaker.allow_request())
+
+    def test_half_open_allows_one_probe(self):
+        first, second = self.make_breaker(), self.make_breaker()
+        self.open_breaker(first)
+
+        self.now += 61
+        self.assertTrue(first.allow_request())
+        self.assertEqual(first.get_state()['state'], SharedCircuitBreaker.HALF_OPEN)
+        # 探测请求未回报结果前，其他进程的请求仍被拒绝
+        self.assertFalse(second.allow_request())
+
+        first.record_success(0.1)
+        self.assertEqual(second.get_state()['state'], SharedCircuitBreaker.CLOSED)
+        self.assertTrue(second.allow_request())
+
+    def test_failed_probe_reopens(self):
+        breaker = self.make_breaker()
+        self.open_breaker(breaker)
+
+        self.now += 61
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure('状态码 502')
+        self.assertEqual(breaker.get_state()['state'], SharedCircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        self.now += 61
+        self.assertTrue(breaker.allow_request())
+
+    def test_probe_without_result_times_out(self):
+        first, second = self.make_breaker(), self.make_breaker()
+        self.open_breaker(first)
+
+        self.now += 61
+        self.assertTrue(first.allow_request())
+        # 探测请求超过 probe_timeout 仍未回报（如进程崩溃），放行下一个探测请求
+        self.now += 31
+        self.assertTrue(second.allow_request())
+
+
+class TesseractEngineTests(TestCase):
+    """本地Tesseract进程池"""
+
+    def test_timeout_terminates_workers_and_replaces_pool(self):
+        process = mock.Mock()
+        executor = mock.Mock(_processes={1: process})
+        executor.submit.return_value = Future()  # 一直不完成，相当于卡住的子进程
+
+        with mock.patch.object(TesseractOCREngine, 'is_available', return_value=True), \
+                mock.patch.object(TesseractOCREngine, 'TIMEOUT', 0.01), \
+                mock.patch.object(TesseractOCREngine, '_executor', executor):
+            success, message = TesseractOCREngine.recognize_text('invoice.jpg')
+            self.assertIsNone(TesseractOCREngine._executor)
+
+        self.assertFalse(success)
+        self.assertIn('超时', message)
+        executor.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        process.terminate.assert_called_once_with()
+
+
+class FakeEngine(OCREngine):
+    doc_types = (DOC_IMAGE,)
+
+    def __init__(self, name, cost, remote=False, complete=None):
+        """complete 为None时识别失败，否则返回完整（True）或不完整（False）的结果"""
+        super().__init__(cost)
+        self.name = name
+        self.remote = remote
+        self.complete = complete
+        self.calls = 0
+
+    def recognize(self, file_path, context):
+        self.calls += 1
+        if self.complete is None:
+            return None
+        return EngineResult({'invoice_number': '12345678', 'total_amount': '106.00'}, f'{self.name} text', self.complete)
+
+
+class InvoiceQRPayloadTests(TestCase):
+    """发票二维码内容解析：01,票种代码,发票代码,发票号码,金额,开票日期,校验码,..."""
+
+    def test_parse_payload(self):
+        cases = [
+            # (二维码内容, 发票类型, 金额, 价税合计)
+            ('01,01,1100182130,12345678,1000.00,20240520,12345678901234567890,ABCD,', 'VAT_SPECIAL', '1000.00', ''),
+            ('01,04,3100181320,00012345,88,20240105,,', 'VAT_GENERAL', '88.00', ''),
+            ('01,10,044002100111,87654321,56.64,20231231,95739265180627436921,F2B5,', 'VAT_GENERAL', '56.64', ''),
+            # 数电发票没有发票代码，二维码中的金额为价税合计
+            ('01,31,,24112000000012345678,113.00,20240520,,A1B2', 'VAT_SPECIAL', '', '113.00'),
+            ('01,32,,24312000000087654321,1130.5,20240601,,C3D4', 'VAT_GENERAL', '', '1130.50'),
+            # 未知票种按普通发票处理，金额为不含税金额
+            (' 01, 99, 123, 11112222, 10.00, 20240101 ', 'VAT_GENERAL', '10.00', ''),
+        ]
+        for payload, invoice_type, amount, total_amount in cases:
+            with self.subTest(payload=payload):
+                info = InvoiceQRDecoder.parse_payload(payload)
+                fields = [field.strip() for field in payload.split(',')]
+                self.assertEqual(info['invoice_number'], fields[3])
+                self.assertEqual(info['invoice_date'].replace('-', ''), fields[5])
+                self.assertEqual(info['invoice_type'], invoice_type)
+                self.assertEqual((info['amount'], info['total_amount']), (amount, total_amount))
+                self.assertEqual(info['tax_amount'], '')
+
+    def test_parse_invalid_payload(self):
+        for payload in (
+            None,
+            '',
+            'https://example.com/invoice?id=1',
+            '01,10,044002100111,87654321,56.64',  # 字段不足
+            '02,10,044002100111,87654321,56.64,20231231',  # 不是发票二维码
+            '01,10,044002100111,NO12345,56.64,20231231',  # 发票号码不是数字
+            '01,10,044002100111,87654321,abc,20231231',  # 金额无效
+            '01,10,044002100111,87654321,56.64,20231341',  # 日期无效
+        ):
+            with self.subTest(payload=payload):
+                self.assertIsNone(InvoiceQRDecoder.parse_payload(payload))
+
+    def test_qr_needs_ocr(self):
+        cases = [
+            # (二维码结果中已有的字段, 是否需要百度OCR补全)
+            ({'seller_name': '上海乙有限公司', 'tax_amount': '13.00', 'total_amount': '113.00'}, False),
+            ({'seller_name': '上海乙有限公司', 'tax_amount': '13.00', 'total_amount': ''}, True),
+            ({'seller_name': '', 'tax_amount': '13.00', 'total_amount': '113.00'}, True),
+            ({'amount': '100.00', 'total_amount': '113.00'}, True),
+            ({}, True),
+        ]
+        for qr_info, needs_ocr in cases:
+            with self.subTest(qr_info=qr_info):
+                self.assertEqual(InvoiceRecognizer.qr_needs_ocr(qr_info), needs_ocr)
+
+        # 数电发票二维码只有价税合计，仍需补全销售方和税额
+        qr_info = InvoiceQRDecoder.parse_payload('01,32,,24312000000087654321,1130.5,20240601,,C3D4')
+        self.assertTrue(InvoiceRecognizer.qr_needs_ocr(qr_info))
+
+        with mock.patch.object(InvoiceRecognizer, 'QR_FILL_FROM_OCR', False):
+            self.assertFalse(InvoiceRecognizer.qr_needs_ocr({}))
+
+
+LOCAL_INVOICE_TEXT = """电子发票（普通发票）
+发票号码：24112000000012345678
+开票日期：2024年05月20日
+购 名称：北京甲公司 销 名称：上海乙有限公司
+买 统一社会信用代码/纳税人识别号：91110000000000001A 售 统一社会信用代码/纳税人识别号：91310000000000002B
+合 计 ￥{amount} ￥{tax_amount}
+价税合计（大写） 壹佰壹拾叁圆整 （小写）¥{total_amount}
+"""
+
+
+class LocalInvoiceTextTests(TestCase):
+    """PDF文本层解析：金额 + 税额 = 价税合计（误差不超过 AMOUNT_TOLERANCE）时才直接采用"""
+
+    def test_amount_tolerance(self):
+        cases = [
+            # (金额, 税额, 价税合计, 是否采用)
+            ('100.00', '13.00', '113.00', True),
+            ('100.00', '13.00', '113.01', True),
+            ('100.00', '13.00', '112.99', True),
+            ('100.00', '13.00', '113.02', False),
+            ('100.00', '13.00', '120.00', False),
+            ('390.38', '23.42', '413.80', True),
+            ('0.10', '0.20', '0.31', True),
+        ]
+        for amount, tax_amount, total_amount, accepted in cases:
+            with self.subTest(amount=amount, tax_amount=tax_amount, total_amount=total_amount):
+                text = LOCAL_INVOICE_TEXT.format(amount=amount, tax_amount=tax_amount, total_amount=total_amount)
+                info = InvoiceRecognizer.parse_local_invoice_text(text)
+                if not accepted:
+                    self.assertIsNone(info)
+                    continue
+                self.assertEqual(
+                    (info['amount'], info['tax_amount'], info['total_amount']), (amount, tax_amount, total_amount)
+                )
+                self.assertEqual(info['invoice_number'], '24112000000012345678')
+                self.assertEqual(info['invoice_date'], '2024-05-20')
+                self.assertEqual(info['seller_name'], '上海乙有限公司')
+
+    def test_incomplete_text_is_rejected(self):
+        text = LOCAL_INVOICE_TEXT.format(amount='100.00', tax_amount='13.00', total_amount='113.00')
+        for label in ('发票号码', '开票日期', '购 名称', '合 计'):
+            with self.subTest(missing=label):
+                lines = [line for line in text.splitlines() if not line.startswith(label)]
+                self.assertIsNone(InvoiceRecognizer.parse_local_invoice_text('\n'.join(lines)))
+        self.assertIsNone(InvoiceRecognizer.parse_local_invoice_text(''))
+
+
+class OCRRouterTests(TestCase):
+    """识别引擎路由：期望成本排序、远程调用次数和结果缓存"""
+
+    def setUp(self):
+        temp_dir = make_temp_dir(self)
+        self.stats_store = EngineStatsStore(os.path.join(temp_dir, 'state.sqlite3'))
+        self.image_path = os.path.join(temp_dir, 'invoice.jpg')
+        Image.new('RGB', (40, 40), 'white').save(self.image_path)
+
+    def plan_names(self, router):
+        return [engine.name for engine in router.plan(DOC_IMAGE, explore=False)]
+
+    def test_engines_ranked_by_expected_cost(self):
+        cheap = FakeEngine('cheap', 1, remote=True)
+        accurate = FakeEngine('accurate', 5, remote=True)
+        router = OCRRouter([accurate, cheap], self.stats_store)
+        # 样本不足时按成功率100%估计，即按成本排序
+        self.assertEqual(self.plan_names(router), ['cheap', 'accurate'])
+
+        for _ in range(OCRRouter.MIN_SAMPLES):
+            self.stats_store.record('cheap', DOC_IMAGE, False, 0.1)
+            self.stats_store.record('accurate', DOC_IMAGE, True, 0.1)
+        # cheap 的成功率为0，期望成本高于 accurate，但仍保留在后面尝试
+        self.assertEqual(self.plan_names(router), ['accurate', 'cheap'])
+
+    def test_remote_engines_limited_per_file(self):
+        engines = [FakeEngine('local', 0), FakeEngine('general', 1, remote=True),
+                   FakeEngine('accurate', 3, remote=True), FakeEngine('vat', 10, remote=True)]
+        router = OCRRouter(engines, self.stats_store)
+        with mock.patch.object(OCRRouter, 'MAX_REMOTE_CALLS', 2):
+            self.assertEqual(self.plan_names(router), ['local', 'general', 'accurate'])
+        with mock.patch.object(OCRRouter, 'MAX_REMOTE_CALLS', 0):
+            self.assertEqual(self.plan_names(router), ['local', 'general', 'accurate', 'vat'])
+
+    def test_cache_checked_before_remote_engines(self):
+        local = FakeEngine('local', 0)
+        remote = FakeEngine('remote', 10, remote=True, complete=True)
+        router = OCRRouter([local, remote], self.stats_store)
+
+        invoice_info, text = router.recognize(self.image_path)
+        self.assertEqual(invoice_info['source'], 'remote')
+        self.assertEqual(text, 'remote text')
+
+        # 相同内容的文件再次识别：本地引擎照常尝试，远程引擎不再调用
+        self.assertEqual(router.recognize(self.image_path), (invoice_info, text))
+        self.assertEqual(local.calls, 2)
+        self.assertEqual(remote.calls, 1)
+        # 原始文本存放在 text 字段，words_result 只保存百度的原始返回
+        entry = OCRCacheEntry.objects.get()
+        self.assertEqual(entry.text, 'remote text')
+        self.assertIsNone(entry.words_result)
+
+    def test_local_results_are_not_cached(self):
+        local = FakeEngine('local', 0, complete=True)
+        remote = FakeEngine('remote', 10, remote=True, complete=True)
+        router = OCRRouter([local, remote], self.stats_store)
+
+        router.recognize(self.image_path)
+        local.complete = None
+        invoice_info, _ = router.recognize(self.image_path)
+        self.assertEqual(invoice_info['source'], 'remote')
+        self.assertEqual(remote.calls, 1)
+
+    def test_incomplete_remote_results_are_not_cached(self):
+        remote = FakeEngine('remote', 10, remote=True, complete=False)
+        router = OCRRouter([remote], self.stats_store)
+
+        router.recognize(self.image_path)
+        router.recognize(self.image_path)
+        self.assertEqual(remote.calls, 2)
+
+
+class OCRCacheCounterTests(TestCase):
+    """OCR缓存计数：进程内累加，定期用一条UPDATE写入数据库"""
+
+    def setUp(self):
+        OCRResultCache.reset_stats()
+        self.addCleanup(OCRResultCache.reset_stats)
+
+    def totals(self):
+        return dict(OCRCacheCounter.objects.values_list('name', 'value'))
+
+    def test_counts_buffered_until_flush(self):
+        with mock.patch.object(OCRResultCache, 'STATS_FLUSH_SECONDS', 3600):
+            for _ in range(5):
+                OCRResultCache._incr('hits')
+            OCRResultCache._incr('misses', 2)
+        self.assertEqual(self.totals(), {})
+        # 未写入的计数也计入累计统计
+        self.assertEqual(OCRResultCache.get_stats()['total_hits'], 5)
+
+        OCRResultCache.flush_stats()
+        self.assertEqual(self.totals(), {'hits': 5, 'misses': 2})
+        self.assertEqual(OCRResultCache.get_stats()['total_hits'], 5)
+
+    def test_flush_updates_existing_counters_in_one_query(self):
+        OCRCacheCounter.objects.create(name='hits', value=10)
+        OCRCacheCounter.objects.create(name='misses', value=1)
+        with mock.patch.object(OCRResultCache, 'STATS_FLUSH_SECONDS', 3600):
+            OCRResultCache._incr('hits', 3)
+            OCRResultCache._incr('misses')
+
+        with self.assertNumQueries(1):
+            OCRResultCache.flush_stats()
+        self.assertEqual(self.totals(), {'hits': 13, 'misses': 2})
+        # 没有新增计数时不访问数据库
+        with self.assertNumQueries(0):
+            OCRResultCache.flush_stats()
+
+    def test_flush_when_interval_elapsed(self):
+        with mock.patch.object(OCRResultCache, 'STATS_FLUSH_SECONDS', 0):
+            OCRResultCache._incr('hits')
+        self.assertEqual(self.totals(), {'hits': 1})
+
+
+class InvoiceSearchTests(TestCase):
+    """发票列表的关键词搜索与其余筛选条件组合"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='secret')
+        cls.travel = InvoiceCategory.objects.create(name='差旅')
+        other = InvoiceCategory.objects.create(name='办公')
+        invoices = []
+        # 1500 张匹配搜索词，其中 1100 张属于差旅类别；另有 300 张差旅类别的发票不匹配
+        for index in range(1500):
+            invoices.append(make_invoice(
+                f'{10000000 + index}', category=cls.travel if index < 1100 else other,
+                invoice_date=date(2024, 1, 1) + timedelta(days=index % 300),
+            ))
+        for index in range(300):
+            invoices.append(make_invoice(
+                f'{20000000 + index}', category=cls.travel, invoice_content='*办公用品*纸张', seller_name='北京测试文具有限公司',
+            ))
+        bulk_create_invoices(invoices)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_search_with_category_filter_beyond_1000_matches(self):
+        params = {'search': '餐饮', 'category': self.travel.pk, 'page_size': 500}
+        response = self.client.get(reverse('invoice:invoice_list'), {**params, 'page': 3})
+
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, 1100)
+        self.assertEqual(len(page_obj), 100)
+
+        seen = set()
+        for page in (1, 2, 3):
+            page_obj = self.client.get(reverse('invoice:invoice_list'), {**params, 'page': page}).context['page_obj']
+            for invoice in page_obj:
+                self.assertEqual(invoice.category_id, self.travel.pk)
+                self.assertIn('餐饮', invoice.invoice_content)
+                seen.add(invoice.pk)
+        self.assertEqual(len(seen), 1100)
+
+    def test_search_without_match_is_empty(self):
+        response = self.client.get(reverse('invoice:invoice_list'), {'search': '不存在的内容', 'category': self.travel.pk})
+        self.assertEqual(response.context['page_obj'].paginator.count, 0)
+
+    def test_filter_keeps_rank_order(self):
+        queryset = InvoiceSearchIndex.filter(Invoice.objects.filter(category=self.travel), '10000001')
+        self.assertEqual(queryset[0].invoice_number, '10000001')
+
+
+class MonthlyRollupTests(TestCase):
+    """发票保存、修改、删除时增量更新的月度汇总应与重建结果一致"""
+
+    def setUp(self):
+        self.category = InvoiceCategory.objects.create(name='差旅')
+
+    def rollups(self):
+        return set(InvoiceMonthlyRollup.objects.values_list(
+            'month', 'category_id', 'buyer_id', 'seller_id', 'status',
+            'invoice_count', 'amount', 'tax_amount', 'total_amount',
+        ))
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        InvoiceMonthlyRollup.rebuild()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_create(self):
+        make_invoice('10000001', category=self.category).save()
+        make_invoice('10000002', category=self.category, amount=Decimal('50.00'), total_amount=Decimal('56.00')).save()
+        make_invoice('10000003').save()
+
+        rollup = InvoiceMonthlyRollup.objects.get(category=self.category)
+        self.assertEqual(rollup.month, date(2024, 3, 1))
+        self.assertEqual(rollup.invoice_count, 2)
+        self.assertEqual(rollup.total_amount, Decimal('162.00'))
+        self.assertMatchesRebuild()
+
+    def test_update_moves_invoice_between_rollups(self):
+        invoice = make_invoice('10000001', category=self.category)
+        invoice.save()
+        make_invoice('10000002', category=self.category).save()
+
+        invoice.invoice_date = date(2024, 4, 2)
+        invoice.status = 'VERIFIED'
+        invoice.total_amount = Decimal('212.00')
+        invoice.save()
+
+        march = InvoiceMonthlyRollup.objects.get(month=date(2024, 3, 1))
+        april = InvoiceMonthlyRollup.objects.get(month=date(2024, 4, 1))
+        self.assertEqual((march.invoice_count, march.total_amount), (1, Decimal('106.00')))
+        self.assertEqual((april.invoice_count, april.status, april.total_amount), (1, 'VERIFIED', Decimal('212.00')))
+        self.assertMatchesRebuild()
+
+    def test_update_without_rollup_fields_changes_nothing(self):
+        invoice = make_invoice('10000001', category=self.category)
+        invoice.save()
+        before = self.rollups()
+
+        invoice.description = '备注'
+        invoice.save(update_fields=['description'])
+        self.assertEqual(self.rollups(), before)
+
+    def test_delete(self):
+        first = make_invoice('10000001', category=self.category)
+        first.save()
+        second = make_invoice('10000002', category=self.category)
+        second.save()
+
+        first.delete()
+        self.assertEqual(InvoiceMonthlyRollup.objects.get().invoice_count, 1)
+        self.assertMatchesRebuild()
+
+        second.delete()
+        self.assertFalse(InvoiceMonthlyRollup.objects.exists())
+
+    def test_delete_without_rollup_row_writes_no_negative_row(self):
+        invoice = make_invoice('10000001', category=self.category)
+        invoice.save()
+        InvoiceMonthlyRollup.objects.all().delete()
+
+        invoice.delete()
+        self.assertFalse(InvoiceMonthlyRollup.objects.exists())
+
+    def test_rows_with_null_keys_stay_unique(self):
+        # 没有类别、交易方的发票：唯一约束不约束空值，由 invoice_rollup_key_nulls 索引保证唯一
+        for number in ('10000001', '10000002'):
+            make_invoice(number, seller_name='', seller_tax_id='', buyer_name='', buyer_tax_id='').save()
+
+        rollup = InvoiceMonthlyRollup.objects.get()
+        self.assertIsNone(rollup.seller_id)
+        self.assertEqual(rollup.invoice_count, 2)
+        self.assertMatchesRebuild()
+
+
+class KeysetPaginatorTests(TestCase):
+    """按 (开票日期, ID) 的游标分页"""
+
+    def create_invoices(self, count):
+        # 每3张发票同一开票日期，翻页边界会落在同一日期的发票之间
+        bulk_create_invoices([
+            make_invoice(f'{10000000 + index}', invoice_date=date(2024, 1, 1) + timedelta(days=index // 3))
+            for index in range(count)
+        ])
+        return list(Invoice.objects.order_by('-invoice_date', '-id').values_list('pk', flat=True))
+
+    def walk_forward(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    @staticmethod
+    def ids(page):
+        return [invoice.pk for invoice in page]
+
+    def test_forward_pages_cover_all_rows_once(self):
+        expected = self.create_invoices(25)
+        pages = self.walk_forward(KeysetPaginator(Invoice.objects.all(), 10))
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], expected)
+        self.assertFalse(pages[0].has_previous())
+
+    def test_last_page_exactly_full(self):
+        self.create_invoices(20)
+        pages = self.walk_forward(KeysetPaginator(Invoice.objects.all(), 10))
+
+        self.assertEqual([len(page) for page in pages], [10, 10])
+        self.assertIsNone(pages[-1].next_cursor)
+
+    def test_previous_cursor_round_trip(self):
+        self.create_invoices(25)
+        paginator = KeysetPaginator(Invoice.objects.all(), 10)
+        pages = self.walk_forward(paginator)
+
+        second = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(self.ids(second), self.ids(pages[1]))
+        self.assertTrue(second.has_next())
+        self.assertEqual(self.ids(paginator.get_page(second.next_cursor)), self.ids(pages[2]))
+
+        first = paginator.get_page(second.previous_cursor)
+        self.assertEqual(self.ids(first), self.ids(pages[0]))
+        self.assertFalse(first.has_previous())
+
+    def test_filtered_queryset(self):
+        self.create_invoices(25)
+        Invoice.objects.filter(invoice_number__endswith='7').update(status='VERIFIED')
+        expected = list(
+            Invoice.objects.filter(status='PENDING').order_by('-invoice_date', '-id').values_list('pk', flat=True)
+        )
+        pages = self.walk_forward(KeysetPaginator(Invoice.objects.filter(status='PENDING'), 4))
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], expected)
+
+    def test_invalid_cursor_returns_first_page(self):
+        expected = self.create_invoices(15)
+        paginator = KeysetPaginator(Invoice.objects.all(), 10)
+        cursor = paginator.get_page().next_cursor
+
+        self.assertEqual(self.ids(paginator.get_page(cursor + 'x')), expected[:10])
+        self.assertEqual(self.ids(paginator.get_page('not-a-cursor')), expected[:10])
+
+    def test_approximate_count_is_capped(self):
+        self.create_invoices(15)
+        paginator = KeysetPaginator(Invoice.objects.all(), 10)
+        self.assertEqual(paginator.approximate_count(limit=20), (15, False))
+        self.assertEqual(paginator.approximate_count(limit=10), (10, True))
+
+    def test_invoice_list_search_uses_ranked_offset_pages(self):
+        self.create_invoices(25)
+        user = User.objects.create_user('tester', password='secret')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('invoice:invoice_list'))
+        self.assertIsInstance(response.context['page_obj'], KeysetPage)
+
+        # 关键词搜索按相关度排序，按页码分页
+        response = self.client.get(reverse('invoice:invoice_list'), {'search': '10000003'})
+        page_obj = response.context['page_obj']
+        self.assertNotIsInstance(page_obj, KeysetPage)
+        self.assertEqual(page_obj[0].invoice_number, '10000003')
+
+
+class FindDuplicatesTests(TestCase):
+    """按发票指纹批量检查重复发票"""
+
+    def setUp(self):
+        make_invoice('10000001').save()
+
+    @staticmethod
+    def candidate(**fields):
+        values = {
+            'invoice_number': '10000001', 'seller_tax_id': '91110000000000001A', 'seller_name': '北京测试餐饮有限公司',
+            'total_amount': '106.00', 'invoice_date': '2024-03-15',
+        }
+        values.update(fields)
+        return values
+
+    def test_same_invoice_is_duplicate(self):
+        duplicates = InvoiceValidator.find_duplicates([self.candidate(invoice_number='1000-0001')])
+        self.assertEqual(duplicates, {0: InvoiceValidator.DUPLICATE_MESSAGE})
+
+    def test_other_seller_tax_id_is_not_duplicate(self):
+        self.assertEqual(InvoiceValidator.find_duplicates([self.candidate(seller_tax_id='91110000000000009Z')]), {})
+
+    def test_candidate_without_tax_id_matches_by_seller_name(self):
+        duplicates = InvoiceValidator.find_duplicates([self.candidate(seller_tax_id='')])
+        self.assertEqual(duplicates, {0: InvoiceValidator.DUPLICATE_MESSAGE})
+        self.assertEqual(InvoiceValidator.find_duplicates([self.candidate(seller_tax_id='', seller_name='其他公司')]), {})
+
+    def test_duplicate_within_batch(self):
+        candidates = [
+            self.candidate(invoice_number='10000002'),
+            self.candidate(invoice_number='10000003'),
+            self.candidate(invoice_number='10000002', seller_tax_id=''),
+        ]
+        self.assertEqual(InvoiceValidator.find_duplicates(candidates), {2: InvoiceValidator.DUPLICATE_IN_BATCH_MESSAGE})
+
+    def test_existing_number_with_other_details(self):
+        candidate = self.candidate(total_amount='99.00')
+        self.assertEqual(InvoiceValidator.find_duplicates([candidate]), {})
+        self.assertEqual(
+            InvoiceValidator.find_duplicates([candidate], match_numbers=True),
+            {0: InvoiceValidator.DUPLICATE_NUMBER_MESSAGE},
+        )
+
+
+class InvoiceIngestionTests(TestCase):
+    """批量录入：逐行校验、整批去重、一个事务写入"""
+
+    def setUp(self):
+        make_invoice('10000001').save()
+
+    @staticmethod
+    def row(label, invoice_number, **fields):
+        # 与手动录入提交的表单一致，字段值为字符串
+        values = {'invoice_date': '2024-03-20', 'amount': '200', 'tax_amount': '12', 'total_amount': '212'}
+        values.update(fields)
+        return {'invoice': make_invoice(invoice_number, **values), 'label': label}
+
+    def test_duplicates_rejected_inside_bulk_ingest(self):
+        recognition = InvoiceRecognition.objects.create(file='invoice_files/new.pdf', status='COMPLETED')
+        rows = [
+            self.row('new.pdf', '10000002'),
+            self.row('existing.pdf', '10000001', invoice_date='2024-03-15', amount='100', tax_amount='6', total_amount='106'),
+            self.row('same-as-new.pdf', '1000 0002'),
+            self.row('bad-amount.pdf', '10000003', amount='abc'),
+            self.row('other.pdf', '10000004'),
+        ]
+        rows[0]['recognition'] = recognition
+        rows[0]['recognition_status'] = 'MANUAL_COMPLETED'
+
+        result = InvoiceIngestion.ingest(rows)
+
+        self.assertEqual([invoice.invoice_number for invoice in result.created], ['10000002', '10000004'])
+        errors = {error['label']: error['error'] for error in result.errors}
+        self.assertEqual(errors['existing.pdf'], InvoiceValidator.DUPLICATE_MESSAGE)
+        self.assertEqual(errors['same-as-new.pdf'], InvoiceValidator.DUPLICATE_IN_BATCH_MESSAGE)
+        self.assertIn('bad-amount.pdf', errors)
+        self.assertEqual(Invoice.objects.count(), 3)
+
+        created = Invoice.objects.get(invoice_number='10000002')
+        self.assertEqual(created.total_amount, Decimal('212.00'))
+        self.assertIsNotNone(created.seller_id)
+        recognition.refresh_from_db()
+        self.assertEqual((recognition.invoice_id, recognition.status), (created.pk, 'MANUAL_COMPLETED'))
+
+        # 月度汇总和搜索索引在同一事务中更新
+        rollup = InvoiceMonthlyRollup.objects.get()
+        self.assertEqual((rollup.invoice_count, rollup.total_amount), (3, Decimal('530.00')))
+        self.assertEqual(InvoiceSearchIndex.filter(Invoice.objects.all(), '10000004').count(), 1)
+
+    def test_database_error_rolls_back_whole_batch(self):
+        rows = [self.row('a.pdf', '10000002'), self.row('b.pdf', '10000003')]
+        with mock.patch.object(InvoiceSearchIndex, 'index', side_effect=DatabaseError('disk I/O error')):
+            result = InvoiceIngestion.ingest(rows)
+
+        self.assertEqual(result.created, [])
+        self.assertEqual(len(result.errors), 2)
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.assertEqual(InvoiceMonthlyRollup.objects.get().invoice_count, 1)
+
+
+class PartyTests(TestCase):
+    """交易方归并：有税号按税号，没有税号按规范化的名称"""
+
+    def test_resolve_by_tax_id(self):
+        seller = Party.resolve('9111 0000-0000 00001a', '北京 测试 餐饮有限公司', 'seller')
+        buyer = Party.resolve('91110000000000001A', '北京测试餐饮公司（OCR误差）', 'buyer')
+        self.assertEqual(seller.pk, buyer.pk)
+        buyer.refresh_from_db()
+        self.assertEqual(buyer.tax_id, '91110000000000001A')
+        # 名称以首次出现的为准，由 refresh_name 重新统计
+        self.assertEqual(buyer.name, '北京测试餐饮有限公司')
+        self.assertTrue(buyer.is_seller and buyer.is_buyer)
+
+    def test_resolve_by_normalized_name(self):
+        first = Party.resolve(None, '张 三', 'buyer')
+        second = Party.resolve('', ' 张三 ', 'seller')
+        self.assertEqual(first.pk, second.pk)
+        self.assertIsNone(second.tax_id)
+        # 同名但有税号的交易方单独归并
+        with_tax_id = Party.resolve('91110000000000009X', '张三', 'seller')
+        self.assertNotEqual(with_tax_id.pk, first.pk)
+        self.assertIsNone(Party.resolve(' ', '  ', 'seller'))
+
+    def test_resolve_many_matches_resolve(self):
+        existing = Party.resolve('91110000000000001A', '北京测试餐饮有限公司', 'seller')
+        pairs = [
+            ('91110000000000001a', '北京测试餐饮'),  # 已有交易方，补上购买方标记
+            (None, '李 四'),
+            ('', '李四'),
+            ('91310000000000002B', ''),
+            (None, None),
+        ]
+        with self.assertNumQueries(4):
+            parties = Party.resolve_many(pairs, 'buyer')
+
+        self.assertEqual(parties[0].pk, existing.pk)
+        self.assertEqual(parties[1].pk, parties[2].pk)
+        self.assertEqual(parties[1].name, '李四')
+        self.assertEqual(parties[3].tax_id, '91310000000000002B')
+        self.assertIsNone(parties[4])
+        self.assertEqual([Party.resolve(*pair, 'buyer') for pair in pairs[:4]], parties[:4])
+        existing.refresh_from_db()
+        self.assertTrue(existing.is_seller and existing.is_buyer)
+
+    def test_refresh_name_after_renames(self):
+        make_invoice('10000001', seller_name='北京测试餐饮有限公司').save()
+        party = Party.objects.get(tax_id='91110000000000001A')
+        self.assertFalse(party.name_stale)
+
+        # 销售方更名后新名称的发票占多数
+        for number in ('10000002', '10000003'):
+            make_invoice(number, seller_name='北京测试 餐饮 集团有限公司').save()
+        party.refresh_from_db()
+        self.assertTrue(party.name_stale)
+        self.assertEqual(party.name, '北京测试餐饮有限公司')
+
+        self.assertEqual(Party.refresh_stale_names(), 1)
+        party.refresh_from_db()
+        self.assertEqual(party.name, '北京测试餐饮集团有限公司')
+        self.assertFalse(party.name_stale)
+
+        # 修改已有发票上的名称后重新统计
+        Invoice.objects.filter(invoice_number__in=['10000002', '10000003']).update(seller_name='北京测试餐饮有限公司')
+        party.refresh_name()
+        self.assertEqual(party.name, '北京测试餐饮有限公司')
+        self.assertEqual(Party.refresh_stale_names(), 0)
+
+
+class RecognitionPayloadMigrationTests(MigrationTestCase):
+    """迁移0011将识别记录的原始文本压缩后移到 RecognitionPayload，回滚时写回"""
+
+    migrate_from = '0010_invoicerecognition_pages'
+    migrate_to = '0011_recognitionpayload'
+
+    raw_text = '电子发票（普通发票）\n发票号码：24112000000012345678\n' + '货物或应税劳务、服务名称 *餐饮服务*餐费\n' * 50
+
+    def setUpBeforeMigration(self, apps):
+        InvoiceRecognition = apps.get_model('invoice', 'InvoiceRecognition')
+        self.completed_pk = InvoiceRecognition.objects.create(
+            file='invoice_files/a.pdf', status='COMPLETED', result='{"invoice_number": "24112000000012345678"}',
+            raw_text=self.raw_text,
+        ).pk
+        self.empty_pk = InvoiceRecognition.objects.create(file='invoice_files/b.jpg', status='PENDING').pk
+        self.failed_pk = InvoiceRecognition.objects.create(
+            file='invoice_files/c.jpg', status='FAILED', result='无法识别发票内容', raw_text='模糊 文本',
+        ).pk
+
+    def test_migrate_forward(self):
+        RecognitionPayload = self.apps.get_model('invoice', 'RecognitionPayload')
+
+        payloads = {payload.recognition_id: payload for payload in RecognitionPayload.objects.all()}
+        self.assertEqual(set(payloads), {self.completed_pk, self.failed_pk})
+        for pk, raw_text in ((self.completed_pk, self.raw_text), (self.failed_pk, '模糊 文本')):
+            payload = payloads[pk]
+            self.assertEqual(zlib.decompress(bytes(payload.raw_text)).decode('utf-8'), raw_text)
+            self.assertEqual(payload.raw_size, len(raw_text.encode('utf-8')))
+        self.assertLess(len(payloads[self.completed_pk].raw_text), payloads[self.completed_pk].raw_size)
+
+    def test_migrate_backward(self):
+        apps = self.migrate([('invoice', self.migrate_from)])
+        InvoiceRecognition = apps.get_model('invoice', 'InvoiceRecognition')
+
+        recognitions = InvoiceRecognition.objects.in_bulk()
+        self.assertEqual(recognitions[self.completed_pk].raw_text, self.raw_text)
+        self.assertEqual(recognitions[self.failed_pk].raw_text, '模糊 文本')
+        self.assertIn(recognitions[self.empty_pk].raw_text, (None, ''))
+
+
+class RecognitionResultMigrationTests(MigrationTestCase):
+    """迁移0012将JSON格式的 result 解析到 result_data、invoice_number、is_complete，失败原因保留在 result 中"""
+
+    migrate_from = '0011_recognitionpayload'
+    migrate_to = '0012_recognition_result_data'
+
+    complete_result = {
+        'invoice_number': '24112000000012345678', 'invoice_date': '2024-05-20', 'amount': '100.00',
+        'tax_amount': '13.00', 'total_amount': '113.00', 'seller_name': '上海乙有限公司',
+    }
+    incomplete_result = {'invoice_number': '12345678', 'invoice_date': '2024-05-20', 'amount': ''}
+
+    def setUpBeforeMigration(self, apps):
+        InvoiceRecognition = apps.get_model('invoice', 'InvoiceRecognition')
+        self.complete_pk = InvoiceRecognition.objects.create(
+            file='invoice_files/a.pdf', status='COMPLETED', result=json.dumps(self.complete_result, ensure_ascii=False),
+        ).pk
+        self.incomplete_pk = InvoiceRecognition.objects.create(
+            file='invoice_files/b.jpg', status='COMPLETED', result=json.dumps(self.incomplete_result),
+        ).pk
+        self.failed_pk = InvoiceRecognition.objects.create(
+            file='invoice_files/c.jpg', status='FAILED', result='{无法识别发票内容}',
+        ).pk
+
+    def test_migrate_forward(self):
+        InvoiceRecognition = self.apps.get_model('invoice', 'InvoiceRecognition')
+        recognitions = InvoiceRecognition.objects.in_bulk()
+
+        complete = recognitions[self.complete_pk]
+        self.assertIsNone(complete.result)
+        self.assertEqual(complete.result_data, self.complete_result)
+        self.assertEqual((complete.invoice_number, complete.is_complete), ('24112000000012345678', True))
+
+        incomplete = recognitions[self.incomplete_pk]
+        self.assertEqual(incomplete.result_data, self.incomplete_result)
+        self.assertEqual((incomplete.invoice_number, incomplete.is_complete), ('12345678', False))
+
+        # 以 { 开头但不是JSON的失败原因保留在 result 中
+        failed = recognitions[self.failed_pk]
+        self.assertEqual(failed.result, '{无法识别发票内容}')
+        self.assertIsNone(failed.result_data)
+        self.assertEqual((failed.invoice_number, failed.is_complete), ('', False))
+
+    def test_migrate_backward(self):
+        apps = self.migrate([('invoice', self.migrate_from)])
+        InvoiceRecognition = apps.get_model('invoice', 'InvoiceRecognition')
+
+        recognitions = InvoiceRecognition.objects.in_bulk()
+        self.assertEqual(json.loads(recognitions[self.complete_pk].result), self.complete_result)
+        self.assertEqual(json.loads(recognitions[self.incomplete_pk].result), self.incomplete_result)
+        self.assertEqual(recognitions[self.failed_pk].result, '{无法识别发票内容}')
+
+
+class PartyMergeMigrationTests(MigrationTestCase):
+    """迁移0019合并没有税号的重复交易方，发票外键和月度汇总随之更新"""
+
+    migrate_from = '0018_invoice_rollup_null_key'
+    migrate_to = '0019_party_name_unique'
+
+    def setUpBeforeMigration(self, apps):
+        Party = apps.get_model('invoice', 'Party')
+        Invoice = apps.get_model('invoice', 'Invoice')
+        InvoiceMonthlyRollup = apps.get_model('invoice', 'InvoiceMonthlyRollup')
+        self.kept = Party.objects.create(name='张三', is_seller=True)
+        duplicate = Party.objects.create(name='张三', is_buyer=True)
+        self.other = Party.objects.create(name='李四', is_seller=True)
+        self.company = Party.objects.create(tax_id='91110000000000001A', name='北京测试餐饮有限公司', is_seller=True)
+
+        rows = [
+            ('20000001', self.kept, self.company),
+            ('20000002', duplicate, self.company),
+            ('20000003', self.other, duplicate),
+        ]
+        for number, seller, buyer in rows:
+            Invoice.objects.create(
+                invoice_number=number, invoice_date=date(2024, 3, 15), invoice_type='ELECTRONIC',
+                amount=Decimal('100.00'), tax_amount=Decimal('6.00'), total_amount=Decimal('106.00'),
+                seller_name=seller.name, seller_tax_id=seller.tax_id or '', seller=seller,
+                buyer_name=buyer.name, buyer_tax_id=buyer.tax_id or '', buyer=buyer,
+            )
+            InvoiceMonthlyRollup.objects.create(
+                month=date(2024, 3, 1), seller_id=seller.pk, buyer_id=buyer.pk, status='PENDING',
+                invoice_count=1, amount=Decimal('100.00'), tax_amount=Decimal('6.00'), total_amount=Decimal('106.00'),
+            )
+
+    def test_duplicates_merged_into_first_party(self):
+        Party = self.apps.get_model('invoice', 'Party')
+        Invoice = self.apps.get_model('invoice', 'Invoice')
+        InvoiceMonthlyRollup = self.apps.get_model('invoice', 'InvoiceMonthlyRollup')
+
+        self.assertEqual(list(Party.objects.filter(name='张三').values_list('pk', flat=True)), [self.kept.pk])
+        kept = Party.objects.get(pk=self.kept.pk)
+        self.assertTrue(kept.is_seller and kept.is_buyer)
+        self.assertEqual(
+            dict(Invoice.objects.values_list('invoice_number', 'seller_id')),
+            {'20000001': self.kept.pk, '20000002': self.kept.pk, '20000003': self.other.pk},
+        )
+        self.assertEqual(Invoice.objects.get(invoice_number='20000003').buyer_id, self.kept.pk)
+
+        # 月度汇总按合并后的交易方重新生成
+        rollups = set(InvoiceMonthlyRollup.objects.values_list('seller_id', 'buyer_id', 'invoice_count', 'total_amount'))
+        self.assertEqual(rollups, {
+            (self.kept.pk, self.company.pk, 2, Decimal('212.00')),
+            (self.other.pk, self.kept.pk, 1, Decimal('106.00')),
+        })
+
+
+class PartyBackfillMigrationTests(MigrationTestCase):
+    """迁移0015由已有发票生成交易方：按税号（没有税号时按名称）归并，以出现次数最多的名称为规范名称"""
+
+    migrate_from = '0014_invoice_search_index'
+    migrate_to = '0015_party'
+
+    def setUpBeforeMigration(self, apps):
+        Invoice = apps.get_model('invoice', 'Invoice')
+        rows = [
+            ('30000001', '91110000000000001a', '北京测试 餐饮有限公司', '', '张 三'),
+            ('30000002', '9111 0000 0000 0000 1A', '北京测试餐饮有限公司', '', '张三'),
+            ('30000003', '91110000000000001A', '北京测试餐厅', '91110000000000001A', '北京测试餐饮有限公司'),
+        ]
+        for number, seller_tax_id, seller_name, buyer_tax_id, buyer_name in rows:
+            Invoice.objects.create(
+                invoice_number=number, invoice_date=date(2024, 3, 15), invoice_type='ELECTRONIC',
+                amount=Decimal('100.00'), tax_amount=Decimal('6.00'), total_amount=Decimal('106.00'),
+                seller_name=seller_name, seller_tax_id=seller_tax_id, buyer_name=buyer_name, buyer_tax_id=buyer_tax_id,
+            )
+
+    def test_invoices_linked_to_backfilled_parties(self):
+        Party = self.apps.get_model('invoice', 'Party')
+        Invoice = self.apps.get_model('invoice', 'Invoice')
+
+        self.assertEqual(Party.objects.count(), 2)
+        company = Party.objects.get(tax_id='91110000000000001A')
+        self.assertEqual(company.name, '北京测试餐饮有限公司')
+        self.assertTrue(company.is_seller and company.is_buyer)
+        person = Party.objects.get(tax_id__isnull=True)
+        self.assertEqual(person.name, '张三')
+
+        self.assertEqual(set(Invoice.objects.values_list('seller_id', flat=True)), {company.pk})
+        self.assertEqual(
+            dict(Invoice.objects.values_list('invoice_number', 'buyer_id')),
+            {'30000001': person.pk, '30000002': person.pk, '30000003': company.pk},
+        )
 
-# Create your tests here.
@@ -0,0 +1,98 @@
+# encoding:utf-8
+"""
+跨进程共享的访问令牌存储
+
+百度OCR的access_token保存在本机的SQLite状态文件中，所有gunicorn进程和后台识别进程共用一份。
+刷新令牌前需要先抢占刷新租约（refresh_lock_until），同一时间只有一个进程会请求TOKEN_URL，
+其他进程等待新令牌写入后直接读取。
+"""
+
+import logging
+import time
+
+from .sqlite_state import SQLiteStateStore
+
+logger = logging.getLogger(__name__)
+
+
+class SharedTokenStore(SQLiteStateStore):
+    """基于SQLite文件的访问令牌存储"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS access_token ('
+        'name TEXT PRIMARY KEY, token TEXT, expires_at REAL NOT NULL DEFAULT 0, '
+        'refresh_lock_until REAL NOT NULL DEFAULT 0, lock_owner TEXT)',
+    )
+
+    def __init__(self, db_path, name='default'):
+        """
+        Args:
+            db_path: SQLite状态文件路径（所有进程需使用同一路径）
+            name: 令牌名称，同一文件中可保存多个令牌
+        """
+        super().__init__(db_path)
+        self.name = name
+
+    def get(self):
+        """读取令牌
+
+        Returns:
+            tuple: (token, expires_at)，没有令牌时返回(None, 0)
+        """
+        row = self._connect().execute(
+            'SELECT token, expires_at FROM access_token WHERE name = ?', (self.name,)
+        ).fetchone()
+        if row is None or not row[0]:
+            return None, 0
+        return row[0], row[1]
+
+    def try_lock(self, owner, lease_seconds):
+        """抢占刷新租约
+
+        Args:
+            owner: 租约持有者标识
+            lease_seconds: 租约时长（秒），持有者崩溃后租约到期自动释放
+
+        Returns:
+            bool: 是否抢占成功
+        """
+        with self.immediate_transaction() as conn:
+            now = time.time()
+            row = conn.execute(
+                'SELECT refresh_lock_until FROM access_token WHERE name = ?', (self.name,)
+            ).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            if row is None:
+                conn.execute(
+                    'INSERT INTO access_token (name, refresh_lock_until, lock_owner) VALUES (?, ?, ?)',
+                    (self.name, now + lease_seconds, owner)
+                )
+            else:
+                conn.execute(
+                    'UPDATE access_token SET refresh_lock_until = ?, lock_owner = ? WHERE name = ?',
+                    (now + lease_seconds, owner, self.name)
+                )
+            return True
+
+    def store(self, token, expires_at, owner):
+        """写入新令牌并释放刷新租约"""
+        self._connect().execute(
+            'UPDATE access_token SET token = ?, expires_at = ?, refresh_lock_until = 0, lock_owner = NULL '
+            'WHERE name = ? AND lock_owner = ?',
+            (token, expires_at, self.name, owner)
+        )
+
+    def release(self, owner):
+        """释放刷新租约（刷新失败时调用）"""
+        self._connect().execute(
+            'UPDATE access_token SET refresh_lock_until = 0, lock_owner = NULL WHERE name = ? AND lock_owner = ?',
+            (self.name, owner)
+        )
+
+    def invalidate(self, token):
+        """令牌被百度判定为无效时清除，下次使用时重新获取"""
+        self._connect().execute(
+            'UPDATE access_token SET token = NULL, expires_at = 0 WHERE name = ? AND token = ?',
+            (self.name, token)
+        )
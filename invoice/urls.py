@@ -22,6 +22,8 @@ urlpatterns = [
     path('reports/export/', views.report_export, name='report_export'),
 
     path('recognize/', views.invoice_recognize, name='invoice_recognize'),
+    path('recognize/status/', views.recognition_status, name='recognition_status'),
+    path('recognize/<int:pk>/raw-text/', views.recognition_raw_text, name='recognition_raw_text'),
     path('recognize/confirm/<int:pk>/', views.invoice_confirm, name='invoice_confirm'),
     path('recognize/batch-confirm/<str:recognition_ids>/', views.batch_confirm, name='batch_confirm'),
     path('recognize/manual-input/<str:recognition_ids>/', views.manual_input, name='manual_input'),
@@ -1,4 +1,3 @@
-import os
 import re
 import io
 import tempfile
@@ -6,16 +5,38 @@ import pytesseract
 from PIL import Image
 import pdfplumber
 # from wand.image import Image as WandImage  # 暂时注释，需要正确配置ImageMagick
-from datetime import datetime
 import logging
-from .baidu_ocr_service import BaiduOCRService
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+from django.db import connection
+from .baidu_ocr_service import get_ocr_service
 from .baidu_ocr_config import BaiduOCRConfig
+from .ocr_cache import OCRResultCache
+from .invoice_extractor import InvoiceInfoExtractor
+from .qr_decoder import InvoiceQRDecoder
+from .tesseract_engine import TesseractOCREngine
 
 logger = logging.getLogger(__name__)
 
 class InvoiceRecognizer:
     """发票识别工具类"""
     
+    # 图片原始文本的来源：'vat' 由增值税发票识别结果生成；'general' 额外调用通用文字识别
+    RAW_TEXT_SOURCE = getattr(settings, 'OCR_RAW_TEXT_SOURCE', 'vat')
+    # PDF优先解析内嵌文本层，结果完整且金额自洽时不再调用百度OCR
+    PDF_LOCAL_FIRST = getattr(settings, 'OCR_PDF_LOCAL_FIRST', True)
+    # 本地解析结果被采用所需的字段
+    LOCAL_REQUIRED_FIELDS = ['invoice_number', 'invoice_date', 'amount', 'tax_amount', 'total_amount', 'seller_name']
+    # 金额 + 税额 与 价税合计 允许的误差（元），比较前先按分取整，避免浮点误差使恰好相差1分的结果被拒绝
+    AMOUNT_TOLERANCE = 0.01
+    # 二维码结果缺少 QR_REQUIRED_FIELDS 时是否调用百度OCR补全销售方、购买方等字段（二维码字段优先）
+    QR_FILL_FROM_OCR = getattr(settings, 'OCR_QR_FILL_FROM_OCR', True)
+    # 二维码结果（含PDF文本层补充的字段）具备这些字段时不再调用百度OCR，与自动确认对二维码结果的要求一致
+    QR_REQUIRED_FIELDS = ['seller_name', 'tax_amount', 'total_amount']
+    # 二维码中没有、可由PDF文本层补充的字段
+    QR_SUPPLEMENT_FIELDS = ['invoice_content', 'seller_name', 'seller_tax_id', 'buyer_name', 'buyer_tax_id']
+    
     @staticmethod
     def extract_text_from_image(image_path, use_baidu_ocr=True):
         """从图片中提取文本（仅使用百度OCR）
@@ -31,7 +52,7 @@ class InvoiceRecognizer:
         
         # 仅使用百度OCR
         try:
-            baidu_service = BaiduOCRService()
+            baidu_service = get_ocr_service()
             success, baidu_text, raw_response = baidu_service.recognize_text(image_path)
             
             if success and baidu_text.strip():
@@ -45,44 +66,72 @@ class InvoiceRecognizer:
             return ""
     
     @classmethod
-    def extract_structured_invoice_data(cls, file_path, use_baidu_ocr=True):
+    def extract_structured_invoice_data(cls, file_path, use_baidu_ocr=True, return_raw=False, use_cache=True,
+                                        page_number=None, wait_timeout=None):
         """从发票文件中提取结构化数据（仅使用百度OCR）
         
         Args:
             file_path: 文件路径（支持图片和PDF）
             use_baidu_ocr: 是否使用百度OCR
+            return_raw: 是否同时返回百度OCR原始的words_result
+            use_cache: 是否读写OCR结果缓存（识别路由已自行缓存最终结果时传False）
+            page_number: 只识别PDF的指定页（从1开始），为None时识别整个文件
+            wait_timeout: 等待限流令牌的最长时间（秒）
             
         Returns:
-            tuple: (success, invoice_data)
+            tuple: (success, invoice_data)，return_raw为True时为(success, invoice_data, words_result)
         """
+        def result(success, invoice_data=None, words_result=None):
+            if return_raw:
+                return success, invoice_data, words_result
+            return success, invoice_data
+        
+        # 相同内容的文件直接返回缓存的识别结果
+        cache_key = None
+        if use_cache:
+            try:
+                cache_key = OCRResultCache.make_key(OCRResultCache.file_sha256(file_path), page_number)
+                cached = OCRResultCache.get(cache_key)
+                if cached:
+                    invoice_data, words_result, _ = cached
+                    return result(True, invoice_data, words_result)
+            except Exception as e:
+                logger.warning(f"读取OCR缓存失败: {str(e)}")
+        
         # 检查百度OCR配置
         if not BaiduOCRConfig.is_configured():
             logger.error("百度OCR API密钥未配置，无法进行发票识别")
-            return False, None
-            
-        # 检测文件类型
-        file_ext = os.path.splitext(file_path)[1].lower()
+            return result(False)
         
         # 仅使用百度增值税发票识别接口
         try:
-            from .baidu_ocr_service import BaiduOCRService
-            baidu_service = BaiduOCRService()
+            baidu_service = get_ocr_service()
             
             # 根据文件类型选择识别方法
-            if file_ext == '.pdf':
-                success, invoice_data, raw_response = baidu_service.recognize_vat_invoice_pdf(file_path)
+            if page_number:
+                success, invoice_data, raw_response = baidu_service.recognize_vat_invoice_pdf(
+                    file_path, wait_timeout=wait_timeout, page_number=page_number
+                )
             else:
-                success, invoice_data, raw_response = baidu_service.recognize_vat_invoice(file_path)
+                success, invoice_data, raw_response = baidu_service.recognize_vat_invoice_file(
+                    file_path, wait_timeout=wait_timeout
+                )
             
             if success and invoice_data:
                 logger.info(f"百度增值税发票识别成功: {file_path}")
-                return True, invoice_data
+                words_result = (raw_response or {}).get('words_result')
+                if cache_key:
+                    try:
+                        OCRResultCache.set(cache_key, invoice_data, words_result)
+                    except Exception as e:
+                        logger.warning(f"写入OCR缓存失败: {str(e)}")
+                return result(True, invoice_data, words_result)
             else:
                 logger.error(f"百度增值税发票识别失败: {file_path}")
-                return False, None
+                return result(False)
         except Exception as e:
             logger.error(f"百度增值税发票识别服务异常: {str(e)}")
-            return False, None
+            return result(False)
     
     @staticmethod
     def preprocess_image(image):
@@ -105,6 +154,151 @@ class InvoiceRecognizer:
             logger.error(f"图片预处理失败: {str(e)}")
             return image
     
+    @staticmethod
+    def extract_pdf_pages_text(pdf_path):
+        """逐页读取PDF内嵌的文本层（电子发票PDF均有文本层，扫描件各页为空字符串）
+        
+        Returns:
+            list: 每页的文本，读取失败时返回空列表
+        """
+        try:
+            with pdfplumber.open(pdf_path) as pdf:
+                return [(page.extract_text() or '').strip() for page in pdf.pages]
+        except Exception as e:
+            logger.warning(f"读取PDF文本层失败 {pdf_path}: {str(e)}")
+            return []
+    
+    @classmethod
+    def extract_pdf_text_layer(cls, pdf_path):
+        """读取PDF内嵌的文本层
+        
+        Returns:
+            str: 各页文本，读取失败时返回空字符串
+        """
+        return '\n'.join(text for text in cls.extract_pdf_pages_text(pdf_path) if text)
+    
+    @staticmethod
+    def get_pdf_page_count(pdf_path):
+        """PDF页数，读取失败时返回0"""
+        try:
+            with pdfplumber.open(pdf_path) as pdf:
+                return len(pdf.pages)
+        except Exception as e:
+            logger.warning(f"读取PDF页数失败 {pdf_path}: {str(e)}")
+            return 0
+    
+    @classmethod
+    def parse_local_invoice_text(cls, text):
+        """从PDF文本层（或OCR识别文本）解析发票信息，并校验结果是否可以直接采用
+        
+        要求 LOCAL_REQUIRED_FIELDS 均已识别，且 金额 + 税额 = 价税合计（误差不超过 AMOUNT_TOLERANCE）。
+        
+        Args:
+            text: PDF文本层或OCR识别文本
+            
+        Returns:
+            dict: 与百度增值税发票识别结果格式一致的发票信息，不完整或金额不自洽时返回None
+        """
+        if not text:
+            return None
+        
+        info = cls.extract_invoice_info(text)
+        info.update(InvoiceInfoExtractor.extract_two_column_parties(text))
+        missing = [field for field in cls.LOCAL_REQUIRED_FIELDS if info.get(field) in ('', None)]
+        if missing:
+            logger.info(f"文本解析缺少字段 {missing}，结果不完整")
+            return None
+        
+        amount, tax_amount, total_amount = info['amount'], info['tax_amount'], info['total_amount']
+        if round(abs(amount + tax_amount - total_amount), 2) > cls.AMOUNT_TOLERANCE:
+            logger.info(
+                f"文本解析金额不一致（{amount} + {tax_amount} != {total_amount}），结果不完整"
+            )
+            return None
+        
+        return cls._format_extracted_info(info, text)
+    
+    @staticmethod
+    def _format_extracted_info(info, text):
+        """将 extract_invoice_info 的结果转换为与百度增值税发票识别结果相同的格式"""
+        if info.get('invoice_date'):
+            info['invoice_date'] = info['invoice_date'].strftime('%Y-%m-%d')
+        for field in ('amount', 'tax_amount', 'total_amount'):
+            if info.get(field) not in ('', None):
+                info[field] = f"{info[field]:.2f}"
+        if '专用发票' in text:
+            info['invoice_type'] = 'VAT_SPECIAL'
+        elif '普通发票' in text:
+            info['invoice_type'] = 'VAT_GENERAL'
+        return info
+    
+    @classmethod
+    def recognize_with_fallback_engine(cls, file_path, page_number=1):
+        """百度OCR熔断期间使用本地Tesseract识别，识别文本经 extract_invoice_info 提取发票信息
+        
+        Args:
+            file_path: 文件路径（图片或PDF）
+            page_number: PDF的页码（从1开始）
+            
+        Returns:
+            tuple: (发票信息dict, 识别文本)，未熔断、Tesseract不可用或未提取到发票号码和金额时返回(None, '')
+        """
+        if not get_ocr_service().is_circuit_open() or not TesseractOCREngine.is_available():
+            return None, ''
+        
+        logger.warning(f"百度OCR熔断中，使用本地Tesseract识别: {file_path}")
+        success, text = TesseractOCREngine.recognize_text(file_path, page_number)
+        if not success:
+            return None, ''
+        
+        info = cls.extract_invoice_info(text)
+        info.update(InvoiceInfoExtractor.extract_two_column_parties(text))
+        if not info.get('invoice_number') and not info.get('total_amount'):
+            logger.warning(f"Tesseract识别结果中未找到发票号码和金额: {file_path}")
+            return None, ''
+        info = cls._format_extracted_info(info, text)
+        info['source'] = 'tesseract'
+        return info, text
+    
+    @classmethod
+    def recognize_qr_code(cls, file_path, text='', page_number=1):
+        """本地解码发票二维码，并用PDF文本层补充二维码中没有的字段
+        
+        Args:
+            file_path: 文件路径（图片或PDF）
+            text: PDF文本层，没有时只返回二维码中的字段
+            page_number: PDF的页码（从1开始）
+            
+        Returns:
+            tuple: (发票信息dict, 二维码文本)，未找到发票二维码时返回(None, '')
+        """
+        invoice_info, payload = InvoiceQRDecoder.decode_file(file_path, page_number)
+        if not invoice_info or not text:
+            return invoice_info, payload
+        
+        local_info = cls.extract_invoice_info(text)
+        local_info.update(InvoiceInfoExtractor.extract_two_column_parties(text))
+        for field in cls.QR_SUPPLEMENT_FIELDS:
+            if local_info.get(field):
+                invoice_info[field] = local_info[field]
+        
+        # 文本层金额自洽且与二维码金额一致时，补全金额、税额和价税合计
+        amounts = [local_info.get(field) for field in ('amount', 'tax_amount', 'total_amount')]
+        if all(value is not None for value in amounts):
+            amount, tax_amount, total_amount = amounts
+            qr_field = 'amount' if invoice_info['amount'] else 'total_amount'
+            if (round(abs(amount + tax_amount - total_amount), 2) <= cls.AMOUNT_TOLERANCE
+                    and round(abs(float(invoice_info[qr_field]) - local_info[qr_field]), 2) <= cls.AMOUNT_TOLERANCE):
+                invoice_info['amount'] = f"{amount:.2f}"
+                invoice_info['tax_amount'] = f"{tax_amount:.2f}"
+                invoice_info['total_amount'] = f"{total_amount:.2f}"
+        return invoice_info, payload
+    
+    @classmethod
+    def qr_needs_ocr(cls, qr_info):
+        """二维码结果是否需要调用百度OCR补全缺少的字段"""
+        return cls.QR_FILL_FROM_OCR and not all(qr_info.get(field) for field in cls.QR_REQUIRED_FIELDS)
+    
     @staticmethod
     def extract_text_from_pdf(pdf_path, use_baidu_ocr=True):
         """从PDF中提取文本（统一使用图片OCR）
@@ -153,329 +347,102 @@ class InvoiceRecognizer:
     
     @classmethod
     def extract_invoice_info(cls, text):
-        """从文本中提取发票信息"""
-        info = {
-            'invoice_number': None,
-            'invoice_content': None,  # 发票内容（原发票代码字段）
-            'invoice_date': None,
-            'invoice_type': None,
-            'amount': None,
-            'tax_amount': None,
-            'total_amount': None,
-            'seller_name': None,
-            'seller_tax_id': None,
-            'buyer_name': None,
-            'buyer_tax_id': None
-        }
-        
-        # 发票号码匹配 - 根据实际OCR结果优化
-        invoice_number_patterns = [
-            r'发票号码[：:：]\s*(\d{20,})',  # 20位长数字
-            r'发票号码[：:：]\s*(\d{8,})',   # 8位以上数字
-            r'(\d{20,})',  # 独立的20位长数字序列
-            r'发票.*?号.*?[：:：]?\s*(\d{8,})',
-            r'号码[：:：]\s*(\d{8,})'
-        ]
-        for pattern in invoice_number_patterns:
-            match = re.search(pattern, text)
-            if match:
-                number = match.group(1)
-                if len(number) >= 8:  # 发票号码至少8位
-                    info['invoice_number'] = number
-                    break
-        
-        # 发票类型识别 - 根据公司名称和内容判断
-        invoice_type_patterns = {
-            'ELECTRONIC': [r'电子发票', r'电子普通发票', r'滴滴', r'出行'],
-            'VAT_GENERAL': [r'增值税普通发票', r'普通发票'],
-            'VAT_SPECIAL': [r'增值税专用发票', r'专用发票'],
-            'PAPER': [r'纸质发票']
-        }
-        
-        for invoice_type, patterns in invoice_type_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, text):
-                    info['invoice_type'] = invoice_type
-                    break
-            if info['invoice_type']:
-                break
-        
-        # 如果没有匹配到具体类型，根据其他特征判断
-        if not info['invoice_type']:
-            if re.search(r'电子|滴滴|出行', text):
-                info['invoice_type'] = 'ELECTRONIC'
-            elif re.search(r'增值税', text):
-                info['invoice_type'] = 'VAT_GENERAL'
-            else:
-                info['invoice_type'] = 'OTHER'
-        
-        # 发票内容匹配 - 根据实际OCR结果优化
-        content_patterns = [
-            r'\*([^\*]+)\*([^\n\r]*)',  # *餐饮服务*餐饮服务格式
-            r'\*([^\*]+)\*',  # 简单的*服务类型*格式
-            r'项目名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)',
-            r'货物或应税劳务[、，]?服务名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)',
-            r'商品名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)',
-            r'服务名称[：:：]?\s*([^\n\r]+?)(?=\s*\d|$)',
-            r'\*([^\*\n\r]+)\*[^\n\r]*?([\d,.]+)\s+([\d,.]+)\s+6%',  # 表格行中的服务项目
-            r'([^\n\r]*技术服务费[^\n\r]*)',  # 直接匹配技术服务费
-            r'([^\n\r]*服务费[^\n\r]*)',  # 匹配各种服务费
-            r'([^\n\r]*(?:餐饮|服务|运输|客运|货运|咨询|技术|维修|安装|培训|设计)[^\n\r]*?)(?=\s*\d|$)',  # 包含服务关键词
-            r'\*([^\*]+)\*\s*([\d,.]+)',  # *服务类型* 后跟数字
-            r'([^\n\r]*(?:费|服务|产品|商品)[^\n\r]*?)(?=\s*[\d,.]+|$)',  # 以费、服务、产品、商品结尾的内容
-        ]
-        
-        for pattern in content_patterns:
-            match = re.search(pattern, text)
-            if match:
-                if len(match.groups()) >= 2 and '*' in pattern:
-                    # 对于*服务类型*描述格式，使用第一个匹配组
-                    content = match.group(1).strip()
-                else:
-                    content = match.group(1).strip()
-                
-                # 清理内容：去除多余空格和特殊字符
-                content = re.sub(r'\s+', ' ', content)
-                content = content.strip()
-                
-                if content and len(content) > 1:  # 确保内容有意义
-                    info['invoice_content'] = content
-                    break
-        
-        # 开票日期匹配 - 处理OCR识别错误
-        date_patterns = [
-            r'开[革票目业]?[目日业]期[：:：]?\s*(\d{4}[年洗/-]\d{1,2}[月晶/-]\d{1,2}[日晶]?)',
-            r'(20\d{2}[年洗]\d{1,2}月\d{1,2}[日晶])',
-            r'(\d{4}[年洗/-]\d{1,2}[月晶/-]\d{1,2}[日晶]?)'
-        ]
-        for pattern in date_patterns:
-            matches = re.findall(pattern, text)
-            for date_str in matches:
-                # 统一日期格式，处理OCR识别错误
-                date_str = re.sub(r'[年洗]', '-', date_str)
-                date_str = re.sub(r'[月晶]', '-', date_str)
-                date_str = re.sub(r'[日晶]', '', date_str)
-                date_str = re.sub(r'[/]', '-', date_str)
-                
-                try:
-                    # 尝试解析日期
-                    if len(date_str.split('-')) == 3:
-                        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                        # 验证日期合理性（2000年后，不超过当前日期）
-                        if 2000 <= date_obj.year <= datetime.now().year:
-                            info['invoice_date'] = date_obj.date()
-                            break
-                except ValueError:
-                    continue
-            if 'invoice_date' in info:
-                break
-        
-        # 销售方名称匹配 - 根据实际OCR结果优化
-        seller_name_patterns = [
-            r'售方[\s\n]*名称[：:：]?\s*([^\n\r]+?)(?=\s*统一社会|纳税人|$)',  # "售方 名称:" 格式
-            r'销售方名称[：:：]?\s*([^\n\r]+?)(?=\s*购买方|统一社会|纳税人|$)',
-            r'销售方[：:：]?\s*([^\n\r]+?)(?=\s*购买方|统一社会|纳税人|$)',
-            r'开票方[：:：]?\s*([^\n\r]+?)(?=\s*收票方|$)',
-            r'售方[\s\n]*名称[：:：]\s*([^\n\r]+?)(?=\s*买方|购买方|统一社会|纳税人|$)',  # 新增：处理"售方名称："格式
-            r'销[\s\n]*名称[：:：]\s*([^\n\r]+?)(?=\s*买方|购买方|统一社会|纳税人|$)',  # 处理"销名称："格式
-            r'([^\n\r]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易|出行|酒店)[^\n\r]*?)(?=\s*统一社会信用代码|纳税人识别号|$)'
-        ]
-        
-        for pattern in seller_name_patterns:
-            matches = re.findall(pattern, text)
-            for seller_name in matches:
-                seller_name = seller_name.strip()
-                
-                # 清理前缀和后缀
-                seller_name = re.sub(r'^[购买销售称方名和郑：:：\s]+', '', seller_name)
-                seller_name = re.sub(r'[：:：\s]*$', '', seller_name)
-                
-                # 提取公司名称（优先选择完整的公司名）
-                company_pattern = r'([^\s]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易|出行)[^\s]*(?:公司|有限)?[^\s]*?)'
-                company_matches = re.findall(company_pattern, seller_name)
-                
-                if company_matches:
-                    # 选择最长的公司名称（通常更完整）
-                    seller_name = max(company_matches, key=len)
-                
-                # 最终清理
-                seller_name = re.sub(r'\s+', '', seller_name)  # 去除所有空格
-                seller_name = seller_name.strip()
-                
-                if seller_name and len(seller_name) > 2:  # 确保名称有意义
-                    info['seller_name'] = seller_name
-                    break
-            if info['seller_name']:
-                break
-        
-        # 购买方名称匹配 - 根据实际OCR结果优化
-        buyer_name_patterns = [
-            r'买方[\s\n]*名称[：:：]?\s*([^\n\r]+?)(?=\s*统一社会|纳税人|$)',  # "买方 名称:" 格式
-            r'购买方名称[：:：]?\s*([^\n\r]+?)(?=\s*销售方|纳税人识别号|统一社会信用代码|$)',
-            r'购买方[：:：]?\s*([^\n\r]+?)(?=\s*销售方|纳税人识别号|统一社会信用代码|$)',
-            r'收票方[：:：]?\s*([^\n\r]+?)(?=\s*开票方|$)',
-            r'购[\s\n]*名称[：:：]\s*([^\n\r]+?)(?=\s*销|售方|统一社会|纳税人|$)',  # 新增：处理"购名称："格式
-            r'买方[\s\n]*([^\n\r]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易)[^\n\r]*?)(?=\s*售方|销|统一社会|纳税人|$)',  # 处理"买方"后直接跟公司名
-            r'([北京|上海|深圳|广州|天津|重庆|杭州|南京|成都|武汉][^\n\r]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易)[^\n\r]*?)(?=\s*统一社会信用代码|纳税人识别号|$)'
-        ]
-        
-        for pattern in buyer_name_patterns:
-            matches = re.findall(pattern, text)
-            for buyer_name in matches:
-                buyer_name = buyer_name.strip()
-                
-                # 清理前缀和后缀
-                buyer_name = re.sub(r'^[购买销售称方名自得和：:：\s]+', '', buyer_name)
-                buyer_name = re.sub(r'[：:：\s]*$', '', buyer_name)
-                buyer_name = re.sub(r'\s*(销售|开票|和\s*名).*$', '', buyer_name)  # 去除后面的销售方信息
-                
-                # 提取公司名称
-                company_pattern = r'([^\s]*(?:公司|有限|科技|文化|传播|集团|企业|商贸|贸易)[^\s]*(?:公司|有限)?[^\s]*?)'
-                company_matches = re.findall(company_pattern, buyer_name)
-                
-                if company_matches:
-                    # 选择最长的公司名称
-                    buyer_name = max(company_matches, key=len)
-                
-                # 最终清理
-                buyer_name = re.sub(r'\s+', '', buyer_name)  # 去除所有空格
-                buyer_name = buyer_name.strip()
-                
-                if buyer_name and len(buyer_name) > 2:  # 确保名称有意义
-                    info['buyer_name'] = buyer_name
-                    break
-            if info['buyer_name']:
-                break
-        
-        # 税额匹配 - 根据实际OCR结果优化
-        tax_patterns = [
-            r'\*[^\*]+\*[^\n]*?([\d,.]+)\s+([\d,.]+)\s+6%\s+([\d,.]+)',  # 表格行格式：金额 金额 6% 税额
-            r'合\s*计\s*￥?([\d,.]+)\s*￥?([\d,.]+)',  # 合计行格式：￥390.38 ￥23.42
-            r'税额[：:]\s*￥?([\d,.]+)',
-            r'([\d,.]+)\s+6%\s+([\d,.]+)'  # 简化的金额 6% 税额格式
-        ]
-        for pattern in tax_patterns:
-            match = re.search(pattern, text)
-            if match:
-                if '6%' in pattern and len(match.groups()) >= 2:  # 包含税率的格式，取最后一个（税额）
-                    tax_str = match.group(-1).replace(',', '')
-                elif '合' in pattern and len(match.groups()) >= 2:  # 合计行格式，取第二个（税额）
-                    tax_str = match.group(2).replace(',', '')
-                else:
-                    tax_str = match.group(1).replace(',', '')
-                try:
-                    info['tax_amount'] = float(tax_str)
-                    break
-                except ValueError:
-                    continue
-        
-        # 价税合计匹配 - 根据实际OCR结果优化
-        total_patterns = [
-            r'\(\s*小[写可]?\s*\)?\s*[¥￥]?([\d,.]+)',  # (小写)￥413.80 格式
-            r'价税[会合]计[（(]?[大小][写可][）)]?.*?[¥￥]?([\d,.]+)',
-            r'(价税[会合]计|合计)[：:]\s*[¥￥]?([\d,.]+)',
-            r'☒[^\n]*?([\d,.]+)圆[\d]*角\s*整'  # ☒肆佰壹拾叁圆捌角整格式，提取数字
-        ]
-        for pattern in total_patterns:
-            match = re.search(pattern, text)
-            if match:
-                if len(match.groups()) >= 2:
-                    total_str = match.group(2).replace(',', '')
-                else:
-                    total_str = match.group(1).replace(',', '')
-                try:
-                    info['total_amount'] = float(total_str)
-                    break
-                except ValueError:
-                    continue
-        
-        # 如果没有匹配到价税合计，尝试从(小写)行提取
-        if not info['total_amount']:
-            small_amount_match = re.search(r'\(小写\)[¥￥]?([\d,.]+)', text)
-            if small_amount_match:
+        """从文本中提取发票信息（规则表见 invoice_extractor）"""
+        return InvoiceInfoExtractor.extract(text)
+    
+    @classmethod
+    def recognize_pdf_pages(cls, file_path, time_budget=None):
+        """逐页识别多页PDF（多张发票合并成的文件，每页一张发票）
+        
+        每页分别经识别路由（ocr_engines.OCRRouter）按成本选择引擎识别，各页并发进行，
+        共享同一时间预算，预算用完时仍未完成的页面记为失败。
+        
+        Args:
+            file_path: PDF文件路径
+            time_budget: 所有页面识别的时间预算（秒），默认使用 BAIDU_OCR_PDF_TIME_BUDGET
+            
+        Returns:
+            list: 按页码排序的 (页码, invoice_info, text)，识别失败的页面 invoice_info 为None、text为失败原因
+        """
+        from .ocr_engines import get_ocr_router
+        
+        pages_text = cls.extract_pdf_pages_text(file_path)[:BaiduOCRConfig.get_pdf_max_pages()]
+        if not pages_text:
+            return []
+        
+        time_budget = time_budget or BaiduOCRConfig.get_pdf_time_budget()
+        deadline = time.monotonic() + time_budget
+        max_workers = max(1, min(len(pages_text), BaiduOCRConfig.get_batch_max_workers()))
+        router = get_ocr_router()
+        results = {}
+        
+        def recognize_page(page_number, text):
+            """在线程中识别单页，结束后关闭该线程的数据库连接（OCR结果缓存）"""
+            try:
+                return router.recognize(file_path, page_number, text, deadline)
+            finally:
+                connection.close()
+        
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='invoice-pdf-page')
+        try:
+            futures = {
+                executor.submit(recognize_page, page_number, text): page_number
+                for page_number, text in enumerate(pages_text, 1)
+            }
+            done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+            for future in done:
+                page_number = futures[future]
                 try:
-                    info['total_amount'] = float(small_amount_match.group(1).replace(',', ''))
-                except ValueError:
-                    pass
-        
-        # 金额匹配 - 提取不含税金额
-        if not info['amount']:
-            amount_patterns = [
-                r'\*[^\*]+\*[^\n]*?([\d,.]+)\s+([\d,.]+)\s+6%',  # 表格行格式中的第一个金额
-                r'合\s*计\s*￥?([\d,.]+)\s*￥?[\d,.]+',  # 合计行的第一个金额
-            ]
-            for pattern in amount_patterns:
-                match = re.search(pattern, text)
-                if match:
-                    try:
-                        info['amount'] = float(match.group(1).replace(',', ''))
-                        break
-                    except ValueError:
-                        continue
-        
-        # 销售方税号匹配
-        if not info['seller_tax_id']:
-            seller_tax_patterns = [
-                r'售方[\s\n]*.*?统一社会信用代码/纳税人识别号[：:：]?\s*([A-Z0-9]{15,18})',
-                r'销售方.*?统一社会信用代码[：:：]?\s*([A-Z0-9]{15,18})',
-                r'统一社会信用代码/纳税人识别号[：:：]?\s*([A-Z0-9]{15,18})'  # 第一个出现的税号通常是销售方
-            ]
-            for pattern in seller_tax_patterns:
-                match = re.search(pattern, text)
-                if match:
-                    info['seller_tax_id'] = match.group(1)
-                    break
-        
-        # 购买方税号匹配
-        if not info['buyer_tax_id']:
-            # 查找所有税号，第二个通常是购买方的
-            all_tax_ids = re.findall(r'统一社会信用代码/纳税人识别号[：:：]?\s*([A-Z0-9]{15,18})', text)
-            if len(all_tax_ids) >= 2:
-                info['buyer_tax_id'] = all_tax_ids[1]  # 第二个税号是购买方
-            elif len(all_tax_ids) == 1 and not info['seller_tax_id']:
-                # 如果只有一个税号且销售方税号未设置，则这个是购买方的
-                info['buyer_tax_id'] = all_tax_ids[0]
-        
-        # 清理None值，避免在JSON序列化时变成字符串'None'
-        for key, value in info.items():
-            if value is None:
-                info[key] = ''
+                    results[page_number] = future.result()
+                except Exception as e:
+                    logger.error(f"PDF第{page_number}页识别时发生错误: {str(e)}")
+            if not_done:
+                unfinished = '、'.join(str(page_number) for page_number in sorted(futures[future] for future in not_done))
+                logger.warning(f"PDF识别超出时间预算（{time_budget}秒），第{unfinished}页未完成: {file_path}")
+        finally:
+            # 不等待超出预算的页面，已排队未开始的页面直接取消
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        page_results = []
+        for page_number in range(1, len(pages_text) + 1):
+            invoice_info, text = results.get(page_number, (None, None))
+            if not invoice_info:
+                text = f"第{page_number}页无法识别发票内容"
+            page_results.append((page_number, invoice_info, text))
+        return page_results
+    
+    @staticmethod
+    def _merge_qr_info(invoice_info, qr_info, source='baidu'):
+        """合并OCR与二维码的识别结果，二维码中已有的字段以二维码为准
         
-        return info
+        Args:
+            invoice_info: OCR识别结果
+            qr_info: 二维码识别结果，可以为None
+            source: OCR识别结果的来源（引擎名称）
+        """
+        if not qr_info:
+            invoice_info['source'] = source
+            return invoice_info
+        invoice_info.update({field: value for field, value in qr_info.items() if value})
+        invoice_info['source'] = f'qr+{source}'
+        return invoice_info
     
     @classmethod
     def recognize_invoice(cls, file_path, use_baidu_ocr=True):
         """识别发票文件
         
+        按成本从低到高依次尝试已配置的识别引擎（PDF文本层、发票二维码、百度各识别接口，
+        熔断期间的本地Tesseract），结果不完整时才升级到更贵的引擎，见 ocr_engines.OCRRouter。
+        
         Args:
             file_path: 文件路径
             use_baidu_ocr: 是否使用百度OCR
-        """
-        file_ext = os.path.splitext(file_path)[1].lower()
-        
-        if file_ext in ['.pdf']:
-            # PDF文件：直接使用结构化识别（支持PDF）
-            success, invoice_info = cls.extract_structured_invoice_data(file_path, use_baidu_ocr)
             
-            if success:
-                # 获取原始文本用于记录
-                text = cls.extract_text_from_pdf(file_path, use_baidu_ocr)
-                return invoice_info, text
-            else:
-                return None, "无法识别发票内容"
-                
-        elif file_ext in ['.jpg', '.jpeg', '.png', '.tiff', '.tif']:
-            # 优先使用结构化发票识别
-            success, invoice_info = cls.extract_structured_invoice_data(file_path, use_baidu_ocr)
-            if success:
-                # 如果结构化识别成功，同时获取原始文本用于记录
-                text = cls.extract_text_from_image(file_path, use_baidu_ocr)
-                return invoice_info, text
-            else:
-                return None, "无法识别发票内容"
-        else:
-            logger.error(f"不支持的文件类型: {file_ext}")
-            return None, "不支持的文件类型"
+        Returns:
+            tuple: (invoice_info, text)，识别失败时invoice_info为None、text为失败原因
+        """
+        from .ocr_engines import get_ocr_router
+        return get_ocr_router().recognize(file_path)
 
 
 class InvoiceValidator:
@@ -497,44 +464,92 @@ class InvoiceValidator:
         return bool(re.match(r'^[A-Z0-9]{15,18}$', tax_id))
     
     @staticmethod
-    def check_duplicate(invoice_number, seller_name=None, amount=None, invoice_date=None):
-        """检查是否有重复发票（综合多个字段判断）"""
-        from .models import Invoice
+    def check_duplicate(invoice_number, seller_name=None, amount=None, invoice_date=None, seller_tax_id=None):
+        """检查是否有重复发票（按发票指纹判断，见 find_duplicates）"""
+        return 0 in InvoiceValidator.find_duplicates([{
+            'invoice_number': invoice_number,
+            'seller_tax_id': seller_tax_id,
+            'seller_name': seller_name,
+            'total_amount': amount,
+            'invoice_date': invoice_date,
+        }])
+    
+    DUPLICATE_MESSAGE = '该发票已存在（发票号码、销售方、金额、日期匹配）'
+    DUPLICATE_NUMBER_MESSAGE = '发票号码已存在'
+    DUPLICATE_IN_BATCH_MESSAGE = '与本批中的其他发票重复'
+    
+    @staticmethod
+    def find_duplicates(candidates, match_numbers=False):
+        """批量检查重复发票，整批只执行一次查询
         
-        if not invoice_number:
-            return False
-            
-        # 首先检查发票号码是否重复
-        base_query = Invoice.objects.filter(invoice_number=invoice_number)
+        发票号码、价税合计、开票日期齐全时按发票指纹（号码+销售方+价税合计+日期）匹配已有发票：
+        提供了销售方税号时与已有发票的税号相同、或已有发票没有税号而名称相同均可匹配；
+        没有销售方税号时按名称匹配已有发票（name_fingerprint，无论已有发票是否有税号）。
+        信息不全时只按发票号码匹配。同一批中与前面的候选发票相同的也计为重复。
         
-        if not base_query.exists():
-            return False
-            
-        # 如果只提供发票号码，则认为重复
-        if not any([seller_name, amount, invoice_date]):
-            return True
-            
-        # 进一步检查其他字段，如果发票号码相同且其他关键信息也匹配，则认为是重复发票
-        duplicate_query = base_query
+        Args:
+            candidates: dict 列表，键为 invoice_number、seller_tax_id、seller_name、total_amount、invoice_date
+            match_numbers: 为True时发票号码已存在（发票号码唯一，无法保存）也计为重复
         
-        if seller_name:
-            duplicate_query = duplicate_query.filter(seller_name__icontains=seller_name.strip())
-            
-        if amount is not None:
-            # 允许金额有小幅差异（0.01元以内）
-            try:
-                amount_float = float(amount)
-                duplicate_query = duplicate_query.filter(
-                    total_amount__gte=amount_float - 0.01,
-                    total_amount__lte=amount_float + 0.01
-                )
-            except (ValueError, TypeError):
-                pass
-                
-        if invoice_date:
-            duplicate_query = duplicate_query.filter(invoice_date=invoice_date)
-            
-        return duplicate_query.exists()
+        Returns:
+            dict: {重复的候选发票在列表中的下标: 原因}
+        """
+        from django.db.models import Q
+        from .models import Invoice, Party
+        
+        # keys: 与已有发票匹配的 (列, 值)；batch_keys: 与本批中其他候选发票匹配的指纹
+        keys, batch_keys, numbers = [], [], []
+        for candidate in candidates:
+            invoice_number = (candidate.get('invoice_number') or '').strip()
+            numbers.append(invoice_number)
+            if not invoice_number:
+                keys.append(set())
+                batch_keys.append(set())
+                continue
+            values = [candidate.get(name) for name in ('seller_name', 'total_amount', 'invoice_date')]
+            name_fingerprint = Invoice.make_fingerprint(invoice_number, None, *values)
+            tax_fingerprint = ''
+            if Party.normalize_tax_id(candidate.get('seller_tax_id')):
+                tax_fingerprint = Invoice.make_fingerprint(invoice_number, candidate.get('seller_tax_id'), *values)
+            if not name_fingerprint:
+                keys.append({('number', invoice_number)})
+                batch_keys.append({('number', invoice_number)})
+            elif tax_fingerprint:
+                keys.append({('fingerprint', tax_fingerprint), ('fingerprint', name_fingerprint)})
+                batch_keys.append({('fingerprint', tax_fingerprint), ('fingerprint', name_fingerprint)})
+            else:
+                keys.append({('name_fingerprint', name_fingerprint)})
+                batch_keys.append({('fingerprint', name_fingerprint)})
+        
+        lookups = set().union(*keys)
+        if match_numbers:
+            lookups |= {('number', invoice_number) for invoice_number in numbers if invoice_number}
+        if not lookups:
+            return {}
+        existing = set()
+        rows = Invoice.objects.filter(
+            Q(fingerprint__in=[value for kind, value in lookups if kind == 'fingerprint']) |
+            Q(name_fingerprint__in=[value for kind, value in lookups if kind == 'name_fingerprint']) |
+            Q(invoice_number__in=[value for kind, value in lookups if kind == 'number'])
+        ).values_list('fingerprint', 'name_fingerprint', 'invoice_number')
+        for fingerprint, name_fingerprint, invoice_number in rows:
+            existing.update({
+                ('fingerprint', fingerprint), ('name_fingerprint', name_fingerprint), ('number', invoice_number)
+            })
+        
+        duplicates = {}
+        seen = set()
+        for position, (key, batch_key, invoice_number) in enumerate(zip(keys, batch_keys, numbers)):
+            if key & existing:
+                duplicates[position] = InvoiceValidator.DUPLICATE_MESSAGE
+            elif batch_key & seen:
+                duplicates[position] = InvoiceValidator.DUPLICATE_IN_BATCH_MESSAGE
+            elif match_numbers and invoice_number and ('number', invoice_number) in existing:
+                duplicates[position] = InvoiceValidator.DUPLICATE_NUMBER_MESSAGE
+            elif match_numbers and invoice_number and ('number', invoice_number) in seen:
+                duplicates[position] = InvoiceValidator.DUPLICATE_IN_BATCH_MESSAGE
+            seen |= batch_key | ({('number', invoice_number)} if match_numbers and invoice_number else set())
+        return duplicates
     
     @staticmethod
     def validate_company_info(buyer_name, buyer_tax_id, company):
@@ -3,19 +3,24 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
 from django.urls import reverse
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, F, Q, Prefetch
+from django.db.models.functions import TruncMonth
 from django.core.paginator import Paginator
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_protect
 from django.conf import settings
+from django.utils import timezone
 
-from .models import Company, InvoiceCategory, Invoice, InvoiceRecognition
-from .utils import InvoiceRecognizer, InvoiceValidator
+from .models import Company, InvoiceCategory, Invoice, InvoiceMonthlyRollup, InvoiceRecognition, Party
+from .utils import InvoiceValidator
+from .recognition_queue import RecognitionQueue
+from .search_index import InvoiceSearchIndex
+from .pagination import KeysetPage, KeysetPaginator
+from .ingestion import InvoiceIngestion
 from .forms import InvoiceForm
 
 import os
-import json
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import logging
 from urllib.parse import quote
 
@@ -24,10 +29,17 @@ logger = logging.getLogger(__name__)
 # 首页视图
 @login_required
 def index(request):
-    # 统计数据
-    invoice_count = Invoice.objects.count()
-    total_amount = Invoice.objects.aggregate(total=Sum('total_amount'))['total'] or 0
-    category_stats = InvoiceCategory.objects.annotate(invoice_count=Count('invoice'))
+    # 统计数据（读取月度汇总，不扫描发票表）
+    totals = InvoiceMonthlyRollup.objects.aggregate(count=Sum('invoice_count'), total=Sum('total_amount'))
+    invoice_count = totals['count'] or 0
+    total_amount = totals['total'] or 0
+    category_counts = dict(
+        InvoiceMonthlyRollup.objects.values('category_id').annotate(count=Sum('invoice_count'))
+        .order_by().values_list('category_id', 'count')
+    )
+    category_stats = list(InvoiceCategory.objects.all())
+    for category in category_stats:
+        category.invoice_count = category_counts.get(category.pk, 0)
     recent_invoices = Invoice.objects.order_by('-created_at')[:5]
     
     context = {
@@ -39,10 +51,32 @@ def index(request):
     }
     return render(request, 'invoice/index.html', context)
 
+def recognition_files_prefetch():
+    """预取发票关联的识别记录，只读取文件链接所需的列（不读取识别结果）"""
+    return Prefetch('recognitions', queryset=InvoiceRecognition.objects.only('id', 'invoice_id', 'file'))
+
+def filter_buyer_company(invoices, buyer_company):
+    """按购买方筛选发票：参数为交易方ID，兼容按购买方名称筛选的旧链接"""
+    if buyer_company.isdigit():
+        return invoices.filter(buyer_id=buyer_company)
+    return invoices.filter(buyer_name=buyer_company)
+
+def use_monthly_rollup(date_from, date_to, buyer_company):
+    """报表的筛选条件能否由月度汇总表统计：日期范围为整月，购买方按交易方ID筛选"""
+    if date_from and not (isinstance(date_from, date) and date_from.day == 1):
+        return False
+    if date_to and not (isinstance(date_to, date) and (date_to + timedelta(days=1)).day == 1):
+        return False
+    return not buyer_company or buyer_company.isdigit()
+
+def buyer_company_choices():
+    """购买方下拉列表（交易方表，不再对发票表去重）"""
+    return Party.objects.filter(is_buyer=True).only('id', 'name')
+
 # 发票列表视图
 @login_required
 def invoice_list(request):
-    invoices = Invoice.objects.select_related('category').prefetch_related('recognitions').all().order_by('-invoice_date')
+    invoices = Invoice.objects.select_related('category').prefetch_related(recognition_files_prefetch()).all().order_by('-invoice_date')
     
     # 筛选条件
     category_id = request.GET.get('category')
@@ -51,21 +85,25 @@ def invoice_list(request):
     
     buyer_company = request.GET.get('buyer_company')
     if buyer_company:
-        invoices = invoices.filter(buyer_name=buyer_company)
+        invoices = filter_buyer_company(invoices, buyer_company)
     
     status = request.GET.get('status')
     if status:
         invoices = invoices.filter(status=status)
     
-    # 关键词搜索
-    search = request.GET.get('search')
+    # 关键词搜索：使用全文索引时按相关度排序（与其余筛选条件在同一条SQL中执行）
+    search = request.GET.get('search', '').strip()
+    ranked = bool(search) and InvoiceSearchIndex.is_supported()
     if search:
-        invoices = invoices.filter(
-            Q(invoice_number__icontains=search) |
-            Q(invoice_content__icontains=search) |
-            Q(seller_name__icontains=search) |
-            Q(buyer_name__icontains=search)
-        )
+        if ranked:
+            invoices = InvoiceSearchIndex.filter(invoices, search)
+        else:
+            invoices = invoices.filter(
+                Q(invoice_number__icontains=search) |
+                Q(invoice_content__icontains=search) |
+                Q(seller_name__icontains=search) |
+                Q(buyer_name__icontains=search)
+            )
     
     # 按销售方搜索
     seller = request.GET.get('seller')
@@ -113,14 +151,20 @@ def invoice_list(request):
     except (ValueError, TypeError):
         page_size = 20
     
-    paginator = Paginator(invoices, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if getattr(settings, 'INVOICE_LIST_PAGINATION', 'keyset') == 'keyset' and not ranked:
+        # 按 (开票日期, ID) 游标分页；按相关度排序的搜索结果按页码分页
+        paginator = KeysetPaginator(invoices, page_size)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+        page_obj.count, page_obj.count_capped = paginator.approximate_count()
+    else:
+        paginator = Paginator(invoices, page_size)
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
     
     # 获取所有类别和购买方公司，用于筛选
     categories = InvoiceCategory.objects.all()
-    # 获取所有购买方公司（从发票中的buyer_name去重）
-    buyer_companies = Invoice.objects.values('buyer_name').distinct().exclude(buyer_name__isnull=True).exclude(buyer_name='').order_by('buyer_name')
+    # 获取所有购买方公司
+    buyer_companies = buyer_company_choices()
     
     context = {
         'page_obj': page_obj,
@@ -129,13 +173,14 @@ def invoice_list(request):
         'invoice_status_choices': Invoice.STATUS_CHOICES,
         'current_page_size': page_size,
         'page_size_choices': [20, 40, 80, 500],
+        'keyset_pagination': isinstance(page_obj, KeysetPage),
     }
     return render(request, 'invoice/invoice_list.html', context)
 
 # 发票详情视图
 @login_required
 def invoice_detail(request, pk):
-    invoice = get_object_or_404(Invoice.objects.prefetch_related('recognitions'), pk=pk)
+    invoice = get_object_or_404(Invoice.objects.prefetch_related(recognition_files_prefetch()), pk=pk)
     context = {'invoice': invoice}
     return render(request, 'invoice/invoice_detail.html', context)
 
@@ -211,8 +256,8 @@ def invoice_edit(request, pk):
     
     # GET请求，显示表单
     categories = InvoiceCategory.objects.all()
-    # 获取所有购买方公司（从发票中的buyer_name去重）
-    buyer_companies = Invoice.objects.values('buyer_name').distinct().exclude(buyer_name__isnull=True).exclude(buyer_name='').order_by('buyer_name')
+    # 获取所有购买方公司
+    buyer_companies = buyer_company_choices()
     context = {
         'invoice': invoice,
         'categories': categories,
@@ -290,91 +335,6 @@ def protected_media_view(request, file_path):
         raise Http404("文件访问失败")
 
 
-def auto_confirm_recognition(recognition, user):
-    """
-    自动确认识别结果，创建发票记录
-    """
-    try:
-        invoice_info = json.loads(recognition.result)
-    except json.JSONDecodeError:
-        logger.error(f"识别结果格式错误，无法自动确认: {recognition.pk}")
-        return None
-    
-    # 检查必要字段
-    required_fields = ['invoice_number', 'amount', 'invoice_date']
-    for field in required_fields:
-        if not invoice_info.get(field):
-            logger.warning(f"缺少必要字段 {field}，无法自动确认: {recognition.pk}")
-            return None
-    
-    # 检查是否有重复发票（综合多个字段判断）
-    original_invoice_number = invoice_info.get('invoice_number')
-    seller_name = invoice_info.get('seller_name')
-    amount = invoice_info.get('total_amount') or invoice_info.get('amount')
-    invoice_date_str = invoice_info.get('invoice_date')
-    
-    # 解析日期用于重复检查
-    invoice_date_for_check = None
-    if invoice_date_str:
-        try:
-            if isinstance(invoice_date_str, str):
-                date_formats = ['%Y-%m-%d', '%Y/%m/%d', '%Y年%m月%d日']
-                for fmt in date_formats:
-                    try:
-                        invoice_date_for_check = datetime.strptime(invoice_date_str, fmt).date()
-                        break
-                    except ValueError:
-                        continue
-            else:
-                invoice_date_for_check = invoice_date_str
-        except Exception:
-            pass
-    
-    # 检查重复发票
-    if InvoiceValidator.check_duplicate(original_invoice_number, seller_name, amount, invoice_date_for_check):
-        logger.warning(f"发票重复，拒绝自动确认: {original_invoice_number} (销售方: {seller_name}, 金额: {amount})")
-        return None
-    
-    try:
-        # 使用之前解析的日期或重新解析
-        invoice_date = invoice_date_for_check
-        if not invoice_date and invoice_date_str:
-            logger.warning(f"无法解析日期格式，无法自动确认: {invoice_date_str}")
-            return None
-        
-        # 创建发票对象
-        invoice = Invoice(
-            invoice_number=invoice_info.get('invoice_number'),
-            invoice_content=invoice_info.get('invoice_content', ''),
-            invoice_date=invoice_date,
-            invoice_type=invoice_info.get('invoice_type', 'ELECTRONIC'),
-            amount=float(invoice_info.get('amount', 0)),
-            tax_amount=float(invoice_info.get('tax_amount', 0)),
-            total_amount=float(invoice_info.get('total_amount', 0)),
-            seller_name=invoice_info.get('seller_name', ''),
-            seller_tax_id=invoice_info.get('seller_tax_id', ''),
-            buyer_name=invoice_info.get('buyer_name', ''),
-            buyer_tax_id=invoice_info.get('buyer_tax_id', ''),
-            description=invoice_info.get('description', ''),
-            created_by=user
-        )
-        
-        # 使用识别记录中的文件
-        invoice.file = recognition.file
-        
-        invoice.save()
-        
-        # 更新识别记录关联的发票
-        recognition.invoice = invoice
-        recognition.save()
-        
-        logger.info(f"自动确认发票成功: {invoice.invoice_number}")
-        return invoice
-        
-    except Exception as e:
-        logger.error(f"自动确认发票失败: {str(e)}")
-        return None
-
 # 下载发票文件视图
 @login_required
 def download_invoice_file(request, pk):
@@ -460,7 +420,7 @@ def batch_download_invoice_files(request):
     if invoice_ids and not recognition_ids:
         try:
             # 通过发票ID获取对应的识别记录ID
-            invoices = Invoice.objects.filter(id__in=invoice_ids).prefetch_related('recognitions')
+            invoices = Invoice.objects.filter(id__in=invoice_ids).prefetch_related(recognition_files_prefetch())
             recognition_ids = []
             for invoice in invoices:
                 # 获取每个发票的识别记录
@@ -560,67 +520,59 @@ def manual_input(request, recognition_ids):
     
     if request.method == 'POST':
         # 处理表单提交
-        saved_count = 0
         errors = []
+        rows = []
         
         for recognition in recognitions:
-            try:
-                # 获取表单数据
-                prefix = f'recognition_{recognition.pk}'
-                
-                # 检查是否选中了这个识别记录
-                if not request.POST.get(f'{prefix}_selected'):
-                    continue
-                
-                # 创建发票对象
-                invoice = Invoice(
-                    invoice_number=request.POST.get(f'{prefix}_invoice_number', '').strip(),
-                    invoice_date=request.POST.get(f'{prefix}_invoice_date') or None,
-                    total_amount=request.POST.get(f'{prefix}_total_amount') or 0,
-                    tax_amount=request.POST.get(f'{prefix}_tax_amount') or 0,
-                    amount=request.POST.get(f'{prefix}_amount_without_tax') or 0,
-                    seller_name=request.POST.get(f'{prefix}_seller_name', '').strip(),
-                    seller_tax_id=request.POST.get(f'{prefix}_seller_tax_number', '').strip(),
-                    buyer_name=request.POST.get(f'{prefix}_buyer_name', '').strip(),
-                    buyer_tax_id=request.POST.get(f'{prefix}_buyer_tax_number', '').strip(),
-                    description=request.POST.get(f'{prefix}_description', '').strip(),
-                    invoice_type='OTHER',  # 默认类型
-                    created_by=request.user
-                )
-                
-                # 设置分类
-                category_id = request.POST.get(f'{prefix}_category')
-                if category_id:
-                    try:
-                        invoice.category = InvoiceCategory.objects.get(pk=category_id)
-                    except InvoiceCategory.DoesNotExist:
-                        pass
-                
-                # 验证必填字段
-                if not invoice.invoice_number:
-                    errors.append(f'文件 {recognition.file.name}: 发票号码不能为空')
-                    continue
-                
-                if not invoice.seller_name:
-                    errors.append(f'文件 {recognition.file.name}: 销售方名称不能为空')
-                    continue
-                
-                if not invoice.buyer_name:
-                    errors.append(f'文件 {recognition.file.name}: 购买方名称不能为空')
-                    continue
-                
-                # 保存发票
-                invoice.save()
-                
-                # 更新识别记录状态
-                recognition.status = 'MANUAL_COMPLETED'
-                recognition.save()
-                
-                saved_count += 1
-                
-            except Exception as e:
-                logger.error(f"手动保存发票失败 {recognition.file.name}: {str(e)}")
-                errors.append(f'文件 {recognition.file.name}: {str(e)}')
+            # 获取表单数据
+            prefix = f'recognition_{recognition.pk}'
+            
+            # 检查是否选中了这个识别记录
+            if not request.POST.get(f'{prefix}_selected'):
+                continue
+            
+            # 创建发票对象（字段由 InvoiceIngestion 校验和转换）
+            invoice = Invoice(
+                invoice_number=request.POST.get(f'{prefix}_invoice_number', '').strip(),
+                invoice_date=request.POST.get(f'{prefix}_invoice_date') or None,
+                total_amount=request.POST.get(f'{prefix}_total_amount') or 0,
+                tax_amount=request.POST.get(f'{prefix}_tax_amount') or 0,
+                amount=request.POST.get(f'{prefix}_amount_without_tax') or 0,
+                seller_name=request.POST.get(f'{prefix}_seller_name', '').strip(),
+                seller_tax_id=request.POST.get(f'{prefix}_seller_tax_number', '').strip(),
+                buyer_name=request.POST.get(f'{prefix}_buyer_name', '').strip(),
+                buyer_tax_id=request.POST.get(f'{prefix}_buyer_tax_number', '').strip(),
+                description=request.POST.get(f'{prefix}_description', '').strip(),
+                invoice_type='OTHER',  # 默认类型
+                category_id=request.POST.get(f'{prefix}_category') or None,
+                created_by=request.user
+            )
+            
+            # 验证必填字段
+            if not invoice.invoice_number:
+                errors.append(f'文件 {recognition.file.name}: 发票号码不能为空')
+                continue
+            
+            if not invoice.seller_name:
+                errors.append(f'文件 {recognition.file.name}: 销售方名称不能为空')
+                continue
+            
+            if not invoice.buyer_name:
+                errors.append(f'文件 {recognition.file.name}: 购买方名称不能为空')
+                continue
+            
+            # 保存后识别记录标记为手动完成
+            rows.append({
+                'invoice': invoice,
+                'recognition': recognition,
+                'recognition_status': 'MANUAL_COMPLETED',
+                'label': recognition.file.name,
+            })
+        
+        # 整批校验、去重，并在一个事务中保存发票和识别记录
+        ingestion = InvoiceIngestion.ingest(rows)
+        saved_count = len(ingestion.created)
+        errors.extend(f"文件 {error['label']}: {error['error']}" for error in ingestion.errors)
         
         # 显示结果消息
         if saved_count > 0:
@@ -644,18 +596,9 @@ def manual_input(request, recognition_ids):
             'filename': os.path.basename(recognition.file.name) if recognition.file else '未知文件',
             'status_display': recognition.get_status_display(),
             'error_message': recognition.result if recognition.status == 'FAILED' else None,
+            'parsed_result': recognition.result_data if recognition.status == 'COMPLETED' else None,
         }
         
-        # 如果有识别结果，尝试解析
-        if recognition.status == 'COMPLETED' and recognition.result:
-            try:
-                parsed_result = json.loads(recognition.result)
-                data['parsed_result'] = parsed_result
-            except (json.JSONDecodeError, TypeError):
-                data['parsed_result'] = None
-        else:
-            data['parsed_result'] = None
-        
         recognition_data.append(data)
     
     context = {
@@ -682,143 +625,28 @@ def invoice_recognize(request):
             return redirect('invoice:invoice_recognize')
         
         uploaded_files = request.FILES.getlist('files')
-        use_baidu_ocr = request.POST.get('use_baidu_ocr') == 'on'
-        # 当使用百度OCR时，自动启用强制OCR处理PDF
-
         
         if not uploaded_files:
             messages.error(request, '请选择要上传的文件')
             return redirect('invoice:invoice_recognize')
         
-        recognition_ids = []
-        successful_recognitions = []
-        failed_recognitions = []
-        auto_confirmed_count = 0
+        queued_count = 0
+        failed_uploads = []
         
-        # 批量处理上传的文件
+        # 只保存文件并加入识别队列，识别由后台进程（run_recognition_worker）完成
         for uploaded_file in uploaded_files:
             try:
-                # 创建识别记录
-                recognition = InvoiceRecognition(
-                    file=uploaded_file,
-                    status='PROCESSING',
-                    created_by=request.user
-                )
-                recognition.save()
-                recognition_ids.append(recognition.pk)
-                
-                # 保存文件到临时目录
-                file_path = os.path.join(settings.MEDIA_ROOT, recognition.file.name)
-                
-                # 识别发票
-                invoice_info, text = InvoiceRecognizer.recognize_invoice(file_path, use_baidu_ocr)
-                
-                if invoice_info:
-                    recognition.result = json.dumps(invoice_info, default=str)
-                    recognition.status = 'COMPLETED'
-                    recognition.save()
-                    
-                    # 检查识别结果是否完整，如果完整则自动确认
-                    required_fields = ['invoice_number', 'amount', 'invoice_date']
-                    is_complete = all(invoice_info.get(field) for field in required_fields)
-                    
-                    if is_complete:
-                        # 信息完整，自动确认保存
-                        try:
-                            auto_confirmed_invoice = auto_confirm_recognition(recognition, request.user)
-                            if auto_confirmed_invoice:
-                                # 自动确认成功，增加计数器
-                                auto_confirmed_count += 1
-                                continue
-                        except Exception as e:
-                            logger.error(f"自动确认发票失败 {uploaded_file.name}: {str(e)}")
-                    
-                    # 信息不完整或自动确认失败，加入成功列表等待用户确认
-                    successful_recognitions.append(recognition)
-                else:
-                    recognition.result = text or '识别失败'
-                    recognition.status = 'FAILED'
-                    recognition.save()
-                    failed_recognitions.append({
-                        'filename': uploaded_file.name,
-                        'error': '无法识别发票信息'
-                    })
-                    
+                RecognitionQueue.enqueue(uploaded_file, request.user)
+                queued_count += 1
             except Exception as e:
-                logger.error(f"发票识别失败 {uploaded_file.name}: {str(e)}")
-                if 'recognition' in locals():
-                    recognition.result = str(e)
-                    recognition.status = 'FAILED'
-                    recognition.save()
-                failed_recognitions.append({
-                    'filename': uploaded_file.name,
-                    'error': str(e)
-                })
-        
-        # 处理结果
-        total_processed = auto_confirmed_count + len(successful_recognitions)
+                logger.error(f"保存上传文件失败 {uploaded_file.name}: {str(e)}")
+                failed_uploads.append(uploaded_file.name)
         
-        # 显示处理结果消息
-        if auto_confirmed_count > 0:
-            messages.success(request, f'成功自动保存了 {auto_confirmed_count} 张发票（信息完整）')
+        if queued_count > 0:
+            messages.success(request, f'已提交 {queued_count} 个文件，正在后台识别，识别完整的发票将自动保存')
         
-        if successful_recognitions:
-            # 有成功识别的发票，显示识别结果让用户确认
-            messages.info(request, f'有 {len(successful_recognitions)} 张发票需要确认（信息不完整），请检查并确认识别结果')
-            
-            # 准备识别结果数据
-            recognized_invoices = []
-            for recognition in successful_recognitions:
-                try:
-                    invoice_info = json.loads(recognition.result)
-                    recognized_invoices.append({
-                        'recognition_id': recognition.pk,
-                        'invoice_number': invoice_info.get('invoice_number', ''),
-                        'amount': invoice_info.get('amount', 0),
-                        'invoice_date': invoice_info.get('invoice_date', ''),
-                        'seller_name': invoice_info.get('seller_name', ''),
-                        'buyer_name': invoice_info.get('buyer_name', ''),
-                        'confidence': invoice_info.get('confidence', 95),
-                        'filename': os.path.basename(recognition.file.name) if recognition.file else '未知文件'
-                    })
-                except json.JSONDecodeError:
-                    continue
-            
-            # 检查百度OCR配置状态
-            from .baidu_ocr_config import BaiduOCRConfig
-            
-            # 获取当前用户的待确认识别记录
-            pending_recognitions = InvoiceRecognition.objects.filter(
-                status='COMPLETED',
-                invoice__isnull=True,  # 未关联发票的记录
-                created_by=request.user
-            ).order_by('-created_at')
-            
-            context = {
-                'baidu_ocr_configured': BaiduOCRConfig.is_configured(),
-                'pending_recognitions': pending_recognitions,
-                'recognized_invoices': recognized_invoices,
-                'recognition_ids': ','.join(map(str, [r.pk for r in successful_recognitions]))
-            }
-            
-            if failed_recognitions:
-                messages.warning(request, f'有 {len(failed_recognitions)} 张发票识别失败')
-            
-            return render(request, 'invoice/invoice_recognize.html', context)
-        
-        elif auto_confirmed_count > 0 and not failed_recognitions:
-            # 只有自动确认成功的发票，直接跳转回识别页面
-            return redirect('invoice:invoice_recognize')
-        
-        elif failed_recognitions:
-            # 全部失败的情况，进入手动填写页面
-            failed_recognition_ids = []
-            for recognition in InvoiceRecognition.objects.filter(status='FAILED', created_by=request.user).order_by('-created_at'):
-                if recognition.pk in recognition_ids:
-                    failed_recognition_ids.append(recognition.pk)
-            if failed_recognition_ids:
-                recognition_ids_str = ','.join(map(str, failed_recognition_ids))
-                return redirect('invoice:manual_input', recognition_ids=recognition_ids_str)
+        if failed_uploads:
+            messages.error(request, f'以下文件保存失败: {", ".join(failed_uploads)}')
         
         return redirect('invoice:invoice_recognize')
     
@@ -830,14 +658,87 @@ def invoice_recognize(request):
         status='COMPLETED',
         invoice__isnull=True,  # 未关联发票的记录
         created_by=request.user
-    ).order_by('-created_at')
+    ).defer('result', 'result_data').order_by('-created_at')
+    
+    # 排队中和识别中的记录
+    queued_recognitions = InvoiceRecognition.objects.filter(
+        status__in=['PENDING', 'PROCESSING'],
+        created_by=request.user
+    ).defer('result', 'result_data').order_by('created_at')
+    
+    # 最近一天内识别失败的记录，可进入手动填写页面
+    failed_recognitions = InvoiceRecognition.objects.filter(
+        status='FAILED',
+        created_by=request.user,
+        created_at__gte=timezone.now() - timedelta(days=1)
+    ).defer('result', 'result_data').order_by('-created_at')
     
     context = {
         'baidu_ocr_configured': BaiduOCRConfig.is_configured(),
-        'pending_recognitions': pending_recognitions
+        'pending_recognitions': pending_recognitions,
+        # 缺少发票号码、金额或开票日期的待确认记录，需要人工补全
+        'pending_incomplete_count': pending_recognitions.filter(is_complete=False).count(),
+        'pending_recognition_ids': ','.join(str(r.pk) for r in pending_recognitions),
+        'queued_recognitions': queued_recognitions,
+        'failed_recognitions': failed_recognitions,
+        'failed_recognition_ids': ','.join(str(r.pk) for r in failed_recognitions),
     }
     return render(request, 'invoice/invoice_recognize.html', context)
 
+# 识别队列状态视图（供识别页面轮询）
+@login_required
+def recognition_status(request):
+    counts = {
+        row['status']: row['count']
+        for row in InvoiceRecognition.objects.filter(
+            status__in=['PENDING', 'PROCESSING'],
+            created_by=request.user
+        ).order_by().values('status').annotate(count=Count('id'))
+    }
+    return JsonResponse({
+        'pending': counts.get('PENDING', 0),
+        'processing': counts.get('PROCESSING', 0),
+    })
+
+# 识别记录原始文本视图
+@login_required
+@csrf_protect
+def recognition_raw_text(request, pk):
+    """查看识别记录的原始文本
+    
+    GET 只返回已保存的原始文本（图片默认由增值税发票识别结果生成）。上传人可以 POST 请求
+    由后台识别进程调用通用文字识别重新生成（PDF读取该页的文本层），完成前显示识别中；
+    format=json 时返回 {'pending': 是否识别中, 'raw_text': 原始文本}，供页面轮询。
+    """
+    recognition = get_object_or_404(
+        InvoiceRecognition.objects.only('id', 'file', 'page_number', 'raw_text_due_at', 'created_by'), pk=pk
+    )
+    is_owner = recognition.created_by_id == request.user.id
+    
+    if request.method == 'POST':
+        if not is_owner:
+            messages.error(request, '只能重新识别自己上传的文件')
+        elif not recognition.file:
+            messages.error(request, '识别记录没有文件')
+        elif RecognitionQueue.request_raw_text(recognition, request.user):
+            messages.success(request, '已提交重新识别，完成后本页自动刷新')
+        else:
+            messages.error(request, f'排队中的重新识别请求已达 {RecognitionQueue.RAW_TEXT_MAX_PENDING} 个，请稍后再试')
+        return redirect('invoice:recognition_raw_text', pk=recognition.pk)
+    
+    raw_text = recognition.get_raw_text()
+    pending = recognition.raw_text_due_at is not None
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'pending': pending, 'raw_text': raw_text})
+    
+    context = {
+        'recognition': recognition,
+        'raw_text': raw_text,
+        'pending': pending,
+        'can_refresh': is_owner and bool(recognition.file),
+    }
+    return render(request, 'invoice/recognition_raw_text.html', context)
+
 # 发票识别确认视图
 @login_required
 def invoice_confirm(request, pk):
@@ -847,9 +748,8 @@ def invoice_confirm(request, pk):
         messages.error(request, '发票识别未完成或失败')
         return redirect('invoice:invoice_recognize')
     
-    try:
-        invoice_info = json.loads(recognition.result)
-    except json.JSONDecodeError:
+    invoice_info = recognition.result_data
+    if not invoice_info:
         messages.error(request, '识别结果格式错误')
         return redirect('invoice:invoice_recognize')
     
@@ -868,7 +768,8 @@ def invoice_confirm(request, pk):
         except ValueError:
             invoice_date = None
             
-        if InvoiceValidator.check_duplicate(invoice_number, seller_name, total_amount, invoice_date):
+        if InvoiceValidator.check_duplicate(invoice_number, seller_name, total_amount, invoice_date,
+                                            seller_tax_id=request.POST.get('seller_tax_id')):
             messages.error(request, '该发票已存在（发票号码、销售方、金额、日期匹配）')
             return redirect('invoice:invoice_confirm', pk=recognition.pk)
         
@@ -949,78 +850,46 @@ def batch_confirm(request, recognition_ids):
     
     if request.method == 'POST':
         selected_recognition_ids = request.POST.getlist('recognition_ids')
-        successful_saves = []
+        recognition_map = recognitions.in_bulk([int(pk) for pk in selected_recognition_ids if pk.isdigit()])
         failed_saves = []
+        rows = []
         
         for recognition_id in selected_recognition_ids:
-            try:
-                recognition = recognitions.get(pk=recognition_id)
-                invoice_info = json.loads(recognition.result)
-                
-                # 获取表单数据（使用recognition_id作为前缀）
-                prefix = f'recognition_{recognition_id}_'
-                invoice_number = request.POST.get(f'{prefix}invoice_number')
-                
-                # 获取其他字段用于重复检查
-                seller_name = request.POST.get(f'{prefix}seller_name')
-                total_amount = request.POST.get(f'{prefix}total_amount')
-                invoice_date_str = request.POST.get(f'{prefix}invoice_date')
-                
-                try:
-                    invoice_date = datetime.strptime(invoice_date_str, '%Y-%m-%d').date() if invoice_date_str else None
-                except ValueError:
-                    invoice_date = None
-                
-                # 检查是否有重复发票（综合多个字段判断）
-                if InvoiceValidator.check_duplicate(invoice_number, seller_name, total_amount, invoice_date):
-                    failed_saves.append({
-                        'filename': recognition.file.name,
-                        'error': '该发票已存在（发票号码、销售方、金额、日期匹配）'
-                    })
-                    continue
-                
-                # 创建发票对象
-                invoice = Invoice(
-                    invoice_number=invoice_number,
-                    invoice_content=request.POST.get(f'{prefix}invoice_content'),
-                    invoice_date=datetime.strptime(request.POST.get(f'{prefix}invoice_date'), '%Y-%m-%d').date(),
-                    invoice_type=request.POST.get(f'{prefix}invoice_type'),
-                    amount=float(request.POST.get(f'{prefix}amount')),
-                    tax_amount=float(request.POST.get(f'{prefix}tax_amount') or 0),
-                    total_amount=float(request.POST.get(f'{prefix}total_amount') or 0),
-                    seller_name=request.POST.get(f'{prefix}seller_name'),
-                    seller_tax_id=request.POST.get(f'{prefix}seller_tax_id'),
-                    buyer_name=request.POST.get(f'{prefix}buyer_name'),
-                    buyer_tax_id=request.POST.get(f'{prefix}buyer_tax_id'),
-                    description=request.POST.get(f'{prefix}description'),
-                    created_by=request.user
-                )
-                
-                category_id = request.POST.get(f'{prefix}category')
-                if category_id:
-                    invoice.category_id = category_id
-                
-                company_id = request.POST.get(f'{prefix}company')
-                if company_id:
-                    invoice.company_id = company_id
-                
-                # 使用识别记录中的文件
-                invoice.file = recognition.file
-                
-                invoice.save()
-                
-                # 更新识别记录关联的发票
-                recognition.invoice = invoice
-                recognition.save()
-                
-                successful_saves.append(invoice)
-                
-            except Exception as e:
-                logger.error(f"批量确认发票失败 {recognition_id}: {str(e)}")
-                failed_saves.append({
-                    'filename': recognition.file.name if 'recognition' in locals() else f'ID:{recognition_id}',
-                    'error': str(e)
-                })
+            recognition = recognition_map.get(int(recognition_id)) if recognition_id.isdigit() else None
+            if recognition is None:
+                failed_saves.append({'filename': f'ID:{recognition_id}', 'error': '未找到识别记录'})
+                continue
+            
+            # 获取表单数据（使用recognition_id作为前缀）
+            prefix = f'recognition_{recognition_id}_'
+            
+            # 创建发票对象（字段由 InvoiceIngestion 校验和转换）
+            invoice = Invoice(
+                invoice_number=request.POST.get(f'{prefix}invoice_number'),
+                invoice_content=request.POST.get(f'{prefix}invoice_content'),
+                invoice_date=request.POST.get(f'{prefix}invoice_date'),
+                invoice_type=request.POST.get(f'{prefix}invoice_type'),
+                amount=request.POST.get(f'{prefix}amount'),
+                tax_amount=request.POST.get(f'{prefix}tax_amount') or 0,
+                total_amount=request.POST.get(f'{prefix}total_amount') or 0,
+                seller_name=request.POST.get(f'{prefix}seller_name'),
+                seller_tax_id=request.POST.get(f'{prefix}seller_tax_id'),
+                buyer_name=request.POST.get(f'{prefix}buyer_name'),
+                buyer_tax_id=request.POST.get(f'{prefix}buyer_tax_id'),
+                description=request.POST.get(f'{prefix}description'),
+                category_id=request.POST.get(f'{prefix}category') or None,
+                company_id=request.POST.get(f'{prefix}company') or None,
+                created_by=request.user
+            )
+            
+            # 使用识别记录中的文件
+            invoice.file = recognition.file
+            rows.append({'invoice': invoice, 'recognition': recognition, 'label': recognition.file.name})
+        
+        # 整批校验、去重，并在一个事务中保存发票和识别记录
+        ingestion = InvoiceIngestion.ingest(rows)
+        successful_saves = ingestion.created
+        failed_saves.extend({'filename': error['label'], 'error': error['error']} for error in ingestion.errors)
         
         # 处理结果
         if successful_saves:
@@ -1038,16 +907,10 @@ def batch_confirm(request, recognition_ids):
             return redirect('invoice:invoice_recognize')
     
     # GET请求，显示批量确认表单
-    recognition_data = []
-    for recognition in recognitions:
-        try:
-            invoice_info = json.loads(recognition.result)
-            recognition_data.append({
-                'recognition': recognition,
-                'invoice_info': invoice_info
-            })
-        except json.JSONDecodeError:
-            continue
+    recognition_data = [
+        {'recognition': recognition, 'invoice_info': recognition.result_data}
+        for recognition in recognitions.filter(result_data__isnull=False)
+    ]
     
     categories = InvoiceCategory.objects.all()
     companies = Company.objects.all()
@@ -1174,58 +1037,70 @@ def report_summary(request):
     
     buyer_company = request.GET.get('buyer_company')
     if buyer_company:
-        invoices = invoices.filter(buyer_name=buyer_company)
+        invoices = filter_buyer_company(invoices, buyer_company)
+    
+    # 日期范围为整月且按交易方ID筛选（或不筛选购买方）时读取月度汇总，否则按发票表统计
+    if use_monthly_rollup(date_from, date_to, buyer_company):
+        rows = InvoiceMonthlyRollup.objects.annotate(report_month=F('month'))
+        if isinstance(date_from, date):
+            rows = rows.filter(month__gte=date_from)
+        if isinstance(date_to, date):
+            rows = rows.filter(month__lte=date_to)
+        if category_id:
+            rows = rows.filter(category_id=category_id)
+        if buyer_company:
+            rows = rows.filter(buyer_id=buyer_company)
+        count = Sum('invoice_count')
+    else:
+        rows = invoices.annotate(report_month=TruncMonth('invoice_date'))
+        count = Count('id')
     
     # 统计数据
-    total_count = invoices.count()
-    total_amount = invoices.aggregate(total=Sum('total_amount'))['total'] or 0
+    totals = rows.aggregate(count=count, total=Sum('total_amount'))
+    total_count = totals['count'] or 0
+    total_amount = totals['total'] or 0
     
     # 按类别统计
-    from django.db.models import Q
-    invoice_ids = list(invoices.values_list('id', flat=True))
-    
-    category_stats = InvoiceCategory.objects.annotate(
-        invoice_count=Count('invoice', filter=Q(invoice__id__in=invoice_ids)),
-        total_amount=Sum('invoice__total_amount', filter=Q(invoice__id__in=invoice_ids))
-    )
+    category_stats = list(rows.values('category_id', 'category__name')
+                              .annotate(count=count, total_amount=Sum('total_amount'))
+                              .order_by('-total_amount'))
+    for stat in category_stats:
+        stat['category__name'] = stat['category__name'] or '未分类'
+        stat['percentage'] = stat['total_amount'] / total_amount * 100 if total_amount else 0
     
     # 按购买方公司统计
-    buyer_company_stats = invoices.values('buyer_name')\
-                                 .annotate(
-                                     invoice_count=Count('id'),
-                                     total_amount=Sum('total_amount')
-                                 )\
-                                 .filter(buyer_name__isnull=False, buyer_name__gt='')\
-                                 .order_by('-total_amount')
+    buyer_company_stats = rows.values('buyer_id', 'buyer__name')\
+                              .annotate(
+                                  invoice_count=count,
+                                  total_amount=Sum('total_amount')
+                              )\
+                              .filter(buyer__isnull=False)\
+                              .order_by('-total_amount')
     
     # 按销售方统计
-    seller_stats = invoices.values('seller_name')\
-                          .annotate(
-                              invoice_count=Count('id'),
-                              total_amount=Sum('total_amount')
-                          )\
-                          .filter(seller_name__isnull=False, seller_name__gt='')\
-                          .order_by('-total_amount')
+    seller_stats = rows.values('seller_id', 'seller__name')\
+                       .annotate(
+                           invoice_count=count,
+                           total_amount=Sum('total_amount')
+                       )\
+                       .filter(seller__isnull=False)\
+                       .order_by('-total_amount')
     
     # 按购买方统计
-    buyer_stats = invoices.values('buyer_name')\
-                         .annotate(
-                             invoice_count=Count('id'),
-                             total_amount=Sum('total_amount')
-                         )\
-                         .filter(buyer_name__isnull=False, buyer_name__gt='')\
-                         .order_by('-total_amount')
+    buyer_stats = buyer_company_stats
     
     # 按月份统计
-    month_stats = invoices.extra(select={'month': "strftime('%%Y-%%m', invoice_date)"})\
-                         .values('month')\
-                         .annotate(count=Count('id'), total=Sum('total_amount'))\
-                         .order_by('month')
+    month_stats = [
+        {'month': stat['report_month'].strftime('%Y-%m'), 'count': stat['count'], 'total': stat['total']}
+        for stat in rows.values('report_month')
+                        .annotate(count=count, total=Sum('total_amount'))
+                        .order_by('report_month')
+    ]
     
     # 获取所有类别和购买方公司，用于筛选
     categories = InvoiceCategory.objects.all()
-    # 获取所有购买方公司（从发票中的buyer_name去重）
-    buyer_companies = Invoice.objects.values('buyer_name').distinct().exclude(buyer_name__isnull=True).exclude(buyer_name='').order_by('buyer_name')
+    # 获取所有购买方公司
+    buyer_companies = buyer_company_choices()
     
     context = {
         'total_count': total_count,
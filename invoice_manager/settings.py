@@ -200,8 +200,10 @@ LOGGING = {
 BAIDU_OCR_APP_ID = os.getenv('BAIDU_OCR_APP_ID', '')
 BAIDU_OCR_API_KEY = os.getenv('BAIDU_OCR_API_KEY', '')
 BAIDU_OCR_SECRET_KEY = os.getenv('BAIDU_OCR_SECRET_KEY', '')
+# 百度OCR接口地址，留空使用官方地址；压测时可指向本地模拟服务（python manage.py fake_baidu_ocr）
+BAIDU_OCR_BASE_URL = os.getenv('BAIDU_OCR_BASE_URL', '')
 
-# 缓存配置（用于存储百度OCR的access_token）
+# 缓存配置（百度OCR的access_token保存在 BAIDU_OCR_STATE_DB 中，由所有进程共享）
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -218,3 +220,73 @@ CACHES = {
 # 密码: admin123
 # 邮箱: admin@example.com
 # 使用命令创建: python manage.py create_default_superuser
+
+# 后台识别队列配置（python manage.py run_recognition_worker）
+RECOGNITION_WORKER_CONCURRENCY = 4  # 每个识别进程同时进行的识别任务数
+RECOGNITION_LEASE_SECONDS = 300  # 任务租约时长（秒），进程崩溃后任务在租约过期后被重新领取
+RECOGNITION_MAX_ATTEMPTS = 3  # 单个任务的最大尝试次数
+RECOGNITION_RAW_TEXT_MAX_PENDING = 5  # 每个用户同时排队的原始文本重新识别请求数
+
+# OCR识别结果缓存配置（按文件内容SHA-256缓存百度增值税发票识别结果）
+OCR_CACHE_ENABLED = True
+OCR_CACHE_MAX_ENTRIES = 10000  # 最多保留的缓存条数，超出时淘汰最久未使用的记录
+OCR_CACHE_MAX_AGE_DAYS = 90  # 缓存最长保留天数
+OCR_CACHE_STATS_FLUSH_SECONDS = 60  # 缓存命中计数在进程内累加，每隔多少秒写入数据库
+
+# 图片发票原始文本来源：'vat' 由增值税发票识别结果生成（每张图片只调用一次百度OCR）；
+# 'general' 额外调用通用文字识别接口获取原始文本
+OCR_RAW_TEXT_SOURCE = 'vat'
+
+# 百度OCR请求配置
+BAIDU_OCR_POOL_MAXSIZE = 10  # 每个进程与百度服务器保持的最大keep-alive连接数，应不小于识别并发数
+BAIDU_OCR_MAX_RETRIES = 3  # 超时、5xx和QPS超限等可重试错误的最大重试次数
+BAIDU_OCR_BATCH_MAX_WORKERS = 4  # 批量识别接口同时进行的最大请求数
+
+# 百度OCR跨进程限流配置（本机所有gunicorn进程和识别进程共享同一个令牌桶）
+BAIDU_OCR_QPS_LIMIT = 2  # 每秒允许的请求数，需与百度控制台中的QPS配额一致，0表示不限流
+BAIDU_OCR_RATE_LIMIT_WAIT_TIMEOUT = 30  # 令牌不足时最长等待时间（秒）
+BAIDU_OCR_STATE_DB = BASE_DIR / 'baidu_ocr_state.sqlite3'  # 限流令牌桶、访问令牌等跨进程共享状态的存储文件
+
+# OCR上传前的图片优化配置（EXIF旋转、缩放、灰度化、重新压缩，均在内存中完成）
+OCR_IMAGE_OPTIMIZE = True
+OCR_IMAGE_MAX_LONG_EDGE = 2400  # 缩放后的最长边（像素）
+OCR_IMAGE_MAX_BYTES = 2 * 1024 * 1024  # 重新编码后的字节数上限，base64编码后需小于百度接口的4MB限制
+
+# 数字化电子发票PDF优先从文本层本地解析，关键字段齐全且金额+税额=价税合计时不再调用百度OCR
+OCR_PDF_LOCAL_FIRST = True
+
+# 发票二维码本地解码配置（需安装 opencv-python-headless，解出的发票号码、日期和金额优先于百度OCR的结果）
+OCR_QR_DECODE = True
+OCR_QR_PDF_RESOLUTION = 150  # PDF首页渲染分辨率（DPI）
+OCR_QR_FILL_FROM_OCR = True  # 二维码和PDF文本层缺少销售方、税额或价税合计时调用百度OCR补全，False 时仅由二维码识别的发票需人工确认
+
+# 多页PDF逐页识别配置（多张发票合并成的PDF，每页生成一条识别记录）
+BAIDU_OCR_PDF_MAX_PAGES = 20  # 单个PDF最多识别的页数
+BAIDU_OCR_PDF_TIME_BUDGET = 120  # 单个PDF所有页面调用百度OCR的总时长上限（秒）
+
+# 百度OCR熔断配置（所有进程共享熔断状态，可用 python manage.py ocr_circuit_breaker 查看）
+BAIDU_OCR_CIRCUIT_FAILURE_THRESHOLD = 5  # 连续失败（超时、5xx、服务端错误、慢请求）多少次后熔断，0表示不启用
+BAIDU_OCR_CIRCUIT_SLOW_CALL_SECONDS = 10  # 单次请求耗时超过该值（秒）时计为失败
+BAIDU_OCR_CIRCUIT_RESET_TIMEOUT = 60  # 熔断后多少秒放行一个探测请求，探测成功即恢复
+
+# 本地Tesseract识别配置（百度OCR熔断期间使用，需安装 tesseract-ocr 及 chi_sim 语言包）
+OCR_TESSERACT_FALLBACK = True
+OCR_TESSERACT_LANG = 'chi_sim+eng'
+OCR_TESSERACT_MAX_WORKERS = 2  # 识别进程池大小
+OCR_TESSERACT_TIMEOUT = 60  # 单个文件的识别超时（秒）
+
+# 识别引擎路由配置（按期望成本 = 成本 / 成功率 从低到高尝试，结果不完整时才升级，可用 python manage.py ocr_engine_stats 查看）
+# 可选引擎：pdf_text、qr、baidu_general、baidu_accurate、baidu（增值税发票识别）、tesseract，或自定义引擎类的导入路径
+# baidu_general、baidu_accurate 与 baidu 均为百度付费接口，默认只启用 baidu
+OCR_ENGINES = ['pdf_text', 'qr', 'baidu', 'tesseract']
+OCR_ENGINE_COSTS = {}  # 覆盖引擎的相对成本，如 {'baidu_general': 1, 'baidu': 10}
+OCR_ROUTER_MAX_REMOTE_CALLS = 2  # 每个文件最多调用的百度OCR引擎数，0表示不限
+OCR_ROUTER_MIN_SAMPLES = 20  # 样本数达到该值后才按统计的成功率排序，之前按成功率100%估计
+OCR_ROUTER_EXPLORE_RATE = 0.05  # 引擎仍按成功率100%估计的概率，使排在后面的引擎的统计随实际情况更新
+
+# 发票关键词搜索配置（SQLite FTS5全文索引，可用 python manage.py rebuild_invoice_search_index 重建）
+INVOICE_SEARCH_INDEX = True  # 是否使用全文索引，False 时退回逐行 icontains 查询
+
+# 发票列表分页配置
+INVOICE_LIST_PAGINATION = 'keyset'  # keyset：按 (开票日期, ID) 游标翻页，不随页数变慢；offset：按页码分页。关键词搜索结果总是按相关度排序、按页码分页
+INVOICE_LIST_COUNT_LIMIT = 10000  # 游标分页时总数最多计数到该值，超过时显示"超过 N 条"；为0时不计数